@@ -52,19 +52,26 @@ _usage="""
     - Property names are not case sensitive in the database; this may
       cause some problems if they are case sensitive in the sd file.
 
+    - The fingerprint and descriptor calculations can be spread over
+      several processes with the --numWorkers argument. A checkpoint is
+      written after each database commit, so an interrupted build can
+      be finished with the --resume argument.
+
       
 """
 from rdkit import RDConfig
 from rdkit import Chem
+from rdkit import DataStructs
 from rdkit.Dbase.DbConnection import DbConnect
 from rdkit.Dbase import DbModule
 from rdkit.RDLogger import logger
 from rdkit.Chem.MolDb import Loader
 
 logger = logger()
-import cPickle,sys,os
+import cPickle,sys,os,time,collections
 from rdkit.Chem.MolDb.FingerprintUtils import BuildSigFactory,LayeredOptions
 from rdkit.Chem.MolDb import FingerprintUtils
+from rdkit.Chem.Pharm2D import Generate
 
 # ---- ---- ---- ----  ---- ---- ---- ----  ---- ---- ---- ----  ---- ---- ---- ---- 
 from optparse import OptionParser
@@ -146,6 +153,24 @@ parser.add_option('--noMorganFps','--noCircularFps',default=True,dest='doMorganF
 parser.add_option('--morganFpTableName',default='morganfps',
                   help='name of the Morgan fingerprints table')
 
+parser.add_option('--doPackedFps',default=False,action='store_true',
+                  help='also write the RDK fingerprints to a memory-mappable packed fingerprint file')
+parser.add_option('--packedFpName',default='rdkitfps.fpb',
+                  help='name of the packed fingerprint file')
+
+parser.add_option('--numWorkers',default=1,type='int',
+                  help='number of worker processes to use for the fingerprint and descriptor calculations. The default is %default')
+parser.add_option('--batchSize',default=500,type='int',
+                  help='number of molecules passed to a worker at a time. The default is %default')
+parser.add_option('--rowsPerTransaction',default=10000,type='int',
+                  help='number of molecules to process between database commits. The default is %default')
+parser.add_option('--resume',default=False,action='store_true',
+                  help='resume an interrupted fingerprint and descriptor calculation from its last checkpoint (the molecules are not reloaded)')
+parser.add_option('--checkpointName',default='createdb.checkpoint',
+                  help='name of the checkpoint file written during the calculations. The default is %default')
+parser.add_option('--stopAfter',default=0,type='int',
+                  help='stop at the first checkpoint after this many molecules have been processed; the build can be finished later with --resume')
+
 parser.add_option('--delimiter','--delim',default=' ',
                   help='the delimiter in the input file')
 parser.add_option('--titleLine',default=False,action='store_true',
@@ -155,15 +180,168 @@ parser.add_option('--smilesColumn','--smilesCol',default=0,type='int',
 parser.add_option('--nameColumn','--nameCol',default=1,type='int',
                   help='the column index with mol names')
 
+# ---- ---- ---- ----  ---- ---- ---- ----  ---- ---- ---- ----  ---- ---- ---- ---- 
+#  The fingerprints and descriptors are generated by a pipeline:
+#    - a reader that pulls batches of molecule pickles from the molecule db
+#    - _calcBatch, which does the calculations for a batch (possibly in
+#      a pool of worker processes)
+#    - a writer in the parent process that inserts the rows in large
+#      transactions and records a checkpoint after each one
+
+# the settings that have to be the same when a build is resumed:
+_checkpointOptions=('doPairs','doFingerprints','doLayered','doDescriptors','doPharm2D',
+                    'doGobbi2D','doMorganFps','doPackedFps')
+
+def _readCheckpoint(fileName):
+  if not os.path.exists(fileName):
+    return None
+  return cPickle.load(file(fileName,'rb'))
+
+def _writeCheckpoint(fileName,options,lastGuid,nDone,packedWriter):
+  if lastGuid is None:
+    return
+  state = {'lastGuid':lastGuid,'nDone':nDone,
+           'options':dict([(x,getattr(options,x)) for x in _checkpointOptions]),
+           'nPacked':0,'packedNBits':None}
+  if packedWriter is not None:
+    state['nPacked']=packedWriter.nWritten
+    state['packedNBits']=packedWriter.nBits
+  # write then rename so that a crash never leaves a partial checkpoint:
+  outF = file(fileName+'.tmp','wb')
+  cPickle.dump(state,outF,2)
+  outF.close()
+  if os.path.exists(fileName):
+    os.unlink(fileName)
+  os.rename(fileName+'.tmp',fileName)
+
+def _readMolBatches(curs,options,lastGuid,timings):
+  """ generator returning lists of (guid,id,molpkl) in guid order,
+  starting after lastGuid (if it's not None)
+
+  """
+  t1=time.time()
+  if lastGuid is None:
+    curs.execute('select guid,%s,molpkl from %s order by guid'%(options.molIdName,
+                                                                options.regName))
+  else:
+    curs.execute('select guid,%s,molpkl from %s where guid>%s order by guid'%(options.molIdName,
+                                                                              options.regName,
+                                                                              DbModule.placeHolder),
+                 (lastGuid,))
+  while 1:
+    batch = curs.fetchmany(options.batchSize)
+    timings['read'] += time.time()-t1
+    if not batch:
+      break
+    yield [(guid,molId,str(pkl)) for guid,molId,pkl in batch]
+    t1=time.time()
+
+_calcOptions=None
+_calcData={}
+def _initCalcWorker(options):
+  """ sets up the global state used by _calcBatch """
+  global _calcOptions,_calcData
+  _calcOptions=options
+  _calcData={}
+  if options.doPharm2D:
+    _calcData['pharm2D']=BuildSigFactory(options)
+  if options.doGobbi2D:
+    from rdkit.Chem.Pharm2D import Gobbi_Pharm2D
+    _calcData['gobbi2D']=Gobbi_Pharm2D.factory
+  if options.doDescriptors:
+    _calcData['descriptors']=cPickle.load(file(options.descriptorCalcFilename,'rb'))
+
+def _calcBatch(batch):
+  """ does the calculations for a list of (guid,id,molpkl) tuples
+
+  returns (rows,elapsed time), rows is a dictionary with the rows for
+  each kind of calculation. Blobs are returned as strings so that the
+  results can be passed back from worker processes.
+
+  """
+  t1=time.time()
+  options=_calcOptions
+  rows = {}
+  for kind,flag in (('pairs','doPairs'),('fps','doFingerprints'),('packed','doPackedFps'),
+                    ('layered','doLayered'),('descriptors','doDescriptors'),('pharm2D','doPharm2D'),
+                    ('gobbi2D','doGobbi2D'),('morgan','doMorganFps')):
+    if getattr(options,flag):
+      rows[kind]=[]
+  mols = []
+  for molGuid,molId,pkl in batch:
+    mol = Chem.Mol(pkl)
+    if not mol: continue
+    mols.append((molGuid,molId,mol))
+  # the pharmacophore fingerprints are generated for the whole batch at once:
+  if options.doPharm2D:
+    pharm2DFps = Generate.GenerateBatch([x[2] for x in mols],_calcData['pharm2D'])
+  if options.doGobbi2D:
+    gobbi2DFps = Generate.GenerateBatch([x[2] for x in mols],_calcData['gobbi2D'])
+  for i,(molGuid,molId,mol) in enumerate(mols):
+
+    if options.doPairs:
+      pairs = FingerprintUtils.BuildAtomPairFP(mol)
+      torsions = FingerprintUtils.BuildTorsionsFP(mol)
+      rows['pairs'].append([molGuid,molId,pairs.ToBinary(),torsions.ToBinary()])
+    if options.doFingerprints or options.doPackedFps:
+      fp2 = FingerprintUtils.BuildRDKitFP(mol)
+    if options.doFingerprints:
+      rows['fps'].append([molGuid,molId,fp2.ToBinary()])
+    if options.doPackedFps:
+      rows['packed'].append((molGuid,DataStructs.BitVectToBinaryText(fp2),fp2.GetNumOnBits(),
+                             fp2.GetNumBits()))
+    if options.doLayered:
+      words = LayeredOptions.GetWords(mol)
+      rows['layered'].append([molGuid,molId]+words)
+    if options.doDescriptors:
+      descrs= _calcData['descriptors'].CalcDescriptors(mol)
+      row = [molGuid,molId]
+      row.extend(descrs)
+      rows['descriptors'].append(row)
+    if options.doPharm2D:
+      rows['pharm2D'].append([molGuid,molId,pharm2DFps[i].ToBinary()])
+    if options.doGobbi2D:
+      rows['gobbi2D'].append([molGuid,molId,gobbi2DFps[i].ToBinary()])
+    if options.doMorganFps:
+      morgan = FingerprintUtils.BuildMorganFP(mol)
+      rows['morgan'].append([molGuid,molId,morgan.ToBinary()])
+  return rows,time.time()-t1
+
+def _runBatches(batches,workers,nWorkers):
+  """ generator returning (last guid,number of molecules,rows,elapsed time)
+  for each batch, in the order the batches were read
+
+  Only a couple of batches per worker are in flight at any time, so
+  the reader doesn't get too far ahead of the calculations.
+
+  """
+  if workers is None:
+    for batch in batches:
+      yield (batch[-1][0],len(batch))+_calcBatch(batch)
+    return
+  inFlight = collections.deque()
+  for batch in batches:
+    inFlight.append((batch[-1][0],len(batch),workers.apply_async(_calcBatch,(batch,))))
+    if len(inFlight)>=2*nWorkers:
+      guid,nInBatch,res = inFlight.popleft()
+      yield (guid,nInBatch)+res.get()
+  while inFlight:
+    guid,nInBatch,res = inFlight.popleft()
+    yield (guid,nInBatch)+res.get()
+
+def _reportRates(nRead,nWritten,timings,nWorkers,elapsed):
+  def rate(n,t):
+    if t>0:
+      return n/t
+    return 0.0
+  logger.info('  read: %.1f rows/sec, calculate: %.1f rows/sec (%d workers), write: %.1f rows/sec, overall: %.1f rows/sec'%(rate(nRead,timings['read']),
+                 rate(nRead,timings['calc'])*nWorkers,nWorkers,
+                 rate(nWritten,timings['write']),rate(nWritten,elapsed)))
+
 def CreateDb(options,dataFilename='',supplier=None):
   if not dataFilename and supplier is None:
     raise ValueError,'Please provide either a data filename or a supplier'
 
-  if options.errFilename:
-    errFile=file(os.path.join(options.outDir,options.errFilename),'w+')
-  else:
-    errFile=None
-
   if options.noExtras:
     options.doPairs=False
     options.doDescriptors=False
@@ -172,8 +350,30 @@ def CreateDb(options,dataFilename='',supplier=None):
     options.doGobbi2D=False
     options.doLayered=False
     options.doMorganFps=False
+    options.doPackedFps=False
 
-  if options.loadMols:
+  checkpointFilename = os.path.join(options.outDir,options.checkpointName)
+  resumeFrom = None
+  if options.resume:
+    resumeFrom = _readCheckpoint(checkpointFilename)
+    if resumeFrom is None:
+      if not options.silent: logger.info('No checkpoint found, building the databases from scratch.')
+    else:
+      # use the settings of the interrupted build:
+      for nm,val in resumeFrom['options'].items():
+        setattr(options,nm,val)
+      if not options.silent:
+        logger.info('Resuming the build after guid %d (%d molecules done).'%(resumeFrom['lastGuid'],
+                                                                           resumeFrom['nDone']))
+  elif os.path.exists(checkpointFilename):
+    # this is a new build, so any old checkpoint is stale:
+    os.unlink(checkpointFilename)
+
+  if options.loadMols and resumeFrom is None:
+    if options.errFilename:
+      errFile=file(os.path.join(options.outDir,options.errFilename),'w+')
+    else:
+      errFile=None
     if supplier is None:
       if not options.molFormat:
         ext = os.path.splitext(dataFilename)[-1].lower()
@@ -210,222 +410,171 @@ def CreateDb(options,dataFilename='',supplier=None):
                   skipSmiles=options.skipSmiles,maxRowsCached=int(options.maxRowsCached),
                   silent=options.silent,nameProp=options.nameProp,
                   lazySupplier=int(options.maxRowsCached)>0)
+  # each table is described by (kind,connection,table name,insert query,blob columns)
+  tables = []
+  def initTable(conn,tableName,colDefs):
+    curs = conn.GetCursor()
+    if resumeFrom is None:
+      try:
+        curs.execute('drop table %s'%(tableName))
+      except:
+        pass
+      curs.execute('create table %s (%s)'%(tableName,colDefs))
+    else:
+      # throw out anything written after the last checkpoint:
+      curs.execute('delete from %s where guid>%s'%(tableName,DbModule.placeHolder),
+                   (resumeFrom['lastGuid'],))
+      conn.Commit()
+  keyDefs = 'guid integer not null primary key,%s varchar not null unique'%options.molIdName
+
   if options.doPairs:
     pairConn = DbConnect(os.path.join(options.outDir,options.pairDbName))
-    pairCurs = pairConn.GetCursor()
-    try:
-      pairCurs.execute('drop table %s'%(options.pairTableName))
-    except:
-      pass
-    pairCurs.execute('create table %s (guid integer not null primary key,%s varchar not null unique,atompairfp blob,torsionfp blob)'%(options.pairTableName,
-                                                                                                         options.molIdName))
+    initTable(pairConn,options.pairTableName,keyDefs+',atompairfp blob,torsionfp blob')
+    tables.append(('pairs',pairConn,options.pairTableName,
+                   'insert into %s values (?,?,?,?)'%options.pairTableName,(2,3)))
 
-  if options.doFingerprints or options.doPharm2D or options.doGobbi2D or options.doLayered:
+  if options.doFingerprints or options.doPharm2D or options.doGobbi2D or options.doLayered or \
+        options.doMorganFps:
     fpConn = DbConnect(os.path.join(options.outDir,options.fpDbName))
-    fpCurs=fpConn.GetCursor()
-    try:
-      fpCurs.execute('drop table %s'%(options.fpTableName))
-    except:
-      pass
-    try:
-      fpCurs.execute('drop table %s'%(options.pharm2DTableName))
-    except:
-      pass
-    try:
-      fpCurs.execute('drop table %s'%(options.gobbi2DTableName))
-    except:
-      pass
-    try:
-      fpCurs.execute('drop table %s'%(options.layeredTableName))
-    except:
-      pass
-
     if options.doFingerprints:
-      fpCurs.execute('create table %s (guid integer not null primary key,%s varchar not null unique,rdkfp blob)'%(options.fpTableName,
-                                                                                     options.molIdName))
+      initTable(fpConn,options.fpTableName,keyDefs+',rdkfp blob')
+      tables.append(('fps',fpConn,options.fpTableName,
+                     'insert into %s values (?,?,?)'%options.fpTableName,(2,)))
     if options.doLayered:
       layeredQs = ','.join('?'*LayeredOptions.nWords)
       colDefs=','.join(['Col_%d integer'%(x+1) for x in range(LayeredOptions.nWords)])
-      fpCurs.execute('create table %s (guid integer not null primary key,%s varchar not null unique,%s)'%(options.layeredTableName,
-                                                                             options.molIdName,
-                                                                             colDefs))
-      
+      initTable(fpConn,options.layeredTableName,keyDefs+','+colDefs)
+      tables.append(('layered',fpConn,options.layeredTableName,
+                     'insert into %s values (?,?,%s)'%(options.layeredTableName,layeredQs),()))
     if options.doPharm2D:
-      fpCurs.execute('create table %s (guid integer not null primary key,%s varchar not null unique,pharm2dfp blob)'%(options.pharm2DTableName,
-                                                                                     options.molIdName))
-      sigFactory = BuildSigFactory(options)
+      initTable(fpConn,options.pharm2DTableName,keyDefs+',pharm2dfp blob')
+      tables.append(('pharm2D',fpConn,options.pharm2DTableName,
+                     'insert into %s values (?,?,?)'%options.pharm2DTableName,(2,)))
     if options.doGobbi2D:
-      fpCurs.execute('create table %s (guid integer not null primary key,%s varchar not null unique,gobbi2dfp blob)'%(options.gobbi2DTableName,
-                                                                                     options.molIdName))
-      from rdkit.Chem.Pharm2D import Generate,Gobbi_Pharm2D
-
-  if options.doMorganFps :
-    fpConn = DbConnect(os.path.join(options.outDir,options.fpDbName))
-    fpCurs=fpConn.GetCursor()
-    try:
-      fpCurs.execute('drop table %s'%(options.morganFpTableName))
-    except:
-      pass
-    fpCurs.execute('create table %s (guid integer not null primary key,%s varchar not null unique,morganfp blob)'%(options.morganFpTableName,
-                                                                                        options.molIdName))
+      initTable(fpConn,options.gobbi2DTableName,keyDefs+',gobbi2dfp blob')
+      tables.append(('gobbi2D',fpConn,options.gobbi2DTableName,
+                     'insert into %s values (?,?,?)'%options.gobbi2DTableName,(2,)))
+    if options.doMorganFps:
+      initTable(fpConn,options.morganFpTableName,keyDefs+',morganfp blob')
+      tables.append(('morgan',fpConn,options.morganFpTableName,
+                     'insert into %s values (?,?,?)'%options.morganFpTableName,(2,)))
 
   if options.doDescriptors:
     descrConn=DbConnect(os.path.join(options.outDir,options.descrDbName))
     calc = cPickle.load(file(options.descriptorCalcFilename,'rb'))
     nms = [x for x in calc.GetDescriptorNames()]
-    descrCurs = descrConn.GetCursor()
-    descrs = ['guid integer not null primary key','%s varchar not null unique'%options.molIdName]
+    descrs = [keyDefs]
     descrs.extend(['%s float'%x for x in nms])
-    try:
-      descrCurs.execute('drop table %s'%(options.descrTableName))
-    except:
-      pass
-    descrCurs.execute('create table %s (%s)'%(options.descrTableName,','.join(descrs)))
-    descrQuery=','.join([DbModule.placeHolder]*len(descrs))
-  pairRows = []
-  fpRows = []
-  layeredRows = []
-  descrRows = []
-  pharm2DRows=[]
-  gobbi2DRows=[]
-  morganRows = []
+    initTable(descrConn,options.descrTableName,','.join(descrs))
+    descrQuery=','.join([DbModule.placeHolder]*(len(nms)+2))
+    tables.append(('descriptors',descrConn,options.descrTableName,
+                   'insert into %s values (%s)'%(options.descrTableName,descrQuery),()))
+
+  packedWriter=None
+  if options.doPackedFps:
+    from rdkit.Chem.MolDb.FingerprintStore import PackedFingerprintWriter
+    if resumeFrom is not None and resumeFrom['nPacked']:
+      packedWriter = PackedFingerprintWriter(os.path.join(options.outDir,options.packedFpName),
+                                             resumeFrom['packedNBits'],
+                                             resumeCount=resumeFrom['nPacked'])
+
+  if not tables and not options.doPackedFps:
+    if not options.silent:
+      logger.info('Finished.')
+    return
 
   if not options.silent: logger.info('Generating fingerprints and descriptors:')
+  if resumeFrom is None:
+    lastGuid = None
+    nDone = 0
+  else:
+    lastGuid = resumeFrom['lastGuid']
+    nDone = resumeFrom['nDone']
   molConn = DbConnect(os.path.join(options.outDir,options.molDbName))
-  molCurs = molConn.GetCursor()
-  if not options.skipSmiles:
-    molCurs.execute('select guid,%s,smiles,molpkl from %s'%(options.molIdName,options.regName))
+
+  nWorkers = max(1,options.numWorkers)
+  if nWorkers>1:
+    from multiprocessing import Pool
+    workers = Pool(nWorkers,_initCalcWorker,(options,))
   else:
-    molCurs.execute('select guid,%s,molpkl from %s'%(options.molIdName,options.regName))
-  i=0
-  while 1:
-    try:
-      tpl = molCurs.fetchone()
-      molGuid = tpl[0]
-      molId = tpl[1]
-      pkl = tpl[-1]
-      i+=1
-    except:
-      break
-    mol = Chem.Mol(str(pkl))
-    if not mol: continue
-     
-    if options.doPairs:
-      pairs = FingerprintUtils.BuildAtomPairFP(mol)
-      torsions = FingerprintUtils.BuildTorsionsFP(mol)
-      pkl1 = DbModule.binaryHolder(pairs.ToBinary())
-      pkl2 = DbModule.binaryHolder(torsions.ToBinary())
-      row = (molGuid,molId,pkl1,pkl2)
-      pairRows.append(row)
-    if options.doFingerprints:
-      fp2 = FingerprintUtils.BuildRDKitFP(mol)
-      pkl = DbModule.binaryHolder(fp2.ToBinary())
-      row = (molGuid,molId,pkl)
-      fpRows.append(row)
-    if options.doLayered:
-      words = LayeredOptions.GetWords(mol)
-      row = [molGuid,molId]+words
-      layeredRows.append(row)
-    if options.doDescriptors:
-      descrs= calc.CalcDescriptors(mol)
-      row = [molGuid,molId]
-      row.extend(descrs)
-      descrRows.append(row)
-    if options.doPharm2D:
-      FingerprintUtils.sigFactory=sigFactory
-      fp= FingerprintUtils.BuildPharm2DFP(mol)
-      pkl = DbModule.binaryHolder(fp.ToBinary())
-      row = (molGuid,molId,pkl)
-      pharm2DRows.append(row)
-    if options.doGobbi2D:
-      FingerprintUtils.sigFactory=Gobbi_Pharm2D.factory
-      fp= FingerprintUtils.BuildPharm2DFP(mol)
-      pkl = DbModule.binaryHolder(fp.ToBinary())
-      row = (molGuid,molId,pkl)
-      gobbi2DRows.append(row)
-    if options.doMorganFps:
-      morgan = FingerprintUtils.BuildMorganFP(mol)
-      pkl = DbModule.binaryHolder(morgan.ToBinary())
-      row = (molGuid,molId,pkl)
-      morganRows.append(row)
-
-    if not i%500:
-      if len(pairRows):
-        pairCurs.executemany('insert into %s values (?,?,?,?)'%options.pairTableName,
-                             pairRows)
-        pairRows = []
-        pairConn.Commit()
-      if len(fpRows):
-        fpCurs.executemany('insert into %s values (?,?,?)'%options.fpTableName,
-                           fpRows)
-        fpRows = []
-        fpConn.Commit()
-      if len(layeredRows):
-        fpCurs.executemany('insert into %s values (?,?,%s)'%(options.layeredTableName,layeredQs),
-                           layeredRows)
-        layeredRows = []
-        fpConn.Commit()
-      if len(descrRows):
-        descrCurs.executemany('insert into %s values (%s)'%(options.descrTableName,descrQuery),
-                              descrRows)
-        descrRows = []
-        descrConn.Commit()
-      if len(pharm2DRows):
-        fpCurs.executemany('insert into %s values (?,?,?)'%options.pharm2DTableName,
-                           pharm2DRows)
-        pharm2DRows = []
-        fpConn.Commit()
-      if len(gobbi2DRows):
-        fpCurs.executemany('insert into %s values (?,?,?)'%options.gobbi2DTableName,
-                           gobbi2DRows)
-        gobbi2DRows = []
-        fpConn.Commit()
-      if len(morganRows):
-        fpCurs.executemany('insert into %s values (?,?,?)'%options.morganFpTableName,
-                             morganRows)
-        morganRows = []
-        fpConn.Commit()
-        
-    if not options.silent and not i%500: 
-      logger.info('  Done: %d'%(i))
-
-  if len(pairRows):
-    pairCurs.executemany('insert into %s values (?,?,?,?)'%options.pairTableName,
-                         pairRows)
-    pairRows = []
-    pairConn.Commit()
-  if len(fpRows):
-    fpCurs.executemany('insert into %s values (?,?,?)'%options.fpTableName,
-                       fpRows)
-    fpRows = []
-    fpConn.Commit()
-  if len(layeredRows):
-    fpCurs.executemany('insert into %s values (?,?,%s)'%(options.layeredTableName,layeredQs),
-                       layeredRows)
-    layeredRows = []
-    fpConn.Commit()
-  if len(descrRows):
-    descrCurs.executemany('insert into %s values (%s)'%(options.descrTableName,descrQuery),
-                          descrRows)
-    descrRows = []
-    descrConn.Commit()
-  if len(pharm2DRows):
-    fpCurs.executemany('insert into %s values (?,?,?)'%options.pharm2DTableName,
-                       pharm2DRows)
-    pharm2DRows = []
-    fpConn.Commit()
-  if len(gobbi2DRows):
-    fpCurs.executemany('insert into %s values (?,?,?)'%options.gobbi2DTableName,
-                       gobbi2DRows)
-    gobbi2DRows = []
-    fpConn.Commit()
-  if len(morganRows):
-    fpCurs.executemany('insert into %s values (?,?,?)'%options.morganFpTableName,
-                       morganRows)
-    morganRows = []
-    fpConn.Commit()
-    
+    workers = None
+    _initCalcWorker(options)
+
+  timings = {'read':0.0,'calc':0.0,'write':0.0}
+  reader = _readMolBatches(molConn.GetCursor(),options,lastGuid,timings)
+  nRead = 0
+  nWritten = 0
+  startTime = time.time()
+  pending = dict([(x[0],[]) for x in tables])
+  nPending = 0
+  lastPendingGuid = lastGuid
+  def writePending():
+    """ inserts the pending rows, commits, and records the checkpoint """
+    t1 = time.time()
+    conns = []
+    for kind,conn,tableName,query,blobCols in tables:
+      rows = pending[kind]
+      if blobCols:
+        for row in rows:
+          for col in blobCols:
+            row[col] = DbModule.binaryHolder(row[col])
+      if rows:
+        conn.GetCursor().executemany(query,rows)
+      pending[kind] = []
+      if conn not in conns:
+        conns.append(conn)
+    for conn in conns:
+      conn.Commit()
+    if packedWriter is not None:
+      packedWriter.Flush()
+    _writeCheckpoint(checkpointFilename,options,lastPendingGuid,nDone,packedWriter)
+    timings['write'] += time.time()-t1
+
+  for batchGuid,nInBatch,rows,elapsed in _runBatches(reader,workers,nWorkers):
+    nRead += nInBatch
+    timings['calc'] += elapsed
+    for kind,kindRows in rows.items():
+      if kind=='packed':
+        for guid,txt,popcount,nBits in kindRows:
+          if packedWriter is None:
+            packedWriter = PackedFingerprintWriter(os.path.join(options.outDir,options.packedFpName),
+                                                   nBits)
+          packedWriter.AddPackedFingerprint(guid,txt,popcount)
+      else:
+        pending[kind].extend(kindRows)
+    nPending += nInBatch
+    nDone += nInBatch
+    lastPendingGuid = batchGuid
+    if nPending>=options.rowsPerTransaction:
+      writePending()
+      nWritten += nPending
+      nPending = 0
+      if not options.silent:
+        logger.info('  Done: %d'%(nDone))
+        _reportRates(nRead,nWritten,timings,nWorkers,time.time()-startTime)
+      if options.stopAfter>0 and nDone>=options.stopAfter:
+        # leave the checkpoint (and the temporary packed fingerprint
+        # files) in place for --resume:
+        if workers is not None:
+          workers.terminate()
+          workers.join()
+        if not options.silent:
+          logger.info('Stopping after %d molecules. Use --resume to finish the build.'%(nDone))
+        return
+  writePending()
+  nWritten += nPending
+
+  if workers is not None:
+    workers.close()
+    workers.join()
+  if packedWriter is not None:
+    packedWriter.Close()
+  # the build is complete, so there's nothing left to resume:
+  if os.path.exists(checkpointFilename):
+    os.unlink(checkpointFilename)
+
   if not options.silent:
+    _reportRates(nRead,nWritten,timings,nWorkers,time.time()-startTime)
     logger.info('Finished.')
 
 if __name__=='__main__':
@@ -54,7 +54,7 @@ from rdkit.Dbase.DbConnection import DbConnect
 
 from rdkit.RDLogger import logger
 logger=logger()
-import zlib
+import zlib,bisect
 from rdkit import Chem
 
 from rdkit.Chem.MolDb.FingerprintUtils import supportedSimilarityMethods,BuildSigFactory,DepickleFP,LayeredOptions
@@ -63,49 +63,213 @@ from rdkit.Chem.MolDb import FingerprintUtils
 from rdkit import DataStructs
 
 
-def GetNeighborLists(probes,topN,pool,
-                     simMetric=DataStructs.DiceSimilarity,
-                     simThresh=-1.,
-                     silent=False,
-                     **kwargs):
+def _makeNeighborLists(nProbes,topN,simThresh,candidates=False):
+  from rdkit.DataStructs.TopNHeap import MultiProbeTopN,MultiProbeCandidates
+  if simThresh<=0:
+    size=topN
+  else:
+    size=-1
+  if candidates:
+    return MultiProbeCandidates(nProbes,size,threshold=simThresh)
+  else:
+    return MultiProbeTopN(nProbes,size,threshold=simThresh)
+
+def _fillNeighborLists(nbrLists,probes,pool,simMetric,silent,blockSize,**kwargs):
+  import numpy
   probeFps = [x[1] for x in probes]
   validProbes = [x for x in range(len(probeFps)) if probeFps[x] is not None]
   validFps=[probeFps[x] for x in validProbes]
-  from rdkit.DataStructs.TopNContainer import TopNContainer
-  if simThresh<=0:
-    nbrLists = [TopNContainer(topN) for x in range(len(probeFps))]
+
+  if(simMetric==DataStructs.DiceSimilarity):
+    scoreFunc = lambda fp:DataStructs.BulkDiceSimilarity(fp,validFps)
+  elif(simMetric==DataStructs.TanimotoSimilarity):
+    scoreFunc = lambda fp:DataStructs.BulkTanimotoSimilarity(fp,validFps)
+  elif(simMetric==DataStructs.TverskySimilarity):
+    av = float(kwargs.get('tverskyA',0.5))
+    bv = float(kwargs.get('tverskyB',0.5))
+    scoreFunc = lambda fp:DataStructs.BulkTverskySimilarity(fp,validFps,av,bv)
   else:
-    nbrLists=[TopNContainer(-1) for x in range(len(probeFps))]
+    scoreFunc = lambda fp:[simMetric(pfp,fp) for pfp in validFps]
 
+  # the scores are collected into probe x block matrices before they
+  # are added to the neighbor lists:
+  blockScores=[]
+  blockNames=[]
   nDone=0
   for nm,fp in pool:
     nDone+=1
     if not silent and not nDone%1000: logger.info('  searched %d rows'%nDone)
-    if(simMetric==DataStructs.DiceSimilarity):
-      scores = DataStructs.BulkDiceSimilarity(fp,validFps)
-      for i,score in enumerate(scores):
-        if score>simThresh:
-          nbrLists[validProbes[i]].Insert(score,nm)
-    elif(simMetric==DataStructs.TanimotoSimilarity):
-      scores = DataStructs.BulkTanimotoSimilarity(fp,validFps)
-      for i,score in enumerate(scores):
-        if score>simThresh:
-          nbrLists[validProbes[i]].Insert(score,nm)
-    elif(simMetric==DataStructs.TverskySimilarity):
-      av = float(kwargs.get('tverskyA',0.5))
-      bv = float(kwargs.get('tverskyB',0.5))
-      scores = DataStructs.BulkTverskySimilarity(fp,validFps,av,bv)
-      for i,score in enumerate(scores):
-        if score>simThresh:
-          nbrLists[validProbes[i]].Insert(score,nm)
+    blockScores.append(scoreFunc(fp))
+    blockNames.append(nm)
+    if len(blockNames)>=blockSize:
+      nbrLists.AddScores(numpy.array(blockScores,numpy.float64).T,blockNames,validProbes)
+      blockScores=[]
+      blockNames=[]
+  if blockNames:
+    nbrLists.AddScores(numpy.array(blockScores,numpy.float64).T,blockNames,validProbes)
+
+def GetNeighborLists(probes,topN,pool,
+                     simMetric=DataStructs.DiceSimilarity,
+                     simThresh=-1.,
+                     silent=False,
+                     blockSize=1000,
+                     **kwargs):
+  nbrLists = _makeNeighborLists(len(probes),topN,simThresh)
+  _fillNeighborLists(nbrLists,probes,pool,simMetric,silent,blockSize,**kwargs)
+  return nbrLists.GetContainers()
+
+def _fillNeighborListsFromStore(nbrLists,probes,store,simMetric,rows,silent,blockSize,**kwargs):
+  from rdkit.DataStructs import PackedBitVects
+  if simMetric in (DataStructs.TanimotoSimilarity,DataStructs.FingerprintSimilarity):
+    bulkFunc = PackedBitVects.BulkTanimotoSimilarity
+  elif simMetric==DataStructs.DiceSimilarity:
+    bulkFunc = PackedBitVects.BulkDiceSimilarity
+  elif simMetric==DataStructs.TverskySimilarity:
+    # GetNeighborLists calculates Tversky(poolFp,probeFp,a,b), the bulk
+    # functions put the probe first:
+    av = float(kwargs.get('tverskyA',0.5))
+    bv = float(kwargs.get('tverskyB',0.5))
+    bulkFunc = lambda probe,fps,probeCount,counts:PackedBitVects.BulkTverskySimilarity(probe,fps,bv,av,
+                                                                                       probeCount,counts)
+  else:
+    raise ValueError,'similarity metric not supported for packed fingerprints'
+
+  nBits = store.GetNumBits()
+  validProbes=[]
+  packedProbes=[]
+  for i,(mol,fp) in enumerate(probes):
+    if fp is None:
+      continue
+    if fp.GetNumBits()>nBits and not fp.GetNumBits()%nBits:
+      fp = DataStructs.FoldFingerprint(fp,fp.GetNumBits()//nBits)
+    if fp.GetNumBits()!=nBits:
+      raise ValueError,'probe fingerprint has %d bits, the store has %d'%(fp.GetNumBits(),nBits)
+    validProbes.append(i)
+    packedProbes.append((PackedBitVects.PackBitVect(fp),fp.GetNumOnBits()))
+
+  nDone=0
+  for blockGuids,blockCounts,blockFps in store.GetBlocks(blockSize,rows):
+    blockGuids = blockGuids.tolist()
+    for i,(probe,probeCount) in zip(validProbes,packedProbes):
+      scores = bulkFunc(probe,blockFps,probeCount,blockCounts)
+      nbrLists.AddProbeScores(i,scores,blockGuids)
+    nDone+=len(blockGuids)
+    if not silent: logger.info('  searched %d rows'%nDone)
+
+def GetNeighborListsFromStore(probes,topN,store,
+                              simMetric=DataStructs.TanimotoSimilarity,
+                              simThresh=-1.,
+                              guids=None,
+                              blockSize=8192,
+                              silent=False,
+                              **kwargs):
+  """ equivalent to GetNeighborLists, but the pool is a
+  PackedFingerprintStore that is scored a block at a time
+
+  if guids is provided, only the fingerprints with those guids are searched
+
+  """
+  if guids is not None:
+    rows = store.GetRowsForGuids(guids)
+  else:
+    rows = None
+  nbrLists = _makeNeighborLists(len(probes),topN,simThresh)
+  _fillNeighborListsFromStore(nbrLists,probes,store,simMetric,rows,silent,blockSize,**kwargs)
+  return nbrLists.GetContainers()
+
+# similarity metrics that can be passed to worker processes:
+_shardMetrics={'tanimoto':DataStructs.TanimotoSimilarity,
+               'dice':DataStructs.DiceSimilarity,
+               'tversky':DataStructs.TverskySimilarity,
+               'fingerprint':DataStructs.FingerprintSimilarity,
+               }
+
+def _searchShard(args):
+  """ *Internal use only*
+
+   searches one shard of the fingerprints, this is run in the worker
+   processes. The shard is described by a dictionary:
+
+     - kind='db': rows of the fingerprint table with lo<=guid<hi, 
+       restricted to the guids in ids if that is not None
+
+     - kind='store': the rows of a packed fingerprint store
+     
+   returns a list with (scores,guids) for each probe
+
+  """
+  shard,probes,topN,simThresh,metricName,kwargs = args
+  simMetric = _shardMetrics[metricName]
+  nbrLists = _makeNeighborLists(len(probes),topN,simThresh,candidates=True)
+  if shard['kind']=='store':
+    from rdkit.Chem.MolDb.FingerprintStore import PackedFingerprintStore
+    store = PackedFingerprintStore(shard['fileName'])
+    _fillNeighborListsFromStore(nbrLists,probes,store,simMetric,shard['rows'],True,
+                                8192,**kwargs)
+  else:
+    conn = DbConnect(shard['dbName'])
+    curs = conn.GetCursor()
+    idCol=shard['idCol']
+    if shard['ids'] is not None:
+      curs.execute('create temporary table _tmpTbl (%s %s)'%(idCol,shard['idTyp']))
+      curs.executemany('insert into _tmpTbl values (?)',[(x,) for x in shard['ids']])
+      join='join  _tmpTbl using (%s)'%idCol
     else:
-      for i in range(len(probeFps)):
-        pfp = probeFps[i]
-        if pfp is not None:
-          score = simMetric(probeFps[i],fp)
-          if score>simThresh:
-            nbrLists[validProbes[i]].Insert(score,nm)
-  return nbrLists
+      join=''
+    curs.execute('select %s,%s from %s %s where %s>=%d and %s<%d'%(idCol,shard['fpColName'],
+                                                                  shard['fpTableName'],join,
+                                                                  idCol,shard['lo'],idCol,shard['hi']))
+    similarityType = shard['similarityType']
+    def poolFromCurs(curs):
+      row = curs.fetchone()
+      while row:
+        id,pkl = row
+        yield (id,DepickleFP(str(pkl),similarityType))
+        row = curs.fetchone()
+    _fillNeighborLists(nbrLists,probes,poolFromCurs(curs),simMetric,True,1000,**kwargs)
+  nbrLists.Finish()
+  return [nbrLists.GetCandidates(x) for x in range(len(probes))]
+
+def GetNeighborListsSharded(probes,topN,shards,numWorkers=1,
+                            simMetric=DataStructs.DiceSimilarity,
+                            simThresh=-1.,
+                            silent=False,
+                            **kwargs):
+  """ equivalent to GetNeighborLists, but the pool is split into shards
+  (see _searchShard) that are searched by a pool of worker processes.
+
+  Each worker returns every neighbor that could make it into a probe's
+  list and the parent merges them in shard order. The shards must be
+  in pool order; the results are then identical to those from a
+  sequential search, independent of the number of workers or shards.
+
+  """
+  metricName=None
+  for nm,metric in _shardMetrics.items():
+    if simMetric==metric:
+      metricName=nm
+  if metricName is None:
+    raise ValueError,'similarity metric not supported for sharded searches'
+  # the molecules aren't needed by the workers:
+  probes = [(None,fp) for mol,fp in probes]
+  tasks = [(shard,probes,topN,simThresh,metricName,kwargs) for shard in shards]
+  if numWorkers>1:
+    from multiprocessing import Pool
+    workers = Pool(numWorkers)
+    results = workers.imap(_searchShard,tasks)
+  else:
+    workers = None
+    results = (_searchShard(x) for x in tasks)
+
+  nbrLists = _makeNeighborLists(len(probes),topN,simThresh)
+  for i,res in enumerate(results):
+    for probeIdx,(scores,guids) in enumerate(res):
+      nbrLists.AddProbeScores(probeIdx,scores,guids)
+    if not silent: logger.info('  searched %d of %d shards'%(i+1,len(shards)))
+  if workers is not None:
+    workers.close()
+    workers.join()
+  return nbrLists.GetContainers()
 
 def GetMolsFromSmilesFile(dataFilename,errFile,nameProp):
   dataFile=file(dataFilename,'r')
@@ -356,12 +520,63 @@ def RunSearch(options,queryFilename):
       logger.info('Found %d molecules matching the query'%(len(ids)))
 
   t1=time.time()
-  if probes:
+  shards=None
+  if probes and options.usePackedFps:
+    if options.similarityType!='RDK':
+      logger.error('packed fingerprints are only available for RDK similarity')
+      sys.exit(1)
+    from rdkit.Chem.MolDb.FingerprintStore import PackedFingerprintStore
+    if not options.silent: logger.info('Finding Neighbors')
+    storeName = os.path.join(options.dbDir,options.packedFpName)
+    store = PackedFingerprintStore(storeName)
+    if options.numWorkers>1:
+      import numpy
+      if ids:
+        rows = store.GetRowsForGuids(ids)
+      else:
+        rows = numpy.arange(len(store))
+      storeShards = [{'kind':'store','fileName':storeName,'rows':x} \
+                       for x in numpy.array_split(rows,options.numWorkers*4) if len(x)]
+      topNLists = GetNeighborListsSharded(probes,options.topN,storeShards,options.numWorkers,
+                                          simMetric=simMetric,simThresh=options.simThresh,
+                                          silent=options.silent,**extraArgs)
+    else:
+      topNLists = GetNeighborListsFromStore(probes,options.topN,store,
+                                            simMetric=simMetric,simThresh=options.simThresh,
+                                            guids=ids or None,silent=options.silent,**extraArgs)
+  elif probes:
     if not options.silent: logger.info('Finding Neighbors')
     conn = DbConnect(dbName)
     cns = conn.GetColumnNames(fpTableName)
     curs = conn.GetCursor()
 
+    if options.numWorkers>1:
+      curs.execute('select min(%(idCol)s),max(%(idCol)s) from %(fpTableName)s'%locals())
+      minId,maxId = curs.fetchone()
+      if cns[0].lower() != idCol.lower() or not isinstance(minId,(int,long)):
+        logger.warning('the fingerprint table cannot be split by guid, using a single process')
+      else:
+        # split the table into guid ranges:
+        nShards = options.numWorkers*4
+        step = max(1,(maxId-minId+nShards)//nShards)
+        if ids:
+          sortedIds = sorted(ids)
+        shards = []
+        for lo in range(minId,maxId+1,step):
+          shard = {'kind':'db','dbName':dbName,'fpTableName':fpTableName,'fpColName':fpColName,
+                   'idCol':idCol,'idTyp':idTyp,'similarityType':options.similarityType,
+                   'lo':lo,'hi':lo+step,'ids':None}
+          if ids:
+            shard['ids'] = sortedIds[bisect.bisect_left(sortedIds,lo):bisect.bisect_left(sortedIds,lo+step)]
+            if not shard['ids']:
+              continue
+          shards.append(shard)
+
+  if probes and shards is not None:
+    topNLists = GetNeighborListsSharded(probes,options.topN,shards,options.numWorkers,
+                                        simMetric=simMetric,simThresh=options.simThresh,
+                                        silent=options.silent,**extraArgs)
+  elif probes and not options.usePackedFps:
     if ids:
       ids = [(x,) for x in ids]
       curs.execute('create temporary table _tmpTbl (%(idCol)s %(idTyp)s)'%locals())
@@ -390,6 +605,7 @@ def RunSearch(options,queryFilename):
         row = curs.fetchone()
     topNLists = GetNeighborLists(probes,options.topN,poolFromCurs(curs,options.similarityType),
                                  simMetric=simMetric,simThresh=options.simThresh,**extraArgs)
+  if probes:
     uniqIds=set()
     nbrLists = {}
     for i,nm in enumerate(nms):
@@ -589,6 +805,12 @@ parser.add_option('--tverskyB',default=0.5,type='float',
                   help='Tversky B value')
 parser.add_option('--simThresh',default=-1,type='float',
                   help='threshold to use for similarity searching. If provided, this supersedes the topN argument')
+parser.add_option('--numWorkers',default=1,type='int',
+                  help='number of worker processes to use for the similarity search. The default is %default')
+parser.add_option('--usePackedFps',default=False,action='store_true',
+                  help='search the packed fingerprint file written by CreateDb --doPackedFps instead of the fingerprint database (RDK similarity only)')
+parser.add_option('--packedFpName',default='rdkitfps.fpb',
+                  help='name of the packed fingerprint file. The default is %default')
 
 if __name__=='__main__':
   import sys,getopt,time
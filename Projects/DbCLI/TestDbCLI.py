@@ -4,7 +4,7 @@
 #
 #   @@ All Rights Reserved  @@
 #
-import unittest,subprocess,os
+import unittest,subprocess,os,shutil
 from rdkit import RDConfig
 from rdkit.Dbase.DbConnection import DbConnect
 
@@ -340,8 +340,121 @@ class TestCase(unittest.TestCase):
       self.failUnless(v>0.7)
     os.unlink('testData/bzr/search.out')
 
+  def test2_9SearchPackedFps(self):
+    p = subprocess.Popen(('python', 'CreateDb.py','--dbDir=testData/bzr','--molFormat=sdf',
+                          '--noPairs','--noDescriptors','--doPackedFps',
+                          'testData/bzr.sdf'))
+    res=p.wait()
+    self.failIf(res)
+    p=None
+    self.failUnless(os.path.exists('testData/bzr/rdkitfps.fpb'))
+    self.failUnless(os.path.exists('testData/bzr/rdkitfps.fpb.ids'))
+
+    for extra in (('--topN=5',),('--simThresh=0.7',),('--topN=5','--metric=tversky','--tverskyA=0.8')):
+      res = []
+      for packed in ((),('--usePackedFps',)):
+        p = subprocess.Popen(('python', 'SearchDb.py','--dbDir=testData/bzr','--molFormat=sdf',
+                              '--outF=testData/bzr/search.out')+extra+packed+('testData/bzr.sdf',))
+        self.failIf(p.wait())
+        p=None
+        inF = file('testData/bzr/search.out','r')
+        res.append(inF.readlines())
+        inF=None
+        os.unlink('testData/bzr/search.out')
+      self.failUnlessEqual(len(res[0]),163)
+      self.failUnlessEqual(res[0],res[1])
+
+  def test3SearchWorkers(self):
+    for extra in (('--topN=5',),('--simThresh=0.7',),('--topN=5','--similarityType=AtomPairs'),
+                  ('--topN=5','--usePackedFps'),('--topN=5','--propQuery=activity>6.5')):
+      res = []
+      for workers in ('--numWorkers=1','--numWorkers=3','--numWorkers=4'):
+        p = subprocess.Popen(('python', 'SearchDb.py','--dbDir=testData/bzr','--molFormat=sdf',
+                              '--outF=testData/bzr/search.out',workers)+extra+('testData/bzr.sdf',))
+        self.failIf(p.wait())
+        p=None
+        inF = file('testData/bzr/search.out','r')
+        res.append(inF.readlines())
+        inF=None
+        os.unlink('testData/bzr/search.out')
+      self.failUnlessEqual(len(res[0]),163)
+      self.failUnlessEqual(res[0],res[1])
+      self.failUnlessEqual(res[0],res[2])
+
+  def test3_1CreateWorkers(self):
+    tables = (('AtomPairs.sqlt','atompairs'),('Fingerprints.sqlt','rdkitfps'),
+              ('Fingerprints.sqlt','layeredfps'),('Fingerprints.sqlt','morganfps'),
+              ('Descriptors.sqlt','descriptors_v1'))
+    res = []
+    for dbDir,extra in (('testData/bzr_1',()),
+                        ('testData/bzr_3',('--numWorkers=3','--batchSize=7','--rowsPerTransaction=20'))):
+      p = subprocess.Popen(('python', 'CreateDb.py','--dbDir=%s'%dbDir,'--molFormat=sdf',
+                            '--doPackedFps')+extra+('testData/bzr.sdf',))
+      self.failIf(p.wait())
+      p=None
+      # the checkpoint is removed once the build is complete:
+      self.failIf(os.path.exists(os.path.join(dbDir,'createdb.checkpoint')))
+      data = {}
+      for dbName,tableName in tables:
+        conn = DbConnect(os.path.join(dbDir,dbName))
+        d = conn.GetData(tableName,fields='*')
+        self.failUnlessEqual(len(d),163)
+        data[tableName] = [[str(x) for x in row] for row in d]
+        conn=None
+        d=None
+      data['packed'] = file(os.path.join(dbDir,'rdkitfps.fpb'),'rb').read()
+      res.append(data)
+    self.failUnlessEqual(res[0],res[1])
+    for dbDir in ('testData/bzr_1','testData/bzr_3'):
+      shutil.rmtree(dbDir)
+
+  def test3_2CreateResume(self):
+    tables = (('AtomPairs.sqlt','atompairs'),('Fingerprints.sqlt','rdkitfps'),
+              ('Fingerprints.sqlt','layeredfps'),('Fingerprints.sqlt','morganfps'),
+              ('Descriptors.sqlt','descriptors_v1'))
+    args = ('python', 'CreateDb.py','--molFormat=sdf','--doPackedFps','--batchSize=7',
+            '--rowsPerTransaction=20')
+
+    p = subprocess.Popen(args+('--dbDir=testData/bzr_full','testData/bzr.sdf'))
+    self.failIf(p.wait())
+    p=None
+
+    # stop the second build at the first checkpoint after 50 molecules:
+    dbDir = 'testData/bzr_resume'
+    p = subprocess.Popen(args+('--dbDir=%s'%dbDir,'--stopAfter=50','testData/bzr.sdf'))
+    self.failIf(p.wait())
+    p=None
+    self.failUnless(os.path.exists(os.path.join(dbDir,'createdb.checkpoint')))
+    self.failIf(os.path.exists(os.path.join(dbDir,'rdkitfps.fpb')))
+    self.failUnless(os.path.exists(os.path.join(dbDir,'rdkitfps.fpb.tmp')))
+    for dbName,tableName in tables:
+      conn = DbConnect(os.path.join(dbDir,dbName))
+      d = conn.GetData(tableName,fields='count(*)')
+      self.failUnless(50<=d[0][0]<163)
+      conn=None
+
+    p = subprocess.Popen(args+('--dbDir=%s'%dbDir,'--resume','--numWorkers=2','testData/bzr.sdf'))
+    self.failIf(p.wait())
+    p=None
+    self.failIf(os.path.exists(os.path.join(dbDir,'createdb.checkpoint')))
+
+    res = []
+    for dbDir in ('testData/bzr_full','testData/bzr_resume'):
+      data = {}
+      for dbName,tableName in tables:
+        conn = DbConnect(os.path.join(dbDir,dbName))
+        d = conn.GetData(tableName,fields='*')
+        self.failUnlessEqual(len(d),163)
+        data[tableName] = [[str(x) for x in row] for row in d]
+        conn=None
+        d=None
+      data['packed'] = file(os.path.join(dbDir,'rdkitfps.fpb'),'rb').read()
+      data['packedIds'] = file(os.path.join(dbDir,'rdkitfps.fpb.ids'),'rb').read()
+      res.append(data)
+    self.failUnlessEqual(res[0],res[1])
+    for dbDir in ('testData/bzr_full','testData/bzr_resume'):
+      shutil.rmtree(dbDir)
 
-    
   def test4CreateOptions(self):
     if os.path.exists('testData/bzr/Compounds.sqlt'):
       os.unlink('testData/bzr/Compounds.sqlt')
@@ -0,0 +1,50 @@
+""" compares TopNContainer with the heap-based TopNHeap and MultiProbeTopN
+
+usage: python bench_topn.py [nPoints] [nProbes]
+
+"""
+import time,random,sys
+import numpy
+from rdkit.DataStructs.TopNContainer import TopNContainer
+from rdkit.DataStructs.TopNHeap import TopNHeap,MultiProbeTopN
+from rdkit.RDLogger import logger
+logger = logger()
+
+nPts = 200000
+nProbes = 10
+if len(sys.argv)>1:
+  nPts = int(sys.argv[1])
+if len(sys.argv)>2:
+  nProbes = int(sys.argv[2])
+
+random.seed(23)
+# sorted input is the worst case for both containers: every point is accepted
+pts = sorted([random.random() for x in range(nPts)])
+scores = numpy.random.RandomState(23).random_sample((nProbes,nPts))
+blockSize = 1000
+
+logger.info('%d points, %d probes'%(nPts,nProbes))
+for k in (10,100,1000,10000):
+  t1=time.time()
+  cont = TopNContainer(k)
+  for i,pt in enumerate(pts):
+    cont.Insert(pt,i)
+  t2=time.time()
+  heap = TopNHeap(k)
+  for i,pt in enumerate(pts):
+    heap.Insert(pt,i)
+  t3=time.time()
+  assert cont.GetExtras()==heap.GetExtras()
+
+  conts = [TopNContainer(k) for x in range(nProbes)]
+  for i in range(nPts):
+    for j in range(nProbes):
+      conts[j].Insert(scores[j,i],i)
+  t4=time.time()
+  multi = MultiProbeTopN(nProbes,k)
+  for start in range(0,nPts,blockSize):
+    multi.AddScores(scores[:,start:start+blockSize],range(start,min(nPts,start+blockSize)))
+  t5=time.time()
+  for j in range(nProbes):
+    assert conts[j].GetExtras()==multi[j].GetExtras()
+  logger.info('k=%d: sorted input: TopNContainer %.2fs, TopNHeap %.2fs; random multi-probe: TopNContainer %.2fs, MultiProbeTopN %.2fs'%(k,t2-t1,t3-t2,t4-t3,t5-t4))
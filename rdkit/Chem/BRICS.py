@@ -36,6 +36,7 @@
 """
 from rdkit import Chem
 from rdkit.Chem import rdChemReactions as Reactions
+from rdkit.Chem.DecompositionCache import _CopyProducts
 import sys,re,random
 
 # These are the definitions that will be applied to fragment molecules:
@@ -378,10 +379,57 @@ def BreakBRICSBonds(mol,bonds=None,sanitize=True,silent=True):
         resConf.SetAtomPosition(ia,conf.GetAtomPosition(pa))
   return res
 
+def _BRICSGroupProducts(mol,nSmi,gpIdx,minFragmentSize,onlyUseReactions,silent):
+  """ *Internal Use Only*
+
+    applies a group of BRICS reactions to a molecule
+
+    **Returns**
+
+      a list with a list of (smiles,fragment) tuples for each of the
+      acceptable product sequences
+
+  """
+  res = []
+  for rxnIdx,reaction in enumerate(reactions[gpIdx]):
+    if onlyUseReactions and (gpIdx,rxnIdx) not in onlyUseReactions:
+      continue
+    if not silent:
+      print '--------'
+      print smartsGps[gpIdx][rxnIdx]
+    ps = reaction.RunReactants((mol,))
+    if ps:
+      if not silent: print  nSmi,'->',len(ps),'products'
+      for prodSeq in ps:
+        seqOk=True
+        # we want to disqualify small fragments, so sort the product sequence by size
+        prodSeq = [(prod.GetNumAtoms(onlyExplicit=True),prod) for prod in prodSeq]
+        prodSeq.sort()
+        for nats,prod in prodSeq:
+          try:
+            Chem.SanitizeMol(prod)
+          except:
+            continue
+          pSmi = Chem.MolToSmiles(prod,1)
+          if minFragmentSize>0:
+            nDummies = pSmi.count('*')
+            if nats-nDummies<minFragmentSize:
+              seqOk=False
+              break
+          prod.pSmi = pSmi
+        if seqOk:
+          res.append([(prod.pSmi,prod) for nats,prod in prodSeq])
+  return res
+
 def BRICSDecompose(mol,allNodes=None,minFragmentSize=1,onlyUseReactions=None,
-                   silent=True,keepNonLeafNodes=False,singlePass=False,returnMols=False):
+                   silent=True,keepNonLeafNodes=False,singlePass=False,returnMols=False,
+                   cache=None):
   """ returns the BRICS decomposition for a molecule
 
+  If a _DecompositionCache_ is provided with the _cache_ argument, the
+  results of breaking up each fragment are stored in it and reused
+  for any other molecule containing the same fragment.
+
   >>> from rdkit import Chem
   >>> m = Chem.MolFromSmiles('CCCOCc1cc(c2ncccc2)ccc1')
   >>> res = list(BRICSDecompose(m))
@@ -442,6 +490,10 @@ def BRICSDecompose(mol,allNodes=None,minFragmentSize=1,onlyUseReactions=None,
   if mSmi in allNodes:
     return set()
 
+  if onlyUseReactions:
+    rxnKey = tuple(sorted(onlyUseReactions))
+  else:
+    rxnKey = None
   activePool={mSmi:mol}
   allNodes.add(mSmi)
   foundMols={mSmi:mol}
@@ -451,42 +503,25 @@ def BRICSDecompose(mol,allNodes=None,minFragmentSize=1,onlyUseReactions=None,
       matched=False
       nSmi = activePool.keys()[0]
       mol = activePool.pop(nSmi)
-      for rxnIdx,reaction in enumerate(reactionGp):
-        if onlyUseReactions and (gpIdx,rxnIdx) not in onlyUseReactions:
-          continue
-        if not silent:
-          print '--------'
-          print smartsGps[gpIdx][rxnIdx]
-        ps = reaction.RunReactants((mol,))
-        if ps:
-          if not silent: print  nSmi,'->',len(ps),'products'
-          for prodSeq in ps:
-            seqOk=True
-            # we want to disqualify small fragments, so sort the product sequence by size
-            prodSeq = [(prod.GetNumAtoms(onlyExplicit=True),prod) for prod in prodSeq]
-            prodSeq.sort()
-            for nats,prod in prodSeq:
-              try:
-                Chem.SanitizeMol(prod)
-              except:
-                continue
-              pSmi = Chem.MolToSmiles(prod,1)
-              if minFragmentSize>0:
-                nDummies = pSmi.count('*')
-                if nats-nDummies<minFragmentSize:
-                  seqOk=False
-                  break
-              prod.pSmi = pSmi
-            if seqOk:
-              matched=True
-              for nats,prod in prodSeq:
-                pSmi = prod.pSmi
-                #print '\t',nats,pSmi
-                if pSmi not in allNodes:
-                  if not singlePass:
-                    activePool[pSmi] = prod
-                  allNodes.add(pSmi)
-                  foundMols[pSmi]=prod
+      if cache is not None:
+        key = ('BRICS',gpIdx,minFragmentSize,rxnKey,nSmi)
+        prods = cache.Get(key)
+        if prods is None:
+          prods = _BRICSGroupProducts(mol,nSmi,gpIdx,minFragmentSize,onlyUseReactions,silent)
+          cache.Set(key,_CopyProducts(prods))
+        else:
+          # don't share the cached molecules with the caller:
+          prods = _CopyProducts(prods)
+      else:
+        prods = _BRICSGroupProducts(mol,nSmi,gpIdx,minFragmentSize,onlyUseReactions,silent)
+      for prodSeq in prods:
+        matched=True
+        for pSmi,prod in prodSeq:
+          if pSmi not in allNodes:
+            if not singlePass:
+              activePool[pSmi] = prod
+            allNodes.add(pSmi)
+            foundMols[pSmi]=prod
       if singlePass or keepNonLeafNodes or not matched:
         newPool[nSmi]=mol
     activePool = newPool
@@ -505,63 +540,233 @@ def BRICSDecompose(mol,allNodes=None,minFragmentSize=1,onlyUseReactions=None,
 
 import random
 dummyPattern=Chem.MolFromSmiles('[*]')
+
+def _DummyLabels(mol):
+  """ *Internal Use Only*
+
+    returns the labels (isotopes) of a molecule's dummy atoms.  The
+    reverse reactions' matchers are single dummy atoms, so whether or not
+    a molecule matches them depends only on these.
+
+  """
+  return frozenset([at.GetIsotope() for at in mol.GetAtoms() if not at.GetAtomicNum()])
+
+class _BRICSBuildIndex(object):
+  """ *Internal Use Only*
+
+    records which reverse reactions each of a pool of fragments can take
+    part in, so that BRICSBuild doesn't need to repeat the substructure
+    searches for every seed at every depth
+
+  """
+  def __init__(self,fragments):
+    self.fragments = list(fragments)
+    self._rxnIndices = dict([(id(rxn),i) for i,rxn in enumerate(reverseReactions)])
+    self._labelMatches = {}
+    # candidates[i] has the (fragment,matches first reactant,matches second reactant)
+    # tuples for the fragments which can react using reverseReactions[i]:
+    self.candidates = [[] for rxn in reverseReactions]
+    for fragment in self.fragments:
+      matches = self.GetMatches(fragment)
+      for i,(m0,m1) in enumerate(matches):
+        if m0 or m1:
+          self.candidates[i].append((fragment,m0,m1))
+
+  def GetMatches(self,mol):
+    """ returns a tuple with a (matches first reactant,matches second
+    reactant) pair for each of the reverse reactions
+
+    """
+    labels = _DummyLabels(mol)
+    res = self._labelMatches.get(labels,None)
+    if res is None:
+      res = tuple([(mol.HasSubstructMatch(rxn._matchers[0]),
+                    mol.HasSubstructMatch(rxn._matchers[1])) for rxn in reverseReactions])
+      self._labelMatches[labels] = res
+    return res
+
+  def GetCandidates(self,rxn):
+    return self.candidates[self._rxnIndices[id(rxn)]]
+
+  def GetReactionIndex(self,rxn):
+    return self._rxnIndices[id(rxn)]
+
+def _BuildProducts(index,seed,reactions,onlyCompleteMols,uniquify,seen):
+  """ *Internal Use Only*
+
+    runs the reverse reactions between a seed and the fragments
+
+    **Returns**
+
+      a 2-tuple:
+
+        1) a list of (smiles,product) tuples for the products to be returned;
+           smiles is None if _uniquify_ is not set
+
+        2) the list of products which can be built up further
+
+  """
+  seedMatches = index.GetMatches(seed)
+  seedIsR1=False
+  seedIsR2=False
+  res = []
+  nextSteps=[]
+  for rxn in reactions:
+    rxnIdx = index.GetReactionIndex(rxn)
+    m0,m1 = seedMatches[rxnIdx]
+    if m0:
+      seedIsR1=True
+    if m1:
+      seedIsR2=True
+    if not (seedIsR1 or seedIsR2):
+      continue
+    for fragment,fragIsR1,fragIsR2 in index.candidates[rxnIdx]:
+      ps = None
+      if fragIsR1 and seedIsR2:
+        ps = rxn.RunReactants((fragment,seed))
+      if fragIsR2 and seedIsR1:
+        ps = rxn.RunReactants((seed,fragment))
+      if ps:
+        for p in ps:
+          pSmi = None
+          if uniquify:
+            pSmi =Chem.MolToSmiles(p[0],True)
+            if pSmi in seen:
+              continue
+            else:
+              seen.add(pSmi)
+          if p[0].HasSubstructMatch(dummyPattern):
+            nextSteps.append(p[0])
+            if not onlyCompleteMols:
+              res.append((pSmi,p[0]))
+          else:
+            res.append((pSmi,p[0]))
+  return res,nextSteps
+
+def _BRICSBuild(index,onlyCompleteMols,seeds,uniquify,scrambleReagents,maxDepth):
+  """ *Internal Use Only*
+
+    generates (smiles,product) tuples for BRICSBuild
+
+    The enumeration works through an explicit stack of levels instead of
+    recursing.  Each level has its own set of products seen; products are
+    only returned if none of the levels above them has seen them yet.
+
+  """
+  def newLevel(seeds,scramble,depth):
+    if scramble:
+      seeds = list(seeds)
+      random.shuffle(seeds)
+      rxns = list(reverseReactions)
+      random.shuffle(rxns)
+    else:
+      rxns = reverseReactions
+    return [iter(seeds),rxns,set(),depth]
+
+  stack = [newLevel(seeds,scrambleReagents,maxDepth)]
+  while stack:
+    level = stack[-1]
+    seedIter,rxns,seen,depth = level
+    try:
+      seed = seedIter.next()
+    except StopIteration:
+      stack.pop()
+      continue
+    res,nextSteps = _BuildProducts(index,seed,rxns,onlyCompleteMols,uniquify,seen)
+    for pSmi,p in res:
+      if uniquify:
+        # the levels above this one filter the product too:
+        for parent in reversed(stack[:-1]):
+          if pSmi in parent[2]:
+            break
+          parent[2].add(pSmi)
+        else:
+          yield pSmi,p
+      else:
+        yield pSmi,p
+    if nextSteps and depth>0:
+      # lower levels always scramble their reagents:
+      stack.append(newLevel(nextSteps,True,depth-1))
+
+_buildData = None
+def _initBuildWorker(buildData):
+  global _buildData
+  fragments,onlyCompleteMols,uniquify,scrambleReagents,maxDepth = buildData
+  _buildData = (_BRICSBuildIndex(fragments),onlyCompleteMols,uniquify,scrambleReagents,
+                maxDepth)
+
+def _buildChunk(seeds):
+  """ enumerates the products of a chunk of seeds using the data set
+  up by _initBuildWorker()
+
+  """
+  index,onlyCompleteMols,uniquify,scrambleReagents,maxDepth = _buildData
+  return list(_BRICSBuild(index,onlyCompleteMols,seeds,uniquify,scrambleReagents,maxDepth))
+
 def BRICSBuild(fragments,onlyCompleteMols=True,seeds=None,uniquify=True,
-               scrambleReagents=True,maxDepth=3):
-  seen = set()
+               scrambleReagents=True,maxDepth=3,numWorkers=0,chunkSize=10):
+  """ generates molecules by combining BRICS fragments
+
+    **Arguments**
+
+      - fragments: the fragments (molecules with labelled dummy atoms) to use
+
+      - onlyCompleteMols: (optional) if set, only products without dummy
+        atoms are returned
+
+      - seeds: (optional) the molecules to start from.  Defaults to
+        _fragments_
+
+      - uniquify: (optional) if set, each product is only returned once
+
+      - scrambleReagents: (optional) if set, the seeds and reactions are
+        used in random order
+
+      - maxDepth: (optional) the number of times products are combined
+        with fragments again
+
+      - numWorkers: (optional) if this is larger than 1, the seeds are
+        split into chunks of _chunkSize_ which are processed by a pool of
+        this many processes.  The products are returned in a different
+        order and, since each chunk of seeds is enumerated independently,
+        products are only filtered across chunks as they are returned.
+
+    **Returns**
+
+      a generator for the products.  Products are generated as needed
+      and, with _uniquify_ set, only their SMILES are stored, so large
+      libraries can be written out as they are built.
+
+  """
   if not seeds:
     seeds = list(fragments)
+  if numWorkers<=1:
+    index = _BRICSBuildIndex(fragments)
+    for pSmi,p in _BRICSBuild(index,onlyCompleteMols,seeds,uniquify,scrambleReagents,maxDepth):
+      yield p
+    return
+
+  seeds = list(seeds)
   if scrambleReagents:
-    seeds = list(seeds)
     random.shuffle(seeds)
-  if scrambleReagents:
-    tempReactions = list(reverseReactions)
-    random.shuffle(tempReactions)
-  else:
-    tempReactions=reverseReactions
-  for seed in seeds:
-    seedIsR1=False
-    seedIsR2=False
-    nextSteps=[]
-    for rxn in tempReactions:
-      if seed.HasSubstructMatch(rxn._matchers[0]):
-        seedIsR1=True
-      if seed.HasSubstructMatch(rxn._matchers[1]):
-        seedIsR2=True
-      for fragment in fragments:
-        ps = None
-        if fragment.HasSubstructMatch(rxn._matchers[0]):
-          if seedIsR2:
-            ps = rxn.RunReactants((fragment,seed))
-        if fragment.HasSubstructMatch(rxn._matchers[1]):
-          if seedIsR1:
-            ps = rxn.RunReactants((seed,fragment))
-        if ps:
-          for p in ps:
-            if uniquify:
-              pSmi =Chem.MolToSmiles(p[0],True)
-              if pSmi in seen:
-                continue
-              else:
-                seen.add(pSmi)
-            if p[0].HasSubstructMatch(dummyPattern):
-              nextSteps.append(p[0])
-              if not onlyCompleteMols:
-                yield p[0]
-            else:
-              yield p[0]
-    if nextSteps and maxDepth>0:
-      for p in BRICSBuild(fragments,onlyCompleteMols=onlyCompleteMols,
-                          seeds=nextSteps,uniquify=uniquify,
-                          maxDepth=maxDepth-1):
+  chunks = [seeds[i:i+chunkSize] for i in range(0,len(seeds),chunkSize)]
+  import multiprocessing
+  pool = multiprocessing.Pool(numWorkers,_initBuildWorker,
+                              ((list(fragments),onlyCompleteMols,uniquify,scrambleReagents,
+                                maxDepth),))
+  seen = set()
+  try:
+    # imap hands the results back in order:
+    for res in pool.imap(_buildChunk,chunks):
+      for pSmi,p in res:
         if uniquify:
-          pSmi =Chem.MolToSmiles(p,True)
           if pSmi in seen:
             continue
-          else:
-            seen.add(pSmi)
+          seen.add(pSmi)
         yield p
-  
-
+  finally:
+    pool.terminate()
+    pool.join()
 
 # ------- ------- ------- ------- ------- ------- ------- -------
 # Begin testing code
@@ -969,6 +1174,53 @@ M  END
       atIds = [x[0] for x in res]
       atIds.sort()
       self.failUnlessEqual(atIds,[(5,2), (6,5)])
+
+    def test13(self):
+      " BRICSBuild's fragment index and worker processes "
+      frags = [Chem.MolFromSmiles(x) for x in ('[16*]c1ccccc1','[3*]OC','[3*]OCC(=O)[6*]',
+                                               '[14*]c1ncncn1','[9*]n1cccc1')]
+      index = _BRICSBuildIndex(frags)
+      for rxn in reverseReactions:
+        for frag in frags:
+          m0,m1 = index.GetMatches(frag)[index.GetReactionIndex(rxn)]
+          self.failUnlessEqual(m0,frag.HasSubstructMatch(rxn._matchers[0]))
+          self.failUnlessEqual(m1,frag.HasSubstructMatch(rxn._matchers[1]))
+
+      random.seed(23)
+      ref = [Chem.MolToSmiles(x,True) for x in BRICSBuild(frags)]
+      random.seed(23)
+      smis = [Chem.MolToSmiles(x,True) for x in BRICSBuild(frags,numWorkers=1)]
+      self.failUnlessEqual(smis,ref)
+
+      smis = [Chem.MolToSmiles(x,True) for x in BRICSBuild(frags,numWorkers=2,chunkSize=2)]
+      self.failUnlessEqual(len(smis),len(set(smis)))
+      for smi in ('c1ccc(-c2ccccc2)cc1','COc1ccccc1','c1ccn(-c2ccccc2)c1'):
+        self.failUnless(smi in ref)
+        self.failUnless(smi in smis)
+
+    def test14(self):
+      " decomposition caches "
+      from rdkit.Chem import DecompositionCache
+      smis = ['CCCOCc1cc(c2ncccc2)ccc1','CCCOCc1cc(c2ncccc2)ccc1OC','n1cncnc1OCC(C1CC1)OC1CNC1',
+              'CNC(=O)C1=NC=CC(OC2=CC=C(NC(=O)NC3=CC(=C(Cl)C=C3)C(F)(F)F)C=C2)=C1']*3
+      ref = [set(BRICSDecompose(Chem.MolFromSmiles(x))) for x in smis]
+      cache = DecompositionCache.DecompositionCache(maxSize=10)
+      res = [set(BRICSDecompose(Chem.MolFromSmiles(x),cache=cache)) for x in smis]
+      self.failUnlessEqual(res,ref)
+      self.failUnless(len(cache)<=10)
+
+      res,hitRate = DecompositionCache.DecomposeMols(smis)
+      self.failUnlessEqual(res,ref)
+      self.failUnless(hitRate>0.5)
+      res,hitRate = DecompositionCache.DecomposeMols(smis,numWorkers=2,chunkSize=4)
+      self.failUnlessEqual(res,ref)
+      self.failUnless(hitRate>0)
+
+      m = Chem.MolFromSmiles(smis[0])
+      ref = sorted([Chem.MolToSmiles(x,True) for x in BRICSDecompose(m,returnMols=True)])
+      for i in range(2):
+        res = BRICSDecompose(m,returnMols=True,cache=cache)
+        self.failUnlessEqual(sorted([Chem.MolToSmiles(x,True) for x in res]),ref)
       
       
 
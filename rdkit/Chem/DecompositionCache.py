@@ -0,0 +1,256 @@
+# $Id$
+#
+#  This file is part of the RDKit.
+#  The contents are covered by the terms of the BSD license
+#  which is included in the file license.txt, found at the root
+#  of the RDKit source tree.
+#
+""" a cache of fragment decompositions which can be shared between
+molecules
+
+BRICS.BRICSDecompose() and Recap.RecapDecompose() both take an optional
+cache argument.  The cache maps the canonical SMILES of each fragment
+(along with the decomposition settings) to the fragment's immediate
+children, so fragments shared by many molecules only need to be broken
+up once:
+
+>>> from rdkit.Chem import BRICS
+>>> cache = DecompositionCache()
+>>> m = Chem.MolFromSmiles('CCCOCc1cc(c2ncccc2)ccc1')
+>>> sorted(BRICS.BRICSDecompose(m,cache=cache))
+['[14*]c1ccccn1', '[16*]c1cccc([16*])c1', '[3*]O[3*]', '[4*]CCC', '[4*]C[8*]']
+>>> cache.GetHitRate()
+0.0
+
+the second time around, everything comes from the cache:
+>>> sorted(BRICS.BRICSDecompose(m,cache=cache))
+['[14*]c1ccccn1', '[16*]c1cccc([16*])c1', '[3*]O[3*]', '[4*]CCC', '[4*]C[8*]']
+>>> cache.GetHitRate()
+0.5
+
+"""
+from rdkit import Chem
+import collections,cPickle,os
+
+class DecompositionCache(object):
+  """ a size-limited store of decomposition results
+
+    When the cache is full, the entries which were used least recently
+    are discarded.
+
+  """
+  def __init__(self,maxSize=100000,fileName=None):
+    """ Constructor
+
+      **Arguments**
+
+        - maxSize: (optional) the maximum number of fragments stored
+
+        - fileName: (optional) the name of a file used to store the
+          cache.  If the file exists, the cache is initialized from it.
+
+    """
+    self.maxSize = maxSize
+    self.fileName = fileName
+    self._data = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    if fileName and os.path.exists(fileName):
+      self.Load(fileName)
+
+  def __len__(self):
+    return len(self._data)
+
+  def __contains__(self,key):
+    return key in self._data
+
+  def Get(self,key):
+    """ returns the value stored for _key_ (None if there isn't one) """
+    try:
+      val = self._data.pop(key)
+    except KeyError:
+      self.misses += 1
+      return None
+    self.hits += 1
+    self._data[key] = val
+    return val
+
+  def Set(self,key,val):
+    """ stores a value, discarding the least recently used entries if
+    the cache is full
+
+    """
+    self._data.pop(key,None)
+    self._data[key] = val
+    while len(self._data)>self.maxSize:
+      self._data.popitem(last=False)
+
+  def Clear(self):
+    """ removes all entries and resets the statistics """
+    self._data.clear()
+    self.hits = 0
+    self.misses = 0
+
+  def GetHitRate(self):
+    """ returns the fraction of lookups which found an entry """
+    nLookups = self.hits+self.misses
+    if not nLookups:
+      return 0.0
+    return float(self.hits)/nLookups
+
+  def Save(self,fileName=None):
+    """ writes the cache entries to a file
+
+      **Arguments**
+
+        - fileName: (optional) the name of the file; defaults to the
+          file the cache was constructed with
+
+    """
+    if fileName is None:
+      fileName = self.fileName
+    if not fileName:
+      raise ValueError,'no file name provided'
+    outF = open(fileName,'wb+')
+    cPickle.dump(self._data.items(),outF,2)
+    outF.close()
+
+  def Load(self,fileName):
+    """ adds the entries stored in a file to the cache """
+    inF = open(fileName,'rb')
+    items = cPickle.load(inF)
+    inF.close()
+    for key,val in items:
+      self.Set(key,val)
+
+def _CopyProducts(prods):
+  """ *Internal Use Only*
+
+    copies the fragments in a cached list of product sequences (lists of
+    (smiles,fragment) tuples), so that the cached molecules aren't shared
+    with callers
+
+  """
+  res = []
+  for prodSeq in prods:
+    seq = []
+    for pSmi,prod in prodSeq:
+      prod = Chem.Mol(prod)
+      prod.pSmi = pSmi
+      seq.append((pSmi,prod))
+    res.append(seq)
+  return res
+
+_decompData = None
+def _initDecompWorker(decompData):
+  global _decompData
+  method,kwargs,maxSize,fileName = decompData
+  _decompData = (method,kwargs,DecompositionCache(maxSize=maxSize,fileName=fileName))
+
+def _decompChunk(smis):
+  """ decomposes a chunk of molecules using the data set up by
+  _initDecompWorker()
+
+  """
+  method,kwargs,cache = _decompData
+  hits,misses = cache.hits,cache.misses
+  res = _DecomposeSmiles(smis,method,kwargs,cache)
+  return res,cache.hits-hits,cache.misses-misses
+
+def _DecomposeSmiles(smis,method,kwargs,cache):
+  from rdkit.Chem import BRICS,Recap
+  res = []
+  for smi in smis:
+    mol = Chem.MolFromSmiles(smi)
+    if mol is None:
+      res.append(None)
+    elif method=='BRICS':
+      res.append(set(BRICS.BRICSDecompose(mol,cache=cache,**kwargs)))
+    else:
+      res.append(set(Recap.RecapDecompose(mol,cache=cache,**kwargs).GetLeaves().keys()))
+  return res
+
+def DecomposeMols(smis,method='BRICS',numWorkers=0,chunkSize=100,cache=None,
+                  maxSize=100000,fileName=None,**kwargs):
+  """ decomposes a set of molecules using a shared cache of fragment
+  decompositions
+
+    **Arguments**
+
+      - smis: a sequence of SMILES
+
+      - method: (optional) 'BRICS' or 'Recap'
+
+      - numWorkers: (optional) if this is larger than 1, a pool of this
+        many processes is used.  Each process has its own cache.
+
+      - chunkSize: (optional) the number of molecules handed to a worker
+        process at a time
+
+      - cache: (optional) the cache to use when _numWorkers_ is not set
+
+      - maxSize, fileName: (optional) used to construct the caches which
+        are not provided.  The worker processes only read _fileName_;
+        when working in a single process, the cache is saved to it at
+        the end.
+
+      - any other keyword arguments are passed to the decomposition
+        function
+
+    **Returns**
+
+      a 2-tuple:
+
+        1) a list with, for each molecule, the set of fragment SMILES
+           from BRICSDecompose() or the SMILES of the leaves of the
+           RecapDecompose() hierarchy (None for SMILES which could not
+           be parsed)
+
+        2) the cache hit rate
+
+  """
+  if method not in ('BRICS','Recap'):
+    raise ValueError,'unknown decomposition method %s'%(repr(method))
+  if numWorkers<=1:
+    if cache is None:
+      cache = DecompositionCache(maxSize=maxSize,fileName=fileName)
+    hits,misses = cache.hits,cache.misses
+    res = _DecomposeSmiles(smis,method,kwargs,cache)
+    hits,misses = cache.hits-hits,cache.misses-misses
+    if fileName:
+      cache.Save(fileName)
+  else:
+    smis = list(smis)
+    chunks = [smis[i:i+chunkSize] for i in range(0,len(smis),chunkSize)]
+    import multiprocessing
+    pool = multiprocessing.Pool(numWorkers,_initDecompWorker,
+                                ((method,kwargs,maxSize,fileName),))
+    res = []
+    hits = misses = 0
+    try:
+      # imap hands the results back in order:
+      for chunkRes,chunkHits,chunkMisses in pool.imap(_decompChunk,chunks):
+        res.extend(chunkRes)
+        hits += chunkHits
+        misses += chunkMisses
+    finally:
+      pool.terminate()
+      pool.join()
+  if hits+misses:
+    hitRate = float(hits)/(hits+misses)
+  else:
+    hitRate = 0.0
+  return res,hitRate
+
+#------------------------------------
+#
+#  doctest boilerplate
+#
+def _test():
+  import doctest,sys
+  return doctest.testmod(sys.modules["__main__"])
+
+if __name__ == '__main__':
+  import sys
+  failed,tried = _test()
+  sys.exit(failed)
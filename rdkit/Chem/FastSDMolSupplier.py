@@ -7,7 +7,8 @@
 #  which is included in the file license.txt, found at the root
 #  of the RDKit source tree.
 #
-import sys
+import sys,os,mmap,struct
+import numpy
 from rdkit import Chem
 
 class FastSDMolSupplier(object):
@@ -17,6 +18,8 @@ class FastSDMolSupplier(object):
 
       NOTE that this class needs to have the entire SD data in memory,
       so it's probably not particularly useful with large files.
+      IndexedSDMolSupplier provides the same functionality for files
+      of any size.
   """
   suppl=None
   data=None
@@ -80,3 +83,220 @@ class FastSDMolSupplier(object):
     return self.suppl[idx]
   
 
+
+
+_indexMagic='RDKSDI01'
+_indexHeaderFormat='<8sqqq'
+_indexHeaderSize=struct.calcsize(_indexHeaderFormat)
+
+def _fileSignature(fileN):
+  st = os.stat(fileN)
+  return st.st_size,int(st.st_mtime)
+
+def BuildSDIndex(data,recogTxt='$$$$'):
+  r""" returns the offsets of the records in SD data (a string or mmap)
+
+    The result has one more element than there are records; record i
+    runs from offsets[i] to offsets[i+1]. The record terminator lines
+    are included in the records.
+
+  >>> txt = 'a\n$$$$\nb\nc\n$$$$\n'
+  >>> list(BuildSDIndex(txt))
+  [0, 7, 16]
+
+  A final record without a terminator is included, trailing blank
+  lines are not:
+  >>> list(BuildSDIndex(txt+'d\n'))
+  [0, 7, 16, 18]
+  >>> list(BuildSDIndex(txt+'\n\n'))
+  [0, 7, 16]
+  >>> list(BuildSDIndex('a\r\n$$$$\r\nb\r\n$$$$\r\n'))
+  [0, 9, 18]
+
+  """
+  size = len(data)
+  nRecog = len(recogTxt)
+  pos = [0]
+  # the terminators have to be at the start of a line:
+  if data[:nRecog]==recogTxt:
+    p = 0
+  else:
+    p = data.find('\n'+recogTxt)
+    if p!=-1:
+      p+=1
+  while p!=-1:
+    eol = data.find('\n',p+nRecog)
+    if eol==-1:
+      pos.append(size)
+      break
+    pos.append(eol+1)
+    p = data.find('\n'+recogTxt,eol)
+    if p!=-1:
+      p+=1
+  if pos[-1]<size and data[pos[-1]:size].strip():
+    pos.append(size)
+  return numpy.array(pos,numpy.int64)
+
+def WriteSDIndex(indexFileN,fileN,offsets):
+  """ saves the offsets for SD file fileN to indexFileN """
+  size,mtime = _fileSignature(fileN)
+  outF = file(indexFileN+'.tmp','wb')
+  outF.write(struct.pack(_indexHeaderFormat,_indexMagic,size,mtime,len(offsets)))
+  outF.write(numpy.asarray(offsets,'<i8').tostring())
+  outF.close()
+  if os.path.exists(indexFileN):
+    os.unlink(indexFileN)
+  os.rename(indexFileN+'.tmp',indexFileN)
+
+def ReadSDIndex(indexFileN,fileN):
+  """ returns the offsets stored in indexFileN, or None if the index
+  is missing or does not match the current contents of fileN
+
+  """
+  try:
+    inF = file(indexFileN,'rb')
+  except IOError:
+    return None
+  data = inF.read()
+  inF.close()
+  if len(data)<_indexHeaderSize:
+    return None
+  magic,size,mtime,nOffsets = struct.unpack(_indexHeaderFormat,data[:_indexHeaderSize])
+  if magic!=_indexMagic or (size,mtime)!=_fileSignature(fileN):
+    return None
+  if len(data)!=_indexHeaderSize+8*nOffsets:
+    return None
+  return numpy.frombuffer(data,'<i8',offset=_indexHeaderSize).astype(numpy.int64)
+
+class IndexedSDMolSupplier(object):
+  """ random access to the molecules in an SD file of any size
+
+      The file is opened with mmap and the record offsets are stored
+      in an index file (by default fileN+'.idx'). The index is built
+      on the first use of a file and reused as long as the file's size
+      and modification time do not change. If the index file cannot be
+      written, the index is only kept in memory.
+
+      Records are only read (and parsed) on demand, so len(), random
+      access and GetItemText() do not require the file to fit in
+      memory.
+
+      GetChunks() splits the supplier into contiguous pieces that can
+      be pickled and handed to worker processes; unpickling a chunk
+      reopens the file instead of copying its contents.
+  """
+  def __init__(self,fileN,sanitize=True,removeHs=True,indexFileN=None,
+               rebuildIndex=False):
+    self.fileN = fileN
+    self.sanitize = sanitize
+    self.removeHs = removeHs
+    if indexFileN is None:
+      indexFileN = fileN+'.idx'
+    self.indexFileN = indexFileN
+    self._open()
+    offsets = None
+    if not rebuildIndex:
+      offsets = ReadSDIndex(indexFileN,fileN)
+    if offsets is None:
+      offsets = BuildSDIndex(self._data)
+      try:
+        WriteSDIndex(indexFileN,fileN,offsets)
+      except (IOError,OSError):
+        pass
+    self._offsets = offsets
+    self._idx = 0
+
+  def _open(self):
+    if os.path.getsize(self.fileN):
+      inF = file(self.fileN,'rb')
+      self._data = mmap.mmap(inF.fileno(),0,access=mmap.ACCESS_READ)
+      inF.close()
+    else:
+      # empty files cannot be mapped:
+      self._data = ''
+    self._suppl = None
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    del state['_data']
+    del state['_suppl']
+    return state
+  def __setstate__(self,state):
+    self.__dict__.update(state)
+    self._open()
+
+  def GetItemText(self,idx):
+    """ returns a read-only buffer onto the text of record idx,
+    the file contents are not copied
+
+    """
+    if idx<0:
+      idx += len(self)
+    if idx<0 or idx>=len(self):
+      raise IndexError,'index %d out of range'%idx
+    start = int(self._offsets[idx])
+    return buffer(self._data,start,int(self._offsets[idx+1])-start)
+
+  def GetChunks(self,nChunks):
+    """ returns a list of up to nChunks suppliers covering contiguous,
+    roughly equal-sized ranges of the records
+
+    """
+    nChunks = max(1,min(nChunks,len(self)))
+    bounds = numpy.linspace(0,len(self),nChunks+1).astype(int)
+    res = []
+    for i in range(nChunks):
+      chunk = self.__class__.__new__(self.__class__)
+      chunk.__dict__.update(self.__getstate__())
+      chunk._data = self._data
+      chunk._suppl = None
+      chunk._offsets = self._offsets[bounds[i]:bounds[i+1]+1]
+      chunk._idx = 0
+      res.append(chunk)
+    return res
+
+  def _parse(self,idx):
+    if self._suppl is None:
+      self._suppl = Chem.SDMolSupplier()
+    self._suppl.SetData(str(self.GetItemText(idx)),sanitize=self.sanitize,
+                        removeHs=self.removeHs)
+    try:
+      return self._suppl.next()
+    except StopIteration:
+      return None
+
+  def reset(self):
+    self._idx=0
+
+  # ----------------------------------------------------------------
+  # support random access and an iterator interface:
+  def __iter__(self):
+    self.reset()
+    return self
+  def next(self):
+    if self._idx>=len(self):
+      raise StopIteration
+    self._idx+=1
+    return self._parse(self._idx-1)
+
+  def __len__(self):
+    return max(0,len(self._offsets)-1)
+  def __getitem__(self,idx):
+    if idx<0:
+      idx += len(self)
+    if idx<0 or idx>=len(self):
+      raise IndexError,'index %d out of range'%idx
+    return self._parse(idx)
+
+#------------------------------------
+#
+#  doctest boilerplate
+#
+def _test():
+  import doctest,sys
+  return doctest.testmod(sys.modules["__main__"])
+
+if __name__ == '__main__':
+  import sys
+  failed,tried = _test()
+  sys.exit(failed)
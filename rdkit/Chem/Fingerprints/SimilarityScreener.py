@@ -14,7 +14,7 @@ See _SimilarityScreener_ for overview of required API
 
 """
 from rdkit import DataStructs
-from rdkit.DataStructs import TopNContainer
+from rdkit.DataStructs import TopNHeap
 from rdkit import RDConfig
 
 class SimilarityScreener(object):
@@ -80,13 +80,58 @@ class ThresholdScreener(SimilarityScreener):
      - The thinness and laziness forces us to support only forward
        iteration (not random access)
 
+     - If a DataStructs.PopcountIndex.PopcountIndex over the
+       fingerprints of the data source is provided as the index
+       argument, the Tanimoto and Dice similarity bounds are used to
+       skip compounds that cannot reach the threshold. The hits and
+       their order are the same as without the index. Hits come from
+       the index's extras if it has them, otherwise from
+       dataSource[idx].
+
   """
-  def __init__(self,threshold,**kwargs):
+  def __init__(self,threshold,index=None,**kwargs):
     SimilarityScreener.__init__(self,**kwargs)
     self.threshold = threshold
-    self.dataIter = iter(self.dataSource)
+    self.index = index
+    self._initIter()
   # FIX: add setters/getters for attributes
 
+  def _initIter(self):
+    """ *Internal use only* """
+    if self.index is None:
+      self.dataIter = iter(self.dataSource)
+    else:
+      self.dataIter = self._indexIter()
+
+  def _indexIter(self):
+    """ *Internal use only*
+
+      generator over the (fingerprint,object) pairs that survive the
+      popcount bounds
+
+    """
+    probe = self.probe
+    nBits = self.index.GetNumBits()
+    if nBits and probe.GetNumBits()>nBits:
+      probe = DataStructs.FoldFingerprint(probe,probe.GetNumBits()/nBits)
+    if nBits and probe.GetNumBits()==nBits:
+      if self.metric==DataStructs.TanimotoSimilarity:
+        metricName='tanimoto'
+      elif self.metric==DataStructs.DiceSimilarity:
+        metricName='dice'
+      else:
+        metricName=''
+      candidates = self.index.GetCandidates(probe.GetNumOnBits(),self.threshold,metricName)
+    else:
+      # the index fingerprints will be folded, so the bounds don't apply
+      candidates = range(len(self.index))
+    for idx in candidates:
+      if self.index.HasExtras():
+        obj = self.index.GetExtra(idx)
+      else:
+        obj = self.dataSource[int(idx)]
+      yield self.index.GetFingerprint(idx),obj
+
   def _nextMatch(self):
     """ *Internal use only* """
     done = 0
@@ -95,8 +140,11 @@ class ThresholdScreener(SimilarityScreener):
     while not done:
       # this is going to crap out when the data source iterator finishes,
       #  that's how we stop when no match is found
-      obj = self.dataIter.next()
-      fp = self.fingerprinter(obj)
+      if self.index is None:
+        obj = self.dataIter.next()
+        fp = self.fingerprinter(obj)
+      else:
+        fp,obj = self.dataIter.next()
       sim = DataStructs.FingerprintSimilarity(fp,self.probe,self.metric)
       if sim >= self.threshold:
         res = obj
@@ -107,8 +155,9 @@ class ThresholdScreener(SimilarityScreener):
     """ used to reset our internal state so that iteration
       starts again from the beginning
     """
-    self.dataSource.reset()
-    self.dataIter = iter(self.dataSource)
+    if self.dataSource is not None:
+      self.dataSource.reset()
+    self._initIter()
   def __iter__(self):
     """ returns an iterator for this screener
     """
@@ -148,7 +197,7 @@ class TopNScreener(SimilarityScreener):
       return res
     
   def _initTopN(self):
-    self.topN = TopNContainer.TopNContainer(self.numToGet)
+    self.topN = TopNHeap.TopNHeap(self.numToGet)
     for obj in self.dataSource:
       fp = self.fingerprinter(obj)
       sim = DataStructs.FingerprintSimilarity(fp,self.probe,self.metric)
@@ -89,6 +89,44 @@ class TestCase(unittest.TestCase):
     assert len(matches2)==5
     assert matches1==matches2
 
+  def test4(self):
+    """ threshold screener with a popcount index
+    """
+    from rdkit.DataStructs.PopcountIndex import PopcountIndex
+    smis = ['C1CCCCC1','C1OCCCC1','C1NCCCC1','c1ccccc1','C1C(C)CCCC1','C1C(C)C(C)CCC1',
+            'C1OCCCC1CCCCCC','OCCO','C1OC(C)CCC1']
+    suppl = Chem.SmilesMolSupplierFromText('\n'.join(smis),
+                                           delimiter=",",
+                                           smilesColumn=0,
+                                           nameColumn=-1,
+                                           titleLine=0)
+    fingerprinter = lambda x:Chem.RDKFingerprint(x,minPath=2,maxPath=7,fpSize=2048)
+    fps = [fingerprinter(x) for x in suppl]
+    index = PopcountIndex(fps)
+    probe = fingerprinter(Chem.MolFromSmiles('C1OCCCC1'))
+
+    for metric in (DataStructs.TanimotoSimilarity,DataStructs.DiceSimilarity,
+                   DataStructs.CosineSimilarity):
+      for thresh in (0.09,0.3,0.5,0.8):
+        screener = SimilarityScreener.ThresholdScreener(thresh,probe=probe,metric=metric,
+                                                        fingerprinter=fingerprinter,
+                                                        dataSource=suppl)
+        matches1 = [(x[0],Chem.MolToSmiles(x[1])) for x in screener]
+        screener = SimilarityScreener.ThresholdScreener(thresh,probe=probe,metric=metric,
+                                                        index=index,dataSource=suppl)
+        matches2 = [(x[0],Chem.MolToSmiles(x[1])) for x in screener]
+        self.failUnlessEqual(matches1,matches2)
+        matches2 = [(x[0],Chem.MolToSmiles(x[1])) for x in screener]
+        self.failUnlessEqual(matches1,matches2)
+
+    # the index can also carry the objects:
+    index = PopcountIndex(fps,extras=smis)
+    screener = SimilarityScreener.ThresholdScreener(0.5,probe=probe,
+                                                    metric=DataStructs.TanimotoSimilarity,
+                                                    index=index)
+    matches = [x[1] for x in screener]
+    self.failUnless('C1OCCCC1' in matches)
+    self.failIf('OCCO' in matches)
 
       
       
@@ -16,6 +16,7 @@ No user-servicable parts inside.  ;-)
 import os
 from rdkit import RDConfig
 from rdkit import Chem
+from rdkit.Chem.PatternSet import PatternScreen
 
 
 defaultPatternFileName = os.path.join(RDConfig.RDDataDir,'FragmentDescriptors.csv')
@@ -23,6 +24,54 @@ defaultPatternFileName = os.path.join(RDConfig.RDDataDir,'FragmentDescriptors.cs
 def _CountMatches(mol,patt,unique=True):
   return len(mol.GetSubstructMatches(patt,uniquify=unique))
 
+# parsed patterns, keyed by SMARTS.  The patterns are parsed the first
+# time they are used, so importing this module (and Chem.Descriptors)
+# does not require parsing every SMARTS in the pattern file:
+_patterns = {}
+_screens = {}
+def _GetPattern(sma):
+  """ *Internal Use Only*
+
+    returns the query molecule for a SMARTS, parsing it if necessary
+
+  """
+  patt = _patterns.get(sma,None)
+  if patt is None:
+    try:
+      patt = Chem.MolFromSmarts(sma)
+    except:
+      patt = None
+    if not patt or patt.GetNumAtoms()==0:
+      raise ValueError,'Smarts %s could not be parsed'%(repr(sma))
+    _patterns[sma] = patt
+    _screens[sma] = PatternScreen(patt)
+  return patt
+
+def _CountPatternMatches(mol,sma,unique=True,molData=None):
+  """ *Internal Use Only*
+
+    counts the matches of a fragment pattern.  If _molData_ (from
+    _PatternSet.GetMolData()_) is provided, the substructure search is
+    skipped when the molecule can't match.  Calculating _molData_ costs
+    more than a single search, so it only pays off when it's shared
+    between the fragment descriptors.
+
+  """
+  patt = _GetPattern(sma)
+  if molData is not None and not _screens[sma].CanMatch(mol,molData):
+    return 0
+  return _CountMatches(mol,patt,unique=unique)
+
+def _ParsePatterns():
+  """ parses all of the fragment patterns
+
+   Calling this before starting worker processes saves each of them
+   from having to parse the patterns again.
+
+  """
+  for name,fn in fns:
+    _GetPattern(fn.smarts)
+
 fns = []
 def _LoadPatterns(fileName=None):
   if fileName is None:
@@ -40,16 +89,10 @@ def _LoadPatterns(fileName=None):
           descr = splitL[1]
           sma = splitL[2]
           descr=descr.replace('"','')
-          ok=1
-          try:
-            patt = Chem.MolFromSmarts(sma)
-          except:
-            ok=0
-          else:
-            if not patt or patt.GetNumAtoms()==0: ok=0
-          if not ok: raise ImportError,'Smarts %s could not be parsed'%(repr(sma))
-          fn = lambda mol,countUnique=True,pattern=patt:_CountMatches(mol,pattern,unique=countUnique)
+          fn = lambda mol,countUnique=True,molData=None,sma=sma:\
+               _CountPatternMatches(mol,sma,unique=countUnique,molData=molData)
           fn.__doc__ = descr
+          fn.smarts = sma
           name = name.replace('=','_')
           name = name.replace('-','_')
           fns.append((name,fn))
@@ -43,6 +43,7 @@ class FGHierarchyNode(object):
   rxnSmarts=""
   parent=None
   removalReaction=None
+  screen=None
   def __init__(self,name,patt,smarts="",label="",rxnSmarts="",parent=None):
     self.name=name
     self.pattern=patt
@@ -135,8 +136,14 @@ def BuildFuncGroupHierarchy(fileNm=None,data=None,force=False):
   hierarchy=res[:]
   return res
 
-def _SetNodeBits(mol,node,res,idx):
-  ms = mol.GetSubstructMatches(node.pattern)
+def _SetNodeBits(mol,node,res,idx,molData=None):
+  if node.screen is None:
+    from rdkit.Chem.PatternSet import PatternScreen
+    node.screen = PatternScreen(node.pattern)
+  if node.screen.CanMatch(mol,molData):
+    ms = mol.GetSubstructMatches(node.pattern)
+  else:
+    ms = ()
   count = 0
   seen = {}
   for m in ms:
@@ -147,7 +154,7 @@ def _SetNodeBits(mol,node,res,idx):
     res[idx] = count
     idx += 1
     for child in node.children:
-      idx=_SetNodeBits(mol,child,res,idx)
+      idx=_SetNodeBits(mol,child,res,idx,molData)
   else:
     idx += len(node)
   return idx
@@ -158,7 +165,9 @@ def CreateMolFingerprint(mol,hierarchy):
     totL += len(entry)
   res = [0]*totL
   idx = 0
+  from rdkit.Chem.PatternSet import GetMolData
+  molData = GetMolData(mol)
   for entry in hierarchy:
-    idx = _SetNodeBits(mol,entry,res,idx)
+    idx = _SetNodeBits(mol,entry,res,idx,molData)
   return res
 
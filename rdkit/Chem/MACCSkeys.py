@@ -32,6 +32,7 @@ May 2011 (gl): Update some definitions based on feedback from Andrew Dalke
 """
 from rdkit import Chem
 from rdkit.Chem import rdMolDescriptors
+from rdkit.Chem import PatternSet
 from rdkit import DataStructs
 # these are SMARTS patterns corresponding to the MDL MACCS keys
 smartsPatts={
@@ -205,6 +206,7 @@ smartsPatts={
   }
 
 maccsKeys = None
+maccsScreens = None
 
 def _InitKeys(keyList,keyDict):
   """ *Internal Use Only*
@@ -247,15 +249,20 @@ def _pyGenMACCSKeys(mol,**kwargs):
   (74, 114, 149, 155, 160)
 
   """
-  global maccsKeys
+  global maccsKeys,maccsScreens
   if maccsKeys is None:
     maccsKeys = [(None,0)]*len(smartsPatts.keys())
     _InitKeys(maccsKeys,smartsPatts)
+    maccsScreens = PatternSet.PatternSet([patt for patt,count in maccsKeys])
   ctor=kwargs.get('ctor',DataStructs.SparseBitVect)
 
   res = ctor(len(maccsKeys)+1)
+  candidates = set(maccsScreens.GetCandidates(mol))
   for i,(patt,count) in enumerate(maccsKeys):
     if patt is not None:
+      if i not in candidates:
+        # the pattern can't match
+        continue
       if count==0:
         res[i+1] = mol.HasSubstructMatch(patt)
       else:
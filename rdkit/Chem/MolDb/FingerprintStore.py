@@ -0,0 +1,160 @@
+# $Id$
+#
+#  This file is part of the RDKit.
+#  The contents are covered by the terms of the BSD license
+#  which is included in the file license.txt, found at the root
+#  of the RDKit source tree.
+#
+""" contiguous, memory-mapped storage for bit-vector fingerprints
+
+A store consists of two files:
+
+  - <name>: a short header followed by one fixed-stride row per
+    fingerprint in the format used by DataStructs.PackedBitVects
+
+  - <name>.ids: one (guid,popcount) record per fingerprint, in the
+    same order as the rows of the fingerprint file
+
+Both files are opened with mmap, so the OS page cache is shared
+between processes searching the same store and nothing has to be
+depickled to score a row.
+
+"""
+import os,struct
+import numpy
+from rdkit.DataStructs import PackedBitVects
+
+_magic = 'RDKPFP01'
+_headerFormat = '<8sII'
+headerSize = struct.calcsize(_headerFormat)
+idDtype = numpy.dtype([('guid','<i8'),('popcount','<i4')])
+
+class PackedFingerprintWriter(object):
+  """ writes fingerprints to a packed store
+
+  The files are written under temporary names and only moved into
+  place by Close(), so a partially written store is never visible.
+
+  """
+  def __init__(self,fileName,nBits,resumeCount=None):
+    """ if resumeCount is provided, the temporary files left by an
+    interrupted writer are reopened and truncated to that many
+    fingerprints
+
+    """
+    self.fileName = fileName
+    self.nBits = nBits
+    self.nBytes = (nBits+7)//8
+    if resumeCount is None:
+      self.nWritten = 0
+      self._fpF = file(fileName+'.tmp','wb')
+      self._idF = file(fileName+'.ids.tmp','wb')
+      self._fpF.write(struct.pack(_headerFormat,_magic,nBits,self.nBytes))
+    else:
+      self.nWritten = resumeCount
+      self._fpF = file(fileName+'.tmp','r+b')
+      self._idF = file(fileName+'.ids.tmp','r+b')
+      magic,fileBits,fileBytes = struct.unpack(_headerFormat,self._fpF.read(headerSize))
+      if magic!=_magic or fileBits!=nBits:
+        raise ValueError,'%s.tmp is not a packed fingerprint file with %d bits'%(fileName,nBits)
+      for f,size in ((self._fpF,headerSize+resumeCount*self.nBytes),
+                     (self._idF,resumeCount*idDtype.itemsize)):
+        f.seek(0,2)
+        if f.tell()<size:
+          raise ValueError,'%s.tmp contains fewer than %d fingerprints'%(fileName,resumeCount)
+        f.truncate(size)
+        f.seek(size)
+
+  def AddPackedFingerprint(self,guid,txt,popcount):
+    """ adds a fingerprint already in DataStructs.BitVectToBinaryText format """
+    if len(txt)!=self.nBytes:
+      raise ValueError,'fingerprint has %d bytes, expected %d'%(len(txt),self.nBytes)
+    self._fpF.write(txt)
+    self._idF.write(struct.pack('<qi',guid,popcount))
+    self.nWritten += 1
+
+  def AddFingerprint(self,guid,fp):
+    """ adds an ExplicitBitVect to the store """
+    from rdkit import DataStructs
+    if fp.GetNumBits()!=self.nBits:
+      raise ValueError,'fingerprint has %d bits, expected %d'%(fp.GetNumBits(),self.nBits)
+    self.AddPackedFingerprint(guid,DataStructs.BitVectToBinaryText(fp),fp.GetNumOnBits())
+
+  def Flush(self):
+    """ makes sure everything added so far is on disk """
+    for f in (self._fpF,self._idF):
+      f.flush()
+      os.fsync(f.fileno())
+
+  def Close(self):
+    self._fpF.close()
+    self._idF.close()
+    for fn in (self.fileName,self.fileName+'.ids'):
+      if os.path.exists(fn):
+        os.unlink(fn)
+      os.rename(fn+'.tmp',fn)
+
+class PackedFingerprintStore(object):
+  """ read-only, memory-mapped access to a packed fingerprint store
+
+  """
+  def __init__(self,fileName):
+    self.fileName = fileName
+    inF = file(fileName,'rb')
+    header = inF.read(headerSize)
+    inF.close()
+    if len(header)!=headerSize:
+      raise ValueError,'%s is not a packed fingerprint file'%fileName
+    magic,self.nBits,self.nBytes = struct.unpack(_headerFormat,header)
+    if magic!=_magic:
+      raise ValueError,'%s is not a packed fingerprint file'%fileName
+    nFps = (os.path.getsize(fileName)-headerSize)//self.nBytes
+    if os.path.getsize(fileName+'.ids')!=nFps*idDtype.itemsize:
+      raise ValueError,'fingerprint and id files for %s are inconsistent'%fileName
+    if nFps:
+      self._fps = numpy.memmap(fileName,dtype=numpy.uint8,mode='r',
+                               offset=headerSize,shape=(nFps,self.nBytes))
+      ids = numpy.memmap(fileName+'.ids',dtype=idDtype,mode='r',shape=(nFps,))
+      self._guids = ids['guid']
+      self._popcounts = ids['popcount']
+    else:
+      self._fps = numpy.zeros((0,self.nBytes),numpy.uint8)
+      self._guids = numpy.zeros(0,numpy.int64)
+      self._popcounts = numpy.zeros(0,numpy.int32)
+
+  def __len__(self):
+    return len(self._guids)
+  def GetNumBits(self):
+    return self.nBits
+  def GetGuids(self):
+    """ returns the (memory-mapped) guid array """
+    return self._guids
+  def GetBitCounts(self):
+    """ returns the (memory-mapped) popcount array """
+    return self._popcounts
+  def GetPackedFingerprints(self):
+    """ returns the (memory-mapped) 2D array of packed fingerprints """
+    return self._fps
+  def GetFingerprint(self,idx):
+    """ returns the fingerprint in row idx as an ExplicitBitVect """
+    return PackedBitVects.UnpackBitVect(self._fps[idx])
+
+  def GetRowsForGuids(self,guids):
+    """ returns the sorted row indices of the fingerprints with the given guids """
+    return numpy.nonzero(numpy.in1d(self._guids,numpy.asarray(list(guids),numpy.int64)))[0]
+
+  def GetBlocks(self,blockSize=8192,rows=None):
+    """ generator returning (guids,popcounts,fps) for successive blocks of rows
+
+    if rows is provided, only those rows (which should be sorted) are
+    returned
+
+    """
+    if rows is None:
+      for start in range(0,len(self),blockSize):
+        end = start+blockSize
+        yield self._guids[start:end],self._popcounts[start:end],self._fps[start:end]
+    else:
+      for start in range(0,len(rows),blockSize):
+        which = rows[start:start+blockSize]
+        yield self._guids[which],self._popcounts[which],self._fps[which]
@@ -0,0 +1,326 @@
+# $Id$
+#
+#  This file is part of the RDKit.
+#  The contents are covered by the terms of the BSD license
+#  which is included in the file license.txt, found at the root
+#  of the RDKit source tree.
+#
+""" cheap screens which rule out substructure queries before they are run
+
+A _PatternScreen_ holds necessary conditions for a query to match a
+molecule: the number of atoms in the query, the number of atoms of
+each element the query requires, the number of aromatic and ring atoms
+it requires, the number of rings in the query and (optionally) a
+pattern fingerprint.  Molecules which fail any of these cannot match
+the query, so the substructure search can be skipped:
+
+>>> screen = PatternScreen(Chem.MolFromSmarts('[Cl]c1ccccc1'))
+>>> screen.CanMatch(Chem.MolFromSmiles('c1ccccc1Br'))
+False
+>>> screen.CanMatch(Chem.MolFromSmiles('ClC1CCCCC1'))
+False
+>>> screen.CanMatch(Chem.MolFromSmiles('c1ccccc1CCl'))
+True
+>>> screen = PatternScreen(Chem.MolFromSmarts('[R]~[R]'))
+>>> screen.CanMatch(Chem.MolFromSmiles('CCCCO'))
+False
+>>> screen = PatternScreen(Chem.MolFromSmarts('*1**1'))
+>>> screen.CanMatch(Chem.MolFromSmiles('CCCCO'))
+False
+>>> screen.CanMatch(Chem.MolFromSmiles('C1CC1'))
+True
+
+A _PatternSet_ screens and runs a sequence of queries:
+
+>>> pset = PatternSet([Chem.MolFromSmarts(x) for x in ('[OH]','[#7]','C(=O)[OH]','[S,P]')])
+>>> pset.HasSubstructMatches(Chem.MolFromSmiles('CC(=O)O'))
+[True, False, True, False]
+>>> pset.CountSubstructMatches(Chem.MolFromSmiles('OCCO'))
+[2, 0, 0, 0]
+>>> pset.nSkipped,pset.nRun
+(2, 6)
+
+"""
+import re
+from rdkit import Chem
+from rdkit import DataStructs
+from rdkit.Chem import PeriodicTable
+
+# element symbols (the other one-letter primitives mean other things in SMARTS):
+_elementNums = dict([(sym,data[0]) for sym,data in PeriodicTable.nameTable.iteritems()
+                     if data[0]>1])
+_aromaticSymbols = {'b':5,'c':6,'n':7,'o':8,'p':15,'s':16,'se':34,'as':33}
+_numberPrimitive = re.compile(r'^#([0-9]+)$')
+# primitives which require an atom to be in a ring ("R0" and "x0" don't):
+_ringPrimitive = re.compile(r'^(R|r|[Rrx][0-9]*[1-9][0-9]*)$')
+_fpSize = 2048
+
+def _StripRecursion(sma):
+  """ *Internal Use Only*
+
+    replaces the recursive queries in an atom's SMARTS with '$'
+
+  >>> _StripRecursion('[#6;$(C=O),$(C#N)]')
+  '[#6;$,$]'
+
+  """
+  res = []
+  depth = 0
+  i = 0
+  while i<len(sma):
+    c = sma[i]
+    if depth:
+      if c=='(':
+        depth += 1
+      elif c==')':
+        depth -= 1
+    elif c=='$' and sma[i+1:i+2]=='(':
+      res.append('$')
+      depth = 1
+      i += 1
+    else:
+      res.append(c)
+    i += 1
+  return ''.join(res)
+
+def _AtomRequirements(atom):
+  """ *Internal Use Only*
+
+    returns the (atomic number,aromatic,ring) requirements of a query
+    atom.  Each can be None if the atom doesn't have the requirement (or
+    if it can't be determined from the atom's SMARTS).  Aromatic atoms
+    are always in rings.
+
+  >>> patt = Chem.MolFromSmarts('C[n;H1][!#6][Cl,Br][#16;$(S=O)]*[R][C;r6][!R][R0][x2]')
+  >>> [_AtomRequirements(x) for x in patt.GetAtoms()]
+  [(6, None, None), (7, True, True), (None, None, None), (None, None, None), (16, None, None), (None, None, None), (None, None, True), (6, None, True), (None, None, None), (None, None, None), (None, None, True)]
+
+  """
+  sma = atom.GetSmarts()
+  if sma[0]!='[':
+    prims = [sma]
+  else:
+    sma = _StripRecursion(sma[1:-1])
+    if ',' in sma:
+      # there's an "or"; give up
+      return None,None,None
+    prims = re.split('[;&]',sma)
+  atNum = None
+  arom = None
+  ring = None
+  for prim in prims:
+    if prim in _elementNums:
+      atNum = _elementNums[prim]
+    elif prim in _aromaticSymbols:
+      atNum = _aromaticSymbols[prim]
+      arom = True
+    elif prim=='a':
+      arom = True
+    elif _ringPrimitive.match(prim):
+      ring = True
+    else:
+      match = _numberPrimitive.match(prim)
+      if match:
+        atNum = int(match.group(1))
+  if arom:
+    ring = True
+  return atNum,arom,ring
+
+def _CountRings(mol):
+  """ *Internal Use Only*
+
+    returns the number of independent rings in a molecule's (or
+    query's) graph: nBonds - nAtoms + nFragments
+
+  >>> _CountRings(Chem.MolFromSmiles('c1ccccc1C1CC1.C1CC1'))
+  3
+  >>> _CountRings(Chem.MolFromSmarts('[#6]1~*~*~1'))
+  1
+
+  """
+  nAtoms = mol.GetNumAtoms()
+  if not nAtoms:
+    return 0
+  return mol.GetNumBonds()-nAtoms+len(Chem.GetMolFrags(mol))
+
+def GetMolData(mol,useFingerprint=False):
+  """ returns the data the screens need for a molecule
+
+    The data is not stored on the molecule (it would be wrong if the
+    molecule were modified), so callers checking many screens against
+    the same molecule should get it once and pass it to
+    _PatternScreen.CanMatch()_.
+
+    **Arguments**
+
+      - mol: the molecule
+
+      - useFingerprint: (optional) if set, the molecule's pattern
+        fingerprint is included
+
+    **Returns**
+
+      a 6-tuple: the number of atoms, a dictionary with the number of
+      atoms of each element, the number of aromatic atoms, the number of
+      ring atoms, the number of rings and the pattern fingerprint (None
+      if _useFingerprint_ isn't set)
+
+  >>> GetMolData(Chem.MolFromSmiles('c1ccccc1CC1CC1Cl'))
+  (11, {17: 1, 6: 10}, 6, 9, 2, None)
+
+  """
+  counts = {}
+  nArom = 0
+  for atom in mol.GetAtoms():
+    atNum = atom.GetAtomicNum()
+    counts[atNum] = counts.get(atNum,0)+1
+    if atom.GetIsAromatic():
+      nArom += 1
+  nAtoms = mol.GetNumAtoms()
+  try:
+    ringInfo = mol.GetRingInfo()
+    nRingAtoms = len([1 for i in range(nAtoms) if ringInfo.NumAtomRings(i)])
+  except RuntimeError:
+    # the ring information hasn't been initialized, don't screen on it:
+    nRingAtoms = nAtoms
+  if useFingerprint:
+    fp = Chem.PatternFingerprint(mol,fpSize=_fpSize)
+  else:
+    fp = None
+  return nAtoms,counts,nArom,nRingAtoms,_CountRings(mol),fp
+
+class PatternScreen(object):
+  """ the necessary conditions for a query to match a molecule
+
+  """
+  def __init__(self,patt,useFingerprint=False):
+    """ Constructor
+
+      **Arguments**
+
+        - patt: the query molecule
+
+        - useFingerprint: (optional) if set, the pattern fingerprints of
+          the query and molecules are compared too.  This is off by
+          default because Chem.PatternFingerprint() is still
+          experimental.
+
+    """
+    self.nAtoms = patt.GetNumAtoms()
+    counts = {}
+    nArom = 0
+    nRingAtoms = 0
+    for atom in patt.GetAtoms():
+      atNum,arom,ring = _AtomRequirements(atom)
+      if atNum is not None:
+        counts[atNum] = counts.get(atNum,0)+1
+      if arom:
+        nArom += 1
+      if ring:
+        nRingAtoms += 1
+    self.elementCounts = counts.items()
+    self.nAromatic = nArom
+    self.nRingAtoms = nRingAtoms
+    self.nRings = _CountRings(patt)
+    if useFingerprint:
+      self.fingerprint = Chem.PatternFingerprint(patt,fpSize=_fpSize)
+    else:
+      self.fingerprint = None
+
+  def CanMatch(self,mol,molData=None):
+    """ returns whether or not the query can match a molecule
+
+      **Arguments**
+
+        - mol: the molecule
+
+        - molData: (optional) the results of _GetMolData(mol)_.  If this
+          is not provided, it's computed.
+
+    """
+    if molData is None:
+      molData = GetMolData(mol,useFingerprint=self.fingerprint is not None)
+    nAtoms,counts,nArom,nRingAtoms,nRings,fp = molData
+    if nAtoms<self.nAtoms or nArom<self.nAromatic or \
+       nRingAtoms<self.nRingAtoms or nRings<self.nRings:
+      return False
+    for atNum,count in self.elementCounts:
+      if counts.get(atNum,0)<count:
+        return False
+    if self.fingerprint is not None:
+      if fp is None:
+        fp = Chem.PatternFingerprint(mol,fpSize=_fpSize)
+      if not DataStructs.AllProbeBitsMatch(self.fingerprint,fp):
+        return False
+    return True
+
+class PatternSet(object):
+  """ a set of substructure queries which are screened before being run
+
+    _nSkipped_ and _nRun_ count the substructure searches which were
+    skipped and run.
+
+  """
+  def __init__(self,patterns,useFingerprint=False):
+    """ Constructor
+
+      **Arguments**
+
+        - patterns: a sequence of query molecules.  Entries which are
+          None never match.
+
+        - useFingerprint: (optional) passed on to _PatternScreen_
+
+    """
+    self.patterns = list(patterns)
+    self.screens = [PatternScreen(x,useFingerprint=useFingerprint) if x is not None else None
+                    for x in self.patterns]
+    self.useFingerprint = useFingerprint
+    self.nSkipped = 0
+    self.nRun = 0
+
+  def __len__(self):
+    return len(self.patterns)
+
+  def GetCandidates(self,mol):
+    """ returns the indices of the patterns which may match a molecule
+
+    """
+    molData = GetMolData(mol,useFingerprint=self.useFingerprint)
+    res = [i for i,screen in enumerate(self.screens)
+           if screen is not None and screen.CanMatch(mol,molData)]
+    self.nRun += len(res)
+    self.nSkipped += len(self.screens)-len(res)
+    return res
+
+  def HasSubstructMatches(self,mol):
+    """ returns a list with whether or not each pattern matches a molecule
+
+    """
+    res = [False]*len(self.patterns)
+    for i in self.GetCandidates(mol):
+      res[i] = mol.HasSubstructMatch(self.patterns[i])
+    return res
+
+  def CountSubstructMatches(self,mol,uniquify=True):
+    """ returns a list with the number of matches of each pattern in a
+    molecule
+
+    """
+    res = [0]*len(self.patterns)
+    for i in self.GetCandidates(mol):
+      res[i] = len(mol.GetSubstructMatches(self.patterns[i],uniquify=uniquify))
+    return res
+
+#------------------------------------
+#
+#  doctest boilerplate
+#
+def _test():
+  import doctest,sys
+  return doctest.testmod(sys.modules["__main__"])
+
+if __name__ == '__main__':
+  import sys
+  failed,tried = _test()
+  sys.exit(failed)
@@ -35,6 +35,8 @@
 """
 from rdkit.Chem.Pharm2D import Utils,SigFactory
 from rdkit.RDLogger import logger
+import itertools
+import numpy
 logger = logger()
 
 _verbose = 0
@@ -76,6 +78,23 @@ def _ShortestPathsMatch(match,featureSet,sig,dMat,sigFactory):
     sig.SetBit(idx)
   
 
+def _GetPerms(sigFactory):
+  """  Internal use only
+
+    returns the default permutations of feature indices for a factory
+
+  """
+  nFeats = len(sigFactory.GetFeatFamilies())
+  minCount = sigFactory.minPointCount
+  maxCount = sigFactory.maxPointCount
+  if maxCount>3:
+    logger.warning(' Pharmacophores with more than 3 points are not currently supported.\nSetting maxCount to 3.')
+    maxCount=3
+  perms = []
+  for count in range(minCount,maxCount+1):
+    perms += Utils.GetIndexCombinations(nFeats,count)
+  return perms
+
 def Gen2DFingerprint(mol,sigFactory,perms=None,dMat=None):
   """ generates a 2D fingerprint for a molecule using the
    parameters in _sig_
@@ -96,15 +115,8 @@ def Gen2DFingerprint(mol,sigFactory,perms=None,dMat=None):
   """
   if not isinstance(sigFactory,SigFactory.SigFactory):
     raise ValueError,'bad factory'
-  featFamilies=sigFactory.GetFeatFamilies()
   if _verbose:
-    print '* feat famillies:',featFamilies
-  nFeats = len(featFamilies)
-  minCount = sigFactory.minPointCount
-  maxCount = sigFactory.maxPointCount
-  if maxCount>3:
-    logger.warning(' Pharmacophores with more than 3 points are not currently supported.\nSetting maxCount to 3.')
-    maxCount=3
+    print '* feat famillies:',sigFactory.GetFeatFamilies()
 
   # generate the molecule's distance matrix, if required
   if dMat is None:
@@ -114,9 +126,7 @@ def Gen2DFingerprint(mol,sigFactory,perms=None,dMat=None):
 
   # generate the permutations, if required
   if perms is None:
-    perms = []
-    for count in range(minCount,maxCount+1):
-      perms += Utils.GetIndexCombinations(nFeats,count)
+    perms = _GetPerms(sigFactory)
 
   # generate the matches:
   featMatches = sigFactory.GetMolFeats(mol)
@@ -153,3 +163,200 @@ def Gen2DFingerprint(mol,sigFactory,perms=None,dMat=None):
       if sigFactory.shortestPathsOnly:
         _ShortestPathsMatch(match,perm,sig,dMat,sigFactory)
   return sig
+
+_combinationCache = {}
+def _IndexCombinations(nItems,nSlots):
+  """  Internal use only
+
+    returns an array with the combinations (without repeats) of nSlots
+    of the first nItems indices, one per row, in sorted order
+
+  """
+  res = _combinationCache.get((nItems,nSlots),None)
+  if res is None:
+    res = numpy.array(list(itertools.combinations(range(nItems),nSlots)),
+                      numpy.intp).reshape(-1,nSlots)
+    _combinationCache[(nItems,nSlots)] = res
+  return res
+
+# the distance reorderings made by Utils.OrderTriangle():
+_triangleReorders = numpy.array([(0,1,2),(1,0,2),(0,2,1),(2,0,1),(1,2,0),(2,1,0)],numpy.intp)
+def _OrderTriangles(featIndices,dists):
+  """  Internal use only
+
+    puts the distances for a set of triangles (one per row of _dists_)
+    into the canonical order used by Utils.OrderTriangle()
+
+  """
+  fs = set(featIndices)
+  if len(fs)==3:
+    return dists
+  d0,d1,d2 = dists[:,0],dists[:,1],dists[:,2]
+  if len(fs)==1:
+    s0,s1,s2 = d0+d1,d0+d2,d1+d2
+    mD = numpy.maximum(numpy.maximum(s0,s1),s2)
+    which = numpy.where(s0==mD,numpy.where(d0>d1,0,1),
+                        numpy.where(s1==mD,numpy.where(d0>d2,2,3),
+                                    numpy.where(d1>d2,4,5)))
+  elif featIndices[0]==featIndices[1]:
+    which = numpy.where(d1>d2,0,2)
+  elif featIndices[0]==featIndices[2]:
+    which = numpy.where(d0>d2,0,5)
+  else:
+    which = numpy.where(d0>d1,0,1)
+  return dists[numpy.arange(len(dists))[:,None],_triangleReorders[which]]
+
+def _Gen2DFingerprintArrays(mol,sigFactory,perms,dMat=None):
+  """  Internal use only
+
+    generates the same fingerprint as Gen2DFingerprint(), but handles
+    all of the feature combinations for each proto-pharmacophore at once
+    using arrays
+
+  """
+  bins = sigFactory.GetBins()
+  minD,maxD = bins[0][0],bins[-1][1]
+  sig = sigFactory.GetSignature()
+  if not sigFactory.shortestPathsOnly:
+    return sig
+  if dMat is None:
+    from rdkit import Chem
+    dMat = Chem.GetDistanceMatrix(mol,sigFactory.includeBondOrder)
+  dMat = numpy.asarray(dMat)
+
+  # Each distinct set of feature atoms is a point.  The points are
+  # sorted so that the points in each combination end up in the order
+  # Utils.GetUniqueCombinations() puts them in.
+  featMatches = sigFactory.GetMolFeats(mol)
+  points = sorted(set([tuple(x) for x in itertools.chain(*featMatches)]))
+  pointIdx = dict([(x,i) for i,x in enumerate(points)])
+  famPoints = [numpy.array(sorted(set([pointIdx[tuple(x)] for x in matches])),numpy.intp)
+               for matches in featMatches]
+
+  # the (truncated) shortest distance between each pair of points:
+  nPoints = len(points)
+  dists = numpy.zeros((nPoints,nPoints),numpy.int64)
+  if nPoints:
+    members = numpy.zeros((nPoints,dMat.shape[0]),numpy.bool)
+    for i,atoms in enumerate(points):
+      members[i,list(atoms)] = True
+    for i,atoms in enumerate(points):
+      closest = dMat[list(atoms)].min(axis=0)
+      dists[i] = numpy.minimum(numpy.where(members,closest,maxD).min(axis=1),maxD)
+  # overlapping points are at distance zero, so they're never combined:
+  valid = (dists!=0)&(dists>=minD)&(dists<maxD)
+
+  bits = []
+  for perm in perms:
+    nPts = len(perm)
+    # runs of the same feature in the permutation pick combinations of
+    # distinct points from that feature:
+    runs = []
+    for i in range(nPts):
+      if i and perm[i]==perm[i-1]:
+        runs[-1][1] += 1
+      else:
+        runs.append([perm[i],1])
+    combos = [famPoints[f][_IndexCombinations(len(famPoints[f]),n)] for f,n in runs]
+    counts = [len(x) for x in combos]
+    if not min(counts):
+      continue
+    which = numpy.indices(counts).reshape(len(counts),-1)
+    matches = numpy.hstack([combo[w] for combo,w in zip(combos,which)])
+
+    pairs = Utils.nPointDistDict[nPts]
+    keep = numpy.ones(len(matches),numpy.bool)
+    for p0,p1 in pairs:
+      keep &= valid[matches[:,p0],matches[:,p1]]
+    matches = matches[keep]
+    if not len(matches):
+      continue
+    matchDists = numpy.column_stack([dists[matches[:,p0],matches[:,p1]] for p0,p1 in pairs])
+    if nPts==3:
+      matchDists = _OrderTriangles(perm,matchDists)
+    bits.append(sigFactory.GetBitIds(perm,matchDists))
+
+  if bits:
+    bits = numpy.concatenate(bits)
+    if sigFactory.useCounts:
+      bits.sort()
+      starts = numpy.concatenate(([0],numpy.nonzero(numpy.diff(bits))[0]+1))
+      bitIds = bits[starts]
+      bitCounts = numpy.diff(numpy.concatenate((starts,[len(bits)])))
+      for idx,count in zip(bitIds.tolist(),bitCounts.tolist()):
+        sig[idx] = sig[idx]+count
+    else:
+      for idx in numpy.unique(bits).tolist():
+        sig.SetBit(idx)
+  return sig
+
+def _GenerateFingerprint(mol,sigFactory,perms):
+  if mol is None:
+    return None
+  return _Gen2DFingerprintArrays(mol,sigFactory,perms)
+
+_batchData = None
+def _initBatchWorker(batchData):
+  global _batchData
+  _batchData = batchData
+
+def _batchChunk(mols):
+  """ generates the fingerprints for a chunk of molecules using the
+  data set up by _initBatchWorker()
+
+  """
+  sigFactory,perms = _batchData
+  return [_GenerateFingerprint(mol,sigFactory,perms) for mol in mols]
+
+def GenerateBatch(mols,sigFactory,perms=None,numWorkers=0,chunkSize=100):
+  """ generates 2D fingerprints for a set of molecules
+
+    The fingerprints are the same as those from Gen2DFingerprint(), but
+    each molecule's features are perceived once, the distances between
+    them are found with a single array operation and the bits for all
+    of the feature combinations of each proto-pharmacophore are
+    computed together.
+
+   **Arguments**
+
+     - mols: a sequence of molecules
+
+     - sigFactory : the SigFactory object with signature parameters.
+       It *must* be pre-initialized.
+
+     - perms: (optional) a sequence of permutation indices limiting which
+       pharmacophore combinations are allowed
+
+     - numWorkers: (optional) if this is larger than 1, the molecules
+       are fingerprinted in a pool of this many processes.  The worker
+       processes inherit the factory when they start.
+
+     - chunkSize: (optional) the number of molecules handed to a worker
+       process at a time
+
+   **Returns**
+
+     a list with the fingerprint for each molecule (None for molecules
+     which are None)
+
+  """
+  if not isinstance(sigFactory,SigFactory.SigFactory):
+    raise ValueError,'bad factory'
+  if perms is None:
+    perms = _GetPerms(sigFactory)
+  if numWorkers<=1:
+    return [_GenerateFingerprint(mol,sigFactory,perms) for mol in mols]
+
+  mols = list(mols)
+  chunks = [mols[i:i+chunkSize] for i in range(0,len(mols),chunkSize)]
+  import multiprocessing
+  pool = multiprocessing.Pool(numWorkers,_initBatchWorker,((sigFactory,perms),))
+  res = []
+  try:
+    # imap hands the results back in order:
+    for chunkRes in pool.imap(_batchChunk,chunks):
+      res.extend(chunkRes)
+  finally:
+    pool.terminate()
+    pool.join()
+  return res
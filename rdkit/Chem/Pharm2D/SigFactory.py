@@ -14,11 +14,16 @@
 """
 from rdkit.DataStructs import SparseBitVect,IntSparseIntVect,LongSparseIntVect
 from rdkit.Chem.Pharm2D import Utils
-import copy
+import copy,bisect,cPickle,os
 import numpy
 
 _verbose = False
 
+# the bit-index tables of the factories initialized in this process,
+#  keyed by the parameters they depend on:
+_tableCache = {}
+_tableVersion = 1
+
 
 class SigFactory(object):
   """
@@ -30,8 +35,18 @@ class SigFactory(object):
   """
   def __init__(self,featFactory,useCounts=False,minPointCount=2,maxPointCount=3,
                shortestPathsOnly=True,includeBondOrder=False,skipFeats=None,
-               trianglePruneBins=True):
+               trianglePruneBins=True,tableCacheDir=None):
+    """ Constructor
+
+      **Arguments** (the ones which aren't obvious)
+
+        - tableCacheDir: (optional) the name of a directory used to store
+          the factory's bit-index tables, so that they only need to be
+          built once for each set of parameters.
+
+    """
     self.featFactory = featFactory
+    self.tableCacheDir = tableCacheDir
     self.useCounts=useCounts
     self.minPointCount=minPointCount
     self.maxPointCount=maxPointCount
@@ -111,79 +126,26 @@ class SigFactory(object):
     res += "|"
     return res
 
-  def _findBinIdx(self,dists,bins,scaffolds):
-    """ OBSOLETE: this has been rewritten in C++
-    Internal use only
-     Returns the index of a bin defined by a set of distances.
-
-    **Arguments**
-
-      - dists: a sequence of distances (not binned)
-
-      - bins: a sorted sequence of distance bins (2-tuples)
-
-      - scaffolds: a list of possible scaffolds (bin combinations)
-
-    **Returns**
-
-      an integer bin index
-      
-    **Note**
-
-      the value returned here is not an index in the overall
-      signature.  It is, rather, an offset of a scaffold in the
-      possible combinations of distance bins for a given
-      proto-pharmacophore.
-    
-    """
-    nBins = len(bins)
-    nDists = len(dists)
-    whichBins = [0]*nDists
-
-    # This would be a ton easier if we had contiguous bins
-    # i.e. if we could maintain the bins as a list of bounds)
-    # because then we could use Python's bisect module.
-    # Since we can't do that, we've got to do our own binary
-    # search here.
-    for i in range(nDists):
-      dist = dists[i]
-      where = -1
-
-      # do a simple binary search:
-      startP,endP = 0,len(bins)
-      while startP<endP:
-        midP = (startP+endP) // 2
-        begBin,endBin = bins[midP]
-        if dist < begBin:
-          endP = midP
-        elif dist >= endBin:
-          startP = midP+1
-        else:
-          where = midP
-          break
-      if where < 0:
-        return None
-      whichBins[i] = where
-    res = scaffolds.index(tuple(whichBins))
-    if _verbose:
-      print '----- _fBI  -----------'
-      print ' scaffolds:',scaffolds
-      print ' bins:',whichBins
-      print ' res:',res
-    return res
-
   def GetFeatFamilies(self):
     fams = [fam for fam in self.featFactory.GetFeatureFamilies() if fam not in self.skipFeats]
     fams.sort()
     return fams
 
   def GetMolFeats(self,mol):
+    """ returns a list with the atom ids of the molecule's features in
+    each of the feature families
+
+      The features are all perceived in a single pass; within each
+      family they're in the order the feature factory finds them.
+
+    """
     featFamilies=self.GetFeatFamilies()
     featMatches = {}
     for fam in featFamilies:
       featMatches[fam] =  []
-      feats = self.featFactory.GetFeaturesForMol(mol,includeOnly=fam)
-      for feat in feats:
+    for feat in self.featFactory.GetFeaturesForMol(mol):
+      fam = feat.GetFamily()
+      if fam in featMatches:
         featMatches[fam].append(feat.GetAtomIds())
     return [featMatches[x] for x in featFamilies]
   
@@ -191,7 +153,7 @@ class SigFactory(object):
     """ returns the index for a pharmacophore described using a set of
       feature indices and distances
 
-    **Arguments***
+    **Arguments**
 
       - featIndices: a sequence of feature indices
 
@@ -212,12 +174,6 @@ class SigFactory(object):
     if nPoints < self.minPointCount: raise IndexError,'bad number of points'
     if nPoints > self.maxPointCount: raise IndexError,'bad number of points'
 
-    # this is the start of the nPoint-point pharmacophores
-    startIdx = self._starts[nPoints]
-
-    #
-    # now we need to map the pattern indices to an offset from startIdx
-    # 
     if sortIndices:
       tmp = list(featIndices)
       tmp.sort()
@@ -228,26 +184,67 @@ class SigFactory(object):
 
     if nPoints==3:
       featIndices,dists=Utils.OrderTriangle(featIndices,dists)
-            
 
-    offset = Utils.CountUpTo(self._nFeats,nPoints,featIndices)
-    if _verbose: print 'offset for feature %s: %d'%(str(featIndices),offset)
-    offset *= len(self._scaffolds[len(dists)])
-
-      
-    try:
-      if _verbose:
-        print '>>>>>>>>>>>>>>>>>>>>>>>'
-        print '\tScaffolds:',repr(self._scaffolds[len(dists)]),type(self._scaffolds[len(dists)])
-        print '\tDists:',repr(dists),type(dists)
-        print '\tbins:',repr(self._bins),type(self._bins)
-      bin = self._findBinIdx(dists,self._bins,self._scaffolds[len(dists)])
-    except ValueError:
+    protoStarts,scaffoldIndices = self._bitIdxTables[nPoints]
+    whichBins = []
+    for dist in dists:
+      binIdx = bisect.bisect_right(self._binEnds,dist)
+      if binIdx>=len(self._binEnds) or dist<self._binStarts[binIdx]:
+        whichBins = None
+        break
+      whichBins.append(binIdx)
+    if whichBins is not None:
+      bin = scaffoldIndices[tuple(whichBins)]
+    else:
+      bin = -1
+    if bin<0:
       fams = self.GetFeatFamilies()
       fams = [fams[x] for x in featIndices]
       raise IndexError,'distance bin not found: feats: %s; dists=%s; bins=%s; scaffolds: %s'%(fams,dists,self._bins,self._scaffolds)
+    res = int(protoStarts[tuple(featIndices)]+bin)
+    if _verbose:
+      print 'bit for feature %s, dists %s: %d'%(str(featIndices),str(dists),res)
+    return res
 
-    return startIdx + offset + bin
+  def GetBitIds(self,featIndices,dists):
+    """ returns the indices for a set of pharmacophores which share
+      their features
+
+    **Arguments**
+
+      - featIndices: a sequence of feature indices, in the order
+        GetBitIdx() would use them after sorting them and putting the
+        triangle in canonical order
+
+      - dists: a 2D array with the distances for each pharmacophore (one
+        row per pharmacophore), in canonical order
+
+    **Returns**
+
+      a numpy array with the integer bit indices
+
+    """
+    nPoints = len(featIndices)
+    if nPoints>3:
+      raise NotImplementedError,'>3 points not supported'
+    if nPoints < self.minPointCount: raise IndexError,'bad number of points'
+    if nPoints > self.maxPointCount: raise IndexError,'bad number of points'
+    if min(featIndices)<0: raise IndexError,'bad feature index'
+    if max(featIndices)>=self._nFeats: raise IndexError,'bad feature index'
+
+    protoStarts,scaffoldIndices = self._bitIdxTables[nPoints]
+    dists = numpy.asarray(dists)
+    whichBins = numpy.searchsorted(self._binEnds,dists,side='right')
+    found = whichBins<len(self._binEnds)
+    whichBins[~found] = 0
+    found &= dists>=numpy.array(self._binStarts)[whichBins]
+    bins = numpy.where(found.all(axis=1),scaffoldIndices[tuple(whichBins.T)],-1)
+    if (bins<0).any():
+      fams = self.GetFeatFamilies()
+      fams = [fams[x] for x in featIndices]
+      badDists = dists[numpy.nonzero(bins<0)[0][0]].tolist()
+      raise IndexError,'distance bin not found: feats: %s; dists=%s; bins=%s; scaffolds: %s'%(fams,badDists,self._bins,self._scaffolds)
+    return protoStarts[tuple(featIndices)]+bins
 
   def GetBitInfo(self,idx):
     """ returns information about the given bit
@@ -269,44 +266,51 @@ class SigFactory(object):
     """
     if idx >= self._sigSize:
       raise IndexError,'bad index (%d) queried. %d is the max'%(idx,self._sigSize)
-    # first figure out how many points are in the p'cophore
-    nPts = self.minPointCount
-    while nPts < self.maxPointCount and self._starts[nPts+1]<=idx:
-      nPts+=1
+    return self.GetBitsInfo([idx])[0]
 
-    # how far are we in from the start point?
-    offsetFromStart = idx - self._starts[nPts]
-    if _verbose:
-      print '\t %d Points, %d offset'%(nPts,offsetFromStart)
+  def GetBitsInfo(self,bitIds):
+    """ returns information about a set of bits
 
-    # lookup the number of scaffolds
-    nDists = len(Utils.nPointDistDict[nPts])
-    scaffolds = self._scaffolds[nDists]
-      
-    nScaffolds = len(scaffolds)
+     **Arguments**
 
-    # figure out to which proto-pharmacophore we belong:
-    protoIdx = offsetFromStart / nScaffolds
-    indexCombos = Utils.GetIndexCombinations(self._nFeats,nPts)
-    combo = tuple(indexCombos[protoIdx])
-    if _verbose:
-      print '\t combo: %s'%(str(combo))
+       - bitIds: a sequence of bit indices
+
+     **Returns**
 
-    # and which scaffold:
-    scaffoldIdx = offsetFromStart % nScaffolds
-    scaffold = scaffolds[scaffoldIdx]
+       a list with the 3-tuple GetBitInfo() returns for each bit
+
+    """
+    bitIds = numpy.asarray(bitIds,numpy.int64)
+    if len(bitIds) and bitIds.max()>=self._sigSize:
+      raise IndexError,'bad index (%d) queried. %d is the max'%(bitIds.max(),self._sigSize)
+    # first figure out how many points are in the p'cophores
+    nPtsList = range(self.minPointCount,self.maxPointCount+1)
+    starts = numpy.array([self._starts[x] for x in nPtsList],numpy.int64)
+    which = numpy.searchsorted(starts,bitIds,side='right')-1
+    which[which<0] = 0
+
+    res = [None]*len(bitIds)
+    for i,nPts in enumerate(nPtsList):
+      here = numpy.nonzero(which==i)[0]
+      if not len(here):
+        continue
+      protoCombos,scaffolds = self._bitInfoTables[nPts]
+      # how far are we in from the start point?
+      offsetsFromStart = bitIds[here]-starts[i]
+      # figure out to which proto-pharmacophore and scaffold the bits belong:
+      combos = protoCombos[offsetsFromStart//len(scaffolds)].tolist()
+      bitScaffolds = scaffolds[offsetsFromStart%len(scaffolds)].tolist()
+      for j,combo,scaffold in zip(here.tolist(),combos,bitScaffolds):
+        res[j] = (nPts,tuple(combo),tuple(scaffold))
     if _verbose:
-      print '\t scaffold: %s'%(str(scaffold))
-    return nPts,combo,scaffold
+      print '\t bit info: %s'%(str(res))
+    return res
 
   def Init(self):
     """ Initializes internal parameters.  This **must** be called after
       making any changes to the signature parameters
 
     """
-    accum = 0
-    self._scaffolds = [0]*(len(Utils.nPointDistDict[self.maxPointCount+1]))
-    self._starts = {}
     if not self.skipFeats:
       self._nFeats = len(self.featFactory.GetFeatureFamilies())
     else:
@@ -314,30 +318,90 @@ class SigFactory(object):
       for fam in self.featFactory.GetFeatureFamilies():
         if fam not in self.skipFeats:
           self._nFeats+=1
+    self._binStarts = [x[0] for x in self._bins]
+    self._binEnds = [x[1] for x in self._bins]
+
+    tableKey = (_tableVersion,self._nFeats,tuple([tuple(x) for x in self._bins]),
+                self.minPointCount,self.maxPointCount,bool(self.trianglePruneBins))
+    tables = _tableCache.get(tableKey,None)
+    tableFile = None
+    if tables is None and getattr(self,'tableCacheDir',None):
+      import hashlib
+      tableFile = os.path.join(self.tableCacheDir,
+                               'Pharm2DTables.%s.pkl'%hashlib.md5(repr(tableKey)).hexdigest())
+      if os.path.exists(tableFile):
+        try:
+          inF = open(tableFile,'rb')
+          try:
+            tables = cPickle.load(inF)
+          finally:
+            inF.close()
+        except Exception:
+          tables = None
+        if tables is not None and tables[0]!=tableKey:
+          tables = None
+    if tables is None:
+      tables = self._BuildTables(tableKey)
+      if tableFile:
+        # write then rename so that other processes never see a partial file:
+        outF = open(tableFile+'.%d'%os.getpid(),'wb+')
+        cPickle.dump(tables,outF,2)
+        outF.close()
+        os.rename(tableFile+'.%d'%os.getpid(),tableFile)
+    _tableCache[tableKey] = tables
+    tableKey,self._scaffolds,self._starts,self._sigSize,self._bitIdxTables,self._bitInfoTables = tables
+    if not self.useCounts:
+      self.sigKlass = SparseBitVect
+    elif self._sigSize<2**31:
+      self.sigKlass = IntSparseIntVect
+    else:
+      self.sigKlass = LongSparseIntVect
+
+  def _BuildTables(self,tableKey):
+    """ Internal use only
+
+      builds the tables used to convert between bit indices and
+      pharmacophores:
+
+        - _bitIdxTables maps the number of points to 2 arrays, one
+          indexed by feature indices with the bit index of the first
+          bit for those features, the other indexed by distance bins
+          with the offset of the scaffold (-1 if there isn't one).
+
+        - _bitInfoTables maps the number of points to 2 arrays: the
+          feature indices for each proto-pharmacophore and the bins
+          for each scaffold.
+
+    """
+    accum = 0
+    scaffolds = [0]*(len(Utils.nPointDistDict[self.maxPointCount+1]))
+    starts = {}
+    bitIdxTables = {}
+    bitInfoTables = {}
+    nBins = len(self._bins)
     for i in range(self.minPointCount,self.maxPointCount+1):
-      self._starts[i] = accum
+      starts[i] = accum
       nDistsHere = len(Utils.nPointDistDict[i])
       scaffoldsHere = Utils.GetPossibleScaffolds(i,self._bins,
                                                  useTriangleInequality=self.trianglePruneBins)
       nBitsHere = len(scaffoldsHere)
-      self._scaffolds[nDistsHere] = scaffoldsHere
+      scaffolds[nDistsHere] = scaffoldsHere
+      combos = Utils.GetIndexCombinations(self._nFeats,i)
+      bitInfoTables[i] = (numpy.array(combos,numpy.int64).reshape(-1,i),
+                          numpy.array(scaffoldsHere,numpy.int64).reshape(-1,nDistsHere))
+      if i<=3:
+        protoStarts = numpy.zeros((self._nFeats,)*i,numpy.int64)
+        for featIndices in numpy.ndindex(*protoStarts.shape):
+          protoStarts[featIndices] = accum+Utils.CountUpTo(self._nFeats,i,featIndices)*nBitsHere
+        scaffoldIndices = -numpy.ones((nBins,)*nDistsHere,numpy.int64)
+        for j,scaffold in enumerate(scaffoldsHere):
+          scaffoldIndices[scaffold] = j
+        bitIdxTables[i] = (protoStarts,scaffoldIndices)
       pointsHere = Utils.NumCombinations(self._nFeats,i) * nBitsHere
       accum += pointsHere
-    self._sigSize = accum
-    if not self.useCounts:
-      self.sigKlass = SparseBitVect
-    elif self._sigSize<2**31:
-      self.sigKlass = IntSparseIntVect
-    else:
-      self.sigKlass = LongSparseIntVect
+    return tableKey,scaffolds,starts,accum,bitIdxTables,bitInfoTables
 
   def GetSigSize(self):
     return self._sigSize
-try:
-  from rdkit.Chem.Pharmacophores import cUtils
-except ImportError:
-  pass
-else:
-  SigFactory._findBinIdx = cUtils.FindBinIdx
 
   
@@ -164,6 +164,30 @@ class TestCase(unittest.TestCase):
           print s1.difference(s2)
         self.failUnlessEqual(sig1,sig2)
 
+  def testBatch(self):
+    smis = ['O=CCC=O','OCCC=O','OCCC(=O)O','Oc1nc(Oc2ncccc2)ccc1','CCCN',
+            'c1ccccc1C(=O)NCCN(C)C','OC(=O)C1CCN(CC1)c1ccc(Cl)cc1']
+    mols = [Chem.MolFromSmiles(x) for x in smis]+[None]
+    sdFile = os.path.join(RDConfig.RDCodeDir,'Chem','Pharm2D','test_data','orderBug.sdf')
+    mols.extend([x for x in Chem.SDMolSupplier(sdFile)])
+    ref = [Generate.Gen2DFingerprint(x,self.factory) if x is not None else None for x in mols]
+    sigs = Generate.GenerateBatch(mols,self.factory)
+    self.failUnlessEqual(len(sigs),len(mols))
+    for sig,refSig in zip(sigs,ref):
+      if refSig is None:
+        self.failUnless(sig is None)
+      else:
+        self.failUnlessEqual(list(sig.GetOnBits()),list(refSig.GetOnBits()))
+    self.failUnlessEqual(list(sigs[2].GetOnBits()),[22, 29, 149, 154, 156, 184, 28822, 30134])
+
+    sigs = Generate.GenerateBatch(mols,self.factory,numWorkers=2,chunkSize=3)
+    self.failUnlessEqual(len(sigs),len(mols))
+    for sig,refSig in zip(sigs,ref):
+      if refSig is None:
+        self.failUnless(sig is None)
+      else:
+        self.failUnlessEqual(list(sig.GetOnBits()),list(refSig.GetOnBits()))
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -240,6 +240,76 @@ class TestCase(unittest.TestCase):
     self.failUnlessEqual(factory.GetBitDescription(4361),
                          'Acceptor Donor Hydrophobe |0 2 0|2 0 0|0 0 0|')
 
+  def testBatch(self):
+    smis = ['OCC(=O)CCCN','OCCC(=O)O','c1ccccc1C(=O)NCCO','OCC(O)CC(=O)N','CC(C)CC(N)C(=O)O']
+    mols = [Chem.MolFromSmiles(x) for x in smis]
+    for useCounts in (False,True):
+      for trianglePruneBins in (False,True):
+        self.factory.useCounts = useCounts
+        self.factory.trianglePruneBins = trianglePruneBins
+        self.factory.Init()
+        sigs = Generate.GenerateBatch(mols,self.factory)
+        for mol,sig in zip(mols,sigs):
+          refSig = Generate.Gen2DFingerprint(mol,self.factory)
+          self.failUnlessEqual(len(sig),len(refSig))
+          if useCounts:
+            self.failUnlessEqual(sig.GetNonzeroElements(),refSig.GetNonzeroElements())
+          else:
+            self.failUnlessEqual(list(sig.GetOnBits()),list(refSig.GetOnBits()))
+
+  def testBatchNonContiguousBins(self):
+    smis = ['OCC(=O)CCCN','OCCC(=O)O','c1ccccc1C(=O)NCCO','OCC(O)CC(=O)N','CC(C)CC(N)C(=O)O',
+            'O=CCC=O','OCCCCCC=O']
+    mols = [Chem.MolFromSmiles(x) for x in smis]
+    self.factory.SetBins([(1,2),(3,5),(6,9)])
+    nFailed = 0
+    for useCounts in (False,True):
+      self.factory.useCounts = useCounts
+      self.factory.Init()
+      for mol in mols:
+        try:
+          refSig = Generate.Gen2DFingerprint(mol,self.factory)
+        except IndexError:
+          # a distance falls between the bins:
+          self.failUnlessRaises(IndexError,Generate.GenerateBatch,[mol],self.factory)
+          nFailed += 1
+          continue
+        sig = Generate.GenerateBatch([mol],self.factory)[0]
+        self.failUnlessEqual(len(sig),len(refSig))
+        if useCounts:
+          self.failUnlessEqual(sig.GetNonzeroElements(),refSig.GetNonzeroElements())
+        else:
+          self.failUnlessEqual(list(sig.GetOnBits()),list(refSig.GetOnBits()))
+    self.failUnless(nFailed<2*len(mols))
+
+  def testTables(self):
+    import tempfile,shutil
+    bits = range(self.factory.GetSigSize())
+    info = [self.factory.GetBitInfo(x) for x in bits]
+    self.failUnlessEqual(self.factory.GetBitsInfo(bits),info)
+    for nPts,combo,scaffold in info[::7]:
+      if len(set(combo))<nPts:
+        # these are reordered by GetBitIdx()
+        continue
+      dists = [self.factory.GetBins()[x][0] for x in scaffold]
+      self.failUnlessEqual(self.factory.GetBitIds(combo,[dists])[0],
+                           self.factory.GetBitIdx(combo,dists,sortIndices=False))
+    self.failUnlessRaises(IndexError,lambda:self.factory.GetBitIdx((0,1),[8]))
+
+    cacheDir = tempfile.mkdtemp()
+    try:
+      SigFactory._tableCache.clear()
+      factory = SigFactory.SigFactory(self.factory.featFactory,minPointCount=2,maxPointCount=3,
+                                      trianglePruneBins=False,tableCacheDir=cacheDir)
+      factory.SetBins([(0,2),(2,5),(5,8)])
+      self.failUnlessEqual(len(os.listdir(cacheDir)),1)
+      SigFactory._tableCache.clear()
+      factory.Init()
+      self.failUnlessEqual(factory.GetSigSize(),990)
+      self.failUnlessEqual(factory.GetBitsInfo(bits),info)
+    finally:
+      shutil.rmtree(cacheDir)
+
 if __name__ == '__main__':
   unittest.main()
 
@@ -994,66 +994,211 @@ def Check2DBounds(atomMatch,mol,pcophore):
         return False
   return True
 
-def _checkMatch(match,mol,bounds,pcophore,use2DLimits):
+def _GetFeatureMasks(matches,bounds,pcophore,use2DLimits=False,mol=None):
   """ **INTERNAL USE ONLY**
 
-  checks whether a particular atom match can be satisfied by
-  a molecule
+  returns a dictionary with a boolean array for each pair of
+  pharmacophore features (k,l), k<l.  The arrays have a row for each
+  match to feature k and a column for each match to feature l; entries
+  are set if the two matches can be used together: they do not share
+  atoms, they pass CoarseScreenPharmacophore() and, if use2DLimits is
+  set (and the molecule is provided), they pass Check2DBounds().
+
+  >>> feats = [ChemicalFeatures.FreeChemicalFeature('HBondAcceptor', 'HAcceptor1', Geometry.Point3D(0.0, 0.0, 0.0)),
+  ...                ChemicalFeatures.FreeChemicalFeature('HBondDonor', 'HDonor1', Geometry.Point3D(2.65, 0.0, 0.0)),
+  ...                ]
+  >>> pcophore=Pharmacophore.Pharmacophore(feats)
+  >>> pcophore.setLowerBound(0,1, 1.1)
+  >>> pcophore.setUpperBound(0,1, 1.9)
+  >>> featFactory = ChemicalFeatures.BuildFeatureFactoryFromString('''DefineFeature HAcceptor1 [N,O;H0]
+  ...   Family HBondAcceptor
+  ...   Weights 1.0
+  ... EndFeature
+  ... DefineFeature HDonor1 [N,O;!H0]
+  ...   Family HBondDonor
+  ...   Weights 1.0
+  ... EndFeature''')
+  >>> m = Chem.MolFromSmiles('OCC(=O)N')
+  >>> match,mList = MatchPharmacophoreToMol(m,featFactory,pcophore)
+  >>> [x.GetAtomIds() for x in mList[0]],[x.GetAtomIds() for x in mList[1]]
+  ([(3,)], [(0,), (4,)])
+  >>> bounds = numpy.array([[0,3,3,3,3],[1,0,3,3,3],[1,1,0,3,3],[1,1,1,0,3],[1,1,1,1,0]],numpy.float)
+  >>> masks = _GetFeatureMasks(mList,bounds,pcophore)
+  >>> masks[(0,1)].tolist()
+  [[True, True]]
+  >>> bounds[4,3] = 2.0
+  >>> _GetFeatureMasks(mList,bounds,pcophore)[(0,1)].tolist()
+  [[True, False]]
 
   """
-  atomMatch = ChemicalFeatures.GetAtomMatch(match)
-  if not atomMatch:
-    return None
-  elif use2DLimits:
-    if not Check2DBounds(atomMatch,mol,pcophore):
-      return None
-  if not CoarseScreenPharmacophore(atomMatch,bounds,pcophore):
-    return None
-  return atomMatch
+  bounds = numpy.asarray(bounds)
+  atomIds = [[feat.GetAtomIds() for feat in featMatches] for featMatches in matches]
+  nFeats = len(atomIds)
+  nAtoms = 1
+  for featIds in atomIds:
+    for ids in featIds:
+      nAtoms = max(nAtoms,max(ids)+1)
+  members = []
+  singles = []
+  for featIds in atomIds:
+    member = numpy.zeros((len(featIds),nAtoms),numpy.int32)
+    for i,ids in enumerate(featIds):
+      member[i,list(ids)] = 1
+    members.append(member)
+    singles.append(numpy.array([ids[0] if len(ids)==1 else -1 for ids in featIds],numpy.intp))
+  if use2DLimits and mol is not None:
+    dm = Chem.GetDistanceMatrix(mol,False,False,False)
+  else:
+    dm = None
+
+  masks = {}
+  for k in range(nFeats):
+    for l in range(k+1,nFeats):
+      # matches which share atoms can't be combined:
+      mask = numpy.dot(members[k],members[l].T)==0
+
+      # the coarse screen is only done for single-atom features:
+      both = (singles[k]>=0)[:,None]&(singles[l]>=0)[None,:]
+      if both.any():
+        idx0 = numpy.minimum(singles[k][:,None],singles[l][None,:])
+        idx1 = numpy.maximum(singles[k][:,None],singles[l][None,:])
+        fail = (bounds[idx1,idx0]>=pcophore.getUpperBound(k,l))| \
+               (bounds[idx0,idx1]<=pcophore.getLowerBound(k,l))
+        mask &= ~(both&fail)
+
+      if dm is not None:
+        lowerB = pcophore._boundsMat2D[l,k]
+        upperB = pcophore._boundsMat2D[k,l]
+        dij = numpy.zeros(mask.shape,numpy.float)
+        for i,ids in enumerate(atomIds[k]):
+          closest = dm[list(ids)].min(axis=0)[:nAtoms]
+          dij[i] = numpy.where(members[l]>0,closest[None,:],10000).min(axis=1)
+        dij = numpy.minimum(dij,10000)
+        mask &= (dij>=lowerB)&(dij<=upperB)
+      masks[(k,l)] = mask
+  return masks
+
+def _EnumerateCompatible(masks,sizes):
+  """ **INTERNAL USE ONLY**
+
+  generator returning, in lexicographic order, the lists of match
+  indices (one per feature) that are compatible according to _masks_
+  (see _GetFeatureMasks())
+
+  >>> masks = {(0,1):numpy.array([[1,0],[1,1]],numpy.bool),
+  ...          (0,2):numpy.array([[1,1],[0,1]],numpy.bool),
+  ...          (1,2):numpy.array([[0,1],[1,1]],numpy.bool)}
+  >>> [x for x in _EnumerateCompatible(masks,(2,2,2))]
+  [[0, 0, 1], [1, 0, 1], [1, 1, 1]]
+  >>> masks[(1,2)][0,1] = 0
+  >>> [x for x in _EnumerateCompatible(masks,(2,2,2))]
+  [[1, 1, 1]]
 
-def ConstrainedEnum(matches,mol,pcophore,bounds,use2DLimits=False,
-                    index=0,soFar=[]):
+  """
+  nFeats = len(sizes)
+  if not nFeats:
+    yield []
+    return
+  allowed = [numpy.ones(n,numpy.bool) for n in sizes]
+  # start by removing matches that aren't compatible with any of the
+  # remaining matches to some other feature:
+  changed = True
+  while changed:
+    changed = False
+    for (k,l),mask in masks.iteritems():
+      allowedK = allowed[k]&mask[:,allowed[l]].any(axis=1)
+      allowedL = allowed[l]&mask[allowed[k],:].any(axis=0)
+      if (allowedK!=allowed[k]).any() or (allowedL!=allowed[l]).any():
+        allowed[k] = allowedK
+        allowed[l] = allowedL
+        changed = True
+  for entry in allowed:
+    if not entry.any():
+      return
+
+  def _extend(level,soFar,allowed):
+    for i in numpy.nonzero(allowed[level])[0].tolist():
+      if level==nFeats-1:
+        yield soFar+[i]
+        continue
+      # intersect the candidates for the remaining features with the
+      # matches compatible with this one:
+      nextAllowed = allowed[:level+1]
+      for j in range(level+1,nFeats):
+        nextAllowed.append(allowed[j]&masks[(level,j)][i])
+        if not nextAllowed[-1].any():
+          break
+      else:
+        for res in _extend(level+1,soFar+[i],nextAllowed):
+          yield res
+  for res in _extend(0,[],allowed):
+    yield res
+
+def _AddStat(stats,name,val=1):
+  if stats is not None:
+    stats[name] = stats.get(name,0)+val
+
+def ConstrainedEnum(matches,mol,pcophore,bounds,use2DLimits=False,stats=None):
   """ Enumerates the list of atom mappings a molecule
   has to a particular pharmacophore.
   We do check distance bounds here.
-  
+
+  The compatibility of every pair of feature matches is determined up
+  front, so incompatible combinations are never built.
+
+  **Arguments**
+
+    - matches: a sequence, with an entry for each feature, of the
+      molecule's matches to that feature
+
+    - mol: the molecule, only used if _use2DLimits_ is set
+
+    - pcophore: the pharmacophore
+
+    - bounds: the molecule's bounds matrix
+
+    - use2DLimits: (optional) toggles filtering using the
+      pharmacophore's 2D limits
+
+    - stats: (optional) a dictionary.  The number of possible
+      combinations of feature matches (nCombos) and the number returned
+      (nCandidates) are added to it.
+
+  **Returns**
+
+    a generator returning (features,atom indices) 2-tuples in
+    lexicographic order
 
   """
-  nMatches = len(matches)
-  if index>=nMatches:
-    yield soFar,[]
-  elif index==nMatches-1:
-    for entry in matches[index]:
-      nextStep = soFar+[entry]
-      if index != 0:
-        atomMatch = _checkMatch(nextStep,mol,bounds,pcophore,use2DLimits)
-      else:
-        atomMatch = ChemicalFeatures.GetAtomMatch(nextStep)
-      if atomMatch:
-        yield soFar+[entry],atomMatch
-  else:
-    for entry in matches[index]:
-      nextStep = soFar+[entry]
-      if index != 0:
-        atomMatch = _checkMatch(nextStep,mol,bounds,pcophore,use2DLimits)
-        if not atomMatch:
-          continue
-      for val in ConstrainedEnum(matches,mol,pcophore,bounds,use2DLimits=use2DLimits,
-                                 index=index+1,soFar=nextStep):
-        if val:
-          yield val
+  sizes = [len(x) for x in matches]
+  nCombos = 1
+  for sz in sizes:
+    nCombos *= sz
+  _AddStat(stats,'nCombos',nCombos)
+  if not nCombos:
+    return
+  masks = _GetFeatureMasks(matches,bounds,pcophore,use2DLimits=use2DLimits,mol=mol)
+  for indices in _EnumerateCompatible(masks,sizes):
+    match = [matches[i][j] for i,j in enumerate(indices)]
+    atomMatch = [list(x.GetAtomIds()) for x in match]
+    _AddStat(stats,'nCandidates')
+    yield match,atomMatch
 
 def MatchPharmacophore(matches,bounds,pcophore,useDownsampling=False,
                        use2DLimits=False,mol=None,excludedVolumes=None,
-                       useDirs=False):
+                       useDirs=False,stats=None):
   """
 
   if use2DLimits is set, the molecule must also be provided and topological
   distances will also be used to filter out matches
 
+  if stats is provided, it should be a dictionary; the counts from
+  ConstrainedEnum() and the number of bounds matrices smoothed
+  (nSmoothed) are added to it
+
   """
   for match,atomMatch in ConstrainedEnum(matches,mol,pcophore,bounds,
-                                         use2DLimits=use2DLimits):
+                                         use2DLimits=use2DLimits,stats=stats):
     bm = bounds.copy()
     bm = UpdatePharmacophoreBounds(bm,atomMatch,pcophore,useDirs=useDirs,mol=mol);
 
@@ -1078,6 +1223,7 @@ def MatchPharmacophore(matches,bounds,pcophore,useDownsampling=False,
         for vol in localEvs:
           indices.append(vol.index)
       bm = DownsampleBoundsMatrix(bm,indices)
+    _AddStat(stats,'nSmoothed')
     if DG.DoTriangleSmoothing(bm):
       return 0,bm,match,(sz,bm.shape[0])
 
@@ -1086,54 +1232,155 @@ def MatchPharmacophore(matches,bounds,pcophore,useDownsampling=False,
 def GetAllPharmacophoreMatches(matches,bounds,pcophore,useDownsampling=0,
                                progressCallback=None,
                                use2DLimits=False,mol=None,
-                               verbose=False):
+                               verbose=False,stats=None):
   res = []
   nDone = 0
-  for match in CombiEnum(matches):
-    atomMatch = ChemicalFeatures.GetAtomMatch(match)
-    if atomMatch and use2DLimits and mol:
-      pass2D = Check2DBounds(atomMatch,mol,pcophore)
-      if verbose:
-        print '..',atomMatch
-        print '  ..Pass2d:',pass2D
-    else:
-      pass2D = True
-    if atomMatch and pass2D and \
-       CoarseScreenPharmacophore(atomMatch,bounds,pcophore,verbose=verbose):
-      if verbose:
-        print '  ..CoarseScreen: Pass'
-
-      bm = bounds.copy()
-      if verbose:
-        print 'pre update:'
-        for row in bm:
-          print ' ',' '.join(['% 4.2f'%x for x in row])
-      bm = UpdatePharmacophoreBounds(bm,atomMatch,pcophore);
-      sz = bm.shape[0]
-      if verbose:
-        print 'pre downsample:'
-        for row in bm:
-          print ' ',' '.join(['% 4.2f'%x for x in row])
-
-      if useDownsampling:
-        indices = []
-        for entry in atomMatch:
-          indices += list(entry)
-        bm = DownsampleBoundsMatrix(bm,indices)
-      if verbose:
-        print 'post downsample:'
-        for row in bm:
-          print ' ',' '.join(['% 4.2f'%x for x in row])
-        
-      if DG.DoTriangleSmoothing(bm):
-        res.append(match)
-      elif verbose:
-        print 'cannot smooth'
-      nDone+=1
-      if progressCallback:
-        progressCallback(nDone)
+  if not use2DLimits or mol is None:
+    use2DLimits=False
+  for match,atomMatch in ConstrainedEnum(matches,mol,pcophore,bounds,
+                                         use2DLimits=use2DLimits,stats=stats):
+    if not atomMatch:
+      continue
+    if verbose:
+      print '..',atomMatch
+      print '  ..CoarseScreen: Pass'
+
+    bm = bounds.copy()
+    if verbose:
+      print 'pre update:'
+      for row in bm:
+        print ' ',' '.join(['% 4.2f'%x for x in row])
+    bm = UpdatePharmacophoreBounds(bm,atomMatch,pcophore);
+    sz = bm.shape[0]
+    if verbose:
+      print 'pre downsample:'
+      for row in bm:
+        print ' ',' '.join(['% 4.2f'%x for x in row])
+
+    if useDownsampling:
+      indices = []
+      for entry in atomMatch:
+        indices += list(entry)
+      bm = DownsampleBoundsMatrix(bm,indices)
+    if verbose:
+      print 'post downsample:'
+      for row in bm:
+        print ' ',' '.join(['% 4.2f'%x for x in row])
+
+    _AddStat(stats,'nSmoothed')
+    if DG.DoTriangleSmoothing(bm):
+      res.append(match)
+    elif verbose:
+      print 'cannot smooth'
+    nDone+=1
+    if progressCallback:
+      progressCallback(nDone)
   return res
 
+_screenStatNames=('nMols','nFeatMatched','nCombos','nCandidates','nSmoothed','nMatched')
+def _ScreenMol(mol,bounds,featFactory,pcophore,stats,useDownsampling=False,
+               use2DLimits=False,useDirs=False):
+  """ **INTERNAL USE ONLY**
+
+  returns the atom indices of the first match of a pharmacophore to a
+  molecule, None if there isn't one
+
+  """
+  _AddStat(stats,'nMols')
+  if bounds is None:
+    bounds = MolDG.GetMoleculeBoundsMatrix(mol)
+  matched,matches = MatchPharmacophoreToMol(mol,featFactory,pcophore)
+  if not matched:
+    return None
+  _AddStat(stats,'nFeatMatched')
+  failed,bm,match,details = MatchPharmacophore(matches,bounds,pcophore,
+                                               useDownsampling=useDownsampling,
+                                               use2DLimits=use2DLimits,mol=mol,
+                                               useDirs=useDirs,stats=stats)
+  if failed:
+    return None
+  _AddStat(stats,'nMatched')
+  return [list(x.GetAtomIds()) for x in match]
+
+_screenData=None
+def _initScreenWorker(screenData):
+  global _screenData
+  _screenData=screenData
+
+def _screenChunk(molData):
+  """ screens a chunk of (molecule,bounds) pairs using the data set up
+  by _initScreenWorker()
+
+  """
+  featFactory,pcophore,kwargs = _screenData
+  stats = dict([(x,0) for x in _screenStatNames])
+  res = [_ScreenMol(mol,bounds,featFactory,pcophore,stats,**kwargs) for mol,bounds in molData]
+  return res,stats
+
+def ScreenMols(molData,featFactory,pcophore,useDownsampling=False,use2DLimits=False,
+               useDirs=False,numWorkers=0,chunkSize=100):
+  """ finds the first match of a pharmacophore to each of a set of
+  molecules
+
+  **Arguments**
+
+    - molData: a sequence of (molecule,bounds matrix) 2-tuples.  If the
+      bounds matrix is None, the molecule's bounds matrix is used.
+
+    - featFactory: the feature factory used to find the features
+
+    - pcophore: the pharmacophore
+
+    - useDownsampling, use2DLimits, useDirs: (optional) passed along to
+      MatchPharmacophore()
+
+    - numWorkers: (optional) if this is larger than 1, the molecules are
+      screened in a pool of this many processes.  The worker processes
+      inherit the feature factory and pharmacophore when they start.
+
+    - chunkSize: (optional) the number of molecules handed to a worker
+      process at a time
+
+  **Returns**
+
+    a 2-tuple:
+
+      1) a list with, for each molecule, the atom indices matching each
+         of the pharmacophore's features (None if the pharmacophore
+         doesn't match)
+
+      2) a dictionary with statistics: the number of molecules screened
+         (nMols), with all of the features (nFeatMatched), and matching
+         the pharmacophore (nMatched); the number of possible combinations
+         of feature matches (nCombos), of combinations that survived the
+         pairwise screens (nCandidates) and of bounds matrices smoothed
+         (nSmoothed)
+
+  """
+  kwargs = {'useDownsampling':useDownsampling,'use2DLimits':use2DLimits,
+            'useDirs':useDirs}
+  if numWorkers<=1:
+    stats = dict([(x,0) for x in _screenStatNames])
+    res = [_ScreenMol(mol,bounds,featFactory,pcophore,stats,**kwargs) for mol,bounds in molData]
+    return res,stats
+
+  molData = list(molData)
+  chunks = [molData[i:i+chunkSize] for i in range(0,len(molData),chunkSize)]
+  import multiprocessing
+  pool = multiprocessing.Pool(numWorkers,_initScreenWorker,((featFactory,pcophore,kwargs),))
+  res = []
+  stats = dict([(x,0) for x in _screenStatNames])
+  try:
+    # imap hands the results back in order:
+    for chunkRes,chunkStats in pool.imap(_screenChunk,chunks):
+      res.extend(chunkRes)
+      for k,v in chunkStats.iteritems():
+        stats[k] += v
+  finally:
+    pool.terminate()
+    pool.join()
+  return res,stats
+
     
 def ComputeChiralVolume(mol,centerIdx,confId=-1):
   """ Computes the chiral volume of an atom
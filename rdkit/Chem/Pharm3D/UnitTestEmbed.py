@@ -248,9 +248,47 @@ class TestCase(unittest.TestCase):
     self.failUnlessEqual(len(EmbedLib.MatchPharmacophore(mList2,b2,pcop,
                                                     mol=m2,use2DLimits=True)[2]),4)
 
-    
- 
-    
+  def test5PrunedEnum(self):
+    inF = gzip.open(os.path.join(self.dataDir,'cdk2-syn-clip100.pkl.gz'),'rb')
+    molData = []
+    while 1:
+      try:
+        name,molPkl,boundsMat = cPickle.load(inF)
+      except:
+        break
+      mol = Chem.Mol(molPkl)
+      molData.append((mol,boundsMat))
+      matched,matches = EmbedLib.MatchPharmacophoreToMol(mol,self.featFactory,self.pcophore)
+      if not matched:
+        continue
+      # compare to the full enumeration:
+      for use2DLimits in (False,True):
+        ref = []
+        for match in EmbedLib.CombiEnum(matches):
+          atomMatch = ChemicalFeatures.GetAtomMatch(match)
+          if atomMatch and \
+             (not use2DLimits or EmbedLib.Check2DBounds(atomMatch,mol,self.pcophore)) and \
+             EmbedLib.CoarseScreenPharmacophore(atomMatch,boundsMat,self.pcophore):
+            ref.append([list(x) for x in atomMatch])
+        res = [atomMatch for match,atomMatch in
+               EmbedLib.ConstrainedEnum(matches,mol,self.pcophore,boundsMat,
+                                        use2DLimits=use2DLimits)]
+        self.failUnlessEqual(res,ref)
+    self.failUnlessEqual(len(molData),100)
+
+    res,stats = EmbedLib.ScreenMols(molData,self.featFactory,self.pcophore)
+    self.failUnlessEqual(len(res),100)
+    self.failUnlessEqual(len([x for x in res if x is not None]),47)
+    self.failUnlessEqual(stats['nMols'],100)
+    self.failUnlessEqual(stats['nMatched'],47)
+    self.failUnless(stats['nCandidates']<=stats['nCombos'])
+    self.failUnless(stats['nSmoothed']<=stats['nCandidates'])
+
+    res2,stats2 = EmbedLib.ScreenMols(molData,self.featFactory,self.pcophore,
+                                      numWorkers=2,chunkSize=15)
+    self.failUnlessEqual(res2,res)
+    self.failUnlessEqual(stats2,stats)
+
 if __name__ == '__main__':
   unittest.main()
 
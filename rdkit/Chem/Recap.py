@@ -60,6 +60,7 @@ To get the standard set of RECAP results, use GetLeaves():
 import weakref
 from rdkit import Chem
 from rdkit.Chem import rdChemReactions as Reactions
+from rdkit.Chem.DecompositionCache import _CopyProducts
 import sys
 
 # These are the definitions that will be applied to fragment molecules:
@@ -150,8 +151,58 @@ class RecapHierarchyNode(object):
     self.mol=None
 
 
-def RecapDecompose(mol,allNodes=None,minFragmentSize=0,onlyUseReactions=None):
-  """ returns the recap decomposition for a molecule """
+def _RecapProducts(mol,minFragmentSize,onlyUseReactions):
+  """ *Internal Use Only*
+
+    applies the RECAP reactions to a molecule
+
+    **Returns**
+
+      a list with a list of (smiles,fragment) tuples for each of the
+      acceptable product sequences
+
+  """
+  res = []
+  for rxnIdx,reaction in enumerate(reactions):
+    if onlyUseReactions and rxnIdx not in onlyUseReactions:
+      continue
+    ps = reaction.RunReactants((mol,))
+    if ps:
+      for prodSeq in ps:
+        seqOk=True
+        # we want to disqualify small fragments, so sort the product sequence by size
+        # and then look for "forbidden" fragments
+        prodSeq = [(prod.GetNumAtoms(onlyExplicit=True),prod) for prod in prodSeq]
+        prodSeq.sort()
+        for nats,prod in prodSeq:
+          try:
+            Chem.SanitizeMol(prod)
+          except:
+            continue
+          pSmi = Chem.MolToSmiles(prod,1)
+          if minFragmentSize>0:
+            nDummies = pSmi.count('*')
+            if nats-nDummies<minFragmentSize:
+              seqOk=False
+              break
+          # don't forget after replacing dummy atoms to remove any empty
+          # branches:
+          elif pSmi.replace('[*]','').replace('()','') in ('','C','CC','CCC'):
+            seqOk=False
+            break
+          prod.pSmi = pSmi
+        if seqOk:
+          res.append([(prod.pSmi,prod) for nats,prod in prodSeq])
+  return res
+
+def RecapDecompose(mol,allNodes=None,minFragmentSize=0,onlyUseReactions=None,cache=None):
+  """ returns the recap decomposition for a molecule
+
+    If a _DecompositionCache_ is provided with the _cache_ argument, the
+    results of breaking up each fragment are stored in it and reused
+    for any other molecule containing the same fragment.
+
+  """
   mSmi = Chem.MolToSmiles(mol,1)
 
   if allNodes is None:
@@ -159,6 +210,10 @@ def RecapDecompose(mol,allNodes=None,minFragmentSize=0,onlyUseReactions=None):
   if allNodes.has_key(mSmi):
     return allNodes[mSmi]
 
+  if onlyUseReactions:
+    rxnKey = tuple(sorted(onlyUseReactions))
+  else:
+    rxnKey = None
   res = RecapHierarchyNode(mol)
   res.smiles =mSmi
   activePool={mSmi:res}
@@ -167,53 +222,30 @@ def RecapDecompose(mol,allNodes=None,minFragmentSize=0,onlyUseReactions=None):
     nSmi = activePool.keys()[0]
     node = activePool.pop(nSmi)
     if not node.mol: continue
-    for rxnIdx,reaction in enumerate(reactions):
-      if onlyUseReactions and rxnIdx not in onlyUseReactions:
-        continue
-      #print '  .',nSmi
-      #print '         !!!!',rxnIdx,nSmi,reactionDefs[rxnIdx]
-      ps = reaction.RunReactants((node.mol,))
-      #print '    ',len(ps)
-      if ps:
-	for prodSeq in ps:
-	  seqOk=True
-	  # we want to disqualify small fragments, so sort the product sequence by size
-	  # and then look for "forbidden" fragments
-	  prodSeq = [(prod.GetNumAtoms(onlyExplicit=True),prod) for prod in prodSeq]
-	  prodSeq.sort()
-	  for nats,prod in prodSeq:
-            try:
-              Chem.SanitizeMol(prod)
-            except:
-              continue
-            pSmi = Chem.MolToSmiles(prod,1)
-            if minFragmentSize>0:
-              nDummies = pSmi.count('*')
-              if nats-nDummies<minFragmentSize:
-                seqOk=False
-                break
-            # don't forget after replacing dummy atoms to remove any empty
-            # branches:
-	    elif pSmi.replace('[*]','').replace('()','') in ('','C','CC','CCC'):
-	      seqOk=False
-	      break
-	    prod.pSmi = pSmi
-	  if seqOk:
-  	    for nats,prod in prodSeq:
-	      pSmi = prod.pSmi
-              #print '\t',nats,pSmi
-              if not allNodes.has_key(pSmi):
-                pNode = RecapHierarchyNode(prod)
-                pNode.smiles=pSmi
-                pNode.parents[nSmi]=weakref.proxy(node)
-                node.children[pSmi]=pNode
-                activePool[pSmi] = pNode
-                allNodes[pSmi]=pNode
-              else:
-                pNode=allNodes[pSmi]
-                pNode.parents[nSmi]=weakref.proxy(node)
-                node.children[pSmi]=pNode
-            #print '                >>an:',allNodes.keys()
+    if cache is not None:
+      key = ('Recap',minFragmentSize,rxnKey,nSmi)
+      prods = cache.Get(key)
+      if prods is None:
+        prods = _RecapProducts(node.mol,minFragmentSize,onlyUseReactions)
+        cache.Set(key,_CopyProducts(prods))
+      else:
+        # don't share the cached molecules with the caller:
+        prods = _CopyProducts(prods)
+    else:
+      prods = _RecapProducts(node.mol,minFragmentSize,onlyUseReactions)
+    for prodSeq in prods:
+      for pSmi,prod in prodSeq:
+        if not allNodes.has_key(pSmi):
+          pNode = RecapHierarchyNode(prod)
+          pNode.smiles=pSmi
+          pNode.parents[nSmi]=weakref.proxy(node)
+          node.children[pSmi]=pNode
+          activePool[pSmi] = pNode
+          allNodes[pSmi]=pNode
+        else:
+          pNode=allNodes[pSmi]
+          pNode.parents[nSmi]=weakref.proxy(node)
+          node.children[pSmi]=pNode
   return res
 
       
@@ -603,6 +635,20 @@ if __name__=='__main__':
       res = RecapDecompose(m)
       self.failUnless(res)
       self.failUnless(len(res.GetLeaves())==0)
+
+    def testCache(self):
+      from rdkit.Chem.DecompositionCache import DecompositionCache
+      cache = DecompositionCache()
+      smis = ('C1CC1Oc1ccccc1-c1ncc(OC)cc1','C1CC1Oc1ccccc1-c1ncccc1','CCCOc1ccccc1NC(=O)C1CC1')
+      for i in range(2):
+        for smi in smis:
+          m = Chem.MolFromSmiles(smi)
+          ref = RecapDecompose(m)
+          res = RecapDecompose(m,cache=cache)
+          self.failUnlessEqual(sorted(res.GetAllChildren().keys()),
+                               sorted(ref.GetAllChildren().keys()))
+          self.failUnlessEqual(sorted(res.GetLeaves().keys()),sorted(ref.GetLeaves().keys()))
+      self.failUnless(cache.GetHitRate()>=0.5)
       
   unittest.main()
 
@@ -33,6 +33,7 @@
 #
 
 from rdkit import Chem
+from rdkit.Chem.PatternSet import PatternScreen,GetMolData
 import os,re
 
 from rdkit import RDConfig
@@ -160,14 +161,27 @@ class SaltRemover(object):
 
     if dontRemoveEverything and len(Chem.GetMolFrags(mol))<=1:
       return mol
+    screens = getattr(self,'_screens',None)
+    if screens is None or len(screens)!=len(self.salts):
+      screens = [PatternScreen(x) for x in self.salts]
+      self._screens = screens
     modified=False
+    molData = GetMolData(mol)
     for i,salt in enumerate(self.salts):
+      if not screens[i].CanMatch(mol,molData):
+        # nothing would be removed
+        continue
       tMol = _applyPattern(mol,salt,dontRemoveEverything)
       if tMol is not mol:
         mol = tMol
+        molData = GetMolData(mol)
         modified=True
         if dontRemoveEverything and len(Chem.GetMolFrags(mol))<=1:
           break
+    if not modified and self.salts and mol.GetNumAtoms()>0:
+      # as when the salts are applied, a (sanitized) copy is returned:
+      mol = Chem.Mol(mol)
+      modified=True
     if modified and mol.GetNumAtoms()>0:
       Chem.SanitizeMol(mol)
     return mol
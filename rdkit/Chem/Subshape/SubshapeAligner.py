@@ -37,6 +37,107 @@ def _getAllTriangles(pts,orderedTraversal=False):
           continue
         yield (i,j,k)
 
+def _getSkelPtCoords(pts):
+  """ returns an (N,3) array with the locations of skeleton points """
+  res = numpy.zeros((len(pts),3),numpy.float64)
+  for i,pt in enumerate(pts):
+    loc = pt.location
+    res[i] = loc.x,loc.y,loc.z
+  return res
+
+def _getTriangleArray(nPts,orderedTraversal=False):
+  """ returns an (N,3) array with the triangles _getAllTriangles()
+  produces for _nPts_ points, in the same order
+
+  """
+  res = numpy.array(list(_getAllTriangles(range(nPts),orderedTraversal=orderedTraversal)),
+                    numpy.intp)
+  return res.reshape((-1,3))
+
+def _getTriangleSides(xyz,tris):
+  """ returns an (N,3) array with the squared lengths of the (0,1), (0,2)
+  and (1,2) edges of each triangle
+
+    GetTriangleMatches() only has lengths for the edges (i,j) with i<j,
+    so an edge whose vertices are in the other order can't match
+    anything.  Its length is set to infinity.
+
+  """
+  res = numpy.zeros((len(tris),3),numpy.float64)
+  for col,(a,b) in enumerate(((0,1),(0,2),(1,2))):
+    delta = xyz[tris[:,a]]-xyz[tris[:,b]]
+    res[:,col] = (delta*delta).sum(axis=1)
+    res[tris[:,a]>tris[:,b],col] = numpy.inf
+  return res
+
+def _getTriangleBuckets(sides,tol):
+  """ hashes triangles by their (squared) side lengths
+
+    The buckets are a little wider than _tol_, so the triangles with all
+    sides within _tol_ of a given triangle's are in the 27 buckets
+    surrounding (and including) the one that triangle would be in.
+
+    **Returns**
+
+      a 2-tuple:
+
+        1) a dictionary mapping bucket keys to arrays of triangle indices
+
+        2) the bucket width
+
+    Triangles with infinite sides can't match anything, so they aren't
+    stored.
+
+  """
+  width = tol*(1.+1e-6)
+  finite = numpy.isfinite(sides).all(axis=1)
+  indices = numpy.nonzero(finite)[0].tolist()
+  keys = numpy.floor(sides[finite]/width).astype(numpy.int64).tolist()
+  res = {}
+  for i,key in zip(indices,keys):
+    res.setdefault(tuple(key),[]).append(i)
+  for key,val in res.items():
+    res[key] = numpy.array(val,numpy.intp)
+  return res,width
+
+def _getTriangleSSDs(tgtLocs,queryLocs):
+  """ returns the sums of squared deviations after aligning each of a
+  set of query triangles onto a target triangle
+
+    This uses the same quaternion-based approach as
+    Alignment.GetAlignmentTransform() but finds the eigenvalues for all
+    the triangles at once, so the results agree with it to within the
+    accuracy of its eigenvalue solver.
+
+    **Arguments**
+
+      - tgtLocs: a (3,3) array with the target triangle's coordinates
+
+      - queryLocs: an (N,3,3) array with the query triangles' coordinates
+
+  """
+  tgt = tgtLocs-tgtLocs.mean(axis=0)
+  query = queryLocs-queryLocs.mean(axis=1)[:,numpy.newaxis,:]
+  # cov[n,a,b] = sum_i query[n,i,a]*tgt[i,b]
+  cov = numpy.einsum('nia,ib->nab',query,tgt)
+  xx,xy,xz = cov[:,0,0],cov[:,0,1],cov[:,0,2]
+  yx,yy,yz = cov[:,1,0],cov[:,1,1],cov[:,1,2]
+  zx,zy,zz = cov[:,2,0],cov[:,2,1],cov[:,2,2]
+  quad = numpy.zeros((len(cov),4,4),numpy.float64)
+  quad[:,0,0] = -2.0*(xx+yy+zz)
+  quad[:,1,1] = -2.0*(xx-yy-zz)
+  quad[:,2,2] = -2.0*(yy-zz-xx)
+  quad[:,3,3] = -2.0*(zz-xx-yy)
+  quad[:,0,1] = quad[:,1,0] = 2.0*(yz-zy)
+  quad[:,0,2] = quad[:,2,0] = 2.0*(zx-xz)
+  quad[:,0,3] = quad[:,3,0] = 2.0*(xy-yx)
+  quad[:,1,2] = quad[:,2,1] = -2.0*(xy+yx)
+  quad[:,1,3] = quad[:,3,1] = -2.0*(zx+xz)
+  quad[:,2,3] = quad[:,3,2] = -2.0*(yz+zy)
+  res = numpy.linalg.eigvalsh(quad)[:,0]
+  res += (tgt*tgt).sum()+(query*query).sum(axis=2).sum(axis=1)
+  return res
+
 class SubshapeDistanceMetric(object):
   TANIMOTO=0
   PROTRUDE=1
@@ -54,6 +155,69 @@ def GetShapeShapeDistance(s1,s2,distMetric):
     d = Geometry.TanimotoDistance(s1.grid,s2.grid)
   return d
 
+def _getGridVals(grid):
+  """ returns an array with the values stored on a grid """
+  vect = grid.GetOccupancyVect()
+  return numpy.array([vect[i] for i in xrange(len(vect))],numpy.int64)
+
+def _getGridPointLocs(grid):
+  """ returns an (N,3) array with the locations of a grid's points """
+  nX,nY,nZ = grid.GetNumX(),grid.GetNumY(),grid.GetNumZ()
+  idx = numpy.arange(nX*nY*nZ)
+  res = numpy.zeros((len(idx),3),numpy.float64)
+  res[:,0] = idx%nX
+  res[:,1] = (idx%(nX*nY))//nX
+  res[:,2] = idx//(nX*nY)
+  res *= grid.GetSpacing()
+  offset = grid.GetOffset()
+  res += (offset.x,offset.y,offset.z)
+  return res
+
+def _getGridData(grid):
+  """ returns the data _resampleGrid() needs for a grid """
+  offset = grid.GetOffset()
+  return (_getGridVals(grid),(grid.GetNumX(),grid.GetNumY(),grid.GetNumZ()),
+          grid.GetSpacing(),numpy.array([offset.x,offset.y,offset.z]))
+
+def _resampleGrid(gridData,locs):
+  """ returns the values of a grid at a set of locations
+
+    Each location gets the value of the closest grid point (as
+    UniformGrid3D.GetValPoint() does) or zero if it's outside the grid.
+
+    **Arguments**
+
+      - gridData: the grid, from _getGridData()
+
+      - locs: an (N,3) array of locations
+
+  """
+  vals,(nX,nY,nZ),spacing,offset = gridData
+  idx = numpy.floor((locs-offset)/spacing+0.5).astype(numpy.int64)
+  inside = (idx>=0).all(axis=1)&(idx[:,0]<nX)&(idx[:,1]<nY)&(idx[:,2]<nZ)
+  idx = idx[inside]
+  res = numpy.zeros(len(locs),vals.dtype)
+  res[inside] = vals[(idx[:,2]*nY+idx[:,1])*nX+idx[:,0]]
+  return res
+
+def _getGridDistance(vals1,vals2,distMetric):
+  """ GetShapeShapeDistance() for arrays of grid values """
+  tot1 = int(vals1.sum())
+  tot2 = int(vals2.sum())
+  l1 = int(numpy.abs(vals1-vals2).sum())
+  if distMetric==SubshapeDistanceMetric.PROTRUDE:
+    if tot2<=tot1:
+      tot1,tot2 = tot2,tot1
+    if not tot1:
+      return 0.0
+    intersect = (tot1+tot2-l1)//2
+    d = float(tot1-intersect)/tot1
+  else:
+    if not l1:
+      return 0.0
+    d = l1/(l1+0.5*(tot1+tot2-l1))
+  return d
+
 # clusters a set of alignments and returns the cluster centroid
 def ClusterAlignments(mol,alignments,builder,
                       neighborTol=0.1,
@@ -92,6 +256,109 @@ def TransformMol(mol,tform,confId=-1,newConfId=100):
   mol.RemoveConformer(newConfId)
   mol.AddConformer(newConf,assignId=False)
   
+_shapeData = None
+def _initShapeWorker(shapeData):
+  global _shapeData
+  _shapeData = shapeData
+
+def _shapeChunk(indices):
+  """ checks the shapes of a chunk of alignments using the data set up
+  by _initShapeWorker()
+
+  """
+  aligner,targetMol,target,queryMol,query,builder,alignments,tgtConf,queryConf,gridData = _shapeData
+  stats = {}
+  res = []
+  for idx in indices:
+    alg = alignments[idx]
+    ok = aligner._checkAlignmentShape(targetMol,target,queryMol,query,alg,builder,
+                                      tgtConf,queryConf,gridData,pruneStats=stats)
+    res.append((ok,alg.shapeDist))
+  return res,stats
+
+_targetData = None
+def _initTargetWorker(targetData):
+  global _targetData
+  _targetData = targetData
+
+def _targetChunk(targets):
+  """ aligns the query set up by _initTargetWorker() to a chunk of
+  targets
+
+  """
+  aligner,queryMol,query,builder,tgtConf,queryConf = _targetData
+  return [_alignToTarget(aligner,targetMol,target,queryMol,query,builder,tgtConf,queryConf)
+          for targetMol,target in targets]
+
+def _alignToTarget(aligner,targetMol,target,queryMol,query,builder,tgtConf,queryConf):
+  if target is None:
+    try:
+      target = builder.GenerateSubshapeShape(targetMol,tgtConf)
+    except ValueError:
+      return None,{}
+  pruneStats = {}
+  algs = aligner.GetSubshapeAlignments(targetMol,target,queryMol,query,builder,
+                                       tgtConf=tgtConf,queryConf=queryConf,
+                                       pruneStats=pruneStats)
+  return algs,pruneStats
+
+def AlignToTargets(queryMol,query,targets,builder,aligner=None,tgtConf=-1,queryConf=-1,
+                   numWorkers=0,chunkSize=10):
+  """ aligns a query to each of a set of targets
+
+    **Arguments**
+
+      - queryMol: the query molecule
+
+      - query: the query's subshape
+
+      - targets: a sequence of (molecule,subshape) 2-tuples.  If a
+        subshape is None, it is generated using the builder (this is
+        usually quicker than passing the subshapes to the worker
+        processes).
+
+      - builder: the SubshapeBuilder
+
+      - aligner: (optional) the SubshapeAligner to use
+
+      - tgtConf, queryConf: (optional) the conformations to use
+
+      - numWorkers: (optional) if this is larger than 1, a pool of this
+        many processes is used.  The aligner and builder are handed to
+        the workers when they start up, so they don't need to be
+        picklable on platforms which fork.
+
+      - chunkSize: (optional) the number of targets handed to a worker
+        process at a time
+
+    **Returns**
+
+      a list with a 2-tuple for each target: the list of alignments
+      from GetSubshapeAlignments() and the pruning statistics.  The
+      alignments are None for targets whose subshapes could not be
+      generated.
+
+  """
+  if aligner is None:
+    aligner = SubshapeAligner()
+  if numWorkers<=1:
+    return [_alignToTarget(aligner,targetMol,target,queryMol,query,builder,tgtConf,queryConf)
+            for targetMol,target in targets]
+  targets = list(targets)
+  chunks = [targets[i:i+chunkSize] for i in range(0,len(targets),chunkSize)]
+  import multiprocessing
+  pool = multiprocessing.Pool(numWorkers,_initTargetWorker,
+                              ((aligner,queryMol,query,builder,tgtConf,queryConf),))
+  res = []
+  try:
+    # imap hands the results back in order:
+    for chunkRes in pool.imap(_targetChunk,chunks):
+      res.extend(chunkRes)
+  finally:
+    pool.terminate()
+    pool.join()
+  return res
+
 class SubshapeAligner(object):
   triangleRMSTol=1.0
   distMetric=SubshapeDistanceMetric.PROTRUDE
@@ -103,49 +370,73 @@ class SubshapeAligner(object):
   #medGridToleranceMult=1.25
   coarseGridToleranceMult=1.0
   medGridToleranceMult=1.0
+  # if this is set, the query's grids are generated once and resampled
+  # for each alignment instead of being regenerated from the transformed
+  # query. This is a lot faster, but the distances are approximate:
+  resampleQueryGrids=False
   
   def GetTriangleMatches(self,target,query):
     """ this is a generator function returning the possible triangle
         matches between the two shapes
+
+      The triangles are visited in the order _getAllTriangles()
+      produces them (ordered for the target, unordered for the query).
+      Each target triangle is only compared to the query triangles in
+      the neighboring buckets of
+      _getTriangleBuckets(), so the edge lengths of most pairs of
+      triangles are never compared.  The candidate alignments for a
+      target triangle are screened together using _getTriangleSSDs();
+      Alignment.GetAlignmentTransform() is only called for the ones
+      which pass.
     """    
     ssdTol = (self.triangleRMSTol**2)*9
-    res = []
+    # the screening SSDs are very slightly different from the ones
+    # GetAlignmentTransform() returns, so give them a little room:
+    screenTol = ssdTol+1e-4*max(ssdTol,1.0)
+    tol2 = self.edgeTol*self.edgeTol
     tgtPts = target.skelPts
     queryPts = query.skelPts
-    tgtLs = {}
-    for i in range(len(tgtPts)):
-      for j in range(i+1,len(tgtPts)):
-        l2 = (tgtPts[i].location-tgtPts[j].location).LengthSq()
-        tgtLs[(i,j)]=l2
-    queryLs = {}
-    for i in range(len(queryPts)):
-      for j in range(i+1,len(queryPts)):
-        l2 = (queryPts[i].location-queryPts[j].location).LengthSq()
-        queryLs[(i,j)]=l2
-    compatEdges={}
-    tol2 = self.edgeTol*self.edgeTol
-    for tk,tv in tgtLs.iteritems():
-      for qk,qv in queryLs.iteritems():
-        if abs(tv-qv)<tol2:
-          compatEdges[(tk,qk)]=1
+    tgtXYZ = _getSkelPtCoords(tgtPts)
+    queryXYZ = _getSkelPtCoords(queryPts)
+    tgtTris = _getTriangleArray(len(tgtPts),orderedTraversal=True)
+    queryTris = _getTriangleArray(len(queryPts),orderedTraversal=False)
+    tgtSides = _getTriangleSides(tgtXYZ,tgtTris)
+    querySides = _getTriangleSides(queryXYZ,queryTris)
+    buckets,width = _getTriangleBuckets(querySides,tol2)
+    offsets = [(a,b,c) for a in (-1,0,1) for b in (-1,0,1) for c in (-1,0,1)]
     seqNo=0
-    for tgtTri in _getAllTriangles(tgtPts,orderedTraversal=True):
+    for tIdx in xrange(len(tgtTris)):
+      sides = tgtSides[tIdx]
+      b0,b1,b2 = [int(x) for x in numpy.floor(sides/width)]
+      cands = [buckets[key] for key in [(b0+o0,b1+o1,b2+o2) for o0,o1,o2 in offsets]
+               if key in buckets]
+      if not cands:
+        continue
+      cands = numpy.concatenate(cands)
+      cands = cands[(numpy.abs(querySides[cands]-sides)<tol2).all(axis=1)]
+      if not len(cands):
+        continue
+      # the buckets are disjoint, so sorting restores the query triangle order:
+      cands.sort()
+      tgtTri = tuple(tgtTris[tIdx].tolist())
+      ssds = _getTriangleSSDs(tgtXYZ[tgtTris[tIdx]],queryXYZ[queryTris[cands]])
+      cands = cands[ssds<=screenTol]
+      if not len(cands):
+        continue
       tgtLocs=[tgtPts[x].location for x in tgtTri]
-      for queryTri in _getAllTriangles(queryPts,orderedTraversal=False):
-        if compatEdges.has_key(((tgtTri[0],tgtTri[1]),(queryTri[0],queryTri[1]))) and \
-           compatEdges.has_key(((tgtTri[0],tgtTri[2]),(queryTri[0],queryTri[2]))) and \
-           compatEdges.has_key(((tgtTri[1],tgtTri[2]),(queryTri[1],queryTri[2]))):
-          queryLocs=[queryPts[x].location for x in queryTri]
-          ssd,tf = Alignment.GetAlignmentTransform(tgtLocs,queryLocs)
-          if ssd<=ssdTol:
-            alg = SubshapeAlignment()
-            alg.transform=tf
-            alg.triangleSSD=ssd
-            alg.targetTri=tgtTri
-            alg.queryTri=queryTri
-            alg._seqNo=seqNo
-            seqNo+=1
-            yield alg    
+      for qIdx in cands:
+        queryTri = tuple(queryTris[qIdx].tolist())
+        queryLocs=[queryPts[x].location for x in queryTri]
+        ssd,tf = Alignment.GetAlignmentTransform(tgtLocs,queryLocs)
+        if ssd<=ssdTol:
+          alg = SubshapeAlignment()
+          alg.transform=tf
+          alg.triangleSSD=ssd
+          alg.targetTri=tgtTri
+          alg.queryTri=queryTri
+          alg._seqNo=seqNo
+          seqNo+=1
+          yield alg    
   
   def _checkMatchFeatures(self,targetPts,queryPts,alignment):
     nMatched=0
@@ -164,17 +455,16 @@ class SubshapeAligner(object):
     return nMatched>=self.numFeatThresh
 
   def PruneMatchesUsingFeatures(self,target,query,alignments,pruneStats=None):
-    i = 0
     targetPts = target.skelPts
     queryPts = query.skelPts
-    while i<len(alignments):
-      alg = alignments[i]
+    res = []
+    for alg in alignments:
       if not self._checkMatchFeatures(targetPts,queryPts,alg):
         if pruneStats is not None:
           pruneStats['features']=pruneStats.get('features',0)+1
-        del alignments[i]
       else:
-        i+=1
+        res.append(alg)
+    alignments[:] = res
 
   def _checkMatchDirections(self,targetPts,queryPts,alignment):
     dot = 0.0
@@ -195,16 +485,16 @@ class SubshapeAligner(object):
     return dot>=self.dirThresh
     
   def PruneMatchesUsingDirection(self,target,query,alignments,pruneStats=None):
-    i = 0
     tgtPts = target.skelPts
     queryPts = query.skelPts
-    while i<len(alignments):
-      if not self._checkMatchDirections(tgtPts,queryPts,alignments[i]):
+    res = []
+    for alg in alignments:
+      if not self._checkMatchDirections(tgtPts,queryPts,alg):
         if pruneStats is not None:
           pruneStats['direction']=pruneStats.get('direction',0)+1
-        del alignments[i]
       else:
-        i+=1
+        res.append(alg)
+    alignments[:] = res
 
   def _addCoarseAndMediumGrids(self,mol,tgt,confId,builder):
     oSpace=builder.gridSpacing
@@ -252,34 +542,114 @@ class SubshapeAligner(object):
     builder.gridSpacing=oSpace
     return matchOk
 
+  def _getShapeGridData(self,target,queryMol,queryConf,builder):
+    """ returns the data _checkMatchShapeResampled() needs: for each of
+    the coarse, medium and fine grids, the values on the target's grid,
+    the locations of its points and the query's grid in its own frame
+
+    """
+    from rdkit.Chem import AllChem
+    conf = queryMol.GetConformer(queryConf)
+    pos = numpy.array([list(conf.GetAtomPosition(i)) for i in range(conf.GetNumAtoms())])
+    center = 0.5*(pos.min(axis=0)+pos.max(axis=0))
+    dims = builder.gridDims
+    offset = Geometry.Point3D(*[c-0.5*d for c,d in zip(center,dims)])
+    res = []
+    for mult,tgtShape in ((2.0,target.coarseGrid),(1.5,target.medGrid),(1.0,target)):
+      grid = Geometry.UniformGrid3D(dims[0],dims[1],dims[2],builder.gridSpacing*mult,
+                                    offSet=offset)
+      AllChem.EncodeShape(queryMol,grid,ignoreHs=False,confId=queryConf)
+      res.append((_getGridVals(tgtShape.grid),_getGridPointLocs(tgtShape.grid),
+                  _getGridData(grid)))
+    return res
+
+  def _checkMatchShapeResampled(self,gridData,alignment,pruneStats=None):
+    tform = numpy.array(alignment.transform)
+    rot = tform[:3,:3]
+    trans = tform[:3,3]
+    tols = (self.shapeDistTol*self.coarseGridToleranceMult,
+            self.shapeDistTol*self.medGridToleranceMult,
+            self.shapeDistTol)
+    for (tgtVals,tgtLocs,queryGrid),tol,statName in zip(gridData,tols,
+                                                       ('coarseGrid','medGrid','fineGrid')):
+      # the transform takes the query onto the target, so its inverse
+      # takes the target's grid points into the query's frame:
+      queryVals = _resampleGrid(queryGrid,numpy.dot(tgtLocs-trans,rot))
+      d = _getGridDistance(queryVals,tgtVals,self.distMetric)
+      if statName=='fineGrid':
+        alignment.shapeDist=d
+      if d>tol:
+        if pruneStats is not None:
+          pruneStats[statName]=pruneStats.get(statName,0)+1
+        return False
+    return True
+
+  def _checkAlignmentShape(self,targetMol,target,queryMol,query,alignment,builder,
+                           tgtConf,queryConf,gridData,pruneStats=None):
+    if gridData is not None:
+      return self._checkMatchShapeResampled(gridData,alignment,pruneStats=pruneStats)
+    return self._checkMatchShape(targetMol,target,queryMol,query,alignment,builder,
+                                 targetConf=tgtConf,queryConf=queryConf,
+                                 pruneStats=pruneStats)
+
   def PruneMatchesUsingShape(self,targetMol,target,queryMol,query,builder,
                              alignments,tgtConf=-1,queryConf=-1,
-                             pruneStats=None):
+                             pruneStats=None,numWorkers=0,chunkSize=100):
+    """ removes the alignments whose shapes don't match well enough
+
+      If _numWorkers_ is larger than 1, the alignments are checked using
+      a pool of that many processes, _chunkSize_ alignments at a time.
+
+    """
     if not hasattr(target,'medGrid'):
       self._addCoarseAndMediumGrids(targetMol,target,tgtConf,builder)
 
     logger.info("Shape-based Pruning")
-    i=0
+    if self.resampleQueryGrids:
+      gridData = self._getShapeGridData(target,queryMol,queryConf,builder)
+    else:
+      gridData = None
     nOrig = len(alignments)
-    nDone=0
-    while i < len(alignments):
-      removeIt=False
-      alg = alignments[i]
-      nDone+=1
-      if not nDone%100:
-        nLeft = len(alignments)
-        logger.info('  processed %d of %d. %d alignments remain'%((nDone,
-                                                                   nOrig,
-                                                                   nLeft)))
-      if not self._checkMatchShape(targetMol,target,queryMol,query,alg,builder,
-                                   targetConf=tgtConf,queryConf=queryConf,
-                                   pruneStats=pruneStats):
-        del alignments[i]
-      else:
-        i+=1
+    res = []
+    if numWorkers<=1:
+      for nDone,alg in enumerate(alignments):
+        if nDone and not nDone%100:
+          nLeft = len(res)+nOrig-nDone
+          logger.info('  processed %d of %d. %d alignments remain'%((nDone,
+                                                                     nOrig,
+                                                                     nLeft)))
+        if self._checkAlignmentShape(targetMol,target,queryMol,query,alg,builder,
+                                     tgtConf,queryConf,gridData,pruneStats=pruneStats):
+          res.append(alg)
+    else:
+      chunks = [range(i,min(i+chunkSize,nOrig)) for i in range(0,nOrig,chunkSize)]
+      import multiprocessing
+      pool = multiprocessing.Pool(numWorkers,_initShapeWorker,
+                                  ((self,targetMol,target,queryMol,query,builder,alignments,
+                                    tgtConf,queryConf,gridData),))
+      try:
+        # imap hands the results back in order:
+        for indices,(chunkRes,chunkStats) in zip(chunks,pool.imap(_shapeChunk,chunks)):
+          for idx,(ok,shapeDist) in zip(indices,chunkRes):
+            alg = alignments[idx]
+            alg.shapeDist = shapeDist
+            if ok:
+              res.append(alg)
+          if pruneStats is not None:
+            for k,v in chunkStats.iteritems():
+              pruneStats[k] = pruneStats.get(k,0)+v
+          nDone = indices[-1]+1
+          logger.info('  processed %d of %d. %d alignments remain'%((nDone,
+                                                                     nOrig,
+                                                                     len(res)+nOrig-nDone)))
+      finally:
+        pool.terminate()
+        pool.join()
+    alignments[:] = res
 
   def GetSubshapeAlignments(self,targetMol,target,queryMol,query,builder,
-                            tgtConf=-1,queryConf=-1,pruneStats=None):
+                            tgtConf=-1,queryConf=-1,pruneStats=None,numWorkers=0,
+                            chunkSize=100):
     import time
     if pruneStats is None:
       pruneStats={}
@@ -305,13 +675,15 @@ class SubshapeAligner(object):
     t1 = time.time()
     self.PruneMatchesUsingShape(targetMol,target,queryMol,query,builder,res,
                                 tgtConf=tgtConf,queryConf=queryConf,
-                                pruneStats=pruneStats)
+                                pruneStats=pruneStats,numWorkers=numWorkers,
+                                chunkSize=chunkSize)
     t2 = time.time()
     pruneStats['shape_time']=t2-t1
     return res
 
   def __call__(self,targetMol,target,queryMol,query,builder,
                              tgtConf=-1,queryConf=-1,pruneStats=None):
+    gridData = None
     for alignment in self.GetTriangleMatches(target,query):
       if builder.featFactory and \
          not self._checkMatchFeatures(target.skelPts,query.skelPts,alignment):
@@ -325,10 +697,11 @@ class SubshapeAligner(object):
 
       if not hasattr(target,'medGrid'):
         self._addCoarseAndMediumGrids(targetMol,target,tgtConf,builder)
+      if self.resampleQueryGrids and gridData is None:
+        gridData = self._getShapeGridData(target,queryMol,queryConf,builder)
 
-      if not self._checkMatchShape(targetMol,target,queryMol,query,alignment,builder,
-                                   targetConf=tgtConf,queryConf=queryConf,
-                                   pruneStats=pruneStats):
+      if not self._checkAlignmentShape(targetMol,target,queryMol,query,alignment,builder,
+                                       tgtConf,queryConf,gridData,pruneStats=pruneStats):
         continue
       # if we made it this far, it's a good alignment
       yield alignment
@@ -74,6 +74,114 @@ class TestCase(unittest.TestCase):
                                                       neighborTol=0.15))
     self.failUnless([len(x) for x in pruned] == [0,2,29,0])
 
+  def test2TriangleMatches(self):
+    " testing the triangle matcher against a brute-force search "
+    from rdkit.Numerics import Alignment
+    suppl = Chem.SDMolSupplier(os.path.join(RDConfig.RDCodeDir,'Chem','Subshape',
+                                        'test_data/5ht3ligs.sdf'))
+    builder = SubshapeBuilder.SubshapeBuilder()
+    builder.gridDims=(20.,20.,10)
+    builder.gridSpacing=0.5
+    builder.winRad=4.
+    ms = []
+    for m in suppl:
+      m = Chem.AddHs(m,addCoords=True)
+      AllChem.CanonicalizeConformer(m.GetConformer())
+      ms.append(m)
+    refShape = builder.GenerateSubshapeShape(ms[0])
+    aligner = SubshapeAligner.SubshapeAligner()
+    for m in ms[1:]:
+      shape = builder.GenerateSubshapeShape(m)
+      for tgt,query in ((refShape,shape),(shape,refShape)):
+        # this is the search GetTriangleMatches() used to do:
+        tgtPts = tgt.skelPts
+        queryPts = query.skelPts
+        tol2 = aligner.edgeTol**2
+        ssdTol = (aligner.triangleRMSTol**2)*9
+        tgtLs = {}
+        for i in range(len(tgtPts)):
+          for j in range(i+1,len(tgtPts)):
+            tgtLs[(i,j)] = (tgtPts[i].location-tgtPts[j].location).LengthSq()
+        queryLs = {}
+        for i in range(len(queryPts)):
+          for j in range(i+1,len(queryPts)):
+            queryLs[(i,j)] = (queryPts[i].location-queryPts[j].location).LengthSq()
+        compatEdges = {}
+        for tk,tv in tgtLs.iteritems():
+          for qk,qv in queryLs.iteritems():
+            if abs(tv-qv)<tol2:
+              compatEdges[(tk,qk)] = 1
+        ref = []
+        for tgtTri in SubshapeAligner._getAllTriangles(tgtPts,orderedTraversal=True):
+          for queryTri in SubshapeAligner._getAllTriangles(queryPts,orderedTraversal=False):
+            if ((tgtTri[0],tgtTri[1]),(queryTri[0],queryTri[1])) in compatEdges and \
+               ((tgtTri[0],tgtTri[2]),(queryTri[0],queryTri[2])) in compatEdges and \
+               ((tgtTri[1],tgtTri[2]),(queryTri[1],queryTri[2])) in compatEdges:
+              ssd,tf = Alignment.GetAlignmentTransform([tgtPts[x].location for x in tgtTri],
+                                                       [queryPts[x].location for x in queryTri])
+              if ssd<=ssdTol:
+                ref.append((tgtTri,queryTri,ssd))
+        algs = list(aligner.GetTriangleMatches(tgt,query))
+        self.failUnless(len(ref))
+        self.failUnlessEqual([(x.targetTri,x.queryTri,x.triangleSSD) for x in algs],ref)
+        self.failUnlessEqual([x._seqNo for x in algs],range(len(algs)))
+
+  def test3ShapePruning(self):
+    " testing parallel, batch and resampled shape pruning "
+    suppl = Chem.SDMolSupplier(os.path.join(RDConfig.RDCodeDir,'Chem','Subshape',
+                                        'test_data/5ht3ligs.sdf'))
+    builder = SubshapeBuilder.SubshapeBuilder()
+    builder.gridDims=(20.,20.,10)
+    builder.gridSpacing=0.5
+    builder.winRad=4.
+    ms = []
+    shapes=[]
+    for m in suppl:
+      m = Chem.AddHs(m,addCoords=True)
+      AllChem.CanonicalizeConformer(m.GetConformer())
+      ms.append(m)
+      shapes.append(builder(m,terminalPtsOnly=True))
+    refShape = builder.GenerateSubshapeShape(ms[0])
+    aligner = SubshapeAligner.SubshapeAligner()
+    aligner.shapeDistTol=.30
+
+    ref = []
+    for m,s in zip(ms[1:],shapes[1:]):
+      algs = aligner.GetSubshapeAlignments(ms[0],refShape,m,s,builder)
+      ref.append([(x.targetTri,x.queryTri,x.shapeDist) for x in algs])
+    # the same counts test1 expects:
+    self.failUnlessEqual([len(x) for x in ref],[2,39,0])
+    for i,(m,s) in enumerate(zip(ms[1:],shapes[1:])):
+      algs = aligner.GetSubshapeAlignments(ms[0],refShape,m,s,builder,numWorkers=2)
+      self.failUnlessEqual([(x.targetTri,x.queryTri,x.shapeDist) for x in algs],ref[i])
+
+    for numWorkers in (0,2):
+      res = SubshapeAligner.AlignToTargets(ms[2],shapes[2],[(ms[0],refShape),(ms[0],None)],
+                                           builder,aligner=aligner,numWorkers=numWorkers)
+      self.failUnlessEqual(len(res),2)
+      for algs,pruneStats in res:
+        self.failUnlessEqual([(x.targetTri,x.queryTri,x.shapeDist) for x in algs],ref[1])
+        self.failUnless('shape_time' in pruneStats)
+
+    # resampling a grid at its own points gives back its values:
+    grid = refShape.grid
+    vals = SubshapeAligner._resampleGrid(SubshapeAligner._getGridData(grid),
+                                         SubshapeAligner._getGridPointLocs(grid))
+    self.failUnlessEqual(list(vals),list(SubshapeAligner._getGridVals(grid)))
+    # and the distances match the grid ones:
+    shape1 = builder.GenerateSubshapeShape(ms[1],addSkeleton=False)
+    for metric in (SubshapeAligner.SubshapeDistanceMetric.PROTRUDE,
+                   SubshapeAligner.SubshapeDistanceMetric.TANIMOTO):
+      d = SubshapeAligner._getGridDistance(SubshapeAligner._getGridVals(shape1.grid),
+                                           SubshapeAligner._getGridVals(grid),metric)
+      self.failUnlessAlmostEqual(d,SubshapeAligner.GetShapeShapeDistance(shape1,refShape,metric))
+
+    aligner.resampleQueryGrids=True
+    algs = aligner.GetSubshapeAlignments(ms[0],refShape,ms[2],shapes[2],builder)
+    matches = [(x.targetTri,x.queryTri) for x in aligner.GetTriangleMatches(refShape,shapes[2])]
+    for alg in algs:
+      self.failUnless((alg.targetTri,alg.queryTri) in matches)
+      self.failUnless(alg.shapeDist<=aligner.shapeDistTol)
 
     
 
@@ -228,6 +228,30 @@ class TestCase(unittest.TestCase):
 	    ]
     self._runTest(data,Fragments.fr_alkyl_halide)
 
+  def test23LazyPatterns(self):
+    " the patterns are not parsed until they are used "
+    import subprocess,sys
+    cmd = "from rdkit.Chem import Descriptors,Fragments;print len(Fragments._patterns)"
+    p = subprocess.Popen([sys.executable,'-c',cmd],stdout=subprocess.PIPE)
+    out = p.communicate()[0]
+    self.failUnlessEqual(p.returncode,0)
+    self.failUnlessEqual(out.strip(),'0')
+
+    Fragments._ParsePatterns()
+    smas = set([fn.smarts for name,fn in Fragments.fns])
+    self.failUnlessEqual(len(Fragments._patterns),len(smas))
+    self.failUnlessRaises(ValueError,Fragments._GetPattern,'[C')
+
+  def test24Screening(self):
+    " screening with shared molecule data gives the same counts "
+    from rdkit.Chem.PatternSet import GetMolData
+    for smi in ('c1ccccc1OC','CCCF','O=C(O)C(=O)O','C1CC1C(=O)N','c1ccncc1C#N'):
+      mol = Chem.MolFromSmiles(smi)
+      molData = GetMolData(mol)
+      for name,fn in Fragments.fns:
+        self.failUnlessEqual(fn(mol,molData=molData),fn(mol),
+                             'bad count for %s with smiles %s'%(name,smi))
+
 
 
 if __name__ == '__main__':
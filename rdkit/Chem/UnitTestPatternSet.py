@@ -0,0 +1,77 @@
+# $Id$
+#
+#  This file is part of the RDKit.
+#  The contents are covered by the terms of the BSD license
+#  which is included in the file license.txt, found at the root
+#  of the RDKit source tree.
+#
+""" unit tests for the substructure pattern screens """
+import unittest
+from rdkit import Chem
+from rdkit.Chem import PatternSet,Fragments,MACCSkeys,FunctionalGroups
+
+_smis = ['CC(=O)O','c1ccccc1Cl','CN1C=NC2=C1C(=O)N(C(=O)N2C)C','OC(=O)c1ccccc1OC(C)=O',
+         'C[NH+](C)C.[Cl-]','CCOP(=S)(OCC)Oc1nc(Cl)c(Cl)cc1Cl','c1ccc2c(c1)[nH]c1ccccc12',
+         'CC(C)(C)NCC(O)c1ccc(O)c(CO)c1','O=S(=O)(N)c1cc(C(=O)O)c(NCc2ccco2)cc1Cl',
+         'FC(F)(F)c1ccc(Oc2ccc([N+](=O)[O-])cc2)cc1','[Na+].[O-]C(=O)CCCCCCCCCCC','C#N',
+         'ICC=C[Si](C)(C)C','Brc1c[se]cc1','C1CC1N=C=S','[2H]C([2H])([2H])Cl','B(O)(O)c1ccccc1']
+
+class TestCase(unittest.TestCase):
+  def _checkPatterns(self,patts):
+    pset = PatternSet.PatternSet(patts)
+    for smi in _smis:
+      mol = Chem.MolFromSmiles(smi)
+      candidates = pset.GetCandidates(mol)
+      for i,patt in enumerate(patts):
+        if patt is not None and i not in candidates:
+          self.failIf(mol.HasSubstructMatch(patt),'%s %s'%(smi,Chem.MolToSmarts(patt)))
+      ref = [patt is not None and mol.HasSubstructMatch(patt) for patt in patts]
+      self.failUnlessEqual(pset.HasSubstructMatches(mol),ref)
+    self.failUnless(pset.nSkipped>0)
+
+  def test1Fragments(self):
+    Fragments._ParsePatterns()
+    self._checkPatterns([Fragments._GetPattern(fn.smarts) for name,fn in Fragments.fns])
+
+  def test2MACCS(self):
+    MACCSkeys._pyGenMACCSKeys(Chem.MolFromSmiles('C'))
+    self._checkPatterns([patt for patt,count in MACCSkeys.maccsKeys])
+
+  def test3FunctionalGroups(self):
+    patts = []
+    nodes = list(FunctionalGroups.BuildFuncGroupHierarchy())
+    while nodes:
+      node = nodes.pop(0)
+      patts.append(node.pattern)
+      nodes.extend(node.children)
+    self._checkPatterns(patts)
+
+  def test4Fingerprints(self):
+    patts = [Chem.MolFromSmarts(x) for x in ('c1ccccc1','C=O','[#7]~[#6]','[Cl,Br]','C(F)(F)F')]
+    pset = PatternSet.PatternSet(patts,useFingerprint=True)
+    for smi in _smis:
+      mol = Chem.MolFromSmiles(smi)
+      self.failUnlessEqual(pset.HasSubstructMatches(mol),
+                           [mol.HasSubstructMatch(x) for x in patts])
+
+  def test5Rings(self):
+    patts = [Chem.MolFromSmarts(x) for x in ('[R]','[R]~[R]','[C;r3]','*1**1','[#6]1~*~*~*~*~*~1',
+                                              '[#6]12~*~*~1~*~2','[x3]','[!R]','[R0]','c:c')]
+    self._checkPatterns(patts)
+
+  def test6ModifiedMols(self):
+    " screening data isn't stale after a molecule is modified "
+    screen = PatternSet.PatternScreen(Chem.MolFromSmarts('[Cl]'))
+    mol = Chem.RWMol(Chem.MolFromSmiles('CCO'))
+    self.failIf(screen.CanMatch(mol))
+    mol.GetAtomWithIdx(2).SetAtomicNum(17)
+    self.failUnless(screen.CanMatch(mol))
+
+    screen = PatternSet.PatternScreen(Chem.MolFromSmarts('c'))
+    mol = Chem.MolFromSmiles('C1=CC=CC=C1',sanitize=False)
+    self.failIf(screen.CanMatch(mol))
+    Chem.SanitizeMol(mol)
+    self.failUnless(screen.CanMatch(mol))
+
+if __name__ == '__main__':
+  unittest.main()
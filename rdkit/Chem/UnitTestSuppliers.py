@@ -105,6 +105,41 @@ CCOC,5
       ms.remove(None)
     assert len(ms)==3
 
+  def test4IndexedSDSupplier(self):
+    from rdkit.Chem.FastSDMolSupplier import IndexedSDMolSupplier
+    import tempfile
+    fileN = os.path.join(RDConfig.RDCodeDir,'VLib','NodeLib','test_data','NCI_aids.10.sdf')
+    indexN = tempfile.mktemp('.idx')
+    self._files.append(indexN)
+
+    suppl = IndexedSDMolSupplier(fileN,indexFileN=indexN)
+    self.failUnless(os.path.exists(indexN))
+    self.failUnlessEqual(len(suppl),10)
+    ref = [x.GetProp('_Name') for x in Chem.SDMolSupplier(fileN)]
+    self.failUnlessEqual([x.GetProp('_Name') for x in suppl],ref)
+    # test repeating:
+    self.failUnlessEqual([x.GetProp('_Name') for x in suppl],ref)
+    self.failUnlessEqual(suppl[3].GetProp('_Name'),ref[3])
+    self.failUnlessEqual(suppl[-1].GetProp('_Name'),ref[-1])
+    self.failUnlessRaises(IndexError,lambda:suppl[10])
+    txt = suppl.GetItemText(1)
+    self.failUnless(str(txt).startswith('78'))
+    self.failUnless(str(txt).strip().endswith('$$$$'))
+
+    # the saved index is picked up:
+    suppl2 = IndexedSDMolSupplier(fileN,indexFileN=indexN)
+    self.failUnlessEqual(list(suppl2._offsets),list(suppl._offsets))
+
+    chunks = suppl.GetChunks(3)
+    self.failUnlessEqual(len(chunks),3)
+    self.failUnlessEqual(sum([len(x) for x in chunks]),10)
+    names = []
+    for chunk in chunks:
+      chunk = cPickle.loads(cPickle.dumps(chunk))
+      names.extend([x.GetProp('_Name') for x in chunk])
+    self.failUnlessEqual(names,ref)
+    self.failUnlessEqual(len(suppl.GetChunks(20)),10)
+
     
         
 if __name__ == '__main__':
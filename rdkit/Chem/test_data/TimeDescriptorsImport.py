@@ -0,0 +1,94 @@
+# $Id$
+#
+#  This file is part of the RDKit.
+#  The contents are covered by the terms of the BSD license
+#  which is included in the file license.txt, found at the root
+#  of the RDKit source tree.
+#
+""" times importing rdkit.Chem.Descriptors in fresh interpreters
+
+Usage: python TimeDescriptorsImport.py [nRuns]
+       python TimeDescriptorsImport.py --fragments [nMols]
+
+The time needed to import rdkit.Chem (which is paid by anything using
+descriptors) is reported separately.
+
+With --fragments the fr_ descriptors are timed instead, both searching
+for every pattern and screening the patterns with data calculated once
+per molecule (as MolecularDescriptorCalculator.CalcDescriptorsBatch()
+does).
+
+"""
+import subprocess,sys,os,time
+
+_timingCode = """import time
+t1=time.time()
+from rdkit import Chem
+t2=time.time()
+from rdkit.Chem import Descriptors
+t3=time.time()
+print t2-t1,t3-t2,len(Descriptors.descList)
+"""
+
+def runIt(nRuns=10):
+  chemTimes = []
+  descrTimes = []
+  for i in range(nRuns):
+    p = subprocess.Popen([sys.executable,'-c',_timingCode],stdout=subprocess.PIPE)
+    out = p.communicate()[0]
+    if p.returncode:
+      raise RuntimeError,'import failed'
+    chemT,descrT,nDescrs = out.split()
+    chemTimes.append(float(chemT))
+    descrTimes.append(float(descrT))
+  chemTimes.sort()
+  descrTimes.sort()
+  print 'descriptors: %s'%nDescrs
+  print 'import rdkit.Chem:             min %.3fs  median %.3fs'%(chemTimes[0],chemTimes[nRuns//2])
+  print 'import rdkit.Chem.Descriptors: min %.3fs  median %.3fs'%(descrTimes[0],descrTimes[nRuns//2])
+  return descrTimes
+
+def runFragments(nMols=1000):
+  from rdkit import Chem
+  from rdkit.Chem import Fragments
+  from rdkit.Chem.PatternSet import GetMolData
+  inF = open(os.path.join(os.path.dirname(os.path.abspath(__file__)),'NCI_5K_TPSA.csv'),'r')
+  mols = []
+  for line in inF:
+    if line[0]=='#':
+      continue
+    mol = Chem.MolFromSmiles(line.split(',')[0])
+    if mol is not None:
+      mols.append(mol)
+    if len(mols)>=nMols:
+      break
+  Fragments._ParsePatterns()
+  fns = [fn for name,fn in Fragments.fns]
+
+  t1 = time.time()
+  unscreened = [[fn(mol) for fn in fns] for mol in mols]
+  t2 = time.time()
+  screened = []
+  for mol in mols:
+    molData = GetMolData(mol)
+    screened.append([fn(mol,molData=molData) for fn in fns])
+  t3 = time.time()
+  if screened!=unscreened:
+    raise ValueError,'screened counts differ'
+  print '%d molecules, %d fr_ descriptors'%(len(mols),len(fns))
+  print 'searching all patterns: %.3fs'%(t2-t1)
+  print 'screening the patterns: %.3fs'%(t3-t2)
+  return t2-t1,t3-t2
+
+if __name__=='__main__':
+  args = sys.argv[1:]
+  if args and args[0]=='--fragments':
+    nMols = 1000
+    if len(args)>1:
+      nMols = int(args[1])
+    runFragments(nMols)
+  else:
+    nRuns = 10
+    if args:
+      nRuns = int(args[0])
+    runIt(nRuns)
@@ -14,6 +14,7 @@ tests=[
   ("python","UnitTestSATIS.py",{}),
   ("python","UnitTestSmiles.py",{}),
   ("python","UnitTestSuppliers.py",{}),
+  ("python","FastSDMolSupplier.py",{}),
   ("python","UnitTestSurf.py",{}),
   ("python","FragmentMatcher.py",{}),
   ("python","MACCSkeys.py",{}),
@@ -22,11 +23,14 @@ tests=[
   ("python","TemplateAlign.py",{}),
   ("python","Recap.py",{}),
   ("python","BRICS.py",{}),
+  ("python","DecompositionCache.py",{}),
   ("python","UnitTestDescriptors.py",{}),
   ("python","AllChem.py",{}),
   ("python","PropertyMol.py",{}),
   ("python","UnitTestInchi.py",{}),
   ("python","SaltRemover.py",{}),
+  ("python","PatternSet.py",{}),
+  ("python","UnitTestPatternSet.py",{}),
   ("python","UnitTestFunctionalGroups.py",{}),
   ("python","UnitTestCrippen.py",{}),
   ("python","__init__.py",{}),
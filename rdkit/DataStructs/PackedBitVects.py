@@ -0,0 +1,168 @@
+# $Id$
+#
+#  This file is part of the RDKit.
+#  The contents are covered by the terms of the BSD license
+#  which is included in the file license.txt, found at the root
+#  of the RDKit source tree.
+#
+""" tools for working with bit vectors packed into contiguous numpy arrays
+
+A packed fingerprint is a row of uint8 values in the format produced by
+DataStructs.BitVectToBinaryText (bit i is bit i%8 of byte i//8).
+Collections of fingerprints are stored as 2D arrays with one row per
+fingerprint, which allows similarities between a probe and a whole
+block of fingerprints to be computed without constructing bit vector
+objects for the block.
+
+>>> import numpy
+>>> fps = numpy.array([[0x0f,0x00],[0x03,0x01],[0x00,0x00]],numpy.uint8)
+>>> list(BitCounts(fps))
+[4, 3, 0]
+>>> probe = numpy.array([0x07,0x01],numpy.uint8)
+>>> list(IntersectionCounts(probe,fps))
+[3, 3, 0]
+>>> ['%.3f'%x for x in BulkTanimotoSimilarity(probe,fps)]
+['0.600', '0.750', '0.000']
+>>> ['%.3f'%x for x in BulkDiceSimilarity(probe,fps)]
+['0.750', '0.857', '0.000']
+
+Tversky similarity is asymmetric; the probe is the first argument:
+>>> ['%.3f'%x for x in BulkTverskySimilarity(probe,fps,1.,0.)]
+['0.750', '0.750', '0.000']
+>>> ['%.3f'%x for x in BulkTverskySimilarity(probe,fps,0.,1.)]
+['0.750', '1.000', '1.000']
+
+"""
+import numpy
+
+# number of set bits in each possible byte value:
+popcountTable = numpy.array([bin(x).count('1') for x in range(256)],numpy.uint8)
+
+def PackBitVect(bv):
+  """ returns a bit vector packed into a uint8 numpy array
+
+  >>> from rdkit import DataStructs
+  >>> bv = DataStructs.ExplicitBitVect(16)
+  >>> bv.SetBitsFromList((0,1,2,9))
+  >>> list(PackBitVect(bv))
+  [7, 2]
+
+  """
+  from rdkit import DataStructs
+  return numpy.frombuffer(DataStructs.BitVectToBinaryText(bv),numpy.uint8)
+
+def PackBitVects(bvs):
+  """ returns a sequence of bit vectors packed into a 2D uint8 numpy array
+
+  all the bit vectors must be the same length
+
+  >>> from rdkit import DataStructs
+  >>> bv1 = DataStructs.ExplicitBitVect(16)
+  >>> bv1.SetBitsFromList((0,1,2,9))
+  >>> bv2 = DataStructs.ExplicitBitVect(16)
+  >>> bv2.SetBitsFromList((8,))
+  >>> fps = PackBitVects((bv1,bv2))
+  >>> fps.shape
+  (2, 2)
+  >>> list(fps[1])
+  [0, 1]
+
+  """
+  bvs = list(bvs)
+  if not bvs:
+    return numpy.zeros((0,0),numpy.uint8)
+  nBits = bvs[0].GetNumBits()
+  res = numpy.zeros((len(bvs),(nBits+7)//8),numpy.uint8)
+  for i,bv in enumerate(bvs):
+    if bv.GetNumBits()!=nBits:
+      raise ValueError,'bit vectors must all be the same length'
+    res[i] = PackBitVect(bv)
+  return res
+
+def UnpackBitVect(row):
+  """ converts a packed row back into an ExplicitBitVect
+
+  >>> from rdkit import DataStructs
+  >>> bv = DataStructs.ExplicitBitVect(16)
+  >>> bv.SetBitsFromList((0,1,2,9))
+  >>> list(UnpackBitVect(PackBitVect(bv)).GetOnBits())
+  [0, 1, 2, 9]
+
+  """
+  from rdkit import DataStructs
+  return DataStructs.CreateFromBinaryText(numpy.asarray(row,numpy.uint8).tostring())
+
+def BitCounts(fps):
+  """ returns the number of set bits in each row of a packed array """
+  fps = numpy.asarray(fps,numpy.uint8)
+  return popcountTable[fps].sum(axis=-1,dtype=numpy.int32)
+
+def IntersectionCounts(probe,fps):
+  """ returns the number of bits each row of fps has in common with probe """
+  fps = numpy.asarray(fps,numpy.uint8)
+  return popcountTable[numpy.bitwise_and(fps,probe)].sum(axis=-1,dtype=numpy.int32)
+
+def _getCounts(probe,fps,probeCount,counts):
+  if probeCount is None:
+    probeCount = int(BitCounts(probe))
+  if counts is None:
+    counts = BitCounts(fps)
+  common = IntersectionCounts(probe,fps).astype(numpy.float64)
+  return common,float(probeCount),numpy.asarray(counts,numpy.float64)
+
+def BulkTanimotoSimilarity(probe,fps,probeCount=None,counts=None):
+  """ returns the Tanimoto similarity between probe and each row of fps
+
+  probeCount and counts, the bit counts of the probe and rows, can
+  be provided if they have already been calculated.
+
+  As with DataStructs.TanimotoSimilarity, two empty fingerprints have
+  a similarity of 1.0
+
+  """
+  common,probeCount,counts = _getCounts(probe,fps,probeCount,counts)
+  denom = probeCount+counts-common
+  res = numpy.ones(len(common),numpy.float64)
+  nz = denom>0
+  res[nz] = common[nz]/denom[nz]
+  return res
+
+def BulkDiceSimilarity(probe,fps,probeCount=None,counts=None):
+  """ returns the Dice similarity between probe and each row of fps
+
+  As with DataStructs.DiceSimilarity, two empty fingerprints have a
+  similarity of 0.0
+
+  """
+  common,probeCount,counts = _getCounts(probe,fps,probeCount,counts)
+  denom = probeCount+counts
+  res = numpy.zeros(len(common),numpy.float64)
+  nz = denom>0
+  res[nz] = 2*common[nz]/denom[nz]
+  return res
+
+def BulkTverskySimilarity(probe,fps,a,b,probeCount=None,counts=None):
+  """ returns the Tversky similarity between probe and each row of fps
+
+  The result for each row matches DataStructs.TverskySimilarity(probe,row,a,b)
+
+  """
+  common,probeCount,counts = _getCounts(probe,fps,probeCount,counts)
+  denom = a*probeCount+b*counts+(1.-a-b)*common
+  res = numpy.ones(len(common),numpy.float64)
+  nz = denom!=0
+  res[nz] = common[nz]/denom[nz]
+  return res
+
+#------------------------------------
+#
+#  doctest boilerplate
+#
+def _test():
+  import doctest,sys
+  return doctest.testmod(sys.modules["__main__"])
+
+if __name__ == '__main__':
+  import sys
+  failed,tried = _test()
+  sys.exit(failed)
@@ -0,0 +1,161 @@
+# $Id$
+#
+#  This file is part of the RDKit.
+#  The contents are covered by the terms of the BSD license
+#  which is included in the file license.txt, found at the root
+#  of the RDKit source tree.
+#
+""" popcount-bucketed index for threshold similarity searches
+
+The Swamidass-Baldi bounds limit the similarity between two bit
+vectors with A and B bits set:
+
+   Tanimoto(A,B) <= min(A,B)/max(A,B)
+   Dice(A,B) <= 2*min(A,B)/(A+B)
+
+so for a given probe and threshold only fingerprints in a contiguous
+range of popcounts need to be scored.
+
+>>> TanimotoPopcountBounds(10,0.8)
+(8, 12)
+>>> DicePopcountBounds(10,0.8)
+(7, 15)
+>>> TanimotoPopcountBounds(10,0.0)
+(0, None)
+
+"""
+import math
+import numpy
+
+# tolerance used to keep the bounds conservative in the face of roundoff:
+_boundTol=1e-8
+
+def TanimotoPopcountBounds(probeCount,threshold):
+  """ returns (lo,hi), the range of popcounts that can reach threshold
+
+  hi is None if there is no upper bound
+
+  """
+  if threshold<=0:
+    return 0,None
+  lo = int(math.ceil(threshold*probeCount-_boundTol))
+  hi = int(math.floor(probeCount/threshold+_boundTol))
+  return lo,hi
+
+def DicePopcountBounds(probeCount,threshold):
+  """ returns (lo,hi), the range of popcounts that can reach threshold
+
+  hi is None if there is no upper bound
+
+  """
+  if threshold<=0:
+    return 0,None
+  if threshold>=2:
+    return probeCount+1,probeCount
+  lo = int(math.ceil(threshold*probeCount/(2.-threshold)-_boundTol))
+  hi = int(math.floor((2.-threshold)*probeCount/threshold+_boundTol))
+  return lo,hi
+
+_boundFuncs={'tanimoto':TanimotoPopcountBounds,
+             'dice':DicePopcountBounds,
+             }
+
+class PopcountIndex(object):
+  """ buckets a set of fingerprints by popcount
+
+  >>> idx = PopcountIndex(counts=[3,10,8,12,13,10,7])
+  >>> len(idx)
+  7
+  >>> list(idx.GetCandidates(10,0.8))
+  [1, 2, 3, 5]
+  >>> list(idx.GetCandidates(10,0.8,metric='dice'))
+  [1, 2, 3, 4, 5, 6]
+  >>> list(idx.GetCandidates(10,0.1))
+  [0, 1, 2, 3, 4, 5, 6]
+
+  The candidates are always returned in their original order, so
+  scoring them gives the hits in the same order as a full scan.
+
+  Unknown metrics cannot be bounded, so everything is a candidate:
+  >>> list(idx.GetCandidates(10,0.8,metric='cosine'))
+  [0, 1, 2, 3, 4, 5, 6]
+
+  """
+  def __init__(self,fps=None,counts=None,extras=None):
+    """ constructor
+
+    Arguments:
+      - fps: (optional) a sequence of bit vectors
+      - counts: (optional) the popcounts of the fingerprints, calculated
+        from fps if not provided
+      - extras: (optional) a sequence of data associated with the fingerprints
+
+    """
+    if fps is not None:
+      fps = list(fps)
+    if counts is None:
+      if fps is None:
+        raise ValueError,'either fps or counts must be provided'
+      counts = [fp.GetNumOnBits() for fp in fps]
+    self._fps = fps
+    self._extras = extras
+    self._counts = numpy.asarray(counts,numpy.int32)
+    if fps:
+      self._nBits = fps[0].GetNumBits()
+    else:
+      self._nBits = None
+    # the original indices sorted by popcount, the sort is stable so
+    # each bucket is in the original order:
+    self._order = numpy.argsort(self._counts,kind='mergesort')
+    self._sortedCounts = self._counts[self._order]
+
+  def __len__(self):
+    return len(self._counts)
+  def GetNumBits(self):
+    return self._nBits
+  def GetCounts(self):
+    return self._counts
+  def GetFingerprint(self,idx):
+    return self._fps[idx]
+  def GetExtra(self,idx):
+    return self._extras[idx]
+  def HasExtras(self):
+    return self._extras is not None
+
+  def GetBucketRange(self,lo,hi=None):
+    """ returns the indices of the fingerprints with lo<=popcount<=hi
+    in their original order
+
+    """
+    start = numpy.searchsorted(self._sortedCounts,lo,side='left')
+    if hi is None:
+      end = len(self._sortedCounts)
+    else:
+      end = numpy.searchsorted(self._sortedCounts,hi,side='right')
+    if end<=start:
+      return numpy.zeros(0,numpy.intp)
+    return numpy.sort(self._order[start:end])
+
+  def GetCandidates(self,probeCount,threshold,metric='tanimoto'):
+    """ returns the indices of the fingerprints that could have a
+    similarity of at least threshold to a probe with probeCount bits set
+
+    """
+    boundFunc = _boundFuncs.get(metric.lower(),None)
+    if boundFunc is None:
+      return numpy.arange(len(self._counts))
+    lo,hi = boundFunc(probeCount,threshold)
+    return self.GetBucketRange(lo,hi)
+
+#------------------------------------
+#
+#  doctest boilerplate
+#
+def _test():
+  import doctest,sys
+  return doctest.testmod(sys.modules["__main__"])
+
+if __name__ == '__main__':
+  import sys
+  failed,tried = _test()
+  sys.exit(failed)
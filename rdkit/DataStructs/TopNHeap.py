@@ -0,0 +1,295 @@
+# $Id$
+#
+#  This file is part of the RDKit.
+#  The contents are covered by the terms of the BSD license
+#  which is included in the file license.txt, found at the root
+#  of the RDKit source tree.
+#
+""" heap-based replacements for TopNContainer
+
+TopNHeap has the same interface and gives the same results (including
+the handling of ties) as TopNContainer, but accepting a new point is
+O(log N) instead of O(N).
+
+MultiProbeTopN maintains one TopNHeap per probe and is filled from
+blocks of probe x pool similarity scores.
+
+"""
+import heapq
+import numpy
+
+class TopNHeap(object):
+  """ maintains the best N data elements seen
+
+  >>> h = TopNHeap(4)
+  >>> for v in (3,8,1,9,4,6,5): h.Insert(v,str(v))
+  >>> h.GetPts()
+  [5, 6, 8, 9]
+  >>> h.GetExtras()
+  ['5', '6', '8', '9']
+  >>> h[0]
+  (5, '5')
+  >>> h.reverse()
+  >>> h.GetPts()
+  [9, 8, 6, 5]
+
+  Until it is full the container is padded with placeholders, as
+  with TopNContainer:
+  >>> h = TopNHeap(3)
+  >>> h.Insert(2.,'a')
+  >>> h.GetPts()
+  [-1e+99, -1e+99, 2.0]
+  >>> h.GetExtras()
+  [None, None, 'a']
+
+  Ties are handled the same way TopNContainer handles them:
+  >>> h = TopNHeap(2)
+  >>> for v,e in ((1,'a'),(1,'b'),(1,'c'),(2,'d')): h.Insert(v,e)
+  >>> h.GetExtras()
+  ['b', 'd']
+
+  A negative size keeps everything:
+  >>> h = TopNHeap(-1)
+  >>> for v in (3,1,2): h.Insert(v)
+  >>> h.GetPts()
+  [1, 2, 3]
+
+  """
+  def __init__(self,size,mostNeg=-1e99):
+    """
+    if size is negative, all entries will be kept in sorted order
+    """
+    self._size = size
+    self._mostNeg = mostNeg
+    # heap entries are (val,insertion count,extra), the insertion count
+    # provides TopNContainer's tie breaking and ensures that extras are
+    # never compared
+    self._heap = []
+    self._count = 0
+    self._sorted = None
+    self._reversed = False
+
+  def Insert(self,val,extra=None):
+    """ only does the insertion if val fits """
+    if self._size>=0:
+      if len(self._heap)<self._size:
+        if val>self._mostNeg:
+          heapq.heappush(self._heap,(val,self._count,extra))
+        else:
+          return
+      elif self._size and val>self._heap[0][0]:
+        heapq.heapreplace(self._heap,(val,self._count,extra))
+      else:
+        return
+    else:
+      heapq.heappush(self._heap,(val,self._count,extra))
+    self._count+=1
+    self._sorted = None
+
+  def GetThreshold(self):
+    """ returns the value a point must exceed to be inserted """
+    if self._size>=0 and len(self._heap)>=self._size:
+      if not self._size:
+        return None
+      return self._heap[0][0]
+    return self._mostNeg
+
+  def _getSorted(self):
+    if self._sorted is None:
+      entries = sorted(self._heap)
+      if self._size>=0:
+        nPad = self._size-len(entries)
+      else:
+        nPad = 0
+      best = [self._mostNeg]*nPad+[x[0] for x in entries]
+      extras = [None]*nPad+[x[2] for x in entries]
+      if self._reversed:
+        best.reverse()
+        extras.reverse()
+      self._sorted = best,extras
+    return self._sorted
+
+  def GetPts(self):
+    """ returns our set of points """
+    return self._getSorted()[0]
+  def GetExtras(self):
+    """ returns our set of extras """
+    return self._getSorted()[1]
+
+  def __len__(self):
+    return self._size
+  def __getitem__(self,which):
+    best,extras = self._getSorted()
+    return best[which],extras[which]
+
+  def reverse(self):
+    self._reversed = not self._reversed
+    if self._sorted is not None:
+      self._sorted[0].reverse()
+      self._sorted[1].reverse()
+
+class MultiProbeTopN(object):
+  """ maintains a TopNHeap for each of a set of probes
+
+  Points are added in blocks of scores; row i of a block contains the
+  scores of probe i against each pool member in the block.
+
+  >>> import numpy
+  >>> nbrs = MultiProbeTopN(2,2)
+  >>> nbrs.AddScores(numpy.array([[.1,.5,.3],[.9,.2,.4]]),('a','b','c'))
+  >>> nbrs.AddScores(numpy.array([[.6,.2],[.1,.95]]),('d','e'))
+  >>> nbrs[0].GetExtras()
+  ['b', 'd']
+  >>> nbrs[1].GetExtras()
+  ['a', 'e']
+
+  with a threshold everything above it is kept:
+  >>> nbrs = MultiProbeTopN(2,-1,threshold=0.35)
+  >>> nbrs.AddScores(numpy.array([[.1,.5,.3],[.9,.2,.4]]),('a','b','c'))
+  >>> nbrs[0].GetExtras()
+  ['b']
+  >>> nbrs[1].GetExtras()
+  ['c', 'a']
+
+  """
+  def __init__(self,nProbes,size,mostNeg=-1e99,threshold=None):
+    self._size = size
+    self._threshold = threshold
+    self._heaps = [TopNHeap(size,mostNeg=mostNeg) for x in range(nProbes)]
+
+  def __len__(self):
+    return len(self._heaps)
+  def __getitem__(self,which):
+    return self._heaps[which]
+  def GetContainers(self):
+    return self._heaps
+
+  def AddProbeScores(self,probeIdx,scores,extras):
+    """ adds the scores of a single probe against a block of the pool
+
+    The points are offered to the probe's heap in pool order, so the
+    results are the same as inserting them one at a time.
+
+    """
+    heap = self._heaps[probeIdx]
+    thresh = heap.GetThreshold()
+    if thresh is None:
+      return
+    if self._threshold is not None:
+      thresh = max(thresh,self._threshold)
+    scores = numpy.asarray(scores)
+    which = numpy.nonzero(scores>thresh)[0]
+    if self._size>=0 and len(which)>self._size:
+      # only points that tie or beat the size-th best in the block
+      # can end up in the heap:
+      cands = scores[which]
+      kth = numpy.partition(cands,len(cands)-self._size)[len(cands)-self._size]
+      which = which[cands>=kth]
+    for idx in which:
+      heap.Insert(float(scores[idx]),extras[idx])
+
+  def AddScores(self,scores,extras,probeIndices=None):
+    """ adds a block of scores with one row per probe
+
+    if provided, probeIndices maps the rows of scores to probe indices
+
+    """
+    if probeIndices is None:
+      probeIndices = range(len(scores))
+    for row,probeIdx in zip(scores,probeIndices):
+      self.AddProbeScores(probeIdx,row,extras)
+
+class MultiProbeCandidates(object):
+  """ collects, for each probe, every point that could be in its top N
+
+  This is used to search part of a pool (e.g. in a worker process).
+  Points are only discarded if at least N points that beat them have
+  been seen, and the survivors are kept in the order they were added.
+  Feeding each part's candidates, in pool order, to a MultiProbeTopN
+  then gives exactly the same results as searching the whole pool with
+  a single MultiProbeTopN, no matter how the pool was split.
+
+  >>> import numpy
+  >>> cands = MultiProbeCandidates(1,2)
+  >>> cands.AddScores(numpy.array([[.1,.5,.3,.5,.2]]),('a','b','c','d','e'))
+  >>> scores,extras = cands.GetCandidates(0)
+  >>> list(scores)
+  [0.5, 0.5]
+  >>> extras
+  ['b', 'd']
+  >>> cands = MultiProbeCandidates(1,2)
+  >>> cands.AddScores(numpy.array([[.1,.5,.3,.3,.2]]),('a','b','c','d','e'))
+  >>> cands.GetCandidates(0)[1]
+  ['b', 'c', 'd']
+
+  """
+  def __init__(self,nProbes,size,mostNeg=-1e99,threshold=None):
+    self._size = size
+    self._threshold = threshold
+    self._mostNeg = mostNeg
+    self._scores = [numpy.zeros(0,numpy.float64) for x in range(nProbes)]
+    self._extras = [[] for x in range(nProbes)]
+    self._cutoffs = [None]*nProbes
+
+  def __len__(self):
+    return len(self._scores)
+
+  def GetCandidates(self,probeIdx):
+    """ returns (scores,extras) for a probe's candidates """
+    return self._scores[probeIdx],self._extras[probeIdx]
+
+  def _prune(self,probeIdx):
+    scores = self._scores[probeIdx]
+    kth = numpy.partition(scores,len(scores)-self._size)[len(scores)-self._size]
+    keep = numpy.nonzero(scores>=kth)[0]
+    extras = self._extras[probeIdx]
+    self._scores[probeIdx] = scores[keep]
+    self._extras[probeIdx] = [extras[x] for x in keep]
+    self._cutoffs[probeIdx] = kth
+
+  def AddProbeScores(self,probeIdx,scores,extras):
+    """ adds the scores of a single probe against a block of the pool """
+    if not self._size:
+      return
+    scores = numpy.asarray(scores,numpy.float64)
+    if self._cutoffs[probeIdx] is not None:
+      # ties with the cutoff are kept:
+      mask = scores>=self._cutoffs[probeIdx]
+    else:
+      mask = scores>self._mostNeg
+    if self._threshold is not None:
+      mask &= scores>self._threshold
+    which = numpy.nonzero(mask)[0]
+    if not len(which):
+      return
+    self._scores[probeIdx] = numpy.concatenate((self._scores[probeIdx],scores[which]))
+    self._extras[probeIdx].extend([extras[x] for x in which])
+    if self._size>0 and len(self._scores[probeIdx])>2*self._size:
+      self._prune(probeIdx)
+
+  def AddScores(self,scores,extras,probeIndices=None):
+    """ adds a block of scores with one row per probe """
+    if probeIndices is None:
+      probeIndices = range(len(scores))
+    for row,probeIdx in zip(scores,probeIndices):
+      self.AddProbeScores(probeIdx,row,extras)
+
+  def Finish(self):
+    """ discards any remaining points that cannot be in the top N """
+    if self._size>0:
+      for i in range(len(self._scores)):
+        if len(self._scores[i])>self._size:
+          self._prune(i)
+
+#------------------------------------
+#
+#  doctest boilerplate
+#
+def _test():
+  import doctest,sys
+  return doctest.testmod(sys.modules["__main__"])
+
+if __name__ == '__main__':
+  import sys
+  failed,tried = _test()
+  sys.exit(failed)
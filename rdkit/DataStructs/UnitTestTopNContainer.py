@@ -11,6 +11,7 @@
 import unittest
 import random
 from rdkit.DataStructs.TopNContainer import TopNContainer
+from rdkit.DataStructs.TopNHeap import TopNHeap,MultiProbeTopN,MultiProbeCandidates
 
 class TestCase(unittest.TestCase):
   def test1(self):
@@ -67,5 +68,64 @@ class TestCase(unittest.TestCase):
       assert e<=lastE
       lastV,lastE = v,e
 
+  def test6(self):
+    """ the heap gives the same results as the container, including ties """
+    random.seed(23)
+    for size in (-1,1,3,10):
+      for i in range(100):
+        vals = [random.randint(0,5) for x in range(random.randint(0,30))]
+        cont = TopNContainer(size)
+        heap = TopNHeap(size)
+        for j,v in enumerate(vals):
+          cont.Insert(v,j)
+          heap.Insert(v,j)
+        self.failUnlessEqual(cont.GetPts(),heap.GetPts())
+        self.failUnlessEqual(cont.GetExtras(),heap.GetExtras())
+        cont.reverse()
+        heap.reverse()
+        self.failUnlessEqual([x for x in cont],[x for x in heap])
+
+  def test7(self):
+    """ the multi-probe heaps give the same results as the container """
+    import numpy
+    random.seed(23)
+    for size,thresh in ((3,None),(10,None),(-1,2)):
+      for i in range(50):
+        scores = numpy.array([[random.randint(0,5) for x in range(40)] for y in range(3)],
+                             numpy.float64)
+        nbrs = MultiProbeTopN(len(scores),size,threshold=thresh)
+        for start in range(0,scores.shape[1],7):
+          nbrs.AddScores(scores[:,start:start+7],range(start,start+7))
+        for j,row in enumerate(scores):
+          cont = TopNContainer(size)
+          for k,v in enumerate(row):
+            if thresh is None or v>thresh:
+              cont.Insert(v,k)
+          self.failUnlessEqual(cont.GetExtras(),nbrs[j].GetExtras())
+
+  def test8(self):
+    """ merging candidates from shards gives the same results as a single pass """
+    import numpy
+    random.seed(23)
+    for size,thresh in ((1,None),(3,None),(10,None),(-1,2)):
+      for i in range(50):
+        scores = numpy.array([[random.randint(0,5) for x in range(60)] for y in range(3)],
+                             numpy.float64)
+        full = MultiProbeTopN(len(scores),size,threshold=thresh)
+        full.AddScores(scores,range(scores.shape[1]))
+        for shardSize in (1,7,25):
+          merged = MultiProbeTopN(len(scores),size,threshold=thresh)
+          for start in range(0,scores.shape[1],shardSize):
+            cands = MultiProbeCandidates(len(scores),size,threshold=thresh)
+            for bStart in range(start,start+shardSize,3):
+              bEnd = min(bStart+3,start+shardSize)
+              cands.AddScores(scores[:,bStart:bEnd],range(bStart,bEnd))
+            cands.Finish()
+            for j in range(len(scores)):
+              cScores,cExtras = cands.GetCandidates(j)
+              merged.AddProbeScores(j,cScores,cExtras)
+          for j in range(len(scores)):
+            self.failUnlessEqual(full[j].GetExtras(),merged[j].GetExtras())
+
 if __name__ == '__main__':
   unittest.main()
@@ -8,6 +8,9 @@ tests=[
   ("python","VectCollection.py",{}),
   ("python","LazySignature.py",{}),
   ("python","SparseIntVect.py",{}),
+  ("python","PackedBitVects.py",{}),
+  ("python","PopcountIndex.py",{}),
+  ("python","TopNHeap.py",{}),
   ]
 longTests=[
   ]
@@ -91,6 +91,10 @@ a QDAT file.
 
   - --prune: prune any models built
 
+  - --numWorkers *count*: build the models of each composite using
+     *count* worker processes.  Each model gets its own random seed,
+     so the composite does not depend on the number of workers.
+
   - -h: print a usage message and exit.
 
   - -V: print the version number and exit
@@ -350,6 +354,7 @@ def GetCommandLine(details):
 ##       args.append('--svmShrink')
         
   if details.replacementSelection: args.append('--replacementSelection')
+  if getattr(details,'numWorkers',0): args.append('--numWorkers=%d'%details.numWorkers)
 
 
   # this should always be last:
@@ -470,6 +475,7 @@ def RunOnData(details,data,progressCallback=None,saveIt=1,setDescNames=0):
   else:
     composite.SetDescriptorNames(data.GetVarNames())
   composite.SetActivityQuantBounds(details.activityBounds)
+  numWorkers = getattr(details,'numWorkers',0)
   if details.nModels==1:
     details.internalHoldoutFrac=0.0
   if details.useTrees:
@@ -496,6 +502,7 @@ def RunOnData(details,data,progressCallback=None,saveIt=1,setDescNames=0):
                    startAt=details.startAt,
                    maxDepth=details.limitDepth,
                    progressCallback=progressCallback,
+                   numWorkers=numWorkers,
                    holdOutFrac=details.internalHoldoutFrac,
                    replacementSelection=details.replacementSelection,
                    recycleVars=details.recycleVars,
@@ -529,6 +536,7 @@ def RunOnData(details,data,progressCallback=None,saveIt=1,setDescNames=0):
                    treeBuilder=builder,
                    maxDepth=details.limitDepth,
                    progressCallback=progressCallback,
+                   numWorkers=numWorkers,
                    holdOutFrac=details.internalHoldoutFrac,
                    replacementSelection=details.replacementSelection,
                    recycleVars=details.recycleVars,
@@ -557,7 +565,7 @@ def RunOnData(details,data,progressCallback=None,saveIt=1,setDescNames=0):
                    needsQuantization=0,
                    numNeigh=details.knnNeighs,
                    holdOutFrac=details.internalHoldoutFrac,
-                   distFunc=dfunc)
+                   distFunc=dfunc,numWorkers=numWorkers)
 
   elif details.useNaiveBayes or details.useSigBayes:
     from rdkit.ML.NaiveBayes import CrossValidate
@@ -569,6 +577,7 @@ def RunOnData(details,data,progressCallback=None,saveIt=1,setDescNames=0):
                      holdOutFrac=details.internalHoldoutFrac,
                      replacementSelection=details.replacementSelection,
                      mEstimateVal=details.mEstimateVal,
+                     numWorkers=numWorkers,
                      silent=not _verbose)
     else:
       if hasattr(details,'useCMIM'):
@@ -583,6 +592,7 @@ def RunOnData(details,data,progressCallback=None,saveIt=1,setDescNames=0):
                      useSigs=True,useCMIM=useCMIM,
                      holdOutFrac=details.internalHoldoutFrac,
                      replacementSelection=details.replacementSelection,
+                     numWorkers=numWorkers,
                      silent=not _verbose)
       
       
@@ -607,7 +617,8 @@ def RunOnData(details,data,progressCallback=None,saveIt=1,setDescNames=0):
     from rdkit.ML.Neural import CrossValidate
     driver = CrossValidate.CrossValidationDriver
     composite.Grow(trainExamples,attrs,[0]+nPossibleVals,nTries=details.nModels,
-                   buildDriver=driver,needsQuantization=0)
+                   buildDriver=driver,needsQuantization=0,
+                   numWorkers=numWorkers)
     
   composite.AverageErrors()
   composite.SortModels()
@@ -733,15 +744,16 @@ def RunIt(details,progressCallback=None,saveIt=1,setDescNames=0):
     details.outName = fName + '.pkl'
   if not details.dbName:
     if details.qBounds != []:
-      data = DataUtils.TextFileToData(fName)
+      data = DataUtils.TextFileToData(fName,asArrays=True)
     else:
-      data = DataUtils.BuildQuantDataSet(fName)
+      data = DataUtils.BuildQuantDataSet(fName,asArrays=True)
   elif details.useSigTrees or details.useSigBayes:
     details.tableName = fName
-    data = details.GetDataSet(pickleCol=0,pickleClass=DataStructs.ExplicitBitVect)
+    data = details.GetDataSet(pickleCol=0,pickleClass=DataStructs.ExplicitBitVect,
+                              asArrays=True)
   elif details.qBounds != [] or not details.useTrees:
     details.tableName = fName
-    data = details.GetDataSet()
+    data = details.GetDataSet(asArrays=True)
   else:
     data = DataUtils.DBToQuantData(details.dbName,fName,quantName=details.qTableName,
                                    user=details.dbUser,password=details.dbPassword)
@@ -816,6 +828,8 @@ def ParseArgs(runDetails):
 ##                               'svmShrink','svmDataType=',
 
                               'replacementSelection',
+
+                              'numWorkers=',
                               
                               ])
   runDetails.profileIt=0
@@ -977,6 +991,8 @@ def ParseArgs(runDetails):
 
     elif arg== '--replacementSelection':
       runDetails.replacementSelection = 1
+    elif arg == '--numWorkers':
+      runDetails.numWorkers = int(val)
 
     elif arg == '-h':
       Usage()
@@ -68,15 +68,25 @@ def ClusterData(data,nPts,distThresh,isDistData=False,distFunc=EuclideanDist):
         nbrLists[i].append(j)
         nbrLists[j].append(i)
   #print nbrLists
+  return _ClustersFromNbrLists(nbrLists)
+
+def _ClustersFromNbrLists(nbrLists,nNbrs=None):
+  """ *Internal use only*
+
+    does the greedy centroid selection given each point's neighbors
+
+  """
+  nPts = len(nbrLists)
+  if nNbrs is None:
+    nNbrs = [len(y) for y in nbrLists]
   # sort by the number of neighbors:
-  tLists = [(len(y),x) for x,y in enumerate(nbrLists)]
+  tLists = zip(nNbrs,range(nPts))
   tLists.sort()
   tLists.reverse()
 
   res = []
   seen = [0]*nPts
-  while tLists:
-    nNbrs,idx = tLists.pop(0)
+  for nNbrs,idx in tLists:
     if seen[idx]:
       continue
     tRes = [idx]
@@ -86,4 +96,143 @@ def ClusterData(data,nPts,distThresh,isDistData=False,distFunc=EuclideanDist):
         seen[nbr]=1
     res.append(tuple(tRes))
   return tuple(res)
+
+class CSRNbrLists(object):
+  """ neighbor lists stored in compressed sparse row form:
+    the neighbors of point i are indices[indptr[i]:indptr[i+1]]
+
+  """
+  def __init__(self,indptr,indices):
+    self.indptr = indptr
+    self.indices = indices
+  def __len__(self):
+    return len(self.indptr)-1
+  def __getitem__(self,idx):
+    return self.indices[self.indptr[idx]:self.indptr[idx+1]].tolist()
+  def GetNumNbrs(self):
+    return numpy.diff(self.indptr)
+
+# state shared with the worker processes used by GetFingerprintNbrLists:
+_nbrFps=None
+_nbrOrder=None
+_nbrCounts=None
+def _initNbrWorker(sortedFps,order,sortedCounts):
+  global _nbrFps,_nbrOrder,_nbrCounts
+  _nbrFps = sortedFps
+  _nbrOrder = order
+  _nbrCounts = sortedCounts
+
+def _findNbrPairs(args):
+  """ *Internal use only*
+
+    finds the neighbors of the points in positions [start,end) of the
+    popcount-sorted fingerprints among the points that precede them.
+    Returns two int32 arrays with the (original) indices of the pairs.
+
+  """
+  from rdkit import DataStructs
+  from rdkit.DataStructs.PopcountIndex import TanimotoPopcountBounds
+  start,end,distThresh = args
+  simThresh = 1.-distThresh
+  resI=[]
+  resJ=[]
+  for pos in range(start,end):
+    # the fingerprints are sorted by popcount, so the only ones that need
+    # to be considered are from the lower bound up to this one:
+    lo = numpy.searchsorted(_nbrCounts,TanimotoPopcountBounds(_nbrCounts[pos],simThresh)[0],
+                            side='left')
+    if lo>=pos:
+      continue
+    sims = numpy.array(DataStructs.BulkTanimotoSimilarity(_nbrFps[pos],_nbrFps[lo:pos]))
+    hits = numpy.nonzero(1.-sims<=distThresh)[0]
+    if len(hits):
+      resI.append(numpy.repeat(_nbrOrder[pos],len(hits)))
+      resJ.append(_nbrOrder[lo+hits])
+  if resI:
+    return numpy.concatenate(resI).astype(numpy.int32),numpy.concatenate(resJ).astype(numpy.int32)
+  else:
+    return numpy.zeros(0,numpy.int32),numpy.zeros(0,numpy.int32)
+
+def GetFingerprintNbrLists(fps,distThresh,numWorkers=1,blockSize=1000):
+  """ returns CSRNbrLists with the neighbors (Tanimoto distance
+    <= distThresh) of each of a list of bit vector fingerprints
+
+    The fingerprints are sorted by popcount so that each one only needs
+    to be compared to the preceding fingerprints that satisfy the
+    Tanimoto popcount bound. Blocks of blockSize fingerprints are
+    handled by numWorkers worker processes.
+
+  """
+  nPts = len(fps)
+  counts = numpy.array([fp.GetNumOnBits() for fp in fps],numpy.int32)
+  order = numpy.argsort(counts,kind='mergesort').astype(numpy.int32)
+  sortedFps = [fps[x] for x in order]
+  sortedCounts = counts[order]
+
+  tasks = [(x,min(x+blockSize,nPts),distThresh) for x in range(0,nPts,blockSize)]
+  if numWorkers>1:
+    from multiprocessing import Pool
+    workers = Pool(numWorkers,_initNbrWorker,(sortedFps,order,sortedCounts))
+    results = workers.imap_unordered(_findNbrPairs,tasks)
+  else:
+    workers = None
+    _initNbrWorker(sortedFps,order,sortedCounts)
+    results = (_findNbrPairs(x) for x in tasks)
+  pairsI=[]
+  pairsJ=[]
+  for resI,resJ in results:
+    pairsI.append(resI)
+    pairsJ.append(resJ)
+  if workers is not None:
+    workers.close()
+    workers.join()
+  else:
+    _initNbrWorker(None,None,None)
+
+  if pairsI:
+    pairsI = numpy.concatenate(pairsI)
+    pairsJ = numpy.concatenate(pairsJ)
+  else:
+    pairsI = numpy.zeros(0,numpy.int32)
+    pairsJ = numpy.zeros(0,numpy.int32)
+  # each pair was found once, the neighbor lists need both directions:
+  rows = numpy.concatenate((pairsI,pairsJ))
+  cols = numpy.concatenate((pairsJ,pairsI))
+  pairsI=pairsJ=None
+  idx = numpy.lexsort((cols,rows))
+  indices = cols[idx]
+  indptr = numpy.zeros(nPts+1,numpy.int64)
+  indptr[1:] = numpy.cumsum(numpy.bincount(rows,minlength=nPts))
+  return CSRNbrLists(indptr,indices)
+
+def ClusterFingerprints(fps,distThresh,numWorkers=1,blockSize=1000):
+  """  clusters a list of bit vector fingerprints using the Tanimoto
+    distance (1-similarity) and returns the list of clusters
+
+    This gives the same results as
+      ClusterData(fps,len(fps),distThresh,
+                  distFunc=lambda x,y:1.-DataStructs.TanimotoSimilarity(x,y))
+    but never constructs the full distance matrix; the neighbor lists
+    are built directly using bulk similarity calls (see
+    GetFingerprintNbrLists) and stored as int32 arrays.
+
+    **Arguments**
+
+      - fps: a list of bit vectors
+
+      - distThresh: elements within this range of each other are considered
+        to be neighbors            
+
+      - numWorkers: the number of processes to use to find neighbors
+
+      - blockSize: the number of fingerprints handled in each task
+
+    **Returns**
+
+      - a tuple of tuples containing information about the clusters,
+        as for ClusterData
+
+  """
+  nbrLists = GetFingerprintNbrLists(fps,distThresh,numWorkers=numWorkers,blockSize=blockSize)
+  return _ClustersFromNbrLists(nbrLists,nbrLists.GetNumNbrs().tolist())
     
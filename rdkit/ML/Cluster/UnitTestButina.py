@@ -96,6 +96,29 @@ class TestCase(unittest.TestCase):
     self.failUnless(cs[1]==(4,))
     self.failUnless(cs[2]==(0,))
 
+  def test7(self):
+    " clustering fingerprints without a distance matrix "
+    import random
+    from rdkit import DataStructs
+    random.seed(23)
+    fps = []
+    for i in range(200):
+      fp = DataStructs.ExplicitBitVect(64)
+      fp.SetBitsFromList(random.sample(range(64),random.randint(0,20)))
+      fps.append(fp)
+    distFunc = lambda x,y:1.-DataStructs.TanimotoSimilarity(x,y)
+    for thresh in (0.,0.4,0.7,1.0):
+      cs = Butina.ClusterData(fps,len(fps),thresh,distFunc=distFunc)
+      self.failUnlessEqual(cs,Butina.ClusterFingerprints(fps,thresh))
+      self.failUnlessEqual(cs,Butina.ClusterFingerprints(fps,thresh,blockSize=7))
+      self.failUnlessEqual(cs,Butina.ClusterFingerprints(fps,thresh,numWorkers=2,blockSize=17))
+
+    nbrs = Butina.GetFingerprintNbrLists(fps,0.4)
+    self.failUnlessEqual(len(nbrs),len(fps))
+    for i in range(len(fps)):
+      ref = [j for j in range(len(fps)) if j!=i and distFunc(fps[i],fps[j])<=0.4]
+      self.failUnlessEqual(nbrs[i],ref)
+
 
 
     
@@ -139,6 +139,22 @@ class BayesComposite(Composite.Composite):
     else:
       return -1,conf
 
+  def ClassifyExamples(self,examples,threshold=0,onlyModels=None,
+                       useModels=None):
+    """ classifies a set of examples using the entire composite
+
+      This just calls _ClassifyExample()_ for each example; selecting
+      the models used (_onlyModels_ and _useModels_) is not supported.
+
+      **Returns**
+
+        a list of (result,confidence) tuples, one per example
+
+    """
+    if onlyModels or useModels is not None:
+      raise ValueError,'BayesComposites always use all of their models'
+    return [self.ClassifyExample(example,threshold=threshold) for example in examples]
+
 
   def __init__(self):
     Composite.Composite.__init__(self)
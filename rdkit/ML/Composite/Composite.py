@@ -26,6 +26,51 @@ from rdkit.ML.Data import DataUtils
 import cPickle
 import math
 import numpy
+import random,sys,itertools
+
+# used by Composite.Grow to share the training data with the
+# processes building the models:
+_growData = None
+def _initGrowWorker(growData):
+  global _growData
+  _growData = growData
+
+def _growModel(growData):
+  """ builds (and, if requested, prunes) a single model for Composite.Grow
+
+    **Returns**
+
+      a 2-tuple: (model,frac)
+
+  """
+  trainExamples,attrs,nPossibleVals,buildDriver,pruner,pruneIt,modelFilter,buildArgs = growData
+  if modelFilter is not None:
+    trainIdx, temp = DataUtils.FilterData(trainExamples, modelFilter[0],
+                                          modelFilter[1],-1, indicesOnly=1)
+    trainSet = [trainExamples[x] for x in trainIdx]
+  else:
+    trainSet = trainExamples
+
+  model,frac = apply(buildDriver,(trainSet,attrs,nPossibleVals),
+                     buildArgs)
+  if pruneIt:
+    model,frac2 = pruner(model,model.GetTrainingExamples(),
+                        model.GetTestExamples(),
+                        minimizeTestErrorOnly=0)
+    frac = frac2
+  if modelFilter is not None and hasattr(model,'_trainIndices'):
+    # correct the model's training indices:
+    trainIndices = [trainIdx[x] for x in model._trainIndices]
+    model._trainIndices = trainIndices
+  return model,frac
+
+def _growSeededModel(seed):
+  """ builds a model for Composite.Grow using the data set up by
+  _initGrowWorker() after seeding the random number generators
+
+  """
+  DataUtils.InitRandomNumbers((seed,seed))
+  return _growModel(_growData)
 
 class Composite(object):
   """a composite model
@@ -197,6 +242,35 @@ class Composite(object):
       quantExample[i] = p
     return quantExample 
 
+  def QuantizeExamples(self,examples,quantBounds=None):
+    """ quantizes a set of examples
+
+      **Arguments**
+
+       - examples: a 2D numeric array with one row per example
+       
+       - quantBounds:  a list of quantization bounds, each quantbound is a
+             list of boundaries.  If this argument is not provided, the composite
+             will use its own quantBounds
+
+      **Returns**
+
+        a new 2D float array with the quantized examples; row _i_ holds
+        the same values as _QuantizeExample(examples[i])_
+
+    """
+    if quantBounds is None:
+      quantBounds = self.quantBounds
+    quantExamples = numpy.array(examples,numpy.float64)
+    assert quantExamples.shape[1]==len(quantBounds),'examples/quantBounds mismatch'
+    for i in xrange(len(quantBounds)):
+      bounds = quantBounds[i]
+      if len(bounds):
+        quantExamples[:,i] = numpy.searchsorted(bounds,quantExamples[:,i],side='right')
+      elif i != 0:
+        quantExamples[:,i] = numpy.trunc(quantExamples[:,i])
+    return quantExamples
+
   def MakeHistogram(self):
     """ creates a histogram of error/count pairs
 
@@ -318,6 +392,154 @@ class Composite(object):
     else:
       return -1,conf
 
+  def _ExampleArray(self,examples):
+    """ converts a sequence of examples to a 2D float array
+
+      The first column (usually the name) and the last column (the
+      activity) are set to zero if they are not numeric.
+
+      **Returns**
+
+        the array, or None if any of the descriptors is not numeric
+
+      **Note**
+
+        - this is primarily intended for internal use
+
+    """
+    if isinstance(examples,numpy.ndarray) and examples.dtype.kind in 'biuf':
+      return examples
+    nCols = len(examples[0])
+    res = numpy.zeros((len(examples),nCols),numpy.float64)
+    for col in xrange(nCols):
+      try:
+        res[:,col] = [example[col] for example in examples]
+      except (TypeError,ValueError):
+        if col not in (0,nCols-1):
+          return None
+        res[:,col] = 0
+    return res
+
+  def ClassifyExamples(self,examples,threshold=0,onlyModels=None,
+                       useModels=None):
+    """ classifies a set of examples using the entire composite
+
+      This gives the same results as calling _ClassifyExample()_ on
+      each example, but the examples are quantized together and each
+      model classifies all of them in one call (decision trees run the
+      whole set through the tree at once), so it is much faster for
+      large sets of examples.
+
+      **Arguments**
+
+       - examples: the data to be classified, either a sequence of
+         examples or a 2D numeric array with one row per example
+
+       - threshold:  if this is a number greater than zero, then a
+          classification will only be returned if the confidence is
+          above _threshold_.  Anything lower is returned as -1.
+
+       - onlyModels: if provided, this should be a sequence of model
+         indices. Only the specified models will be used in the
+         prediction.
+
+       - useModels: (optional) a 2D boolean array with one row per
+         example and one column per model; model _j_ only votes on
+         example _i_ if _useModels[i,j]_ is set.  Examples that none of
+         the models can vote on use all of them, as _ClassifyExample()_
+         does when _onlyModels_ is empty.
+
+      **Returns**
+
+        a list of (result,confidence) tuples, one per example
+
+      **Notes**
+
+        - unlike _ClassifyExample()_ this does not set the results of
+          _GetVoteDetails()_
+
+    """
+    nExamples = len(examples)
+    if not nExamples:
+      return []
+    if self._mapOrder is not None:
+      if isinstance(examples,numpy.ndarray):
+        order = list(self._mapOrder)
+        mapped = numpy.zeros((nExamples,len(order)),examples.dtype)
+        mapped[:,:-1] = examples[:,order[:-1]]
+        if order[-1] != -1:
+          mapped[:,-1] = examples[:,order[-1]]
+        examples = mapped
+      else:
+        examples = map(self._RemapInput,examples)
+
+    if not onlyModels:
+      onlyModels = range(len(self))
+
+    from rdkit.ML.DecTree.DecTree import DecTreeNode
+    from rdkit.ML.DecTree.FrozenTree import FrozenTree
+    treeTypes = (DecTreeNode,FrozenTree)
+    if [1 for i in onlyModels if isinstance(self.modelList[i],treeTypes)]:
+      exampleArray = self._ExampleArray(examples)
+    else:
+      exampleArray = None
+    quantArray = None
+    quantExamples = None
+    if self.quantBounds is not None and 1 in self.quantizationRequirements:
+      if exampleArray is not None:
+        quantArray = self.QuantizeExamples(exampleArray,self.quantBounds)
+      if [1 for i in onlyModels if self.quantizationRequirements[i] and \
+          not (quantArray is not None and isinstance(self.modelList[i],treeTypes))]:
+        quantExamples = [self.QuantizeExample(x,self.quantBounds) for x in examples]
+
+    if useModels is not None:
+      useModels = numpy.asarray(useModels,numpy.bool)
+      # examples none of the models can vote on get votes from all of them:
+      noModels = ~useModels[:,onlyModels].any(axis=1)
+
+    nClasses = self.nPossibleVals[-1]
+    votes = numpy.zeros((nExamples,nClasses),numpy.int64)
+    flatVotes = votes.ravel()
+    for i in onlyModels:
+      model = self.modelList[i]
+      if isinstance(model,treeTypes) and exampleArray is not None:
+        if self.quantizationRequirements[i]:
+          data = quantArray
+        else:
+          data = exampleArray
+      elif self.quantizationRequirements[i]:
+        data = quantExamples
+      else:
+        data = examples
+
+      if useModels is not None:
+        rows = numpy.nonzero(useModels[:,i]|noModels)[0]
+        if not len(rows):
+          continue
+        if isinstance(data,numpy.ndarray):
+          data = data[rows]
+        else:
+          data = [data[x] for x in rows]
+      else:
+        rows = numpy.arange(nExamples)
+
+      if hasattr(model,'ClassifyExamples'):
+        preds = model.ClassifyExamples(data)
+      else:
+        preds = [model.ClassifyExample(x) for x in data]
+      # this rounds the same way int(round(x)) does:
+      preds = numpy.asarray(preds,numpy.float64)
+      preds = (numpy.sign(preds)*numpy.floor(numpy.abs(preds)+0.5)).astype(numpy.intp)
+      if preds.min()<-nClasses or preds.max()>=nClasses:
+        raise IndexError,'list index out of range'
+      preds %= nClasses
+      flatVotes += numpy.bincount(rows*nClasses+preds,
+                                  minlength=len(flatVotes))*self.countList[i]
+
+    res = numpy.argmax(votes,axis=1)
+    confs = votes[numpy.arange(nExamples),res]/votes.sum(axis=1).astype(numpy.float64)
+    return [(r,c) if c>threshold else (-1,c) for r,c in zip(res,confs.tolist())]
+
   def GetVoteDetails(self):
     """ returns the votes from the last classification
 
@@ -407,7 +629,7 @@ class Composite(object):
 
   def Grow(self,examples,attrs,nPossibleVals,buildDriver,pruner=None,
            nTries=10,pruneIt=0,
-           needsQuantization=1,progressCallback=None,
+           needsQuantization=1,progressCallback=None,numWorkers=0,
            **buildArgs):
     """ Grows the composite
 
@@ -434,6 +656,14 @@ class Composite(object):
        - needsQuantization: used to indicate whether or not this type of model
           requires quantized data
 
+       - numWorkers: (optional) if this is nonzero, each model is built
+          using its own random seed, drawn in order from the _random_
+          module, and the models are built by _numWorkers_ processes.
+          The models are added in the same order no matter how many
+          workers are used, so the results do not depend on _numWorkers_.
+          The default (0) builds the models one after the other with
+          the shared random number generators.
+
        - **buildArgs: all other keyword args are passed to _buildDriver_
 
       **Note**
@@ -464,38 +694,57 @@ class Composite(object):
     else:
       trainExamples = examples
 
-    for i in xrange(nTries):
-      trainSet = None
-      
-      if (hasattr(self, '_modelFilterFrac')) and (self._modelFilterFrac != 0) :
-        trainIdx, temp = DataUtils.FilterData(trainExamples, self._modelFilterVal,
-                                              self._modelFilterFrac,-1, indicesOnly=1)
-        trainSet = [trainExamples[x] for x in trainIdx]
+    if hasattr(self,'_modelFilterFrac') and self._modelFilterFrac!=0:
+      modelFilter = (self._modelFilterVal,self._modelFilterFrac)
+    else:
+      modelFilter = None
+    growData = (trainExamples,attrs,nPossibleVals,buildDriver,pruner,pruneIt,
+                modelFilter,buildArgs)
 
+    pool = None
+    if not numWorkers:
+      results = (_growModel(growData) for x in xrange(nTries))
+    else:
+      # each model gets its own random seed, drawn up front and in model
+      # order, so the composite does not depend on the number of workers:
+      seeds = [random.randint(0,sys.maxint) for x in xrange(nTries)]
+      if numWorkers>1:
+        import multiprocessing
+        pool = multiprocessing.Pool(numWorkers,_initGrowWorker,(growData,))
+        # imap hands the models back in order:
+        results = pool.imap(_growSeededModel,seeds)
       else:
-        trainSet = trainExamples
-
-      #print "Training model %i with %i out of %i examples"%(i, len(trainSet), len(trainExamples))
-      model,frac = apply(buildDriver,(trainSet,attrs,nPossibleVals),
-                         buildArgs)
-      if pruneIt:
-        model,frac2 = pruner(model,model.GetTrainingExamples(),
-                            model.GetTestExamples(),
-                            minimizeTestErrorOnly=0)
-        frac = frac2
-      if hasattr(self, '_modelFilterFrac') and self._modelFilterFrac!=0 and \
-         hasattr(model,'_trainIndices'):
-        # correct the model's training indices:
-        trainIndices = [trainIdx[x] for x in model._trainIndices]
-        model._trainIndices = trainIndices
-        
-      self.AddModel(model,frac,needsQuantization)
-      if not silent and (nTries < 10 or i % (nTries/10) == 0):
-        print 'Cycle: % 4d'%(i)
-      if progressCallback is not None:
-        progressCallback(i)
+        _initGrowWorker(growData)
+        results = itertools.imap(_growSeededModel,seeds)
+    try:
+      for i in xrange(nTries):
+        model,frac = results.next()
+        self.AddModel(model,frac,needsQuantization)
+        if not silent and (nTries < 10 or i % (nTries/10) == 0):
+          print 'Cycle: % 4d'%(i)
+        if progressCallback is not None:
+          progressCallback(i)
+    finally:
+      if pool is not None:
+        pool.terminate()
+        pool.join()
+      elif numWorkers:
+        _initGrowWorker(None)
 
   
+  def FreezeModels(self):
+    """ replaces each decision tree in the composite with a
+    _FrozenTree_, which classifies the same way but is much smaller
+    when pickled and faster to load
+
+    The frozen trees cannot be pruned or modified.
+
+    """
+    from rdkit.ML.DecTree.DecTree import DecTreeNode
+    for i in xrange(len(self.modelList)):
+      if isinstance(self.modelList[i],DecTreeNode):
+        self.modelList[i] = self.modelList[i].Freeze()
+
   def ClearModelExamples(self):
     for i in range(len(self)):
       m = self.GetModel(i)
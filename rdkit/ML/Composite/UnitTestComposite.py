@@ -63,6 +63,28 @@ class TestCase(unittest.TestCase):
       #assert t1 == t2, 'tree mismatch'
       #assert c1 == c2, 'count mismatch'
 
+  def testTreeGrowWorkers(self):
+    " testing that parallel growing does not depend on the number of workers "
+    from rdkit.ML.Data import DataUtils
+    from rdkit.ML.DecTree import CrossValidate
+    driver = CrossValidate.CrossValidationDriver
+    compos = []
+    for numWorkers in (1,3):
+      DataUtils.InitRandomNumbers((23,43))
+      composite = Composite.Composite()
+      composite._varNames=self.varNames
+      composite.SetQuantBounds(self.qBounds,self.nPoss)
+      composite.Grow(self.examples,self.attrs,[],buildDriver=driver,
+                     nTries=20,silent=1,numWorkers=numWorkers)
+      compos.append(composite)
+    self.failUnlessEqual(len(compos[0]),len(compos[1]))
+    self.failUnlessEqual(compos[0].GetAllData()[1:],compos[1].GetAllData()[1:])
+    for i in xrange(len(compos[0])):
+      self.failUnless(compos[0].GetModel(i)==compos[1].GetModel(i))
+    for example in self.examples:
+      self.failUnlessEqual(compos[0].ClassifyExample(example),
+                           compos[1].ClassifyExample(example))
+
   def testTreeScreen(self):
     " testing tree-based composite screening "
     self.refCompos = cPickle.load(open(RDConfig.RDCodeDir+'/ML/Composite/test_data/composite_base.pkl','rb'))
@@ -73,6 +95,22 @@ class TestCase(unittest.TestCase):
       assert res==cRes,'result mismatch'
       assert conf==cConf,'confidence mismatch'
     
+  def testBatchClassify(self):
+    " testing classifying sets of examples "
+    import numpy
+    for fName in ('composite_base.pkl','composite_base.unittree.pkl'):
+      compos = cPickle.load(open(RDConfig.RDCodeDir+'/ML/Composite/test_data/'+fName,'rb'))
+      for threshold in (0,0.8):
+        ref = [compos.ClassifyExample(x,threshold=threshold) for x in self.examples]
+        self.failUnlessEqual(compos.ClassifyExamples(self.examples,threshold=threshold),ref)
+        # numeric arrays work too:
+        examples = numpy.array([[0]+x[1:] for x in self.examples],numpy.float64)
+        self.failUnlessEqual(compos.ClassifyExamples(examples,threshold=threshold),ref)
+      ref = [compos.ClassifyExample(x,onlyModels=range(0,len(compos),2)) for x in self.examples]
+      self.failUnlessEqual(compos.ClassifyExamples(self.examples,
+                                                   onlyModels=range(0,len(compos),2)),ref)
+    self.failUnlessEqual(compos.ClassifyExamples([]),[])
+    
   def testErrorEstimate(self):
     " testing out-of-bag error estimates "
 
@@ -167,6 +205,14 @@ class TestCase(unittest.TestCase):
     pred,conf=compos.ClassifyExample(data[3],onlyModels=(0,1))
     assert pred==0
     assert conf==0.5
+
+    # and the batch version:
+    useModels = [[0,1,1],[0,0,1],[1,0,0],[1,1,0]]
+    res = compos.ClassifyExamples(data,useModels=useModels)
+    self.failUnlessEqual(res,[(0,1.0),(0,1.0),(1,1.0),(0,0.5)])
+    # examples none of the models can vote on use all of them:
+    res = compos.ClassifyExamples(data,useModels=[[0,0,0]]*4)
+    self.failUnlessEqual(res,[compos.ClassifyExample(x) for x in data])
     
     
 if __name__ == '__main__':
@@ -42,6 +42,7 @@ def SetDefaults(runDetails):
   runDetails.randomActivities = 0
   runDetails.shuffleActivities = 0
   runDetails.replacementSelection = 0
+  runDetails.numWorkers = 0
 
   #
   # Tree Parameters
@@ -128,6 +128,18 @@ def ReadVars(inFile):
       qBounds[i] = []
   return varNames,qBounds
 
+def _IterQuantExamples(inFile):
+  """ generator for the (name,example) pairs in a .qdat file """
+  expr1 = re.compile(r'^#')
+  expr2 = re.compile(r'[\ ]*|[\t]*')
+  inLine = inFile.readline()
+  while inLine:
+    if expr1.search(inLine) is None:
+      resArr = expr2.split(inLine)
+      if len(resArr)>1:
+        yield resArr[0],map(lambda x: int(x),resArr[1:])
+    inLine = inFile.readline()
+
 def ReadQuantExamples(inFile):
   """ reads the examples from a .qdat file
 
@@ -149,19 +161,33 @@ def ReadQuantExamples(inFile):
       are integers
       
   """
-  expr1 = re.compile(r'^#')
-  expr2 = re.compile(r'[\ ]*|[\t]*')
   examples = []
   names = []
+  for name,example in _IterQuantExamples(inFile):
+    examples.append(example)
+    names.append(name)
+  return names,examples
+
+def _IterGeneralExamples(inFile):
+  """ generator for the (name,example) pairs in a .dat file """
+  expr1 = re.compile(r'^#')
+  expr2 = re.compile(r'[\ ]*|[\t]*')
   inLine = inFile.readline()
   while inLine:
     if expr1.search(inLine) is None:
-      resArr = expr2.split(inLine)
+      resArr = expr2.split(inLine)[:-1]
       if len(resArr)>1:
-        examples.append(map(lambda x: int(x),resArr[1:]))
-        names.append(resArr[0])
+        for i in xrange(1,len(resArr)):
+          d = resArr[i]
+          try:
+            resArr[i] = int(d)
+          except ValueError:
+            try:
+              resArr[i] = float(d)
+            except ValueError:
+              pass
+        yield resArr[0],resArr[1:]
     inLine = inFile.readline()
-  return names,examples
 
 def ReadGeneralExamples(inFile):
   """ reads the examples from a .dat file
@@ -184,36 +210,39 @@ def ReadGeneralExamples(inFile):
         if those both fail, they are left as strings
 
   """
-  expr1 = re.compile(r'^#')
-  expr2 = re.compile(r'[\ ]*|[\t]*')
   examples = []
   names = []
-  inLine = inFile.readline()
-  while inLine:
-    if expr1.search(inLine) is None:
-      resArr = expr2.split(inLine)[:-1]
-      if len(resArr)>1:
-        for i in xrange(1,len(resArr)):
-          d = resArr[i]
-          try:
-            resArr[i] = int(d)
-          except ValueError:
-            try:
-              resArr[i] = float(d)
-            except ValueError:
-              pass
-        examples.append(resArr[1:])
-        names.append(resArr[0])
-    inLine = inFile.readline()
+  for name,example in _IterGeneralExamples(inFile):
+    examples.append(example)
+    names.append(name)
   return names,examples
 
-def BuildQuantDataSet(fileName):
+def _ExamplesToColumns(examples):
+  """ collects (name,example) pairs into a list of names and a
+  list of column arrays (see _MLData.ArrayDataBuilder_)
+
+  """
+  builder = None
+  names = []
+  for name,example in examples:
+    if builder is None:
+      builder = MLData.ArrayDataBuilder(len(example))
+    builder.AddRow(example)
+    names.append(name)
+  if builder is None:
+    raise ValueError,'no data'
+  return names,builder.GetColumns()
+
+def BuildQuantDataSet(fileName,asArrays=False):
   """ builds a data set from a .qdat file
 
     **Arguments**
 
       - fileName: the name of the .qdat file
 
+      - asArrays: if set, an _MLData.MLArrayQuantDataSet_ is returned.
+        The examples are read straight into the arrays.
+
     **Returns**
 
       an _MLData.MLQuantDataSet_
@@ -222,19 +251,27 @@ def BuildQuantDataSet(fileName):
   inFile = open(fileName,'r')
 
   varNames,qBounds = ReadVars(inFile)
-  ptNames,examples = ReadQuantExamples(inFile)
-  data = MLData.MLQuantDataSet(examples,qBounds=qBounds,varNames=varNames,
-                               ptNames=ptNames)
+  if asArrays:
+    ptNames,columns = _ExamplesToColumns(_IterQuantExamples(inFile))
+    data = MLData.MLArrayQuantDataSet(columns=columns,qBounds=qBounds,
+                                      varNames=varNames,ptNames=ptNames)
+  else:
+    ptNames,examples = ReadQuantExamples(inFile)
+    data = MLData.MLQuantDataSet(examples,qBounds=qBounds,varNames=varNames,
+                                 ptNames=ptNames)
   return data
 
 
-def BuildDataSet(fileName):
+def BuildDataSet(fileName,asArrays=False):
   """ builds a data set from a .dat file
 
     **Arguments**
 
       - fileName: the name of the .dat file
 
+      - asArrays: if set, an _MLData.MLArrayDataSet_ is returned.
+        The examples are read straight into the arrays.
+
     **Returns**
 
       an _MLData.MLDataSet_
@@ -243,9 +280,14 @@ def BuildDataSet(fileName):
   inFile = open(fileName,'r')
 
   varNames,qBounds = ReadVars(inFile)
-  ptNames,examples = ReadGeneralExamples(inFile)
-  data = MLData.MLDataSet(examples,qBounds=qBounds,varNames=varNames,
-                          ptNames=ptNames)
+  if asArrays:
+    ptNames,columns = _ExamplesToColumns(_IterGeneralExamples(inFile))
+    data = MLData.MLArrayDataSet(columns=columns,qBounds=qBounds,
+                                 varNames=varNames,ptNames=ptNames)
+  else:
+    ptNames,examples = ReadGeneralExamples(inFile)
+    data = MLData.MLDataSet(examples,qBounds=qBounds,varNames=varNames,
+                            ptNames=ptNames)
   return data
 
 
@@ -354,7 +396,7 @@ def TakeEnsemble(vect,ensembleIds,isDataVect=False):
 
 def DBToData(dbName,tableName,user='sysdba',password='masterkey',dupCol=-1,
              what='*',where='',join='',pickleCol=-1,pickleClass=None,
-             ensembleIds=None):
+             ensembleIds=None,asArrays=False):
   """ constructs  an _MLData.MLDataSet_ from a database
 
     **Arguments**
@@ -370,6 +412,10 @@ def DBToData(dbName,tableName,user='sysdba',password='masterkey',dupCol=-1,
       - dupCol: if nonzero specifies which column should be used to recognize
         duplicates.
 
+      - asArrays: if set, an _MLData.MLArrayDataSet_ is returned. The
+        rows are streamed from the database into the arrays, so the
+        full set of rows is never held in memory as python lists.
+
     **Returns**
 
        an _MLData.MLDataSet_
@@ -380,15 +426,24 @@ def DBToData(dbName,tableName,user='sysdba',password='masterkey',dupCol=-1,
 
   """
   conn = DbConnect(dbName,tableName,user,password)
-  res = conn.GetData(fields=what,where=where,join=join,removeDups=dupCol,
-                     forceList=1)
-  nPts = len(res)
-  vals = [None]*nPts
-  ptNames = [None]*nPts
+  if asArrays:
+    res = conn.GetData(fields=what,where=where,join=join,randomAccess=0)
+    builder = None
+    seen = set()
+  else:
+    res = conn.GetData(fields=what,where=where,join=join,removeDups=dupCol,
+                       forceList=1)
+    vals = []
+  ptNames = []
   classWorks=True
-  for i in range(nPts):
-    tmp = list(res[i])
-    ptNames[i] = tmp.pop(0)
+  for row in res:
+    tmp = list(row)
+    if asArrays and dupCol>0:
+      # this matches the handling of duplicates when forceList is set
+      if tmp[dupCol] in seen:
+        continue
+      seen.add(tmp[dupCol])
+    ptNames.append(tmp.pop(0))
     if pickleCol>=0:
       if not pickleClass or not classWorks:
         tmp[pickleCol] = cPickle.loads(str(tmp[pickleCol]))
@@ -403,18 +458,32 @@ def DBToData(dbName,tableName,user='sysdba',password='masterkey',dupCol=-1,
     else:
       if ensembleIds:
         tmp = TakeEnsemble(tmp,ensembleIds,isDataVect=True)
-    vals[i] = tmp  
+    if asArrays:
+      if builder is None:
+        builder = MLData.ArrayDataBuilder(len(tmp))
+      builder.AddRow(tmp)
+    else:
+      vals.append(tmp)
   varNames = conn.GetColumnNames(join=join,what=what)
-  data = MLData.MLDataSet(vals,varNames=varNames,ptNames=ptNames)
+  if asArrays:
+    if builder is None:
+      raise ValueError,'no data'
+    data = MLData.MLArrayDataSet(columns=builder.GetColumns(),varNames=varNames,
+                                 ptNames=ptNames)
+  else:
+    data = MLData.MLDataSet(vals,varNames=varNames,ptNames=ptNames)
   return data
 
-def TextToData(reader,ignoreCols=[],onlyCols=None):
+def TextToData(reader,ignoreCols=[],onlyCols=None,asArrays=False):
   """ constructs  an _MLData.MLDataSet_ from a bunch of text
 #DOC
     **Arguments**
       - reader needs to be iterable and return lists of elements
         (like a csv.reader)
 
+      - asArrays: if set, an _MLData.MLArrayDataSet_ is built directly
+        from the reader's rows
+
     **Returns**
 
        an _MLData.MLDataSet_
@@ -436,7 +505,10 @@ def TextToData(reader,ignoreCols=[],onlyCols=None):
   nCols = len(varNames)
   varNames = tuple([varNames[x] for x in keepCols])
   nVars = len(varNames)
-  vals = []
+  if asArrays:
+    builder = MLData.ArrayDataBuilder(nVars-1)
+  else:
+    vals = []
   ptNames = []
   for splitLine in reader:
     if len(splitLine):
@@ -454,11 +526,18 @@ def TextToData(reader,ignoreCols=[],onlyCols=None):
           except:
             val = str(tmp[j+1])
         pt[j] = val    
-      vals.append(pt)
-  data = MLData.MLDataSet(vals,varNames=varNames,ptNames=ptNames)
+      if asArrays:
+        builder.AddRow(pt)
+      else:
+        vals.append(pt)
+  if asArrays:
+    data = MLData.MLArrayDataSet(columns=builder.GetColumns(),varNames=varNames,
+                                 ptNames=ptNames)
+  else:
+    data = MLData.MLDataSet(vals,varNames=varNames,ptNames=ptNames)
   return data
 
-def TextFileToData(fName,onlyCols=None):
+def TextFileToData(fName,onlyCols=None,asArrays=False):
   """
   #DOC
 
@@ -469,7 +548,7 @@ def TextFileToData(fName,onlyCols=None):
     splitter = csv.reader(open(fName,'rU'))
   else:
     splitter = csv.reader(open(fName,'rU'),delimiter='\t')
-  return TextToData(splitter,onlyCols=onlyCols)
+  return TextToData(splitter,onlyCols=onlyCols,asArrays=asArrays)
 
 def InitRandomNumbers(seed):
   """ Seeds the random number generators
@@ -648,7 +727,7 @@ def RandomizeActivities(dataSet,shuffle=0,runDetails=None):
   nPts = dataSet.GetNPts()
   if shuffle:
     if runDetails: runDetails.shuffled = 1
-    acts = dataSet.GetResults()[:]
+    acts = list(dataSet.GetResults())
     random.shuffle(acts)
   else:
     if runDetails: runDetails.randomized = 1
@@ -310,6 +310,394 @@ class MLQuantDataSet(MLDataSet):
       ptNames = ['']*self.nPts
     self.ptNames = ptNames
 
+#------------------------------------
+#
+#  array-backed data sets
+#
+def _ValsDtype(vals):
+  """ returns the dtype to be used for an array holding vals
+
+  >>> _ValsDtype([1,2,3])
+  dtype('int64')
+  >>> _ValsDtype([1,2.5,3])
+  dtype('float64')
+  >>> _ValsDtype([1,'a',3])
+  dtype('O')
+
+  """
+  valTypes = set([type(x) for x in vals])
+  if not valTypes.difference((int,long)):
+    return numpy.dtype(numpy.int64)
+  elif not valTypes.difference(numericTypes):
+    return numpy.dtype(numpy.float64)
+  return numpy.dtype(object)
+
+def _CommonDtype(dtypes):
+  if numpy.dtype(object) in dtypes:
+    return numpy.dtype(object)
+  elif numpy.dtype(numpy.float64) in dtypes:
+    return numpy.dtype(numpy.float64)
+  return numpy.dtype(numpy.int64)
+
+def _ValsToArray(vals):
+  dtype = _ValsDtype(vals)
+  if dtype==object:
+    # the values may themselves be sequences (e.g. bit vectors), so
+    # numpy can't be allowed to convert them:
+    res = numpy.empty(len(vals),object)
+    for i,val in enumerate(vals):
+      res[i] = val
+  else:
+    try:
+      res = numpy.array(vals,dtype)
+    except OverflowError:
+      res = _ValsToArray(vals+[None])[:-1]
+  return res
+
+def _StackColumns(cols,nRows):
+  """ combines a list of 1D arrays into a 2D array """
+  res = numpy.empty((nRows,len(cols)),_CommonDtype([x.dtype for x in cols]))
+  for i,col in enumerate(cols):
+    res[:,i] = col
+  return res
+
+class ArrayDataBuilder(object):
+  """ collects rows of data into typed columns without keeping the
+  rows themselves around
+
+  The rows are converted in chunks, so the memory required is that of
+  the arrays plus one chunk of rows.
+
+  >>> builder = ArrayDataBuilder(3,chunkSize=2)
+  >>> for row in ([1,2,3],[2,3,4],[3,4.5,'a']): builder.AddRow(row)
+  >>> len(builder)
+  3
+  >>> [x.dtype.name for x in builder.GetColumns()]
+  ['int64', 'float64', 'object']
+
+  """
+  def __init__(self,nCols,chunkSize=10000):
+    self.nCols = nCols
+    self.chunkSize = chunkSize
+    self._chunks = []
+    self._rows = []
+    self._nRows = 0
+
+  def __len__(self):
+    return self._nRows+len(self._rows)
+
+  def _flush(self):
+    if self._rows:
+      self._chunks.append([_ValsToArray([row[i] for row in self._rows])
+                           for i in range(self.nCols)])
+      self._nRows += len(self._rows)
+      self._rows = []
+
+  def AddRow(self,row):
+    if len(row)!=self.nCols:
+      raise ValueError,'bad row length'
+    self._rows.append(row)
+    if len(self._rows)>=self.chunkSize:
+      self._flush()
+
+  def GetColumns(self):
+    """ returns a list with a 1D array for each column """
+    self._flush()
+    res = []
+    for i in range(self.nCols):
+      pieces = [x[i] for x in self._chunks]
+      if not pieces:
+        res.append(numpy.zeros(0,numpy.int64))
+      elif len(pieces)==1:
+        res.append(pieces[0])
+      else:
+        col = numpy.empty(self._nRows,_CommonDtype([x.dtype for x in pieces]))
+        pos = 0
+        for piece in pieces:
+          col[pos:pos+len(piece)] = piece
+          pos += len(piece)
+        res.append(col)
+    # the chunks are now in the columns, so don't hold onto them:
+    self._chunks = [res]
+    return res
+
+class MLArrayDataSet(MLDataSet):
+  """ A data set that stores its data in numpy arrays
+
+   The input variables are held in a single 2D array that is integer
+   or floating point if the data allow it (otherwise it's an object
+   array), the results are in a second array, and the point names are
+   in a list. This takes a fraction of the memory of MLDataSet's lists
+   of lists and GetInputData() and GetResults() return the arrays
+   themselves instead of building new lists.
+
+   The rest of the MLDataSet interface is supported and returns the
+   same values MLDataSet would. Columns that contain only ints still
+   return ints, but ints in columns that also contain floats are
+   returned as floats:
+
+   >>> d = MLArrayDataSet([[1,2.5,0],[2,3.5,1],[3,1.0,1]],ptNames=['a','b','c'])
+   >>> d.GetNPts(),d.GetNVars(),d.GetNResults()
+   (3, 2, 1)
+   >>> d.GetInputData().dtype.name
+   'float64'
+   >>> list(d.GetResults())
+   [0, 1, 1]
+   >>> d.GetNamedData()[1]
+   ['b', 2, 3.5, 1]
+   >>> d[2]
+   ['c', 3, 1.0, 1]
+   >>> d.GetNPossibleVals()
+   [4, 0, 2]
+
+  """
+  def __init__(self,data=None,nVars=None,nPts=None,nPossibleVals=None,
+               qBounds=None,varNames=None,ptNames=None,nResults=1,
+               columns=None):
+    """ Constructor
+
+      **Arguments**
+
+        - data: a list of lists containing the data, as for MLDataSet.
+              The data are copied into arrays.
+
+        - columns: (optional) a list of 1D arrays, one per column, that
+              is used instead of _data_ (e.g. from ArrayDataBuilder.GetColumns())
+
+      the other arguments are as for MLDataSet
+
+    """
+    if columns is None:
+      if data is None:
+        raise ValueError,'either data or columns must be provided'
+      if nVars is None:
+        nCols = len(data[0])
+      else:
+        nCols = nVars+nResults
+      builder = ArrayDataBuilder(nCols)
+      for row in data:
+        builder.AddRow(row)
+      columns = builder.GetColumns()
+      builder = None
+    self.nResults = nResults
+    if nVars is None:
+      nVars = len(columns)-self.nResults
+    self.nVars = nVars
+    if nPts is None:
+      if columns:
+        nPts = len(columns[0])
+      else:
+        nPts = 0
+    self.nPts = nPts
+    self._setColumns(columns)
+    if qBounds is None:
+      qBounds = [[]]*len(columns)
+    self.qBounds = qBounds
+    if nPossibleVals is None:
+      nPossibleVals = self._CalcNPossible(None)
+    self.nPossibleVals = nPossibleVals
+    if varNames is None:
+      varNames = ['']*self.nVars
+    self.varNames = varNames
+    if ptNames is None:
+      ptNames = ['']*self.nPts
+    self.ptNames = list(ptNames)
+
+  def _setColumns(self,columns):
+    nRows = len(columns[0])
+    self._inputs = _StackColumns(columns[:self.nVars],nRows)
+    self._results = _StackColumns(columns[self.nVars:],nRows)
+    # columns of ints that are being stored as floats:
+    self._intCols = []
+    for i,col in enumerate(columns):
+      if i<self.nVars:
+        block = self._inputs
+      else:
+        block = self._results
+      if col.dtype==numpy.int64 and block.dtype==numpy.float64:
+        self._intCols.append(i)
+
+  def _getColumns(self):
+    res = [self._inputs[:,i] for i in range(self.nVars)]+\
+          [self._results[:,i] for i in range(self.nResults)]
+    for i in self._intCols:
+      res[i] = res[i].astype(numpy.int64)
+    return res
+
+  def _columnDtype(self,i):
+    if i in self._intCols:
+      return numpy.dtype(numpy.int64)
+    elif i<self.nVars:
+      return self._inputs.dtype
+    return self._results.dtype
+
+  def _CalcNPossible(self,data):
+    """calculates the number of possible values of each variable (where possible)
+
+      gives the same results as MLDataSet._CalcNPossible(), the data
+      argument is ignored
+
+    """
+    nPossible = []
+    for i,col in enumerate(self._getColumns()):
+      if i<len(self.qBounds) and len(self.qBounds[i])>0:
+        nPossible.append(len(self.qBounds[i])+1)
+      elif col.dtype==object:
+        nPoss = -1
+        for d in col:
+          if type(d) in numericTypes and math.floor(d)==d:
+            nPoss = max(math.floor(d),nPoss)
+          else:
+            nPoss = -1
+            break
+        nPossible.append(int(nPoss)+1)
+      elif not len(col) or (numpy.floor(col)!=col).any():
+        nPossible.append(0)
+      else:
+        nPossible.append(int(max(col.max(),-1))+1)
+    return nPossible
+
+  def _rowsToLists(self,block,offset,which):
+    rows = block[which].tolist()
+    if block.dtype==numpy.float64:
+      intCols = [x-offset for x in self._intCols if offset<=x<offset+block.shape[1]]
+      if intCols:
+        for row in rows:
+          for col in intCols:
+            row[col] = int(row[col])
+    return rows
+
+  def _rowLists(self,which=slice(None)):
+    """ returns the rows of the data set as lists """
+    inputs = self._rowsToLists(self._inputs,0,which)
+    results = self._rowsToLists(self._results,self.nVars,which)
+    for i,row in enumerate(inputs):
+      row.extend(results[i])
+    return inputs
+
+  def GetInputData(self):
+    """ returns the input data
+
+     **Note**
+
+       this is the 2D array used to store the data, not a copy
+
+    """
+    return self._inputs
+
+  def GetResults(self):
+    """ Returns the result fields from each example
+
+     **Note**
+
+       this is the array used to store the data (a view of it if there
+       is a single result column), not a copy
+
+    """
+    if self.GetNResults()>1:
+      return self._results
+    return self._results[:,0]
+
+  def GetAllData(self):
+    """ returns a *copy* of the data
+
+    """
+    return self._rowLists()
+
+  def GetNamedData(self):
+    """ returns a list of named examples
+
+     **Note**
+
+       a named example is the result of prepending the example
+        name to the data list
+        
+    """
+    res = self._rowLists()
+    for i,row in enumerate(res):
+      row.insert(0,self.ptNames[i])
+    return res
+
+  def __getitem__(self,idx):
+    return [self.ptNames[idx]]+self._rowLists([idx])[0]
+
+  def __setitem__(self,idx,val):
+    if len(val) != self.GetNVars()+self.GetNResults()+1:
+      raise ValueError,'bad value in assignment'
+    vals = val[1:]
+    dtypes = [_CommonDtype([self._columnDtype(i),_ValsDtype([v])]) for i,v in enumerate(vals)]
+    if [self._columnDtype(i) for i in range(len(vals))]!=dtypes:
+      # the new values don't fit, so the arrays have to be rebuilt:
+      self._setColumns([col.astype(dtypes[i]) for i,col in enumerate(self._getColumns())])
+    self.ptNames[idx] = val[0]
+    for i,v in enumerate(vals):
+      if i<self.nVars:
+        self._inputs[idx,i] = v
+      else:
+        self._results[idx,i-self.nVars] = v
+    return val
+
+  def AddPoints(self,pts,names):
+    if len(pts)!=len(names):
+      raise ValueError,"input length mismatch"
+    builder = ArrayDataBuilder(self.nVars+self.nResults)
+    for pt in pts:
+      builder.AddRow(pt)
+    columns = self._getColumns()
+    for i,col in enumerate(builder.GetColumns()):
+      newCol = numpy.empty(len(columns[i])+len(col),_CommonDtype([columns[i].dtype,col.dtype]))
+      newCol[:len(columns[i])] = columns[i]
+      newCol[len(columns[i]):] = col
+      columns[i] = newCol
+    self._setColumns(columns)
+    self.ptNames += names
+    self.nPts = len(self._inputs)
+
+  def AddPoint(self,pt):
+    self.AddPoints([pt[1:]],[pt[0]])
+
+class MLArrayQuantDataSet(MLArrayDataSet):
+  """ an array-backed data set for holding quantized data
+
+   this is the counterpart of MLQuantDataSet: results are assumed to be
+   quantized and the number of possible values of each column is
+   calculated from the data (no qBounds entry is required)
+
+   >>> d = MLArrayQuantDataSet([[0,1,0],[1,2,1],[0,0,1]],ptNames=['a','b','c'])
+   >>> d.GetInputData().dtype.name
+   'int64'
+   >>> d.GetNPossibleVals()
+   [2, 3, 2]
+   >>> d.GetNamedData()[1]
+   ['b', 1, 2, 1]
+   >>> d.GetQuantBounds()
+   [[], []]
+
+  """
+  def __init__(self,data=None,nVars=None,nPts=None,nPossibleVals=None,
+               qBounds=None,varNames=None,ptNames=None,nResults=1,
+               columns=None):
+    if qBounds is None:
+      if nVars is not None:
+        qBounds = [[]]*nVars
+      elif columns is not None:
+        qBounds = [[]]*(len(columns)-nResults)
+      elif data is not None:
+        qBounds = [[]]*(len(data[0])-nResults)
+    MLArrayDataSet.__init__(self,data=data,nVars=nVars,nPts=nPts,
+                            nPossibleVals=nPossibleVals,qBounds=qBounds,
+                            varNames=varNames,ptNames=ptNames,
+                            nResults=nResults,columns=columns)
+
+  def _CalcNPossible(self,data):
+    """calculates the number of possible values of each variable
+
+      gives the same results as MLQuantDataSet._CalcNPossible(), the
+      data argument is ignored
+
+    """
+    return [int(max(x))+1 for x in self._getColumns()]
+
 
 if __name__ == '__main__':
   import DataUtils
@@ -14,6 +14,11 @@ lie.
   - bounds are less than, so if the bounds are [1.,2.],
     [0.9,1.,1.1,2.,2.2] -> [0,1,1,2,2]
 
+  - the search for the best bounds is done with numpy: the information
+    gain of a set of bounds is a sum of terms for the individual bins,
+    so the best bounds can be found from cumulative counts of the
+    result codes without trying every combination of bounds.
+
 """
 import numpy
 from rdkit.ML.InfoTheory import entropy
@@ -25,6 +30,8 @@ else:
   hascQuantize = 1  
   
 _float_tol = 1e-8
+# the maximum number of equally good sets of bounds compared by _FindBestCuts():
+_maxCandidates = 100
 def feq(v1,v2,tol=_float_tol):
   """ floating point equality with a tolerance factor
 
@@ -274,8 +281,12 @@ def _NewPyFindStartPoints(sortVals,sortResults,nData):
     startNext.append(lastDiv)
   return startNext
 
-def FindVarMultQuantBounds(vals,nBounds,results,nPossibleRes):
-  """ finds multiple quantization bounds for a single variable
+def _PyFindVarMultQuantBounds(vals,nBounds,results,nPossibleRes):
+  """ Primarily intended for internal use
+
+   the original implementation of FindVarMultQuantBounds(), which tries
+   every combination of bounds.  This is a lot slower and is only kept
+   around for testing.
   
    **Arguments**
 
@@ -331,6 +342,302 @@ def FindVarMultQuantBounds(vals,nBounds,results,nPossibleRes):
       
   return quantBounds,maxGain
 
+def _NumpyFindStartPoints(sortVals,sortResults,nData):
+  """ Primarily intended for internal use
+
+   a numpy version of _NewPyFindStartPoints(), returns the same list
+   of potential starting points for quantization bounds
+
+   **Arguments**
+
+     - sortVals: a 1D numpy array with the sorted values of the variable
+
+     - sortResults: a 1D numpy array with the corresponding result codes
+
+     - nData: the number of points
+
+  """
+  if nData < 2:
+    return []
+  # values closer than the tolerance are in the same block:
+  blockStarts = numpy.nonzero(sortVals[1:nData]-sortVals[:nData-1]>_float_tol)[0]+1
+  if not len(blockStarts):
+    return []
+  blockStarts = numpy.concatenate(([0],blockStarts))
+  blockIds = numpy.zeros(nData,numpy.intp)
+  blockIds[blockStarts[1:]] = 1
+  blockIds = numpy.cumsum(blockIds)
+  # blocks with more than one result code get activity -1:
+  changes = numpy.nonzero(sortResults[1:nData]!=sortResults[:nData-1])[0]+1
+  changes = changes[blockIds[changes]==blockIds[changes-1]]
+  mixed = numpy.zeros(len(blockStarts),numpy.bool)
+  mixed[blockIds[changes]] = True
+  acts = numpy.where(mixed,-1,sortResults[blockStarts])
+  # there's a possible bound in front of every block that is mixed or
+  # has a different activity than the block before it:
+  keep = (acts[1:]==-1)|(acts[:-1]==-1)|(acts[1:]!=acts[:-1])
+  return blockStarts[1:][keep].tolist()
+
+def _XLogX(x):
+  """ Primarily intended for internal use
+
+    x*log(x), with zero for non-positive x
+
+  """
+  pos = x>0
+  return numpy.where(pos,x*numpy.log(numpy.where(pos,x,1)),0.)
+
+def _BinCosts(cumCounts,bots,tops):
+  """ Primarily intended for internal use
+
+   returns the contribution of bins to the entropy of a quantization
+   (the bin's entropy multiplied by its size, in nats): element [i,j]
+   of the result is for the bin that runs from _bots[i]_ to _tops[j]_.
+
+   **Arguments**
+
+     - cumCounts: a 2D numpy array with the cumulative counts of the
+       result codes at each possible bin boundary
+
+     - bots: indices (into _cumCounts_) of the bottoms of the bins
+
+     - tops: indices (into _cumCounts_) of the tops of the bins
+
+  """
+  counts = cumCounts[numpy.newaxis,tops,:]-cumCounts[bots,numpy.newaxis,:]
+  return _XLogX(counts.sum(-1))-_XLogX(counts).sum(-1)
+
+def _CutsVarTable(cuts,starts,sortResults,nPossibleRes):
+  """ Primarily intended for internal use
+
+   a faster _GenVarTable() for sorted numpy arrays of result codes
+
+  """
+  bins = numpy.searchsorted([starts[x] for x in cuts],numpy.arange(len(sortResults)),
+                            side='right')
+  varTable = numpy.bincount(bins*nPossibleRes+(sortResults%nPossibleRes),
+                            minlength=(len(cuts)+1)*nPossibleRes)
+  return varTable.reshape((len(cuts)+1,nPossibleRes)).astype('i')
+
+def _FindBestCuts(starts,sortResults,nBounds,nPossibleRes):
+  """ Primarily intended for internal use
+
+   finds the best _nBounds_ quantization bounds using dynamic programming
+
+   **Arguments**
+
+     - starts: a list of potential starting points for quantization bounds
+
+     - sortResults: a 1D numpy array with the sorted result codes
+
+     - nBounds: the number of bounds to find
+
+     - nPossibleRes: an integer with the number of possible result codes
+
+   **Returns**
+
+     - a 2-tuple containing:
+
+       1) the information gain
+
+       2) a list of the quantization bound indices (into _starts_ )
+
+   **Notes**
+
+     - sets of bounds which are (nearly) as good as the best one are
+       compared using entropy.InfoGain() in the order _RecurseOnBounds()
+       tries them, so ties are broken the same way.
+
+  """
+  nData = len(sortResults)
+  # the possible bin boundaries:
+  divs = numpy.array([0]+list(starts)+[nData],numpy.intp)
+  nDivs = len(divs)
+  cumCounts = numpy.zeros((nData+1,nPossibleRes),numpy.float64)
+  cumCounts[1:] = numpy.cumsum(numpy.eye(nPossibleRes)[sortResults],0)
+  cumCounts = cumCounts[divs]
+  tol = 1e-12*nData
+
+  # costs[j][i] is the lowest cost of covering the points above divs[i]
+  # with j more bounds:
+  costs = [numpy.empty(nDivs,numpy.float64)]
+  costs[0][:-1] = _BinCosts(cumCounts,numpy.arange(nDivs-1),[nDivs-1])[:,0]
+  costs[0][-1] = numpy.inf
+  allDivs = numpy.arange(nDivs)
+  chunkSize = max(1,1000000//(nDivs*nPossibleRes))
+  for j in range(1,nBounds):
+    costsHere = numpy.empty(nDivs,numpy.float64)
+    costsHere.fill(numpy.inf)
+    for bot in range(1,nDivs-1,chunkSize):
+      bots = allDivs[bot:bot+chunkSize]
+      tots = _BinCosts(cumCounts,bots,allDivs)+costs[j-1]
+      tots[allDivs<=bots[:,numpy.newaxis]] = numpy.inf
+      costsHere[bots] = tots.min(1)
+    costs.append(costsHere)
+
+  # now walk forward to collect the sets of cuts which are as good as
+  # the best one:
+  candidates = []
+  def walk(bot,j,costHere,cuts):
+    tots = _BinCosts(cumCounts,[bot],allDivs)[0]+costs[j-1]+costHere
+    tots[:bot+1] = numpy.inf
+    for top in numpy.nonzero(tots<=bestCost+tol)[0]:
+      if len(candidates) >= _maxCandidates:
+        break
+      if j == 1:
+        candidates.append(cuts+[int(top)-1])
+      else:
+        walk(top,j-1,costHere+_BinCosts(cumCounts,[bot],[top])[0,0],cuts+[int(top)-1])
+  tots = _BinCosts(cumCounts,[0],allDivs)[0]+costs[nBounds-1]
+  tots[0] = numpy.inf
+  bestCost = tots.min()
+  walk(0,nBounds,0.,[])
+
+  maxGain = -1e6
+  bestCuts = None
+  for cuts in candidates:
+    gainHere = entropy.InfoGain(_CutsVarTable(cuts,starts,sortResults,nPossibleRes))
+    if gainHere > maxGain:
+      maxGain = gainHere
+      bestCuts = cuts
+  return maxGain,bestCuts
+
+def _FindSortedVarMultQuantBounds(sortVals,sortResults,nBounds,nPossibleRes):
+  """ Primarily intended for internal use
+
+   FindVarMultQuantBounds() for data which has already been sorted (by
+   value and then by result)
+
+   **Arguments**
+
+     - sortVals: a 1D numpy array with the sorted values of the variable
+
+     - nBounds: the number of quantization bounds to find
+
+     - sortResults: a 1D numpy array with the corresponding (integer)
+       result codes
+
+     - nPossibleRes: an integer with the number of possible values of the
+       result variable
+
+   **Returns**
+
+     - a 2-tuple containing:
+
+       1) a list of the quantization bounds (floats)
+
+       2) the information gain associated with this quantization
+
+  """
+  nData = len(sortVals)
+  if nData == 0:
+    return [],-1e8
+  startNext=_NumpyFindStartPoints(sortVals,sortResults,nData)
+  if not len(startNext):
+    return [0],0.0
+  if len(startNext)<nBounds:
+    nBounds = len(startNext)-1
+  if nBounds == 0:
+    nBounds=1
+  maxGain,bestCuts = _FindBestCuts(startNext,sortResults,nBounds,nPossibleRes)
+  quantBounds = []
+  for cut in bestCuts:
+    idx = startNext[cut]
+    if idx == nData:
+      quantBounds.append(float(sortVals[-1]))
+    elif idx == 0:
+      quantBounds.append(float(sortVals[idx]))
+    else:
+      quantBounds.append(float(sortVals[idx]+sortVals[idx-1])/2.)
+  return quantBounds,maxGain
+
+def _SortVarData(vals,results):
+  """ Primarily intended for internal use
+
+    returns 1D numpy arrays with the values and results sorted by value
+    and then by result
+
+  """
+  vals = numpy.asarray(vals,numpy.float64)
+  if vals.ndim != 1:
+    raise ValueError,'variable values should be a sequence of numbers'
+  results = numpy.asarray(results).astype(numpy.intp)
+  order = numpy.lexsort((results,vals))
+  return vals[order],results[order]
+
+def FindVarMultQuantBounds(vals,nBounds,results,nPossibleRes):
+  """ finds multiple quantization bounds for a single variable
+  
+   **Arguments**
+
+     - vals: sequence of variable values (assumed to be floats)
+
+     - nBounds: the number of quantization bounds to find
+
+     - results: a list of result codes (should be integers)
+
+     - nPossibleRes: an integer with the number of possible values of the
+       result variable
+
+   **Returns**
+
+     - a 2-tuple containing:
+
+       1) a list of the quantization bounds (floats)
+
+       2) the information gain associated with this quantization
+
+
+  """
+  assert len(vals) == len(results), 'vals/results length mismatch'
+  sortVals,sortResults = _SortVarData(vals,results)
+  return _FindSortedVarMultQuantBounds(sortVals,sortResults,nBounds,nPossibleRes)
+
+def FindAllVarMultQuantBounds(data,nBoundsPerVar,nPossibleRes):
+  """ finds the quantization bounds for all the variables in a data set
+
+   **Arguments**
+
+     - data: a sequence of examples (or a 2D numpy array), the last
+       column of which contains the (integer) result codes
+
+     - nBoundsPerVar: a sequence with the number of quantization bounds
+       to find for each column of _data_.  Columns with no bounds (and
+       the result column) are not quantized and can contain anything.
+
+     - nPossibleRes: an integer with the number of possible values of the
+       result variable
+
+   **Returns**
+
+     - a 2-tuple containing:
+
+       1) a list with the quantization bounds for each column (empty
+          for columns which were not quantized)
+
+       2) a list with the information gain for each column (0.0 for
+          columns which were not quantized)
+
+  """
+  if isinstance(data,numpy.ndarray):
+    getCol = lambda i:data[:,i]
+  else:
+    getCol = lambda i:[x[i] for x in data]
+  nCols = len(nBoundsPerVar)
+  if len(data):
+    results = getCol(-1)
+  else:
+    results = []
+  quantBounds = [[] for i in range(nCols)]
+  gains = [0.0]*nCols
+  for i in range(nCols-1):
+    if nBoundsPerVar[i] > 0:
+      sortVals,sortResults = _SortVarData(getCol(i),results)
+      quantBounds[i],gains[i] = _FindSortedVarMultQuantBounds(sortVals,sortResults,
+                                                              nBoundsPerVar[i],
+                                                              nPossibleRes)
+  return quantBounds,gains
+
 #hascQuantize=0
 if hascQuantize:
   _RecurseOnBounds = cQuantize._RecurseOnBounds
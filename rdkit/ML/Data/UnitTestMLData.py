@@ -117,6 +117,60 @@ class TestCase(unittest.TestCase):
     assert self.d.GetInputData()[3]==d.GetInputData()[3],'GetInputData wrong'
     assert self.d.GetNamedData()[2]==d.GetNamedData()[2],'GetNamedData wrong'
     
+  def testArrayDataSet(self):
+    " testing ArrayDataSet"
+    self.setUpGeneralLoad()
+    d = MLData.MLArrayDataSet(self.d.GetAllData(),varNames=self.d.GetVarNames(),
+                              qBounds=self.d.GetQuantBounds(),ptNames=self.d.GetPtNames())
+    self.failUnlessEqual(d.GetNPts(),5)
+    self.failUnlessEqual(d.GetNVars(),4)
+    self.failUnlessEqual(d.GetNPossibleVals(),[0, 6, 0, 0, 3])
+    self.failUnlessEqual(list(d.GetResults()),[1.1, 2.1, 3.1, 4.1, 5.1])
+    self.failUnlessEqual(d.GetInputData().shape,(5,4))
+    self.failUnlessEqual(d.GetAllData(),self.d.GetAllData())
+    self.failUnlessEqual(d.GetNamedData(),self.d.GetNamedData())
+    self.failUnlessEqual(d[3],['p4', 'foo', 4, 1.0, 1, 4.1])
+    d[3]=d[1]
+    self.failUnlessEqual(d[3],['p2','foo', 2, 1.0, 1, 2.1])
+    d.AddPoint(['p6','bar', 6, 1.5, 2, 6.1])
+    self.failUnlessEqual(d.GetNPts(),6)
+    self.failUnlessEqual(d[5],['p6','bar', 6, 1.5, 2, 6.1])
+    d2 = cPickle.loads(cPickle.dumps(d))
+    self.failUnlessEqual(d2.GetNamedData(),d.GetNamedData())
+
+    # numeric data ends up in typed arrays:
+    fName = RDConfig.RDCodeDir+'/ML/KNN/test_data/random_pts.csv'
+    d1 = DataUtils.TextFileToData(fName)
+    d2 = DataUtils.TextFileToData(fName,asArrays=True)
+    self.failUnless(isinstance(d2,MLData.MLArrayDataSet))
+    self.failUnlessEqual(d2.GetInputData().dtype.name,'float64')
+    self.failUnlessEqual(d2.GetResults().dtype.name,'int64')
+    self.failUnlessEqual(d1.GetNPts(),d2.GetNPts())
+    self.failUnlessEqual(d1.GetVarNames(),d2.GetVarNames())
+    self.failUnlessEqual(d1.GetNPossibleVals(),d2.GetNPossibleVals())
+    self.failUnlessEqual(d1.GetNamedData(),d2.GetNamedData())
+    self.failUnlessEqual(d1.GetResults(),list(d2.GetResults()))
+
+  def testArrayLoads(self):
+    " testing loading .qdat and .dat files into arrays"
+    self.setUpQuantLoad()
+    d = DataUtils.BuildQuantDataSet(RDConfig.RDCodeDir+'/ML/Data/test_data/test.qdat',
+                                    asArrays=True)
+    self.failUnless(isinstance(d,MLData.MLArrayQuantDataSet))
+    self.failUnlessEqual(d.GetInputData().dtype.name,'int64')
+    self.failUnlessEqual(d.GetNPossibleVals(),self.d.GetNPossibleVals())
+    self.failUnlessEqual(d.GetQuantBounds(),self.d.GetQuantBounds())
+    self.failUnlessEqual(d.GetVarNames(),self.d.GetVarNames())
+    self.failUnlessEqual(d.GetNamedData(),self.d.GetNamedData())
+    self.failUnlessEqual(list(d.GetResults()),self.d.GetResults())
+
+    self.setUpGeneralLoad()
+    d = DataUtils.BuildDataSet(RDConfig.RDCodeDir+'/ML/Data/test_data/test.dat',
+                               asArrays=True)
+    self.failUnless(isinstance(d,MLData.MLArrayDataSet))
+    self.failUnlessEqual(d.GetNPossibleVals(),self.d.GetNPossibleVals())
+    self.failUnlessEqual(d.GetQuantBounds(),self.d.GetQuantBounds())
+    self.failUnlessEqual(d.GetNamedData(),self.d.GetNamedData())
 
 if __name__ == '__main__':
   unittest.main()
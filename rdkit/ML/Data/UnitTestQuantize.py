@@ -6,6 +6,7 @@
 
 """
 import unittest
+import numpy
 from rdkit import RDConfig
 from rdkit.ML.Data import Quantize    
 
@@ -433,6 +434,56 @@ class TestCase(unittest.TestCase):
     self.failUnlessRaises(ValueError,lambda :Quantize.FindVarMultQuantBounds(d2,1,a,2))
     self.failUnlessRaises(ValueError,lambda :Quantize._FindStartPoints(d2,a,len(d2)))
 
+  def testCompareImplementations(self):
+    """ compare the numpy bounds search with the original one
+    """
+    import random
+    random.seed(23)
+    for i in range(150):
+      nPts = random.randint(2,20)
+      nPossibleRes = random.randint(2,4)
+      if i%3:
+        varValues = [random.randint(0,8)/4. for x in range(nPts)]
+      else:
+        varValues = [random.random() for x in range(nPts)]
+      resCodes = [random.randint(0,nPossibleRes-1) for x in range(nPts)]
+      svs = zip(varValues,resCodes)
+      svs.sort()
+      sortVals,sortResults = zip(*svs)
+      self.failUnlessEqual(Quantize._NumpyFindStartPoints(numpy.array(sortVals),
+                                                          numpy.array(sortResults),nPts),
+                           Quantize._NewPyFindStartPoints(sortVals,sortResults,nPts))
+      for nBounds in (1,2,3):
+        res = Quantize.FindVarMultQuantBounds(varValues,nBounds,resCodes,nPossibleRes)
+        target = Quantize._PyFindVarMultQuantBounds(varValues,nBounds,resCodes,nPossibleRes)
+        self.failUnlessEqual(len(res[0]),len(target[0]))
+        for bound,tgt in zip(res[0],target[0]):
+          self.failUnless(Quantize.feq(bound,tgt),'%s != %s'%(res[0],target[0]))
+        self.failUnless(Quantize.feq(res[1],target[1]),'%s != %s'%(res[1],target[1]))
+
+  def testAllVars(self):
+    """ finding the bounds for a whole data set
+    """
+    import random
+    random.seed(23)
+    data = []
+    for i in range(50):
+      descrs = [random.random(),random.randint(0,3)/2.,random.random()]
+      data.append(['p%d'%i]+descrs+[int(descrs[0]+descrs[1]>1)])
+    nBoundsPerVar = [0,1,2,0,0]
+    for dataSet in (data,numpy.array([[0]+x[1:] for x in data])):
+      qBounds,gains = Quantize.FindAllVarMultQuantBounds(dataSet,nBoundsPerVar,2)
+      self.failUnlessEqual(len(qBounds),len(nBoundsPerVar))
+      self.failUnlessEqual(qBounds[0],[])
+      self.failUnlessEqual(qBounds[3],[])
+      self.failUnlessEqual(qBounds[4],[])
+      self.failUnlessEqual(gains[3],0.0)
+      for i in (1,2):
+        target = Quantize.FindVarMultQuantBounds([x[i] for x in data],nBoundsPerVar[i],
+                                                 [x[-1] for x in data],2)
+        self.failUnlessEqual(qBounds[i],target[0])
+        self.failUnlessEqual(gains[i],target[1])
+
 
 
 if __name__ == '__main__':
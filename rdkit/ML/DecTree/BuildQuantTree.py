@@ -15,13 +15,128 @@ from rdkit.ML.DecTree import QuantTree, ID3
 from rdkit.ML.InfoTheory import entropy
 from rdkit.ML.Data import Quantize
 
+class SplitData(object):
+  """ the examples at a node of a QuantTree, in a form which allows the
+  splits to be found quickly
+
+    The values of each variable which needs quantization bounds are
+    sorted once, for the root of the tree; each node passes the sorted
+    indices of its examples on to its children, so no further sorting
+    is needed.
+
+  """
+  def __init__(self,examples=None,attrs=None,nBoundsPerVar=None):
+    if examples is None:
+      return
+    nExamples = len(examples)
+    self.results = numpy.array([int(x[-1]) for x in examples],numpy.intp)
+    self.values = {}
+    self.sortedIndices = {}
+    for var in attrs:
+      if nBoundsPerVar[var] < 0:
+        continue
+      vals = numpy.array([x[var] for x in examples],numpy.float64)
+      self.values[var] = vals
+      if nBoundsPerVar[var] > 0:
+        # sort by value and then by result, the same order
+        # FindVarMultQuantBounds uses:
+        self.sortedIndices[var] = numpy.lexsort((self.results,vals))
+    self.exIndices = numpy.arange(nExamples)
+    self._scratch = numpy.zeros(nExamples,numpy.intp)
+
+  def __len__(self):
+    return len(self.exIndices)
+
+  def GetResultCodes(self):
+    """ returns the result codes of the examples at this node """
+    return self.results[self.exIndices]
+
+  def GetVarTable(self,var,nPossibleVals,nPossibleRes):
+    """ equivalent to ID3.GenVarTable() for a single variable """
+    vals = self.values[var][self.exIndices].astype(numpy.intp)
+    nVals = nPossibleVals[var]
+    vals = numpy.where(vals<0,vals+nVals,vals)
+    if len(vals) and (vals.min()<0 or vals.max()>=nVals):
+      raise IndexError,'index out of bounds'
+    res = self.GetResultCodes()
+    counts = numpy.bincount(vals*nPossibleRes+res,minlength=nVals*nPossibleRes)
+    return counts.reshape((nVals,nPossibleRes)).astype('i')
+
+  def FindQuantBounds(self,var,nBounds,nPossibleRes):
+    """ equivalent to Quantize.FindVarMultQuantBounds() for a single variable """
+    order = self.sortedIndices[var]
+    return Quantize._FindSortedVarMultQuantBounds(self.values[var][order],
+                                                  self.results[order],
+                                                  nBounds,nPossibleRes)
+
+  def Split(self,var,bounds,nVals,attrs):
+    """ returns a list with the SplitData for each child of a node
+    that splits on _var_ (None for children without examples)
+
+      **Arguments**
+
+        - var: the variable used for the split
+
+        - bounds: the quantization bounds for the split, if this is
+          empty the examples are split on the values of the variable
+
+        - nVals: the number of possible values of the variable
+
+        - attrs: the variables the children can use
+
+    """
+    vals = self.values[var][self.exIndices]
+    if len(bounds):
+      # examples go with the first bound they are below:
+      boxes = numpy.empty(len(vals),numpy.intp)
+      boxes.fill(len(bounds))
+      placed = numpy.zeros(len(vals),numpy.bool)
+      for i,bound in enumerate(bounds):
+        here = ~placed&(vals<bound)
+        boxes[here] = i
+        placed |= here
+      nBoxes = len(bounds)+1
+    else:
+      ints = vals.astype(numpy.intp)
+      boxes = numpy.where(ints==vals,ints,-1)
+      nBoxes = nVals
+    self._scratch[self.exIndices] = boxes
+    sortedVars = [x for x in attrs if self.sortedIndices.has_key(x)]
+    res = []
+    for box in xrange(nBoxes):
+      exIndices = self.exIndices[boxes==box]
+      if not len(exIndices):
+        res.append(None)
+        continue
+      child = SplitData()
+      child.results = self.results
+      child.values = self.values
+      child._scratch = self._scratch
+      child.exIndices = exIndices
+      child.sortedIndices = {}
+      for sortVar in sortedVars:
+        order = self.sortedIndices[sortVar]
+        child.sortedIndices[sortVar] = order[self._scratch[order]==box]
+      res.append(child)
+    return res
+
 def FindBest(resCodes,examples,nBoundsPerVar,nPossibleRes,
-             nPossibleVals,attrs,exIndices=None,**kwargs):
+             nPossibleVals,attrs,exIndices=None,splitData=None,**kwargs):
+  """ finds the variable (and its quantization bounds) giving the
+  largest information gain
+
+    if _splitData_ (a _SplitData_ for the examples) is provided, it is
+    used to speed up the search and _resCodes_, _examples_ and
+    _exIndices_ are ignored
+
+  """
   bestGain =-1e6
   best = -1
   bestBounds = []
 
-  if exIndices is None:
+  if splitData is not None:
+    exIndices = splitData.exIndices
+  elif exIndices is None:
     exIndices=range(len(examples))
   
   if not len(exIndices):
@@ -39,7 +154,12 @@ def FindBest(resCodes,examples,nBoundsPerVar,nPossibleRes,
 
   for var in attrs:
     nBounds = nBoundsPerVar[var]
-    if nBounds > 0:
+    if nBounds > 0 and splitData is not None:
+      qBounds,gainHere = splitData.FindQuantBounds(var,nBounds,nPossibleRes)
+    elif nBounds==0 and splitData is not None:
+      gainHere = entropy.InfoGain(splitData.GetVarTable(var,nPossibleVals,nPossibleRes))
+      qBounds = []
+    elif nBounds > 0:
       #vTable = map(lambda x,z=var:x[z],examples)
       try:
         vTable = [examples[x][var] for x in exIndices]
@@ -89,7 +209,7 @@ def FindBest(resCodes,examples,nBoundsPerVar,nPossibleRes,
 
 
 def BuildQuantTree(examples,target,attrs,nPossibleVals,nBoundsPerVar,
-                   depth=0,maxDepth=-1,exIndices=None,**kwargs):
+                   depth=0,maxDepth=-1,exIndices=None,splitData=None,**kwargs):
   """ 
     **Arguments**
     
@@ -109,6 +229,12 @@ def BuildQuantTree(examples,target,attrs,nPossibleVals,nBoundsPerVar,
 
       - maxDepth: (optional) the maximum depth to which the tree
                    will be grown
+
+      - exIndices: (optional) the indices of the examples to use
+
+      - splitData: (optional) a _SplitData_ for the examples to use,
+                   if this is provided _exIndices_ is ignored
+
     **Returns**
     
      a QuantTree.QuantTreeNode with the decision tree
@@ -120,14 +246,19 @@ def BuildQuantTree(examples,target,attrs,nPossibleVals,nBoundsPerVar,
   tree.SetData(-666)
   nPossibleRes = nPossibleVals[-1]
 
-  if exIndices is None:
-    exIndices=range(len(examples))
+  if splitData is not None:
+    exIndices = splitData.exIndices
+    resCodes = splitData.GetResultCodes()
+    counts = numpy.bincount(resCodes,minlength=nPossibleRes).tolist()
+  else:
+    if exIndices is None:
+      exIndices=range(len(examples))
   
-  # counts of each result code:
-  resCodes = [int(x[-1]) for x in (examples[y] for y in exIndices)]
-  counts = [0]*nPossibleRes
-  for res in resCodes:
-    counts[res] += 1
+    # counts of each result code:
+    resCodes = [int(x[-1]) for x in (examples[y] for y in exIndices)]
+    counts = [0]*nPossibleRes
+    for res in resCodes:
+      counts[res] += 1
   nzCounts = numpy.nonzero(counts)[0]
 
   if len(nzCounts) == 1:
@@ -152,7 +283,7 @@ def BuildQuantTree(examples,target,attrs,nPossibleVals,nBoundsPerVar,
     best,bestGain,bestBounds = FindBest(resCodes,examples,nBoundsPerVar,
                                         nPossibleRes,nPossibleVals,attrs,
                                         exIndices=exIndices,
-                                        **kwargs)
+                                        splitData=splitData,**kwargs)
 
     # remove that variable from the lists of possible variables
     nextAttrs = attrs[:]
@@ -167,8 +298,20 @@ def BuildQuantTree(examples,target,attrs,nPossibleVals,nBoundsPerVar,
     
     # loop over possible values of the new variable and
     #  build a subtree for each one
-    indices = exIndices[:]
-    if len(bestBounds) > 0:
+    if splitData is not None:
+      for childData in splitData.Split(best,bestBounds,nPossibleVals[best],nextAttrs):
+        if childData is None:
+          v =  numpy.argmax(counts)
+          tree.AddChild('%d'%v,label=v,data=0.0,isTerminal=1)
+        else:
+          tree.AddChildNode(BuildQuantTree(examples,best,
+                                           nextAttrs,nPossibleVals,
+                                           nBoundsPerVar,
+                                           depth=depth+1,maxDepth=maxDepth,
+                                           splitData=childData,
+                                           **kwargs))
+    elif len(bestBounds) > 0:
+      indices = exIndices[:]
       for bound in bestBounds:
         nextExamples = []
         for index in indices[:]:
@@ -246,13 +389,23 @@ def QuantTreeBoot(examples,attrs,nPossibleVals,nBoundsPerVar,initialVar=None,
   counts = [0]*nPossibleRes
   for res in resCodes:
     counts[res] += 1
+  try:
+    splitData = SplitData(examples,attrs,nBoundsPerVar)
+  except (TypeError,ValueError):
+    # non-numeric descriptor values, do things the slow way:
+    splitData = None
   if initialVar is None:
     best,gainHere,qBounds = FindBest(resCodes,examples,nBoundsPerVar,
                                      nPossibleRes,nPossibleVals,attrs,
-                                     **kwargs)
+                                     splitData=splitData,**kwargs)
   else:
     best = initialVar
-    if nBoundsPerVar[best] > 0:
+    if nBoundsPerVar[best] > 0 and splitData is not None:
+      qBounds,gainHere = splitData.FindQuantBounds(best,nBoundsPerVar[best],nPossibleRes)
+    elif nBoundsPerVar[best] == 0 and splitData is not None:
+      gainHere = entropy.InfoGain(splitData.GetVarTable(best,nPossibleVals,nPossibleRes))
+      qBounds = []
+    elif nBoundsPerVar[best] > 0:
       vTable = map(lambda x,z=best:x[z],examples)
       qBounds,gainHere = Quantize.FindVarMultQuantBounds(vTable,nBoundsPerVar[best],
                                                          resCodes,nPossibleRes)
@@ -273,6 +426,22 @@ def QuantTreeBoot(examples,attrs,nPossibleVals,nBoundsPerVar,initialVar=None,
   if not kwargs.get('recycleVars',0):
     nextAttrs.remove(best)
 
+  if splitData is not None:
+    # the children work with the full set of examples and the
+    # indices in their SplitData:
+    for childData in splitData.Split(best,qBounds,nPossibleVals[best],nextAttrs):
+      if childData is not None:
+        tree.AddChildNode(BuildQuantTree(examples,best,
+                                         nextAttrs,nPossibleVals,
+                                         nBoundsPerVar,
+                                         depth=1,maxDepth=maxDepth,
+                                         splitData=childData,
+                                         **kwargs))
+      else:
+        v =  numpy.argmax(counts)
+        tree.AddChild('%d??'%(v),label=v,data=0.0,isTerminal=1)
+    return tree
+
   indices = range(len(examples))
   if len(qBounds) > 0:
     for bound in qBounds:
@@ -8,6 +8,7 @@
 
 """
 from rdkit.ML.DecTree import Tree
+import numpy
 
 class DecTreeNode(Tree.TreeNode):
   """ This is used to represent decision trees
@@ -61,6 +62,80 @@ class DecTreeNode(Tree.TreeNode):
     else:
       val = example[self.label]
       return self.children[val].ClassifyExample(example,appendExamples)
+
+  def ClassifyExamples(self,examples,appendExamples=0):
+    """ Classify a set of examples
+
+      **Arguments**
+
+        - examples: the examples to be classified.  If this is a 2D
+          numeric numpy array (one row per example), all of the examples
+          are run through the tree together; otherwise _ClassifyExample()_
+          is called for each of them.
+
+        - appendExamples: if this is nonzero then this node (and all children)
+          will store the examples
+
+      **Returns**
+
+        a list with the classification of each of _examples_
+
+    """
+    if appendExamples or not isinstance(examples,numpy.ndarray) or \
+       examples.dtype.kind not in 'biuf':
+      return [self.ClassifyExample(x,appendExamples=appendExamples) for x in examples]
+    res = numpy.empty(len(examples),numpy.object)
+    self._classifyRows(examples,numpy.arange(len(examples)),res)
+    return list(res)
+
+  def Freeze(self):
+    """ returns a compact, read-only copy of this tree
+
+      **Returns**
+
+        a _FrozenTree.FrozenTree_ which classifies examples the same way
+        this tree does
+
+    """
+    from rdkit.ML.DecTree import FrozenTree
+    return FrozenTree.FreezeTree(self)
+
+  def _branchIndices(self,vals):
+    """ returns the index of the child each of _vals_ leads to
+
+      **NOTE:** this is primarily intended for internal use and should
+        be overridden by subclasses which compute the child index in a
+        different way in _ClassifyExample()_
+
+    """
+    return vals.astype(numpy.intp)
+
+  def _classifyRows(self,examples,rows,res):
+    """ sets res[rows] to the classifications of those rows of examples
+
+      **NOTE:** this is primarily intended for internal use
+
+    """
+    if self.terminalNode:
+      res[rows] = self.label
+      return
+    vals = self._branchIndices(examples[rows,self.label])
+    nChildren = len(self.children)
+    # negative indices work the way they do in ClassifyExample:
+    vals = numpy.where(vals<0,vals+nChildren,vals)
+    if len(vals) and (vals.min()<0 or vals.max()>=nChildren):
+      raise IndexError,'list index out of range'
+    if nChildren==1:
+      self.children[0]._classifyRows(examples,rows,res)
+      return
+    order = numpy.argsort(vals,kind='mergesort')
+    counts = numpy.bincount(vals,minlength=nChildren)
+    start = 0
+    for i in xrange(nChildren):
+      end = start+counts[i]
+      if end>start:
+        self.children[i]._classifyRows(examples,rows[order[start:end]],res)
+      start = end
  
   def AddChild(self,name,label=None,data=None,isTerminal=0):
     """ Constructs and adds a child with the specified data to our list
@@ -0,0 +1,282 @@
+# $Id$
+#
+#  This file is part of the RDKit.
+#  The contents are covered by the terms of the BSD license
+#  which is included in the file license.txt, found at the root
+#  of the RDKit source tree.
+#
+""" Defines the class _FrozenTree_, a compact, read-only form of a
+trained decision tree
+
+A _FrozenTree_ stores a _DecTreeNode_, _QuantTreeNode_ or _SigTreeNode_
+tree as a set of parallel arrays (one entry per node): the variable
+each node splits on, its quantization bounds, the offset of its
+children and its label.  Frozen trees classify examples without
+recursion, classify numeric arrays of examples in a single pass,
+pickle to a small fraction of the size of the original tree and load
+quickly.  They cannot be modified, pruned or drawn; keep the original
+tree if that's required.
+
+>>> from rdkit.ML.DecTree.QuantTree import QuantTreeNode
+>>> t = QuantTreeNode(None,'d1',1)
+>>> t.SetQuantBounds([0.5])
+>>> c = QuantTreeNode(t,'d2',2)
+>>> c.SetQuantBounds([1.5,2.5])
+>>> t.AddChildNode(c)
+>>> for i in range(3): c.AddChildNode(QuantTreeNode(c,str(i),i,isTerminal=1))
+>>> t.AddChildNode(QuantTreeNode(t,'3',3,isTerminal=1))
+>>> frozen = FreezeTree(t)
+>>> len(frozen)
+6
+>>> [frozen.ClassifyExample(x) for x in (['a',0.2,1.0],['a',0.2,2.0],['a',0.7,1.0])]
+[0, 1, 3]
+>>> import numpy
+>>> frozen.ClassifyExamples(numpy.array([[0,0.2,1.0],[0,0.2,3.0],[0,0.7,1.0]]))
+[0, 2, 3]
+
+"""
+import copy
+import numpy
+from rdkit.ML.DecTree import QuantTree
+
+# the ways a node can pick a child:
+_valueNode=0  # the example's value is the child index (DecTreeNode)
+_quantNode=1  # the value is quantized using the node's bounds (QuantTreeNode)
+_sigNode=2    # the bit of the example's signature is the child index (SigTreeNode)
+
+class FrozenTree(object):
+  """ a read-only, array-based decision tree
+
+    Nodes are numbered in depth-first order, so the root is node 0.
+    For node _i_:
+
+      - _terminal[i]_ is nonzero for leaves
+
+      - _labels[i]_ is the node's label: the classification for leaves,
+        the index of the variable used for the split otherwise
+
+      - _kinds[i]_ indicates how the child is selected
+
+      - the node's quantization bounds are
+        _bounds[boundStarts[i]:boundStarts[i]+nBounds[i]]_
+
+      - the node's children are
+        _children[childStarts[i]:childStarts[i]+nChildren[i]]_
+
+  """
+  def __init__(self,tree=None):
+    self._scalarData = None
+    if tree is not None:
+      self._freeze(tree)
+
+  def _freeze(self,tree):
+    try:
+      from rdkit.ML.DecTree.SigTree import SigTreeNode
+    except ImportError:
+      SigTreeNode = None
+
+    # number the nodes in depth-first order:
+    nodes = []
+    stack = [tree]
+    while stack:
+      node = stack.pop()
+      nodes.append(node)
+      stack.extend(reversed(node.GetChildren()))
+    nodeIds = dict([(id(node),i) for i,node in enumerate(nodes)])
+
+    nNodes = len(nodes)
+    terminal = numpy.zeros(nNodes,numpy.bool)
+    kinds = numpy.zeros(nNodes,numpy.int8)
+    labels = [None]*nNodes
+    boundStarts = numpy.zeros(nNodes,numpy.int32)
+    nBounds = numpy.zeros(nNodes,numpy.int32)
+    childStarts = numpy.zeros(nNodes,numpy.int32)
+    nChildren = numpy.zeros(nNodes,numpy.int32)
+    bounds = []
+    children = []
+    for i,node in enumerate(nodes):
+      terminal[i] = node.GetTerminal()
+      labels[i] = node.GetLabel()
+      if SigTreeNode is not None and isinstance(node,SigTreeNode):
+        kinds[i] = _sigNode
+      elif isinstance(node,QuantTree.QuantTreeNode):
+        kinds[i] = _quantNode
+        boundStarts[i] = len(bounds)
+        nBounds[i] = len(node.GetQuantBounds())
+        bounds.extend(node.GetQuantBounds())
+      else:
+        kinds[i] = _valueNode
+      childStarts[i] = len(children)
+      nChildren[i] = len(node.GetChildren())
+      children.extend([nodeIds[id(x)] for x in node.GetChildren()])
+
+    self._terminal = terminal
+    self._kinds = kinds
+    try:
+      self._labels = numpy.array(labels,numpy.int64)
+      if self._labels.tolist()!=labels:
+        raise ValueError
+    except (TypeError,ValueError):
+      self._labels = numpy.array(labels,numpy.object)
+    self._boundStarts = boundStarts
+    self._nBounds = nBounds
+    self._bounds = numpy.array(bounds,numpy.float64)
+    self._childStarts = childStarts
+    self._nChildren = nChildren
+    self._children = numpy.array(children,numpy.int32)
+    if hasattr(tree,'_trainIndices'):
+      self._trainIndices = tree._trainIndices
+    self._scalarData = None
+
+  def __len__(self):
+    """ returns the number of nodes in the tree """
+    return len(self._terminal)
+
+  def __getstate__(self):
+    d = self.__dict__.copy()
+    d['_scalarData'] = None
+    return d
+
+  def _getScalarData(self):
+    # list versions of the arrays are a lot faster to index one node at a time:
+    if self._scalarData is None:
+      bounds = self._bounds.tolist()
+      nodeBounds = [bounds[s:s+n] for s,n in zip(self._boundStarts.tolist(),
+                                                self._nBounds.tolist())]
+      children = self._children.tolist()
+      nodeChildren = [children[s:s+n] for s,n in zip(self._childStarts.tolist(),
+                                                    self._nChildren.tolist())]
+      self._scalarData = (self._terminal.tolist(),self._kinds.tolist(),
+                          self._labels.tolist(),nodeBounds,nodeChildren)
+    return self._scalarData
+
+  def GetTerminal(self,node=0):
+    """ returns whether or not a node is terminal """
+    return bool(self._terminal[node])
+
+  def GetLabel(self,node=0):
+    """ returns a node's label """
+    return self._getScalarData()[2][node]
+
+  def ClearExamples(self):
+    """ frozen trees do not store examples, so this does nothing """
+    pass
+
+  def ClassifyExample(self,example,appendExamples=0):
+    """ classifies an example by walking the tree
+
+      **Arguments**
+
+        - example: the example to be classified
+
+        - appendExamples: ignored; frozen trees do not store examples
+
+      **Returns**
+
+        the classification of _example_, the same value the original
+        tree's _ClassifyExample()_ returns
+
+    """
+    terminal,kinds,labels,nodeBounds,nodeChildren = self._getScalarData()
+    node = 0
+    while not terminal[node]:
+      kind = kinds[node]
+      if kind == _sigNode:
+        sig = example[1]
+        val = sig[labels[node]]
+        if val and hasattr(sig,'DetachVectsNotMatchingBit'):
+          # VectCollections are modified on the way down the tree:
+          sig = copy.copy(sig)
+          sig.DetachVectsNotMatchingBit(labels[node])
+          example = [example[0],sig]+list(example[2:])
+      else:
+        val = example[labels[node]]
+        if kind == _quantNode and nodeBounds[node]:
+          for i,bound in enumerate(nodeBounds[node]):
+            if val < bound:
+              val = i
+              break
+          else:
+            val = i+1
+        else:
+          val = int(val)
+      node = nodeChildren[node][val]
+    return labels[node]
+
+  def ClassifyExamples(self,examples,appendExamples=0):
+    """ classifies a set of examples
+
+      **Arguments**
+
+        - examples: the examples to be classified.  If this is a 2D
+          numeric numpy array (one row per example) and the tree does
+          not use signatures, all of the examples are run through the
+          tree together; otherwise _ClassifyExample()_ is called for
+          each of them.
+
+        - appendExamples: ignored; frozen trees do not store examples
+
+      **Returns**
+
+        a list with the classification of each of _examples_
+
+    """
+    if not isinstance(examples,numpy.ndarray) or \
+       examples.dtype.kind not in 'biuf' or \
+       (self._kinds==_sigNode).any():
+      return [self.ClassifyExample(x) for x in examples]
+
+    nodes = numpy.zeros(len(examples),numpy.intp)
+    active = numpy.arange(len(examples))
+    maxBounds = self._nBounds.max() if len(self._nBounds) else 0
+    while len(active):
+      current = nodes[active]
+      keep = ~self._terminal[current]
+      active = active[keep]
+      current = current[keep]
+      if not len(active):
+        break
+      vals = examples[active,self._labels[current].astype(numpy.intp)]
+      nBounds = self._nBounds[current]
+      quantized = (self._kinds[current]==_quantNode)&(nBounds>0)
+      branch = numpy.where(quantized,0,vals).astype(numpy.intp)
+      if quantized.any():
+        # count the bounds each value is not below (as in
+        # ClassifyExample, NaNs end up in the last box):
+        starts = self._boundStarts[current]
+        errs = numpy.seterr(invalid='ignore')
+        try:
+          for i in xrange(maxBounds):
+            use = quantized&(nBounds>i)
+            if not use.any():
+              break
+            branch[use] += ~(vals[use]<self._bounds[starts[use]+i])
+        finally:
+          numpy.seterr(**errs)
+      nChildren = self._nChildren[current]
+      # negative indices work the way they do in ClassifyExample:
+      branch = numpy.where(branch<0,branch+nChildren,branch)
+      if (branch<0).any() or (branch>=nChildren).any():
+        raise IndexError,'list index out of range'
+      nodes[active] = self._children[self._childStarts[current]+branch]
+    return self._labels[nodes].tolist()
+
+def FreezeTree(tree):
+  """ returns a _FrozenTree_ for a _DecTreeNode_, _QuantTreeNode_ or
+  _SigTreeNode_ tree
+
+  """
+  return FrozenTree(tree)
+
+#------------------------------------
+#
+#  doctest boilerplate
+#
+def _test():
+  import doctest,sys
+  return doctest.testmod(sys.modules["__main__"])
+
+if __name__ == '__main__':
+  import sys
+  failed,tried = _test()
+  sys.exit(failed)
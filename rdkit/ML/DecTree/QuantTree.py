@@ -10,6 +10,7 @@
 
 """
 from rdkit.ML.DecTree import DecTree,Tree
+import numpy
 
 class QuantTreeNode(DecTree.DecTreeNode):
   """ 
@@ -58,6 +59,14 @@ class QuantTreeNode(DecTree.DecTreeNode):
         val = int(val)
       return self.children[val].ClassifyExample(example,appendExamples=appendExamples)
 
+  def _branchIndices(self,vals):
+    if not hasattr(self,'nBounds'): self.nBounds = len(self.qBounds)
+    if self.nBounds:
+      # the number of bounds <= each value is the box it falls in:
+      return numpy.searchsorted(self.qBounds,vals,side='right')
+    else:
+      return vals.astype(numpy.intp)
+
   def SetQuantBounds(self,qBounds):
     self.qBounds = qBounds[:]
     self.nBounds = len(self.qBounds)
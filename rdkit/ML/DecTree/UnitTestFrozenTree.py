@@ -0,0 +1,84 @@
+# $Id$
+#
+#  This file is part of the RDKit.
+#  The contents are covered by the terms of the BSD license
+#  which is included in the file license.txt, found at the root
+#  of the RDKit source tree.
+#
+""" unit tests for frozen decision trees """
+from rdkit import RDConfig
+import unittest,cPickle,random
+import numpy
+from rdkit.ML.DecTree import FrozenTree
+from rdkit.ML.DecTree.QuantTree import QuantTreeNode
+
+class TestCase(unittest.TestCase):
+  def _checkTree(self,tree,examples):
+    frozen = tree.Freeze()
+    ref = [tree.ClassifyExample(x) for x in examples]
+    self.failUnlessEqual([frozen.ClassifyExample(x) for x in examples],ref)
+    self.failUnlessEqual(frozen.ClassifyExamples(examples),ref)
+    arr = numpy.array([[0]+list(x[1:]) for x in examples],numpy.float64)
+    self.failUnlessEqual(frozen.ClassifyExamples(arr),ref)
+    self.failUnlessEqual(tree.ClassifyExamples(arr),ref)
+
+    # pickling:
+    frozen2 = cPickle.loads(cPickle.dumps(frozen,2))
+    self.failUnlessEqual(frozen2.ClassifyExamples(arr),ref)
+    self.failUnlessEqual([frozen2.ClassifyExample(x) for x in examples],ref)
+    return frozen
+
+  def test1QuantTrees(self):
+    " testing frozen QuantTrees "
+    random.seed(23)
+    for fName,nVars in (('QuantTree1.pkl',3),('QuantTree2.pkl',3)):
+      tree = cPickle.load(open(RDConfig.RDCodeDir+'/ML/DecTree/test_data/'+fName,'r'))
+      examples = [['p%d'%i]+[random.choice((0,1,0.1,1.1)) for j in range(nVars)]+[0]
+                  for i in range(100)]
+      self._checkTree(tree,examples)
+
+  def test2DecTrees(self):
+    " testing frozen DecTrees "
+    random.seed(23)
+    tree = cPickle.load(open(RDConfig.RDCodeDir+'/ML/DecTree/test_data/BasicTree.pkl','r'))
+    # the basic tree has no name column:
+    examples = [[random.randint(0,2),random.randint(0,2),random.randint(0,1),
+                 random.randint(0,1),0] for i in range(100)]
+    frozen = tree.Freeze()
+    ref = [tree.ClassifyExample(x) for x in examples]
+    self.failUnlessEqual([frozen.ClassifyExample(x) for x in examples],ref)
+    arr = numpy.array(examples)
+    self.failUnlessEqual(frozen.ClassifyExamples(arr),ref)
+    self.failUnlessEqual(tree.ClassifyExamples(arr),ref)
+
+  def test3Bounds(self):
+    " testing values on and around quantization bounds "
+    t = QuantTreeNode(None,'d1',1)
+    t.SetQuantBounds([0.5,1.5])
+    for i in range(3):
+      t.AddChild(str(i),label=i,isTerminal=1)
+    frozen = t.Freeze()
+    vals = [-1.0,0.5,0.7,1.5,2.0,float('nan')]
+    ref = [t.ClassifyExample([0,x]) for x in vals]
+    self.failUnlessEqual(ref,[0,1,1,2,2,2])
+    self.failUnlessEqual([frozen.ClassifyExample([0,x]) for x in vals],ref)
+    self.failUnlessEqual(frozen.ClassifyExamples(numpy.array([[0,x] for x in vals])),ref)
+
+  def test4Composite(self):
+    " testing frozen trees in composites "
+    compos = cPickle.load(open(RDConfig.RDCodeDir+'/ML/Composite/test_data/composite_base.pkl','rb'))
+    examples = cPickle.load(open(RDConfig.RDCodeDir+'/ML/Composite/test_data/ferro.pkl','rb'))
+    ref = [compos.ClassifyExample(x) for x in examples]
+    origSize = len(cPickle.dumps(compos,2))
+    compos.FreezeModels()
+    for i in range(len(compos)):
+      self.failUnless(isinstance(compos.GetModel(i),FrozenTree.FrozenTree))
+    self.failUnlessEqual([compos.ClassifyExample(x) for x in examples],ref)
+    self.failUnlessEqual(compos.ClassifyExamples(examples),ref)
+    pkl = cPickle.dumps(compos,2)
+    self.failUnless(len(pkl)<origSize)
+    compos = cPickle.loads(pkl)
+    self.failUnlessEqual(compos.ClassifyExamples(examples),ref)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -203,6 +203,35 @@ class TestCase(unittest.TestCase):
     assert self.t1.GetChildren()[0].GetLabel()==3,self.t1.GetChildren()[0].GetLabel()
     assert self.t1.GetChildren()[1].GetLabel()==54,self.t1.GetChildren()[1].GetLabel()
     
+  def testSplitData(self):
+    """ compare trees built with and without SplitData """
+    import random
+    random.seed(23)
+    nAttrs = 6
+    examples = []
+    for i in range(100):
+      descrs = [random.randint(0,20)/20. for x in range(nAttrs/2)]+\
+               [random.randint(0,2) for x in range(nAttrs/2)]
+      act = int(descrs[0]+descrs[1]>1) + int(descrs[3]==2 or descrs[4]==0)
+      examples.append(['p%d'%i]+descrs+[act])
+    attrs = range(1,nAttrs+1)
+    nPossibleVals = [0]+[0]*(nAttrs/2)+[3]*(nAttrs/2)+[3]
+    for nBounds in (1,2):
+      boundsPerVar = [0]+[nBounds]*(nAttrs/2)+[0]*(nAttrs/2)+[0]
+      for kwargs in ({},{'maxDepth':2},{'recycleVars':1,'randomDescriptors':3}):
+        trees = []
+        for splitData in (None,BuildQuantTree.SplitData(examples,attrs,boundsPerVar)):
+          random.seed(42)
+          trees.append(BuildQuantTree.BuildQuantTree(examples,-1,attrs,nPossibleVals,
+                                                     boundsPerVar,splitData=splitData,
+                                                     **kwargs))
+        self.failUnless(trees[0]==trees[1])
+        random.seed(42)
+        t = BuildQuantTree.QuantTreeBoot(examples,attrs,nPossibleVals,boundsPerVar,
+                                         **kwargs)
+        self.failUnlessEqual([t.ClassifyExample(x) for x in examples],
+                             [trees[0].ClassifyExample(x) for x in examples])
+
 
 
 
@@ -7,6 +7,8 @@ tests=[
   ("python","UnitTestPrune.py",{}),
   ("python","UnitTestQuantTree.py",{}),
   ("python","UnitTestSigTree.py",{}),
+  ("python","FrozenTree.py",{}),
+  ("python","UnitTestFrozenTree.py",{}),
   
   ]
 
@@ -11,7 +11,59 @@ from rdkit.Chem import Descriptors as DescriptorsMod
 
 from rdkit.RDLogger import logger
 logger = logger()
-import re
+import re,time
+import numpy
+
+def _SharedData():
+  """ returns a tuple of (name,function,descriptorNames) tuples
+  describing the intermediate results which are shared between
+  descriptors
+
+   Each function calculates (and caches on the molecule) the intermediate
+   result; _descriptorNames_ are the descriptors which use it.
+
+  """
+  from rdkit import Chem
+  from rdkit.Chem import MolSurf
+  from rdkit.Chem.EState import EState,EState_VSA
+  eStateNames = ['MaxEStateIndex','MinEStateIndex','MaxAbsEStateIndex','MinAbsEStateIndex']
+  vsaNames = ['VSA_EState%d'%(i+1) for i in range(len(EState_VSA.vsaBins)+1)]
+  estateVSANames = ['EState_VSA%d'%(i+1) for i in range(len(EState_VSA.estateBins)+1)]
+  chargeNames = ['MaxPartialCharge','MinPartialCharge','MaxAbsPartialCharge','MinAbsPartialCharge']
+  def distMat(mol):
+    # this is the matrix Ipc uses; the EState indices use the copy
+    # cached on the molecule itself:
+    mol._adjMat = Chem.GetDistanceMatrix(mol,0)
+  return (('DistanceMatrix',distMat,['Ipc']+eStateNames+vsaNames+estateVSANames),
+          ('EStateIndices',lambda x:EState.EStateIndices(x,force=1),
+           eStateNames+vsaNames+estateVSANames),
+          ('LabuteContribs',lambda x:MolSurf._LabuteHelper(x,force=1),
+           vsaNames+estateVSANames),
+          ('VSA_EState',lambda x:EState_VSA.VSA_EState_(x,force=0),vsaNames),
+          ('EState_VSA',lambda x:EState_VSA.EState_VSA_(x,force=0),estateVSANames),
+          ('GasteigerCharges',lambda x:DescriptorsMod._ChargeDescriptors(x,force=True),
+           chargeNames),
+          )
+
+# keyword arguments which tell descriptors to use the shared results
+# instead of recalculating them:
+_sharedDataArgs = {'MaxEStateIndex':{'force':0},
+                   'MinEStateIndex':{'force':0},
+                   'MaxAbsEStateIndex':{'force':0},
+                   'MinAbsEStateIndex':{'force':0},
+                   }
+
+_calcData = None
+def _initCalcWorker(calc):
+  global _calcData
+  _calcData = calc
+
+def _calcChunk(mols):
+  """ calculates descriptors for a chunk of molecules using the
+  calculator set up by _initCalcWorker()
+
+  """
+  return _calcData._CalcBatchChunk(mols)
 
 class MolecularDescriptorCalculator(Descriptors.DescriptorCalculator):
   """ used for calculating descriptors for molecules
@@ -88,6 +140,171 @@ class MolecularDescriptorCalculator(Descriptors.DescriptorCalculator):
         traceback.print_exc()
     return tuple(res)
 
+  def _CalcBatchChunk(self,mols):
+    """ *Internal Use Only*
+
+      calculates the descriptors for a sequence of molecules
+
+      **Returns**
+
+        a 4-tuple:
+
+          1) the descriptor matrix
+
+          2) an array with the time spent on each descriptor
+
+          3) a dictionary with the time spent on each shared
+             intermediate result
+
+          4) an array with the number of failures for each descriptor
+
+    """
+    funcs = self.GetDescriptorFuncs()
+    nDescs = len(funcs)
+    fnArgs = [_sharedDataArgs.get(nm,{}) for nm in self.simpleList]
+    used = set(self.simpleList)
+    shared = [(nm,fn) for nm,fn,users in _SharedData() if used.intersection(users)]
+    # the fragment descriptors share the data their pattern screens use:
+    screened = [j for j,fn in enumerate(funcs) if hasattr(fn,'smarts')]
+    if screened:
+      from rdkit.Chem.PatternSet import GetMolData
+
+    res = numpy.zeros((len(mols),nDescs),numpy.float64)
+    res.fill(-666)
+    timings = numpy.zeros(nDescs,numpy.float64)
+    sharedTimings = dict([(nm,0.0) for nm,fn in shared])
+    if screened:
+      sharedTimings['PatternScreenData'] = 0.0
+    failures = numpy.zeros(nDescs,numpy.int32)
+    for i,mol in enumerate(mols):
+      for nm,fn in shared:
+        t1 = time.time()
+        try:
+          fn(mol)
+        except:
+          # the descriptors using this will fail on their own
+          pass
+        sharedTimings[nm] += time.time()-t1
+      if screened:
+        t1 = time.time()
+        try:
+          molData = GetMolData(mol)
+        except:
+          molData = None
+        for j in screened:
+          fnArgs[j] = {'molData':molData}
+        sharedTimings['PatternScreenData'] += time.time()-t1
+      row = res[i]
+      for j,fn in enumerate(funcs):
+        t1 = time.time()
+        try:
+          row[j] = fn(mol,**fnArgs[j])
+        except:
+          failures[j] += 1
+        timings[j] += time.time()-t1
+    return res,timings,sharedTimings,failures
+
+  def CalcDescriptorsBatch(self,mols,numWorkers=0,chunkSize=100):
+    """ calculates all descriptors for a set of molecules
+
+      Intermediate results used by more than one descriptor (EState
+      indices, Labute ASA contributions, Gasteiger charges, the
+      distance matrix, the data used to screen the fragment
+      descriptors' patterns) are calculated once per molecule.  The time
+      spent on each descriptor is added to the totals returned by
+      _GetDescriptorTimings()_.
+
+      **Arguments**
+
+        - mols: a sequence of molecules
+
+        - numWorkers: (optional) if this is larger than 1, a pool of
+          this many processes is used to do the calculation
+
+        - chunkSize: (optional) the number of molecules handed to a
+          worker process at a time
+
+      **Returns**
+
+        a numpy array with one row per molecule and one column per
+        descriptor.  Rows contain the same values _CalcDescriptors()_
+        returns: descriptors which fail are set to -666, unknown
+        descriptors to 777.
+
+      **Notes**
+
+        - failures are not reported individually; a single warning
+          per descriptor gives the number of molecules it failed for
+
+    """
+    nDescs = len(self.simpleList)
+    chunks = [mols[i:i+chunkSize] for i in range(0,len(mols),chunkSize)]
+    pool = None
+    if numWorkers>1 and len(chunks)>1:
+      import multiprocessing
+      pool = multiprocessing.Pool(numWorkers,_initCalcWorker,(self,))
+      # imap hands the results back in order:
+      results = pool.imap(_calcChunk,chunks)
+    else:
+      results = (self._CalcBatchChunk(chunk) for chunk in chunks)
+
+    rows = [numpy.zeros((0,nDescs),numpy.float64)]
+    timings = numpy.zeros(nDescs,numpy.float64)
+    sharedTimings = {}
+    failures = numpy.zeros(nDescs,numpy.int32)
+    try:
+      for res,chunkTimings,chunkShared,chunkFailures in results:
+        rows.append(res)
+        timings += chunkTimings
+        failures += chunkFailures
+        for nm,t in chunkShared.iteritems():
+          sharedTimings[nm] = sharedTimings.get(nm,0.0)+t
+    finally:
+      if pool is not None:
+        pool.terminate()
+        pool.join()
+
+    self._descriptorTimings = tuple(numpy.array(self.GetDescriptorTimings())+timings)
+    totals = self.GetSharedDataTimings()
+    for nm,t in sharedTimings.iteritems():
+      totals[nm] = totals.get(nm,0.0)+t
+    self._sharedDataTimings = totals
+    for nm,count in zip(self.simpleList,failures):
+      if count:
+        logger.warning('descriptor %s failed for %d of %d molecules'%(nm,count,len(mols)))
+    return numpy.concatenate(rows)
+
+  def GetDescriptorTimings(self):
+    """ returns a tuple with the total time (in seconds) spent by
+    _CalcDescriptorsBatch()_ on each of this calculator's descriptors
+
+    """
+    res = getattr(self,'_descriptorTimings',None)
+    if res is None:
+      res = (0.0,)*len(self.simpleList)
+    return res
+
+  def GetSharedDataTimings(self):
+    """ returns a dictionary with the total time (in seconds) spent by
+    _CalcDescriptorsBatch()_ calculating the intermediate results shared
+    between descriptors
+
+    """
+    return dict(getattr(self,'_sharedDataTimings',{}))
+
+  def ResetTimings(self):
+    """ clears the timings collected by _CalcDescriptorsBatch()_
+
+    """
+    self._descriptorTimings = None
+    self._sharedDataTimings = {}
+
+  def __getstate__(self):
+    d = self.__dict__.copy()
+    d.pop('_descriptorTimings',None)
+    d.pop('_sharedDataTimings',None)
+    return d
+
   def GetDescriptorNames(self):
     """ returns a tuple of the names of the descriptors this calculator generates
 
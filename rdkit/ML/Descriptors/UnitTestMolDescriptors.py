@@ -52,6 +52,27 @@ class TestCase(unittest.TestCase):
     self.failUnlessEqual(calc.GetDescriptorNames(),tuple(self.descs))
     self.failUnlessEqual(calc.GetDescriptorVersions(),tuple(self.vers))
     self._testVals(calc,self.testD)
+
+  def testCalcBatch(self):
+    " testing CalcDescriptorsBatch "
+    descs = ['MolLogP','Chi1v','Ipc','BertzCT','MaxEStateIndex','MinAbsEStateIndex',
+             'VSA_EState3','EState_VSA2','MaxPartialCharge','MinAbsPartialCharge',
+             'LabuteASA','NotADescriptor']
+    calc = MoleculeDescriptors.MolecularDescriptorCalculator(descs)
+    smis = ['CCOC','CC=O','CCC(=O)O','c1ccccc1O','C1CCNCC1C(=O)N','[Na+].[Cl-]']*20
+    ref = numpy.array([calc.CalcDescriptors(Chem.MolFromSmiles(x)) for x in smis])
+    for numWorkers in (0,2):
+      res = calc.CalcDescriptorsBatch([Chem.MolFromSmiles(x) for x in smis],
+                                      numWorkers=numWorkers,chunkSize=25)
+      self.failUnlessEqual(res.shape,(len(smis),len(descs)))
+      self.failUnlessEqual(res.dtype,numpy.float64)
+      self.failUnless(numpy.allclose(res,ref),'batch values do not match')
+    self.failUnlessEqual(len(calc.GetDescriptorTimings()),len(descs))
+    self.failUnless(min(calc.GetDescriptorTimings())>=0)
+    self.failUnless('EStateIndices' in calc.GetSharedDataTimings())
+    self.failUnlessEqual(calc.CalcDescriptorsBatch([]).shape,(0,len(descs)))
+    calc.ResetTimings()
+    self.failUnlessEqual(calc.GetDescriptorTimings(),(0.0,)*len(descs))
     
     
 if __name__ == '__main__':
@@ -4,7 +4,9 @@
 #    All Rights Reserved
 #
 """ for the moment this is using Francois Fleuret's cmim library
- to do the feature selection
+ to do the feature selection. If that isn't available, a numpy version
+ of the algorithm, which works on packed bit vectors (see
+ _BitRank.PackedBitVects_), is used.
 
  Reference: F. Fleuret "Fast Binary Feature Selection with Conditional
             Mutual Information", J. Machine Learn. Res. 5, 1531-1535
@@ -13,17 +15,86 @@
 """
 from rdkit import RDConfig
 from rdkit import DataStructs
+from rdkit.ML.InfoTheory import BitRank,entropy
+import numpy
 import tempfile
 import os
-import rdFeatSelect
+try:
+  import rdFeatSelect
+except ImportError:
+  rdFeatSelect=None
+
+# features which add less information than this are not picked:
+_infoTol=1e-8
 
 def SelectFeatures(examples,nFeatsToPick,bvCol=1):
+  if rdFeatSelect is None:
+    return PySelectFeatures(examples,nFeatsToPick,bvCol=bvCol)
   res = rdFeatSelect.selectCMIM(examples,nFeatsToPick)
   if -1 in res:
     res = list(res)
     res = tuple(res[:res.index(-1)])
   return res
 
+def PySelectFeatures(examples,nFeatsToPick,bvCol=1):
+  """ selects features using CMIM
+
+    **Arguments**
+
+      - examples: a sequence of examples, the bit vectors are in column
+        _bvCol_ and the (integer) activities are in the last column
+
+      - nFeatsToPick: the number of features to select
+
+      - bvCol: (optional) the column containing the bit vectors
+
+    **Returns**
+
+      a tuple with the selected bits; this is shorter than _nFeatsToPick_
+      if the other bits do not add any information
+
+  """
+  bitVects = BitRank.PackedBitVects([x[bvCol] for x in examples])
+  acts = numpy.array([int(x[-1]) for x in examples],numpy.intp)
+  nPts = len(acts)
+  nActs = acts.max()+1
+  actMasks = [bitVects.PackMask(acts==x) for x in range(nActs)]
+  actCounts = numpy.bincount(acts,minlength=nActs)
+  onCounts = bitVects.GetActivityCounts(acts,nActs)
+
+  # the score of a bit is its mutual information with the activity,
+  # conditional on the bit picked so far which makes it least useful:
+  tables = numpy.zeros((bitVects.nBits,2,nActs),numpy.intp)
+  tables[:,0,:] = actCounts-onCounts
+  tables[:,1,:] = onCounts
+  scores = entropy.InfoGains(tables)
+  picked = numpy.zeros(bitVects.nBits,numpy.bool)
+  res = []
+  while len(res) < nFeatsToPick:
+    best = int(numpy.argmax(numpy.where(picked,-1.,scores)))
+    if picked[best] or scores[best] < _infoTol:
+      break
+    res.append(best)
+    picked[best] = True
+
+    # the joint counts of each bit with the new one:
+    column = bitVects.bits[best]
+    both = numpy.zeros((bitVects.nBits,nActs),numpy.intp)
+    for act in range(nActs):
+      both[:,act] = bitVects.GetBitCounts(column&actMasks[act])
+    bestOn = onCounts[best]
+    onTables = numpy.zeros((bitVects.nBits,2,nActs),numpy.intp)
+    onTables[:,0,:] = bestOn-both
+    onTables[:,1,:] = both
+    offTables = numpy.zeros((bitVects.nBits,2,nActs),numpy.intp)
+    offTables[:,0,:] = actCounts-bestOn-onCounts+both
+    offTables[:,1,:] = onCounts-both
+    nOn = float(bestOn.sum())
+    condInfo = (nOn*entropy.InfoGains(onTables) + \
+                (nPts-nOn)*entropy.InfoGains(offTables))/nPts
+    scores = numpy.minimum(scores,condInfo)
+  return tuple(res)
+
 def _SelectFeatures(examples,nFeatsToPick,bvCol=1):
   nPts = len(examples)
   nFeats = examples[0][bvCol].GetNumBits()
@@ -43,5 +43,11 @@ class TestCase(unittest.TestCase):
      r = CMIM.SelectFeatures(examples,3)
      self.failUnless(r==(2,4))
 
+     # the numpy implementation gives the same answers:
+     r = CMIM.PySelectFeatures(examples,2)
+     self.failUnless(r==(2,4))
+     r = CMIM.PySelectFeatures(examples,3)
+     self.failUnless(r==(2,4))
+
 if __name__ == '__main__':
    unittest.main()
@@ -1,2 +1,5 @@
 from rdkit import DataStructs
-from rdFeatSelect import *
+try:
+  from rdFeatSelect import *
+except ImportError:
+  pass
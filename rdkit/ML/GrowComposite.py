@@ -90,6 +90,10 @@
        2) If you have integer valued data that should not be quantized
           further, enter 0 for that descriptor.
 
+  - --numWorkers *count*: build the new models using *count* worker
+     processes.  Each model gets its own random seed, so the composite
+     does not depend on the number of workers.
+
   - -V: print the version number and exit
 
 """
@@ -157,10 +161,10 @@ def GrowIt(details,composite,progressCallback=None,
     if details.outName == '':
       details.outName = fName + '.pkl'
     if details.dbName == '':
-      data = DataUtils.BuildQuantDataSet(fName)
+      data = DataUtils.BuildQuantDataSet(fName,asArrays=True)
     elif details.qBounds != []:
       details.tableName = fName
-      data = details.GetDataSet()
+      data = details.GetDataSet(asArrays=True)
     else:
       data = DataUtils.DBToQuantData(details.dbName,fName,quantName=details.qTableName,
                                      user=details.dbUser,password=details.dbPassword)
@@ -182,6 +186,7 @@ def GrowIt(details,composite,progressCallback=None,
   nVars = data.GetNVars()
   nPossibleVals = composite.nPossibleVals
   attrs = range(1,nVars+1)
+  numWorkers = getattr(details,'numWorkers',0)
 
   if details.useTrees:
     from rdkit.ML.DecTree import CrossValidate,PruneTree
@@ -205,6 +210,7 @@ def GrowIt(details,composite,progressCallback=None,
                    startAt=details.startAt,
                    maxDepth=details.limitDepth,
                    progressCallback=progressCallback,
+                   numWorkers=numWorkers,
                    silent=not _verbose)
 
 
@@ -212,7 +218,8 @@ def GrowIt(details,composite,progressCallback=None,
     from rdkit.ML.Neural import CrossValidate
     driver = CrossValidate.CrossValidationDriver
     composite.Grow(trainExamples,attrs,[0]+nPossibleVals,nTries=details.nModels,
-                   buildDriver=driver,needsQuantization=0)
+                   buildDriver=driver,needsQuantization=0,
+                   numWorkers=numWorkers)
     
   composite.AverageErrors()
   composite.SortModels()
@@ -307,7 +314,7 @@ def BalanceComposite(details,composite,data1=None,data2=None):
     details.tableName = fName
     dbName = details.dbName
     details.dbName = details.balDb
-    data1 = details.GetDataSet()
+    data1 = details.GetDataSet(asArrays=True)
     details.tableName = tmp
     details.dbName = dbName
   if data1 is None:
@@ -345,7 +352,7 @@ def BalanceComposite(details,composite,data1=None,data2=None):
   #
   if data2 is None:
     message("\tReading Second Data Set")
-    data2 = details.GetDataSet()
+    data2 = details.GetDataSet(asArrays=True)
   if data2 is None:
     return composite
   details.splitFrac = composite._splitFrac
@@ -418,7 +425,7 @@ def ParseArgs(runDetails):
   import getopt
   args,extra = getopt.getopt(sys.argv[1:],'P:o:n:p:b:sf:F:v:hlgd:rSTt:Q:q:DVG:L:C:N:',
                              ['inNote=','outNote=','balTable=','balWeight=','balCnt=',
-                              'balH','balT','balDb=',])
+                              'balH','balT','balDb=','numWorkers=',])
   runDetails.inNote=''
   runDetails.composFileName=''
   runDetails.balTable=''
@@ -446,6 +453,8 @@ def ParseArgs(runDetails):
       runDetails.balDoTrain=1
     elif arg=='--balDb':
       runDetails.balDb=val
+    elif arg == '--numWorkers':
+      runDetails.numWorkers = int(val)
     elif arg == '--inNote':
       runDetails.inNote=val
     elif arg == '-N' or arg=='--outNote':
@@ -17,10 +17,163 @@
    It is perfectly acceptable for them to be read-only, so long as they are
    random-access.
 
+ **Packed bit vectors**
+
+   Binary data are converted into a _PackedBitVects_ before the bits are
+   ranked. The number of vectors in each activity class which have each
+   bit set is then found by counting set bits in whole words at a time.
+   All of the functions here which take a *sequence* of bit vectors also
+   accept a _PackedBitVects_, so the conversion only needs to be done
+   once for a data set.
+
 """
 import numpy
 from rdkit.ML.InfoTheory import entropy
 
+# the number of set bits in each possible byte value:
+_byteCounts = numpy.array([bin(x).count('1') for x in range(256)],numpy.uint8)
+# the number of vectors converted at a time (this should be a multiple of 64):
+_blockSize = 4096
+
+def _NumBits(bitVect):
+  if hasattr(bitVect,'GetNumBits'):
+    return bitVect.GetNumBits()
+  return len(bitVect)
+
+def _PackRows(flags):
+  """ packs a 2D boolean array into a uint64 array, 64 columns to a word
+
+    **Notes**
+
+      - the order of the bits within the words is arbitrary, but
+        always the same
+ 
+  """
+  nRows,nCols = flags.shape
+  nWords = (nCols+63)//64
+  padded = numpy.zeros((nRows,nWords*64),numpy.bool)
+  padded[:,:nCols] = flags
+  return numpy.ascontiguousarray(numpy.packbits(padded,axis=1)).view(numpy.uint64)
+
+def _PopCounts(words):
+  """ returns the number of set bits in each row of a 2D uint64 array """
+  res = numpy.zeros(len(words),numpy.intp)
+  step = max(1,(1<<20)//max(1,words.shape[1]))
+  for i in xrange(0,len(words),step):
+    block = numpy.ascontiguousarray(words[i:i+step]).view(numpy.uint8)
+    res[i:i+step] = _byteCounts[block].sum(1,dtype=numpy.intp)
+  return res
+
+class PackedBitVects(object):
+  """ a set of binary vectors packed into a uint64 matrix
+
+    The matrix (_bits_) is stored one row per bit position: row _i_ holds
+    bit _i_ of every vector, 64 vectors to a word.  The number of vectors
+    in a subset which have a particular bit set is then the number of
+    set bits in that row ANDed with a mask for the subset (see
+    _PackMask()_).
+
+  """
+  def __init__(self,bitVects,nBits=None):
+    """ Constructor
+
+      **Arguments**
+
+        - bitVects: a *sequence* containing *IntVectors*, bit vectors or
+          SBVs, or a 2D numpy array with one row per vector
+
+        - nBits: (optional) the number of bits in each vector, by default
+          this is the length of the first vector
+
+    """
+    nPts = len(bitVects)
+    if nBits is None:
+      if nPts:
+        nBits = _NumBits(bitVects[0])
+      else:
+        nBits = 0
+    self.nPts = nPts
+    self.nBits = nBits
+    self.bits = numpy.zeros((nBits,(nPts+63)//64),numpy.uint64)
+    for start in xrange(0,nPts,_blockSize):
+      stop = min(nPts,start+_blockSize)
+      if isinstance(bitVects,numpy.ndarray):
+        flags = bitVects[start:stop,:nBits].T != 0
+      else:
+        flags = numpy.zeros((nBits,stop-start),numpy.bool)
+        for i in xrange(start,stop):
+          bitVect = bitVects[i]
+          if hasattr(bitVect,'GetOnBits'):
+            flags[numpy.array(list(bitVect.GetOnBits()),numpy.intp),i-start] = True
+          else:
+            flags[:,i-start] = numpy.asarray(bitVect)[:nBits] != 0
+      self.bits[:,start//64:(stop+63)//64] = _PackRows(flags)
+
+  def __len__(self):
+    return self.nPts
+
+  def PackMask(self,flags):
+    """ returns a mask (a 1D uint64 array) for the vectors which have
+    _flags_ set
+
+      **Arguments**
+
+        - flags: a *sequence* with a boolean for each vector
+
+    """
+    flags = numpy.asarray(flags,numpy.bool)
+    if len(flags) != self.nPts:
+      raise ValueError,'there should be one flag per vector'
+    return _PackRows(flags[numpy.newaxis,:])[0]
+
+  def GetBitCounts(self,mask=None):
+    """ returns a 1D numpy array with the number of vectors which have each bit set
+
+      **Arguments**
+
+        - mask: (optional) a mask from _PackMask()_, if this is provided
+          only the vectors in the mask are counted
+
+    """
+    if mask is None:
+      return _PopCounts(self.bits)
+    return _PopCounts(self.bits & mask)
+
+  def GetActivityCounts(self,actVals,nPossibleActs):
+    """ returns a 2D numpy array (nBits x nPossibleActs) with the number
+    of vectors with each activity value which have each bit set
+
+      **Arguments**
+
+        - actVals: a *sequence* with the (integer) activity of each vector
+
+        - nPossibleActs: the (integer) number of possible activity values.
+
+    """
+    actVals = numpy.asarray(actVals).astype(numpy.intp)
+    res = numpy.zeros((self.nBits,nPossibleActs),numpy.intp)
+    for act in xrange(nPossibleActs):
+      res[:,act] = self.GetBitCounts(self.PackMask(actVals==act))
+    return res
+
+def _GetPacked(bitVects,nBits=None):
+  if isinstance(bitVects,PackedBitVects):
+    return bitVects
+  return PackedBitVects(bitVects,nBits=nBits)
+
+def _BitTables(bitVects,actVals,nPossibleActs):
+  """ returns a 3D numpy array with the counts matrices (see _FormCounts()_)
+  for all of the bits of binary vectors
+
+  """
+  bitVects = _GetPacked(bitVects)
+  actVals = numpy.asarray(actVals).astype(numpy.intp)
+  onCounts = bitVects.GetActivityCounts(actVals,nPossibleActs)
+  res = numpy.zeros((bitVects.nBits,2,nPossibleActs),numpy.intp)
+  res[:,0,:] = numpy.bincount(actVals,minlength=nPossibleActs)[:nPossibleActs]-onCounts
+  res[:,1,:] = onCounts
+  return res
+
 def FormCounts(bitVects,actVals,whichBit,nPossibleActs,nPossibleBitVals=2):
   """ generates the counts matrix for a particular bit
 
@@ -70,16 +223,57 @@ def CalcInfoGains(bitVects,actVals,nPossibleActs,nPossibleBitVals=2):
 
      a list of floats
 
+   **Notes**
+
+     - binary data (the default) are handled with a _PackedBitVects_
+
   """
   if len(bitVects) != len(actVals): raise ValueError,'var and activity lists should be the same length'
+  if nPossibleBitVals == 2:
+    return entropy.InfoGains(_BitTables(bitVects,actVals,nPossibleActs))
+
   nBits = len(bitVects[0])
-  res = numpy.zeros(nBits,Float)
+  res = numpy.zeros(nBits,numpy.float)
 
   for bit in xrange(nBits):
     counts = FormCounts(bitVects,actVals,bit,nPossibleActs,
                         nPossibleBitVals=nPossibleBitVals)
     res[bit] = entropy.InfoGain(counts)
   return res  
+
+def CalcChiSquares(bitVects,actVals,nPossibleActs,nPossibleBitVals=2):
+  """  Calculates the chi-squared value for a set of points and activity values
+
+  **Arguments**
+
+    - bitVects: a *sequence* containing *IntVectors*
+
+    - actVals: a *sequence*
+
+    - nPossibleActs: the (integer) number of possible activity values.
+
+    - nPossibleBitVals: (optional) if specified, this integer provides the maximum
+      value attainable by the (increasingly inaccurately named) bits in _bitVects_.
+
+   **Returns**   
+
+     a list of floats
+
+  """
+  if len(bitVects) != len(actVals): raise ValueError,'var and activity lists should be the same length'
+  if nPossibleBitVals == 2:
+    tables = _BitTables(bitVects,actVals,nPossibleActs)
+  else:
+    nBits = len(bitVects[0])
+    tables = numpy.array([FormCounts(bitVects,actVals,bit,nPossibleActs,
+                                     nPossibleBitVals=nPossibleBitVals)
+                          for bit in xrange(nBits)])
+  tables = numpy.asarray(tables,numpy.float64)
+  tSum = tables.sum(-1).sum(-1)
+  expected = tables.sum(2)[:,:,numpy.newaxis]*tables.sum(1)[:,numpy.newaxis,:]/\
+             numpy.where(tSum>0,tSum,1)[:,numpy.newaxis,numpy.newaxis]
+  terms = (tables-expected)**2/numpy.where(expected>0,expected,1)
+  return numpy.where(expected>0,terms,0.).sum(-1).sum(-1)
   
 def RankBits(bitVects,actVals,nPossibleBitVals=2,
              metricFunc=CalcInfoGains):
@@ -95,7 +289,8 @@ def RankBits(bitVects,actVals,nPossibleBitVals=2,
       value attainable by the (increasingly inaccurately named) bits in _bitVects_.
 
     - metricFunc: (optional) the metric function to be used.  See _CalcInfoGains()_
-      for a description of the signature of this function.
+      for a description of the signature of this function; _CalcChiSquares()_
+      can also be used.
 
    **Returns**
 
@@ -119,13 +314,18 @@ def AnalyzeSparseVects(bitVects,actVals):
 
   **Arguments**
 
-    - bitVects: a *sequence* containing SBVs
+    - bitVects: a *sequence* containing SBVs (or a _PackedBitVects_)
 
     - actVals: a *sequence*
 
    **Returns**   
 
-     a list of floats
+     a 2-tuple containing:
+
+       - a list of (bit,gain,nActive,nInactive) tuples, one for each
+         bit set in at least one of the vectors
+
+       - a list with the gains
 
    **Notes**
 
@@ -134,36 +334,23 @@ def AnalyzeSparseVects(bitVects,actVals):
   """
   nPts = len(bitVects)
   if nPts != len(actVals): raise ValueError,'var and activity lists should be the same length'
-  nBits = bitVects[0].GetSize()
-
-  actives = numpy.zeros(nBits,numpy.integer)
-  inactives = numpy.zeros(nBits,numpy.integer)
-  nActives,nInactives = 0,0
-  for i in range(nPts):
-    sig,act = bitVects[i],actVals[i]
-    onBitList = sig.GetOnBits()
-    if act:
-      for bit in onBitList:
-        actives[bit] += 1
-      nActives += 1
-    else:
-      for bit in onBitList:
-        inactives[bit] += 1
-      nInactives += 1
-  resTbl = numpy.zeros((2,2),numpy.integer)
-  res = []
-  gains = []
-  counts = []
-  for bit in xrange(nBits):
-    nAct,nInact = actives[bit],inactives[bit]
-    if nAct or nInact:
-      resTbl[0,0] = nAct
-      resTbl[1,0] = nPts - nAct
-      resTbl[0,1] = nInact
-      resTbl[1,1] = nPts - nInact
-      gain = entropy.InfoGain(resTbl)
-      gains.append(gain)
-      res.append((bit,gain,nAct,nInact))
+  if isinstance(bitVects,PackedBitVects):
+    nBits = bitVects.nBits
+  else:
+    nBits = bitVects[0].GetSize()
+  bitVects = _GetPacked(bitVects,nBits=nBits)
+
+  acts = numpy.array([bool(x) for x in actVals],numpy.bool)
+  actives = bitVects.GetBitCounts(bitVects.PackMask(acts))
+  inactives = bitVects.GetBitCounts(bitVects.PackMask(~acts))
+  bits = numpy.nonzero(actives|inactives)[0]
+  resTbls = numpy.zeros((len(bits),2,2),numpy.intp)
+  resTbls[:,0,0] = actives[bits]
+  resTbls[:,1,0] = nPts - actives[bits]
+  resTbls[:,0,1] = inactives[bits]
+  resTbls[:,1,1] = nPts - inactives[bits]
+  gains = entropy.InfoGains(resTbls).tolist()
+  res = zip(bits.tolist(),gains,actives[bits].tolist(),inactives[bits].tolist())
   return res,gains
   
 def SparseRankBits(bitVects,actVals,metricFunc=AnalyzeSparseVects):
@@ -0,0 +1,99 @@
+# $Id$
+#
+#  This file is part of the RDKit.
+#  The contents are covered by the terms of the BSD license
+#  which is included in the file license.txt, found at the root
+#  of the RDKit source tree.
+#
+""" unit tests for bit ranking """
+import unittest,random
+import numpy
+from rdkit import DataStructs
+from rdkit.ML.InfoTheory import BitRank,entropy
+
+def feq(v1,v2,tol=1e-8):
+  return abs(v1-v2)<tol
+
+class TestCase(unittest.TestCase):
+  def setUp(self):
+    random.seed(23)
+    self.nBits = 150
+    self.vects = []
+    self.acts = []
+    for i in range(200):
+      act = random.randint(0,2)
+      # the first few bits are correlated with the activity:
+      vect = [int(random.random()<0.1+0.2*act*(bit<10)) for bit in range(self.nBits)]
+      self.vects.append(vect)
+      self.acts.append(act)
+
+  def test1Packing(self):
+    " testing packing bit vectors "
+    packed = BitRank.PackedBitVects(self.vects)
+    self.failUnlessEqual(len(packed),len(self.vects))
+    self.failUnlessEqual(packed.nBits,self.nBits)
+    self.failUnlessEqual(packed.GetBitCounts().tolist(),
+                         numpy.sum(self.vects,0).tolist())
+    counts = packed.GetActivityCounts(self.acts,3)
+    for bit in range(self.nBits):
+      tbl = BitRank.FormCounts(self.vects,self.acts,bit,3)
+      self.failUnlessEqual(counts[bit].tolist(),tbl[1].tolist())
+    # numpy arrays work too:
+    packed2 = BitRank.PackedBitVects(numpy.array(self.vects))
+    self.failUnless((packed.bits==packed2.bits).all())
+
+  def test2InfoGains(self):
+    " testing info gains "
+    gains = BitRank.CalcInfoGains(self.vects,self.acts,3)
+    packed = BitRank.PackedBitVects(self.vects)
+    gains2 = BitRank.CalcInfoGains(packed,self.acts,3)
+    for bit in range(self.nBits):
+      tbl = BitRank.FormCounts(self.vects,self.acts,bit,3)
+      self.failUnless(feq(gains[bit],entropy.InfoGain(tbl)))
+      self.failUnless(feq(gains2[bit],gains[bit]))
+    order,metrics = BitRank.RankBits(packed,self.acts)
+    self.failUnless(max(order[:5])<10)
+    self.failUnlessEqual(list(metrics),list(gains))
+
+  def test3ChiSquares(self):
+    " testing chi squared values "
+    chis = BitRank.CalcChiSquares(self.vects,self.acts,3)
+    for bit in range(self.nBits):
+      tbl = BitRank.FormCounts(self.vects,self.acts,bit,3).astype(numpy.float)
+      tot = tbl.sum()
+      chi = 0.0
+      for i in range(2):
+        for j in range(3):
+          expect = tbl[i].sum()*tbl[:,j].sum()/tot
+          if expect:
+            chi += (tbl[i,j]-expect)**2/expect
+      self.failUnless(feq(chis[bit],chi))
+    order,metrics = BitRank.RankBits(self.vects,self.acts,metricFunc=BitRank.CalcChiSquares)
+    self.failUnless(max(order[:5])<10)
+
+  def test4SparseVects(self):
+    " testing sparse bit vectors "
+    sbvs = []
+    acts = []
+    for vect,act in zip(self.vects,self.acts):
+      sbv = DataStructs.SparseBitVect(10000)
+      for bit in range(self.nBits):
+        if vect[bit]:
+          sbv.SetBit(bit*50)
+      sbvs.append(sbv)
+      acts.append(act==2)
+    info,gains = BitRank.AnalyzeSparseVects(sbvs,acts)
+    counts = numpy.sum(self.vects,0)
+    self.failUnlessEqual([x[0] for x in info],[x*50 for x in range(self.nBits) if counts[x]])
+    for bit,gain,nAct,nInact in info:
+      vals = [x[bit//50] for x in self.vects]
+      self.failUnlessEqual(nAct,sum([x for x,y in zip(vals,acts) if y]))
+      self.failUnlessEqual(nAct+nInact,sum(vals))
+      tbl = numpy.array([[nAct,nInact],[len(sbvs)-nAct,len(sbvs)-nInact]])
+      self.failUnless(feq(gain,entropy.InfoGain(tbl)))
+    order,info2 = BitRank.SparseRankBits(sbvs,acts)
+    self.failUnlessEqual(info2,info)
+    self.failUnlessEqual(gains[order[0]],max(gains))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -92,6 +92,37 @@ def PyInfoGain(varMat):
     gain = 0
   return gain
 
+def InfoGains(varMats):
+  """ calculates the information gain for each of a set of variables
+
+    **Arguments**
+
+      varMats is a 3D numpy array containing a stack of the matrices
+        _InfoGain()_ takes, so a set of 100 variables which adopt 4
+        possible values for a result which has 3 possible values
+        would be 100x4x3
+
+    **Returns**
+
+      a 1D numpy array with the expected information gain of each variable
+
+    **Notes**
+
+      the gains are all calculated at once using numpy, which is a lot
+      faster than calling _InfoGain()_ for each variable
+
+  """
+  varMats = numpy.asarray(varMats,numpy.float64)
+  def entropies(counts):
+    tots = counts.sum(-1)
+    probs = counts/numpy.where(tots>0,tots,1)[...,numpy.newaxis]
+    t = numpy.where(probs>0,probs,1)
+    return (-probs*numpy.log(t)/_log2).sum(-1),tots
+  variableEnts,variableRes = entropies(varMats)
+  overallEnt,tSum = entropies(varMats.sum(1))
+  term2 = (variableRes*variableEnts).sum(-1)/numpy.where(tSum>0,tSum,1)
+  return numpy.where(tSum>0,overallEnt-term2,0.)
+
 # if we have the C versions, use them, otherwise use the python stuff
 if hascEntropy:
   InfoEntropy = cEntropy.InfoEntropy
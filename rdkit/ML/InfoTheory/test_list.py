@@ -1,6 +1,7 @@
 
 tests=[
     ("python","testCorrMatGen.py",{}),
+    ("python","UnitTestBitRank.py",{}),
     ]
 
 longTests=[
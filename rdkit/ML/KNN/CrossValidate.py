@@ -41,20 +41,22 @@ def CrossValidate(knnMod,testExamples,appendExamples=0):
   if isinstance(knnMod,KNNClassificationModel):
     badExamples = []
     nBad = 0
+    preds = knnMod.ClassifyExamples(testExamples, appendExamples)
     for i in xrange(nTest):
       testEx = testExamples[i]
       trueRes = testEx[-1]
-      res = knnMod.ClassifyExample(testEx, appendExamples)
+      res = preds[i]
       if (trueRes != res) :
         badExamples.append(testEx)
         nBad += 1
     return float(nBad)/nTest, badExamples
   elif isinstance(knnMod,KNNRegressionModel):
     devSum=0.0
+    preds = knnMod.PredictExamples(testExamples, appendExamples)
     for i in xrange(nTest):
       testEx = testExamples[i]
       trueRes = testEx[-1]
-      res = knnMod.PredictExample(testEx, appendExamples)
+      res = preds[i]
       devSum += abs(trueRes-res)
     return devSum/nTest,None
   raise ValueError,"Unrecognized Model Type"
@@ -55,17 +55,50 @@ class KNNClassificationModel(KNNModel.KNNModel) :
       
     # first find the k-closest examples in the traning set
     knnLst = self.GetNeighbors(example)
+    if neighborList is not None:
+      neighborList.extend(knnLst)
+    return self._classFromNeighbors(knnLst)
+
+  def ClassifyExamples(self, examples, appendExamples=0, neighborLists=None) :
+    """ Classify a set of examples
+
+    This gives the same results as calling _ClassifyExample()_ on each
+    example, but the neighbors are found with _GetNeighborsBatch()_,
+    which is much faster for large sets of examples.
+
+    **Arguments**
+
+    - examples: the examples to be classified
+
+    - appendExamples: if this is nonzero then the examples will be stored on this model
 
+    - neighborLists: if provided, the list of neighbors for each example
+      will be appended to it
+
+    **Returns**
+
+      - a list with the classification of each of _examples_
+    """
+    if appendExamples:
+      self._examples.extend(examples)
+    res = []
+    for knnLst in self.GetNeighborsBatch(examples):
+      if neighborLists is not None:
+        neighborLists.append(knnLst)
+      res.append(self._classFromNeighbors(knnLst))
+    return res
+
+  def _classFromNeighbors(self,knnLst):
     # find out how many of the neighbors belong to each of the classes
     clsCnt = {}
     for knn in knnLst :
+      # with a radius there may be fewer than k neighbors:
+      if knn[1] is None: continue
       cls = knn[1][-1]
       if (clsCnt.has_key(cls)) :
         clsCnt[cls] += 1
       else :
         clsCnt[cls] = 1
-    if neighborList is not None:
-      neighborList.extend(knnLst)
 
     # now return the class with the maximum count
     mkey = -1
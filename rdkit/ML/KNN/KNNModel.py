@@ -7,7 +7,9 @@
 """ Define the class _KNNModel_, used to represent a k-nearest neighbhors model
 
 """
-from rdkit.DataStructs.TopNContainer import TopNContainer
+import numpy
+from rdkit.DataStructs.TopNHeap import TopNHeap,MultiProbeTopN
+from rdkit.ML.KNN import DistFunctions
 class KNNModel(object):
   """ This is a base class used by KNNClassificationModel
   and KNNRegressionModel to represent a k-nearest neighbor predictor. In general
@@ -39,6 +41,7 @@ class KNNModel(object):
     self._dfunc = dfunc
     self._name = ""
     self._radius = radius
+    self._trainingIndex = None
 
   def GetName(self) :
     return self_name
@@ -57,6 +60,7 @@ class KNNModel(object):
 
   def SetTrainingExamples(self,examples):
     self._trainingExamples = examples
+    self._trainingIndex = None
 
   def GetTestExamples(self) :
     return self._testExamples
@@ -68,11 +72,170 @@ class KNNModel(object):
     """ Returns the k nearest neighbors of the example
 
     """
-    nbrs = TopNContainer(self._k)
+    nbrs = TopNHeap(self._k)
     for trex in self._trainingExamples:
       dist = self._dfunc(trex, example, self._attrs)
       if self._radius is None or dist<self._radius:
         nbrs.Insert(-dist,trex)
     nbrs.reverse()
     return [x for x in nbrs]
-    
+
+  def __getstate__(self):
+    # the training index is rebuilt on demand, there's no point in
+    # storing it:
+    state = self.__dict__.copy()
+    state['_trainingIndex'] = None
+    return state
+
+  def _getTrainingIndex(self):
+    """ returns the training examples' attribute values as an array
+    (with the values set to 0 or 1 for the Tanimoto metric), along
+    with the popcounts of the rows for Tanimoto
+
+    returns None if the distance function or the data can't be
+    handled with arrays
+
+    """
+    if self._dfunc not in (DistFunctions.EuclideanDist,DistFunctions.TanimotoDist):
+      return None
+    index = getattr(self,'_trainingIndex',None)
+    if index is None:
+      try:
+        vals = numpy.array([[ex[i] for i in self._attrs] for ex in self._trainingExamples],
+                           numpy.float64)
+      except (TypeError,ValueError):
+        return None
+      vals = vals.reshape((len(self._trainingExamples),len(self._attrs)))
+      if self._dfunc==DistFunctions.TanimotoDist:
+        # 0/1 floats so that the intersection counts are matrix products:
+        vals = (vals!=0).astype(numpy.float64)
+        counts = vals.sum(1).astype(numpy.int64)
+        order = numpy.argsort(counts,kind='mergesort')
+        index = vals,counts,order,counts[order]
+      else:
+        index = vals,None,None,None
+      self._trainingIndex = index
+    return index
+
+  def _euclideanDists(self,queries,vals):
+    # the distances are accumulated in the same order as
+    # DistFunctions.EuclideanDist does, so the results are identical
+    dists = numpy.zeros((len(queries),len(vals)),numpy.float64)
+    for i in range(vals.shape[1]):
+      dists += (vals[:,i][numpy.newaxis,:]-queries[:,i][:,numpy.newaxis])**2
+    return numpy.sqrt(dists)
+
+  def _tanimotoCandidates(self,query,queryCount,index,threshold=None):
+    """ returns the sorted indices of the training examples that could
+    be neighbors of the query, along with their distances
+
+    The training examples are considered in order of decreasing upper
+    bound on their similarity to the query (min(A,B)/max(A,B) for
+    popcounts A and B); once the k best similarities seen are better
+    than the bound for the remaining examples, they can be skipped.
+
+    """
+    vals,counts,order,sortedCounts = index
+    nTrain = len(vals)
+    if threshold is not None:
+      from rdkit.DataStructs.PopcountIndex import TanimotoPopcountBounds
+      lo,hi = TanimotoPopcountBounds(queryCount,threshold)
+      start = numpy.searchsorted(sortedCounts,lo,side='left')
+      if hi is None:
+        end = nTrain
+      else:
+        end = numpy.searchsorted(sortedCounts,hi,side='right')
+      cands = order[start:end]
+    elif self._k<=0 or self._k>=nTrain:
+      cands = numpy.arange(nTrain)
+    else:
+      # work outwards from the query's popcount:
+      mid = numpy.searchsorted(sortedCounts,queryCount,side='left')
+      lo = mid
+      hi = mid
+      best = numpy.zeros(0,numpy.float64)
+      pieces = []
+      while lo>0 or hi<nTrain:
+        if lo>0:
+          loBound = float(sortedCounts[lo-1])/max(queryCount,1)
+        else:
+          loBound = -1.0
+        if hi<nTrain:
+          hiBound = float(queryCount)/max(sortedCounts[hi],1)
+        else:
+          hiBound = -1.0
+        bound = max(loBound,hiBound)
+        if len(best)>=self._k and bound+1e-8<best[-self._k]:
+          break
+        # take the whole bucket with the best bound:
+        if loBound>=hiBound:
+          newLo = numpy.searchsorted(sortedCounts,sortedCounts[lo-1],side='left')
+          which = order[newLo:lo]
+          lo = newLo
+        else:
+          newHi = numpy.searchsorted(sortedCounts,sortedCounts[hi],side='right')
+          which = order[hi:newHi]
+          hi = newHi
+        pieces.append(which)
+        inter = numpy.dot(vals[which],query)
+        union = counts[which]+queryCount-inter
+        sims = numpy.where(union>0,inter/numpy.maximum(union,1),0.0)
+        best = numpy.sort(numpy.concatenate((best,sims)))[-self._k:]
+      cands = numpy.concatenate(pieces)
+    cands = numpy.sort(cands)
+    inter = numpy.dot(vals[cands],query)
+    union = (counts[cands]+queryCount).astype(numpy.float64)-inter
+    # this matches DistFunctions.TanimotoDist, including its handling
+    # of empty examples:
+    dists = numpy.where(union>0,1-inter/numpy.maximum(union,1),1.0)
+    return cands,dists
+
+  def GetNeighborsBatch(self,examples,blockSize=1000):
+    """ Returns the k nearest neighbors of each of a sequence of examples
+
+    The results are identical to calling GetNeighbors() on each
+    example. If the model uses DistFunctions.EuclideanDist or
+    DistFunctions.TanimotoDist, the distances are calculated with
+    numpy against a cached array of the training examples (with
+    popcount pruning for Tanimoto), which is much faster.
+
+    """
+    index = self._getTrainingIndex()
+    if index is None or not len(self._trainingExamples):
+      return [self.GetNeighbors(x) for x in examples]
+    try:
+      queries = numpy.array([[ex[i] for i in self._attrs] for ex in examples],numpy.float64)
+    except (TypeError,ValueError):
+      return [self.GetNeighbors(x) for x in examples]
+    queries = queries.reshape((len(examples),len(self._attrs)))
+
+    nbrs = MultiProbeTopN(len(examples),self._k)
+    trex = self._trainingExamples
+    if self._dfunc==DistFunctions.EuclideanDist:
+      vals = index[0]
+      # keep the blocks of distances to about blockSize*blockSize entries:
+      nPerBlock = max(1,blockSize*blockSize//len(vals))
+      for start in range(0,len(queries),nPerBlock):
+        dists = self._euclideanDists(queries[start:start+nPerBlock],vals)
+        if self._radius is not None:
+          dists[dists>=self._radius] = numpy.inf
+        nbrs.AddScores(-dists,trex,range(start,start+len(dists)))
+    else:
+      queries = (queries!=0).astype(numpy.float64)
+      if self._radius is not None:
+        threshold = 1.-self._radius
+      else:
+        threshold = None
+      for i,query in enumerate(queries):
+        cands,dists = self._tanimotoCandidates(query,int(query.sum()),index,threshold)
+        if self._radius is not None:
+          keep = dists<self._radius
+          cands = cands[keep]
+          dists = dists[keep]
+        nbrs.AddProbeScores(i,-dists,[trex[x] for x in cands])
+    res = []
+    for heap in nbrs.GetContainers():
+      heap.reverse()
+      res.append([x for x in heap])
+    return res
+
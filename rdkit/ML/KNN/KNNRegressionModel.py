@@ -59,7 +59,44 @@ class KNNRegressionModel(KNNModel.KNNModel) :
 
     # first find the k-closest examples in the training set
     knnLst = self.GetNeighbors(example)
+    if neighborList is not None:
+      neighborList.extend(knnLst)
+    return self._valueFromNeighbors(knnLst,weightedAverage)
+
+  def PredictExamples(self, examples, appendExamples=0, weightedAverage=0, neighborLists=None) :
+    """ Generates predictions for a set of examples
+
+    This gives the same results as calling _PredictExample()_ on each
+    example, but the neighbors are found with _GetNeighborsBatch()_,
+    which is much faster for large sets of examples.
+
+    **Arguments**
+
+      - examples: the examples to be predicted
+
+      - appendExamples: if this is nonzero then the examples will be stored on this model
+
+      - weightedAverage: if provided, the neighbors' contributions to the value will be
+                         weighed by their reciprocal square distance
+
+      - neighborLists: if provided, the list of neighbors for each example
+        will be appended to it
+
+    **Returns**
+
+      - a list with the prediction for each of _examples_
 
+    """
+    if appendExamples:
+      self._examples.extend(examples)
+    res = []
+    for knnLst in self.GetNeighborsBatch(examples):
+      if neighborLists is not None:
+        neighborLists.append(knnLst)
+      res.append(self._valueFromNeighbors(knnLst,weightedAverage))
+    return res
+
+  def _valueFromNeighbors(self,knnLst,weightedAverage):
     accum = 0.0
     denom = 0.0
     for knn in knnLst:
@@ -76,7 +113,4 @@ class KNNRegressionModel(KNNModel.KNNModel) :
       denom += w
     if denom:
       accum /= denom
-    if neighborList is not None:
-      neighborList.extend(knnLst)
     return accum
-
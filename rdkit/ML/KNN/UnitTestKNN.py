@@ -84,6 +84,37 @@ class TestCase(unittest.TestCase):
     # NOTE: this number hasn't been extensively checked
     assert feq(err,0.07725),err
 
+  def test5Batch(self):
+    fName = os.path.join(RDConfig.RDCodeDir,'ML','KNN','test_data','random_pts.csv')
+    data = DataUtils.TextFileToData(fName)
+    examples = data.GetNamedData()
+    nvars = data.GetNVars()
+    attrs = range(1,nvars+1)
+    # a binary version of the data for the Tanimoto metric:
+    bitExamples = [[ex[0]]+[int(ex[x]>0.5) for x in attrs]+[ex[-1]] for ex in examples]
+    for metric,exs in ((DistFunctions.EuclideanDist,examples),
+                       (DistFunctions.TanimotoDist,bitExamples)):
+      for radius in (None,0.5):
+        trainExamples = exs[:400]
+        testExamples = exs[400:]
+        mdl = KNNClassificationModel.KNNClassificationModel(5,attrs,metric,radius=radius)
+        mdl.SetTrainingExamples(trainExamples)
+        nbrs = []
+        res = mdl.ClassifyExamples(testExamples,neighborLists=nbrs)
+        self.failUnlessEqual(len(res),len(testExamples))
+        self.failUnlessEqual(len(nbrs),len(testExamples))
+        for i,ex in enumerate(testExamples):
+          tgt = mdl.GetNeighbors(ex)
+          self.failUnlessEqual([x[0] for x in tgt],[x[0] for x in nbrs[i]])
+          self.failUnlessEqual([x[1] for x in tgt],[x[1] for x in nbrs[i]])
+          self.failUnlessEqual(mdl.ClassifyExample(ex),res[i])
+
+        mdl = KNNRegressionModel.KNNRegressionModel(5,attrs,metric,radius=radius)
+        mdl.SetTrainingExamples(trainExamples)
+        res = mdl.PredictExamples(testExamples)
+        for i,ex in enumerate(testExamples):
+          self.failUnless(feq(mdl.PredictExample(ex),res[i]))
+
 
       
     
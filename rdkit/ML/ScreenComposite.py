@@ -166,7 +166,7 @@ def CalcEnrichment(mat,tgt=1):
 
 
 def CollectResults(indices,dataSet,composite,callback=None,appendExamples=0,
-                   errorEstimate=0):
+                   errorEstimate=0,blockSize=10000):
   """ screens a set of examples through a composite and returns the
   results
 #DOC
@@ -192,6 +192,10 @@ def CollectResults(indices,dataSet,composite,callback=None,appendExamples=0,
       [L. Breiman "Out-of-bag Estimation", UC Berkeley Dept of
       Statistics Technical Report (1996)]
 
+    - blockSize: (optional) unless _appendExamples_ is set, the
+      examples are classified in blocks of this size using the
+      composite's _ClassifyExamples()_ method.
+
   **Returns**
 
     a list of 3-tuples _nExamples_ long:
@@ -217,6 +221,31 @@ def CollectResults(indices,dataSet,composite,callback=None,appendExamples=0,
 
   nPts = len(indices)
   res = [None]*nPts
+  if not appendExamples:
+    nModels = len(composite)
+    for start in range(0,nPts,blockSize):
+      blockIndices = indices[start:start+blockSize]
+      examples = [dataSet[idx] for idx in blockIndices]
+      if errorEstimate:
+        useModels = numpy.ones((len(blockIndices),nModels),numpy.bool)
+        for j in range(nModels):
+          trainIndices = composite.GetModel(j)._trainIndices
+          for i,idx in enumerate(blockIndices):
+            if trainIndices.get(idx,0):
+              useModels[i,j] = False
+      else:
+        useModels = None
+      preds = composite.ClassifyExamples(examples,useModels=useModels)
+      for i,example in enumerate(examples):
+        if composite.GetActivityQuantBounds():
+          answer = composite.QuantizeActivity(example)[-1]
+        else:
+          answer = example[-1]
+        pred,conf = preds[i]
+        res[start+i] = answer,pred,conf
+        if callback: callback(start+i)
+    return res
+
   for i in range(nPts):
     idx = indices[i]
     example = dataSet[idx]
@@ -692,9 +721,10 @@ def ScreenFromDetails(models,details,callback=None,setup=None,appendExamples=0,
   if data is None:
     if hasattr(details,'pickleCol'):
       data = details.GetDataSet(pickleCol=details.pickleCol,
-                                pickleClass=DataStructs.ExplicitBitVect)
+                                pickleClass=DataStructs.ExplicitBitVect,
+                                asArrays=True)
     else:
-      data = details.GetDataSet()
+      data = details.GetDataSet(asArrays=True)
   if details.threshold>0.0:
     partialVote = 1
   else:
@@ -1327,9 +1357,10 @@ if __name__ == '__main__':
     if details.dbName != '':
       details.tableName = fName
       data = details.GetDataSet(pickleCol=details.pickleCol,
-                                pickleClass=DataStructs.ExplicitBitVect)
+                                pickleClass=DataStructs.ExplicitBitVect,
+                                asArrays=True)
     else:
-      data = DataUtils.BuildDataSet(fName)
+      data = DataUtils.BuildDataSet(fName,asArrays=True)
     descNames = data.GetVarNames()
     nModels = len(models)
     screenResults = [None]*nModels